@@ -26,6 +26,7 @@ import getpass
 import bonneville.loader
 import bonneville.utils
 import bonneville.payload
+import bonneville.utils.tokenstore
 
 log = logging.getLogger(__name__)
 
@@ -39,6 +40,11 @@ class LoadAuth(object):
         self.max_fail = 1.0
         self.serial = bonneville.payload.Serial(opts)
         self.auth = bonneville.loader.auth(opts)
+        self.tokens = bonneville.utils.tokenstore.get_store(opts)
+        # When set, a failed authentication does not sleep but leaves the
+        # time the reply has to be held back in delay
+        self.defer_failures = False
+        self.delay = 0
 
     def load_name(self, load):
         '''
@@ -81,7 +87,9 @@ class LoadAuth(object):
 
     def time_auth(self, load):
         '''
-        Make sure that all failures happen in the same amount of time
+        Make sure that all failures happen in the same amount of time. With
+        defer_failures the caller is in charge of holding the reply back for
+        the time left in delay.
         '''
         start = time.time()
         ret = self.__auth_call(load)
@@ -95,10 +103,22 @@ class LoadAuth(object):
                 self.max_fail - deviation,
                 self.max_fail + deviation
                 )
-        while start + r_time > time.time():
-            time.sleep(0.001)
+        left = start + r_time - time.time()
+        if left > 0:
+            if self.defer_failures:
+                self.delay = max(self.delay, left)
+            else:
+                time.sleep(left)
         return False
 
+    def pop_delay(self):
+        '''
+        Return the seconds the reply to the last request has to be held back
+        and reset it
+        '''
+        delay, self.delay = self.delay, 0
+        return delay
+
     def mk_token(self, load):
         '''
         Run time_auth and create a token. Return False or the token
@@ -108,18 +128,15 @@ class LoadAuth(object):
             return {}
         fstr = '{0}.auth'.format(load['eauth'])
         tok = str(hashlib.md5(os.urandom(512)).hexdigest())
-        t_path = os.path.join(self.opts['token_dir'], tok)
-        while os.path.isfile(t_path):
+        while self.tokens.exists(tok):
             tok = hashlib.md5(os.urandom(512)).hexdigest()
-            t_path = os.path.join(self.opts['token_dir'], tok)
         fcall = bonneville.utils.format_call(self.auth[fstr], load)
         tdata = {'start': time.time(),
                  'expire': time.time() + self.opts['token_expire'],
                  'name': fcall['args'][0],
                  'eauth': load['eauth'],
                  'token': tok}
-        with bonneville.utils.fopen(t_path, 'w+b') as fp_:
-            fp_.write(self.serial.dumps(tdata))
+        self.tokens.put(tdata)
         return tdata
 
     def get_tok(self, tok):
@@ -127,24 +144,7 @@ class LoadAuth(object):
         Return the name associated with the token, or False if the token is
         not valid
         '''
-        t_path = os.path.join(self.opts['token_dir'], tok)
-        if not os.path.isfile(t_path):
-            return {}
-        with bonneville.utils.fopen(t_path, 'rb') as fp_:
-            tdata = self.serial.loads(fp_.read())
-        rm_tok = False
-        if 'expire' not in tdata:
-            # invalid token, delete it!
-            rm_tok = True
-        if tdata.get('expire', '0') < time.time():
-            rm_tok = True
-        if rm_tok:
-            try:
-                os.remove(t_path)
-                return {}
-            except (IOError, OSError):
-                pass
-        return tdata
+        return self.tokens.get(tok)
 
 
 class Resolver(object):
@@ -7,11 +7,13 @@ Execute batch runs
 from __future__ import print_function
 import math
 import time
-import copy
+import collections
 
 # Import bonneville libs
 import bonneville.client
 import bonneville.output
+import bonneville.utils.minions
+from bonneville.utils.event import tagify
 
 
 class Batch(object):
@@ -22,26 +24,56 @@ class Batch(object):
         self.opts = opts
         self.quiet = quiet
         self.local = bonneville.client.LocalClient(opts['conf_file'])
+        self.stats = {'returned': 0,
+                      'timed_out': 0,
+                      'elapsed': 0.0,
+                      'throughput': 0.0}
         self.minions = self.__gather_minions()
 
-    def __gather_minions(self):
+    def __expr_form(self):
         '''
-        Return a list of minions to use for the batch run
+        Return the target type used for this batch run
         '''
-        args = [self.opts['tgt'],
-                'test.ping',
-                [],
-                5,
-                ]
-
         selected_target_option = self.opts.get('selected_target_option', None)
         if selected_target_option is not None:
-            args.append(selected_target_option)
-        else:
-            args.append(self.opts.get('expr_form', 'glob'))
+            return selected_target_option
+        return self.opts.get('expr_form', 'glob')
 
+    def __cached_minions(self):
+        '''
+        Split the targeted minions into the ones whose cached minion data is
+        recent enough to trust that they are up, and the remaining ones which
+        need to be pinged. Returns None if the cache cannot be used.
+        '''
+        max_age = self.opts.get('batch_cache_max_age', 0)
+        if not max_age or not self.opts.get('minion_data_cache', False):
+            return None
+        ckminions = bonneville.utils.minions.CkMinions(self.opts)
+        return ckminions.split_by_data_age(
+            self.opts['tgt'], self.__expr_form(), max_age
+        )
+
+    def __gather_minions(self):
+        '''
+        Return a list of minions to use for the batch run
+        '''
+        tgt = self.opts['tgt']
+        expr_form = self.__expr_form()
         fret = []
-        for ret in self.local.cmd_iter(*args):
+
+        cached = self.__cached_minions()
+        if cached is not None:
+            fret, stale = cached
+            if not self.quiet:
+                for minion in fret:
+                    print('{0} Detected for this batch run'.format(minion))
+            if not stale:
+                return sorted(fret)
+            # Only ping the minions without fresh data
+            tgt = stale
+            expr_form = 'list'
+
+        for ret in self.local.cmd_iter(tgt, 'test.ping', [], 5, expr_form):
             for minion in ret:
                 if not self.quiet:
                     print('{0} Detected for this batch run'.format(minion))
@@ -67,120 +99,145 @@ class Batch(object):
                 print(('Invalid batch data sent: {0}\nData must be in the form'
                        'of %10, 10% or 3').format(self.opts['batch']))
 
+    def __publish(self, minions, fun, arg, timeout):
+        '''
+        Publish a sub job to the passed minions and return its jid, or None
+        if the publish failed
+        '''
+        pub_data = self.local.run_job(
+            minions,
+            fun,
+            arg,
+            'list',
+            timeout=timeout)
+        return pub_data.get('jid') if pub_data else None
+
+    def __display(self, minion, data):
+        '''
+        Print the return of a single minion
+        '''
+        data = dict(data)
+        data[minion] = data.pop('ret')
+        out = data.pop('out', None)
+        bonneville.output.display_output(data, out, self.opts)
+
     def run(self):
         '''
         Execute the batch run
+
+        This keeps a sliding window of ``batch`` minions running, a new
+        minion is started as soon as any running minion returns. The returns
+        of every sub job are gathered from a single event subscription.
         '''
-        args = [[],
-                self.opts['fun'],
-                self.opts['arg'],
-                self.opts['timeout'],
-                'list',
-                ]
         bnum = self.get_bnum()
-        to_run = copy.deepcopy(self.minions)
-        active = []
-        ret = {}
-        iters = []
-
-        # the minion tracker keeps track of responses and iterators
-        # - it removes finished iterators from iters[]
-        # - if a previously detected minion does not respond, its
-        #   added with an empty answer to ret{} once the timeout is reached
-        # - unresponsive minions are removed from active[] to make
-        #   sure that the main while loop finishes even with unresp minions
-        minion_tracker = {}
-
-        # Iterate while we still have things to execute
-        while len(ret) < len(self.minions):
-            next_ = []
-            if len(to_run) <= bnum and not active:
-                # last bit of them, add them all to next iterator
-                while to_run:
-                    next_.append(to_run.pop())
-            else:
-                for i in range(bnum - len(active)):
-                    if to_run:
-                        next_.append(to_run.pop())
-
-            active += next_
-            args[0] = next_
-
-            if next_:
+        if not bnum:
+            return
+        timeout = self.local._get_timeout(self.opts['timeout'])
+        fun = self.opts['fun']
+        arg = self.opts['arg']
+        raw = self.opts.get('raw', False)
+        tag = tagify(prefix='job')
+
+        to_run = collections.deque(self.minions)
+        # Maps the running minions to their jid, deadline and whether a
+        # saltutil.find_job probe is already pending for them
+        pending = {}
+        # Maps the jids of the find_job probes to the jid they look for
+        probes = {}
+        start = time.time()
+
+        while to_run or pending:
+            free = bnum - len(pending)
+            if free > 0 and to_run:
+                next_ = [to_run.popleft()
+                         for _ in range(min(free, len(to_run)))]
                 if not self.quiet:
                     print('\nExecuting run on {0}\n'.format(next_))
-                # create a new iterator for this batch of minions
-                new_iter = self.local.cmd_iter_no_block(
-                                *args,
-                                raw=self.opts.get('raw', False))
-                # add it to our iterators and to the minion_tracker
-                iters.append(new_iter)
-                minion_tracker[new_iter] = {}
-                # every iterator added is 'active' and has its set of minions
-                minion_tracker[new_iter]['minions'] = next_
-                minion_tracker[new_iter]['active'] = True
-
-            else:
-                time.sleep(0.02)
-            parts = {}
-
-            for queue in iters:
-                try:
-                    # Gather returns until we get to the bottom
-                    ncnt = 0
-                    while True:
-                        part = next(queue)
-                        if part is None:
-                            time.sleep(0.01)
-                            ncnt += 1
-                            if ncnt > 5:
-                                break
-                            continue
-                        if self.opts.get('raw'):
-                            parts.update({part['id']: part})
+                jid = self.__publish(next_, fun, arg, timeout)
+                if jid is None:
+                    for minion in next_:
+                        self.stats['timed_out'] += 1
+                        for ret in self.__finish(minion, {'ret': {}}, raw):
+                            yield ret
+                    continue
+                deadline = time.time() + timeout
+                for minion in next_:
+                    pending[minion] = {'jid': jid,
+                                       'deadline': deadline,
+                                       'probed': False}
+
+            # Wait for the next return, but never past the closest deadline
+            now = time.time()
+            wait = 1
+            if pending:
+                closest = min(item['deadline'] for item in pending.values())
+                wait = min(wait, max(closest - now, 0.05))
+            event = self.local.event.get_event(wait, tag, full=True)
+            if event is not None:
+                data = event['data']
+                minion = data.get('id')
+                if minion in pending and 'return' in data:
+                    if data.get('jid') in probes:
+                        if data['return']:
+                            # The job is still running, give it more time
+                            pending[minion]['deadline'] = \
+                                time.time() + timeout
+                            pending[minion]['probed'] = False
+                    elif data.get('jid') == pending[minion]['jid']:
+                        del pending[minion]
+                        self.stats['returned'] += 1
+                        if raw:
+                            result = data
                         else:
-                            parts.update(part)
-                except StopIteration:
-                    # if a iterator is done:
-                    # - set it to inactive
-                    # - add minions that have not responded to parts{}
-
-                    # check if the tracker contains the iterator
-                    if queue in minion_tracker:
-                        minion_tracker[queue]['active'] = False
-
-                        # add all minions that belong to this iterator and
-                        # that have not responded to parts{} with an empty response
-                        for minion in minion_tracker[queue]['minions']:
-                            if minion not in parts.keys():
-                                parts[minion] = {}
-                                parts[minion]['ret'] = {}
-
-            for minion, data in parts.items():
-                active.remove(minion)
-                if self.opts.get('raw'):
-                    yield data
-                else:
-                    ret[minion] = data['ret']
-                    yield {minion: data['ret']}
-                if not self.quiet:
-                    ret[minion] = data['ret']
-                    data[minion] = data.pop('ret')
-                    if 'out' in data:
-                        out = data.pop('out')
-                    else:
-                        out = None
-                    bonneville.output.display_output(
-                            data,
-                            out,
-                            self.opts)
-
-            # remove inactive iterators from the iters list
-            for queue in minion_tracker.keys():
-                # only remove inactive queues
-                if not minion_tracker[queue]['active'] and queue in iters:
-                    iters.remove(queue)
-                    # also remove the iterator's minions from the active list
-                    for minion in minion_tracker[queue]['minions']:
-                        if minion in active:
-                            active.remove(minion)
+                            result = {'ret': data['return']}
+                            if 'out' in data:
+                                result['out'] = data['out']
+                        for ret in self.__finish(minion, result, raw):
+                            yield ret
+
+            # Look for minions past their deadline, the first time ask them
+            # if the job is still running, the second time give up on them
+            now = time.time()
+            expired = {}
+            for minion, item in list(pending.items()):
+                if item['deadline'] > now:
+                    continue
+                if item['probed']:
+                    del pending[minion]
+                    self.stats['timed_out'] += 1
+                    for ret in self.__finish(minion, {'ret': {}}, raw):
+                        yield ret
+                    continue
+                expired.setdefault(item['jid'], []).append(minion)
+            for jid, minions in expired.items():
+                probe = self.__publish(minions, 'saltutil.find_job', [jid], 2)
+                if probe is not None:
+                    probes[probe] = jid
+                for minion in minions:
+                    pending[minion]['probed'] = True
+                    pending[minion]['deadline'] = now + 2
+
+        self.stats['elapsed'] = time.time() - start
+        if self.stats['elapsed']:
+            self.stats['throughput'] = (
+                self.stats['returned'] / self.stats['elapsed']
+            )
+        if not self.quiet:
+            print(
+                '\nBatch run finished in {elapsed:.2f}s: {returned} minions '
+                'returned, {timed_out} did not return, {throughput:.2f} '
+                'returns per second'.format(**self.stats)
+            )
+
+    def __finish(self, minion, data, raw):
+        '''
+        Yield the return of a finished minion and display it
+        '''
+        if raw:
+            yield data
+        else:
+            yield {minion: data['ret']}
+        if not self.quiet:
+            if raw:
+                data = {'ret': data.get('return', data.get('ret', {}))}
+            self.__display(minion, data)
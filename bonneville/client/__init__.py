@@ -36,6 +36,7 @@ import glob
 import time
 import copy
 import getpass
+import threading
 
 # Import bonneville libs
 import bonneville.config
@@ -44,6 +45,7 @@ import bonneville.utils
 import bonneville.utils.verify
 import bonneville.utils.event
 import bonneville.utils.minions
+import bonneville.client.jobstream
 import bonneville.syspaths as syspaths
 from bonneville.exceptions import SaltInvocationError
 from bonneville.exceptions import EauthAuthenticationError
@@ -92,6 +94,8 @@ class LocalClient(object):
         self.salt_user = self.__get_user()
         self.key = self.__read_master_key()
         self.event = bonneville.utils.event.LocalClientEvent(self.opts['sock_dir'])
+        self._demux = None
+        self._demux_lock = threading.Lock()
 
     def __read_master_key(self):
         '''
@@ -575,6 +579,113 @@ class LocalClient(object):
                                                 **kwargs):
                 yield fn_ret
 
+    def _get_demux(self):
+        '''
+        Return the return demultiplexer shared by all the async calls
+        '''
+        with self._demux_lock:
+            if self._demux is None:
+                self._demux = bonneville.client.jobstream.ReturnDemux(
+                    self.opts
+                )
+        self._demux.start()
+        return self._demux
+
+    def async_cmd_iter(
+            self,
+            tgt,
+            fun,
+            arg=(),
+            timeout=None,
+            expr_form='glob',
+            ret='',
+            kwarg=None,
+            **kwargs):
+        '''
+        Publish a command and return a
+        :py:class:`~bonneville.client.jobstream.JobStream` of its returns.
+
+        All the jobs started this way share a single event subscription, the
+        returns are routed to the stream of their job. The stream can be
+        iterated from any thread, or with ``async for`` from an asyncio
+        coroutine, and yields ``{minion_id: {'ret': data}}`` items until all
+        the targeted minions returned or ``timeout`` seconds passed. Call
+        ``cancel()`` on the stream to stop following the job.
+
+        The function signature is the same as :py:meth:`cmd`.
+
+        .. code-block:: python
+
+            stream = local.async_cmd_iter('*', 'test.ping')
+            async for ret in stream:
+                print(ret)
+        '''
+        arg = condition_kwarg(arg, kwarg)
+        timeout = self._get_timeout(timeout)
+        demux = self._get_demux()
+        # The stream is registered before the publication, the first returns
+        # can arrive before the publish call returns
+        jid = bonneville.utils.gen_jid()
+        stream = demux.register(jid, [], timeout)
+        try:
+            pub_data = self._check_pub_data(
+                self.pub(
+                    tgt,
+                    fun,
+                    arg,
+                    expr_form,
+                    ret,
+                    jid=jid,
+                    timeout=timeout,
+                    **kwargs)
+            )
+        except Exception:
+            stream.cancel()
+            raise
+        if not pub_data:
+            # Nothing was published, hand back a finished stream
+            stream.cancel()
+            return stream
+        stream.expect(pub_data['minions'])
+        return stream
+
+    def async_cmd(
+            self,
+            tgt,
+            fun,
+            arg=(),
+            timeout=None,
+            expr_form='glob',
+            ret='',
+            kwarg=None,
+            **kwargs):
+        '''
+        Publish a command and return an asyncio future resolved with the
+        ``{minion_id: data}`` returns once all the targeted minions returned
+        or ``timeout`` seconds passed. This must be called from a running
+        asyncio event loop, see :py:meth:`async_cmd_iter` to follow the job
+        from a thread.
+
+        The function signature is the same as :py:meth:`cmd`.
+
+        .. code-block:: python
+
+            returns = await local.async_cmd('*', 'test.ping')
+        '''
+        if not bonneville.client.jobstream.HAS_ASYNCIO:
+            raise SaltInvocationError(
+                'async_cmd requires asyncio, use async_cmd_iter instead'
+            )
+        return self.async_cmd_iter(
+            tgt,
+            fun,
+            arg,
+            timeout,
+            expr_form,
+            ret,
+            kwarg,
+            **kwargs).result()
+
     def cmd_full_return(
             self,
             tgt,
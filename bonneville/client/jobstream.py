@@ -0,0 +1,302 @@
+# -*- coding: utf-8 -*-
+'''
+Stream the returns of many jobs from a single event subscription
+
+A :class:`ReturnDemux` reads the master event bus in a background thread and
+hands every job return to the :class:`JobStream` registered for its jid. A
+``JobStream`` can be consumed from a thread by iterating over it, or from an
+asyncio coroutine with ``async for`` when asyncio is available, so a single
+process can follow hundreds of jobs without a thread or an event subscription
+per job.
+'''
+
+# Import python libs
+import time
+import logging
+import threading
+import collections
+
+# Import bonneville libs
+import bonneville.utils.event
+from bonneville.utils.event import tagify
+
+try:
+    import asyncio
+    HAS_ASYNCIO = True
+except ImportError:
+    HAS_ASYNCIO = False
+
+log = logging.getLogger(__name__)
+
+# The longest pause of the reader thread while the event bus keeps failing
+MAX_BACKOFF = 30
+
+
+class JobStream(object):
+    '''
+    The returns of a single job, in the order they arrive
+
+    Each item is a dict in the same form as the items yielded by
+    :py:meth:`LocalClient.cmd_iter`, ``{minion_id: {'ret': data}}``. The
+    stream ends once every targeted minion has returned, when the timeout is
+    reached or when the stream is cancelled.
+    '''
+    def __init__(self, demux, jid, minions, timeout):
+        self.demux = demux
+        self.jid = jid
+        self.minions = set(minions)
+        self.found = set()
+        self.returns = {}
+        self.timeout = timeout
+        self.deadline = time.time() + timeout
+        self.done = False
+        self._items = collections.deque()
+        self._cond = threading.Condition()
+        # (loop, future) pairs of the coroutines waiting for the next item
+        self._waiters = collections.deque()
+        self._results = []
+
+    def put(self, data):
+        '''
+        Add a return read from the event bus, called by the demux thread
+        '''
+        if 'minions' in data.get('data', {}):
+            # A syndic announcing the minions it published to
+            with self._cond:
+                self.minions.update(data['data']['minions'])
+            return
+        minion = data['id']
+        item = {minion: {'ret': data['return']}}
+        if 'out' in data:
+            item[minion]['out'] = data['out']
+        with self._cond:
+            if self.done:
+                return
+            self.found.add(minion)
+            self.returns[minion] = data['return']
+            self._items.append(item)
+            if self.minions and self.minions.issubset(self.found):
+                self.done = True
+            self._cond.notify_all()
+        self._wake()
+
+    def expect(self, minions):
+        '''
+        Add the minions targeted by the job, known once it is published
+        '''
+        with self._cond:
+            self.minions.update(minions)
+            if self.minions and self.minions.issubset(self.found):
+                self.done = True
+            self._cond.notify_all()
+        self._wake()
+
+    def cancel(self):
+        '''
+        Stop following the job, the consumers see the end of the stream
+        '''
+        with self._cond:
+            self.done = True
+            self._cond.notify_all()
+        self.demux.unregister(self.jid)
+        self._wake()
+
+    def _expired(self):
+        return self.done or time.time() >= self.deadline
+
+    def _finish(self):
+        '''
+        Mark the stream as finished and stop routing returns to it
+        '''
+        self.done = True
+        self.demux.unregister(self.jid)
+
+    def next(self, timeout=None):
+        '''
+        Return the next item, or None once the stream is finished
+        '''
+        with self._cond:
+            while not self._items:
+                if self._expired():
+                    self._finish()
+                    return None
+                wait = self.deadline - time.time()
+                if timeout is not None:
+                    wait = min(wait, timeout)
+                self._cond.wait(max(wait, 0))
+            return self._items.popleft()
+
+    def __iter__(self):
+        while True:
+            item = self.next()
+            if item is None:
+                return
+            yield item
+
+    def wait(self):
+        '''
+        Block until the stream is finished and return ``{minion_id: data}``
+        '''
+        for _ in self:
+            pass
+        return self.returns
+
+    # asyncio support, written without the async syntax so that this module
+    # still loads on interpreters without asyncio
+
+    def __aiter__(self):
+        return self
+
+    def __anext__(self):
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+        with self._cond:
+            self._waiters.append((loop, future))
+        self._wake()
+        if not future.done():
+            handle = loop.call_at(
+                loop.time() + max(self.deadline - time.time(), 0) + 0.01,
+                self._wake
+            )
+            future.add_done_callback(lambda _: handle.cancel())
+        return future
+
+    def result(self):
+        '''
+        Return an asyncio future resolved with ``{minion_id: data}`` once
+        the stream is finished
+        '''
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+        with self._cond:
+            self._results.append((loop, future))
+        self._wake()
+        if not future.done():
+            handle = loop.call_at(
+                loop.time() + max(self.deadline - time.time(), 0) + 0.01,
+                self._wake
+            )
+            future.add_done_callback(lambda _: handle.cancel())
+        return future
+
+    def _wake(self):
+        '''
+        Hand the available items to the waiting coroutines, this can be
+        called from any thread
+        '''
+        with self._cond:
+            waiters = []
+            while self._waiters and (self._items or self._expired()):
+                loop, future = self._waiters.popleft()
+                if self._items:
+                    waiters.append((loop, future, self._items.popleft()))
+                else:
+                    waiters.append((loop, future, None))
+            results = []
+            if self._results and self._expired():
+                results, self._results = self._results, []
+            if self._expired() and not self._items:
+                self._finish()
+        for loop, future, item in waiters:
+            loop.call_soon_threadsafe(_resolve, future, item)
+        for loop, future in results:
+            loop.call_soon_threadsafe(_resolve, future, dict(self.returns))
+
+
+def _resolve(future, item):
+    '''
+    Set the result of a future from inside its event loop
+    '''
+    if future.done():
+        return
+    if item is None:
+        future.set_exception(StopAsyncIteration())
+    else:
+        future.set_result(item)
+
+
+class ReturnDemux(object):
+    '''
+    Read the job returns from one event subscription and route them to the
+    registered :class:`JobStream` objects by jid. The streams are registered
+    before their job is published, the returns of the other jobs are dropped.
+    '''
+    def __init__(self, opts):
+        self.opts = opts
+        self.streams = {}
+        self.lock = threading.Lock()
+        self.ready = threading.Event()
+        self.thread = None
+
+    def start(self):
+        '''
+        Start the reader thread, it is started automatically on first use
+        '''
+        with self.lock:
+            if self.thread is not None and self.thread.is_alive():
+                return
+            self.ready.clear()
+            self.thread = threading.Thread(target=self._run)
+            self.thread.daemon = True
+            self.thread.start()
+        # Returns published before the subscription is in place are lost
+        self.ready.wait(5)
+
+    def register(self, jid, minions, timeout):
+        '''
+        Create the stream of a job, before the job is published so that no
+        return is missed
+        '''
+        stream = JobStream(self, jid, minions, timeout)
+        with self.lock:
+            self.streams[jid] = stream
+        return stream
+
+    def unregister(self, jid):
+        '''
+        Stop routing the returns of a job
+        '''
+        with self.lock:
+            self.streams.pop(jid, None)
+
+    def _route(self, data):
+        '''
+        Hand a job return to its stream, the returns of the jobs without a
+        stream are dropped
+        '''
+        with self.lock:
+            stream = self.streams.get(data.get('jid'))
+        if stream is not None:
+            stream.put(data)
+
+    def _run(self):
+        '''
+        The reader thread, it owns the event subscription
+        '''
+        event = bonneville.utils.event.LocalClientEvent(self.opts['sock_dir'])
+        tag = tagify(prefix='job')
+        event.subscribe(tag)
+        self.ready.set()
+        backoff = 0
+        while True:
+            try:
+                raw = event.get_event(1, tag, full=True)
+            except Exception:
+                backoff = min(backoff * 2 or 1, MAX_BACKOFF)
+                log.error(
+                    'Failed to read the job returns, retrying in {0} '
+                    'seconds'.format(backoff),
+                    exc_info=True
+                )
+                time.sleep(backoff)
+                continue
+            backoff = 0
+            if raw is None:
+                continue
+            data = raw['data']
+            if 'jid' not in data:
+                continue
+            if 'return' in data and 'id' in data:
+                self._route(data)
+            elif 'minions' in data.get('data', {}):
+                self._route(data)
@@ -4,15 +4,26 @@ Create ssh executor system
 '''
 # Import python libs
 import os
+import errno
+import hashlib
+import logging
 import tarfile
 import tempfile
 import json
 import shutil
 from contextlib import closing
 
+# Import third party libs
+try:
+    import fcntl
+    HAS_FCNTL = True
+except ImportError:
+    HAS_FCNTL = False
+
 # Import bonneville libs
 import bonneville.client.ssh.shell
 import bonneville.client.ssh
+import bonneville.fileclient
 import bonneville.utils
 import bonneville.utils.thin
 import bonneville.roster
@@ -20,6 +31,12 @@ import bonneville.state
 import bonneville.loader
 import bonneville.minion
 
+log = logging.getLogger(__name__)
+
+# The remote location of the state file bundles, they are named after the
+# hash of their file set
+REMOTE_BUNDLE = '/tmp/.salt/state_{0}.tgz'
+
 
 class SSHState(bonneville.state.State):
     '''
@@ -151,3 +168,140 @@ def prep_trans_tar(opts, chunks, file_refs):
     os.chdir(cwd)
     shutil.rmtree(gendir)
     return trans_tar
+
+
+def bundle_files(file_client, file_refs):
+    '''
+    Return the sorted ``(env, relative path, local path)`` of the files
+    referenced by the file refs
+    '''
+    files = set()
+    for env in file_refs:
+        for ref in file_refs[env]:
+            for name in ref:
+                short = name[7:]
+                path = file_client.cache_file(name, env)
+                if path:
+                    files.add((env, short, path))
+                    break
+                cached = file_client.cache_dir(name, env, True)
+                if cached:
+                    for filename in cached:
+                        rel = filename[filename.find(short) + len(short):]
+                        files.add((env,
+                                   os.path.join(short, rel.lstrip(os.sep)),
+                                   filename))
+                    break
+    return sorted(files)
+
+
+def bundle_key(files):
+    '''
+    Return the hash identifying a file set, made of the environments, paths,
+    sizes and modification times of the files
+    '''
+    key = hashlib.sha256()
+    for env, rel, path in files:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        key.update('{0}\0{1}\0{2}\0{3!r}\n'.format(
+            env, rel, stat.st_size, stat.st_mtime
+        ))
+    return key.hexdigest()
+
+
+def _prune_bundles(cachedir, keep):
+    '''
+    Remove the least recently used bundles past the given number
+    '''
+    bundles = []
+    for fn_ in os.listdir(cachedir):
+        if not fn_.endswith('.tgz'):
+            continue
+        try:
+            bundles.append(
+                (os.path.getmtime(os.path.join(cachedir, fn_)), fn_[:-4])
+            )
+        except OSError:
+            continue
+    bundles.sort(reverse=True)
+    for _, key in bundles[keep:]:
+        for ext in ('.tgz', '.sum'):
+            try:
+                os.remove(os.path.join(cachedir, key + ext))
+            except OSError:
+                pass
+
+
+def trans_bundle(opts, file_refs):
+    '''
+    Return the path, the file set hash and the hash of the tarball holding
+    the files referenced by the low state. The tarballs are built once per
+    file set and kept in the master cache, the ``ssh_state_bundles`` most
+    recently used ones are kept.
+    '''
+    file_client = bonneville.fileclient.LocalClient(opts)
+    files = bundle_files(file_client, file_refs)
+    key = bundle_key(files)
+    cachedir = os.path.join(opts['cachedir'], 'ssh_state')
+    if not os.path.isdir(cachedir):
+        try:
+            os.makedirs(cachedir)
+        except OSError as exc:
+            if exc.errno != errno.EEXIST:
+                raise
+    bundle = os.path.join(cachedir, '{0}.tgz'.format(key))
+    sumfn = os.path.join(cachedir, '{0}.sum'.format(key))
+    lock_fp = None
+    if HAS_FCNTL:
+        # The hosts are run in separate processes, the first one builds the
+        # bundle while the others wait for it
+        lock_fp = bonneville.utils.fopen(
+            os.path.join(cachedir, '.lock'), 'w+'
+        )
+        fcntl.flock(lock_fp.fileno(), fcntl.LOCK_EX)
+    try:
+        if os.path.isfile(bundle) and os.path.isfile(sumfn):
+            with bonneville.utils.fopen(sumfn, 'r') as fp_:
+                bundle_sum = fp_.read().strip()
+            # Mark the bundle as recently used
+            os.utime(bundle, None)
+            return bundle, key, bundle_sum
+        log.debug('Building the state file bundle %s', key)
+        gendir = tempfile.mkdtemp()
+        try:
+            for env, rel, path in files:
+                tgt = os.path.join(gendir, env, rel)
+                tgt_dir = os.path.dirname(tgt)
+                if not os.path.isdir(tgt_dir):
+                    os.makedirs(tgt_dir)
+                shutil.copy(path, tgt)
+            tmp = '{0}.{1}'.format(bundle, os.getpid())
+            with closing(tarfile.open(tmp, 'w:gz')) as tfp:
+                for fn_ in sorted(os.listdir(gendir)):
+                    tfp.add(os.path.join(gendir, fn_), arcname=fn_)
+        finally:
+            shutil.rmtree(gendir)
+        bundle_sum = bonneville.utils.get_hash(tmp, opts['hash_type'])
+        with bonneville.utils.fopen(sumfn, 'w+') as fp_:
+            fp_.write(bundle_sum)
+        os.rename(tmp, bundle)
+        _prune_bundles(cachedir, max(opts.get('ssh_state_bundles', 64), 1))
+        return bundle, key, bundle_sum
+    finally:
+        if lock_fp is not None:
+            fcntl.flock(lock_fp.fileno(), fcntl.LOCK_UN)
+            lock_fp.close()
+
+
+def prep_lowstate(chunks):
+    '''
+    Write the low state of a host to a temporary file, it is shipped apart
+    from the file bundle
+    '''
+    lowfn = bonneville.utils.mkstemp()
+    with bonneville.utils.fopen(lowfn, 'w+') as fp_:
+        fp_.write(json.dumps(chunks))
+    return lowfn
@@ -6,6 +6,7 @@ Create ssh executor system
 import os
 import copy
 import json
+import binascii
 
 # Import bonneville libs
 import bonneville.client.ssh.shell
@@ -18,6 +19,45 @@ import bonneville.loader
 import bonneville.minion
 
 
+def _exec_pkg(chunks, test=None):
+    '''
+    Run the low state on the remote host. The files it references are
+    shipped in a bundle named after the file set, the bundle is only sent
+    when the host does not have it yet
+    '''
+    file_refs = bonneville.client.ssh.state.lowstate_file_refs(chunks)
+    bundle, key, bundle_sum = bonneville.client.ssh.state.trans_bundle(
+            __opts__,
+            file_refs)
+    remote_bundle = bonneville.client.ssh.state.REMOTE_BUNDLE.format(key)
+    lowfn = bonneville.client.ssh.state.prep_lowstate(chunks)
+    remote_low = '/tmp/.salt/lowstate_{0}.json'.format(
+            binascii.hexlify(os.urandom(8)))
+    cmd = 'state.pkg {0} test={1} pkg_sum={2} hash_type={3} lowstate={4}'.format(
+            remote_bundle,
+            test,
+            bundle_sum,
+            __opts__['hash_type'],
+            remote_low)
+    single = bonneville.client.ssh.Single(
+            __opts__,
+            cmd,
+            **__salt__.kwargs)
+    try:
+        single.shell.send(lowfn, remote_low)
+    finally:
+        os.remove(lowfn)
+    stdout, stderr = single.cmd_block()
+    ret = json.loads(stdout, object_hook=bonneville.utils.decode_dict)
+    data = ret.get('local', ret) if isinstance(ret, dict) else ret
+    if isinstance(data, dict) and '__pkg_missing__' in data:
+        # The host does not have this file set yet
+        single.shell.send(bundle, remote_bundle)
+        stdout, stderr = single.cmd_block()
+        ret = json.loads(stdout, object_hook=bonneville.utils.decode_dict)
+    return ret
+
+
 def sls(mods, env='base', test=None, exclude=None, **kwargs):
     '''
     Create the seed file for a state.sls run
@@ -47,25 +87,7 @@ def sls(mods, env='base', test=None, exclude=None, **kwargs):
         return errors
     # Compile and verify the raw chunks
     chunks = st_.state.compile_high_data(high)
-    file_refs = bonneville.client.ssh.state.lowstate_file_refs(chunks)
-    trans_tar = bonneville.client.ssh.state.prep_trans_tar(
-            __opts__,
-            chunks,
-            file_refs)
-    trans_tar_sum = bonneville.utils.get_hash(trans_tar, __opts__['hash_type'])
-    cmd = 'state.pkg /tmp/.salt/salt_state.tgz test={0} pkg_sum={1} hash_type={2}'.format(
-            test,
-            trans_tar_sum,
-            __opts__['hash_type'])
-    single = bonneville.client.ssh.Single(
-            __opts__,
-            cmd,
-            **__salt__.kwargs)
-    single.shell.send(
-            trans_tar,
-            '/tmp/.salt/salt_state.tgz')
-    stdout, stderr = single.cmd_block()
-    return json.loads(stdout, object_hook=bonneville.utils.decode_dict)
+    return _exec_pkg(chunks, test)
 
 
 def low(data):
@@ -84,24 +106,7 @@ def low(data):
     err = st_.verify_data(data)
     if err:
         return err
-    file_refs = bonneville.client.ssh.state.lowstate_file_refs(chunks)
-    trans_tar = bonneville.client.ssh.state.prep_trans_tar(
-            __opts__,
-            chunks,
-            file_refs)
-    trans_tar_sum = bonneville.utils.get_hash(trans_tar, __opts__['hash_type'])
-    cmd = 'state.pkg /tmp/.salt/salt_state.tgz pkg_sum={0} hash_type={1}'.format(
-            trans_tar_sum,
-            __opts__['hash_type'])
-    single = bonneville.client.ssh.Single(
-            __opts__,
-            cmd,
-            **__salt__.kwargs)
-    single.shell.send(
-            trans_tar,
-            '/tmp/.salt/salt_state.tgz')
-    stdout, stderr = single.cmd_block()
-    return json.loads(stdout, object_hook=bonneville.utils.decode_dict)
+    return _exec_pkg(chunks)
 
 
 def high(data):
@@ -116,25 +121,8 @@ def high(data):
         salt '*' state.high '{"vim": {"pkg": ["installed"]}}'
     '''
     st_ = bonneville.client.ssh.state.SSHHighState(__opts__, __pillar__, __salt__)
-    chunks = st_.state.compile_high_data(high)
-    file_refs = bonneville.client.ssh.state.lowstate_file_refs(chunks)
-    trans_tar = bonneville.client.ssh.state.prep_trans_tar(
-            __opts__,
-            chunks,
-            file_refs)
-    trans_tar_sum = bonneville.utils.get_hash(trans_tar, __opts__['hash_type'])
-    cmd = 'state.pkg /tmp/.salt/salt_state.tgz pkg_sum={0} hash_type={1}'.format(
-            trans_tar_sum,
-            __opts__['hash_type'])
-    single = bonneville.client.ssh.Single(
-            __opts__,
-            cmd,
-            **__salt__.kwargs)
-    single.shell.send(
-            trans_tar,
-            '/tmp/.salt/salt_state.tgz')
-    stdout, stderr = single.cmd_block()
-    return json.loads(stdout, object_hook=bonneville.utils.decode_dict)
+    chunks = st_.state.compile_high_data(data)
+    return _exec_pkg(chunks)
 
 
 def highstate(test=None, **kwargs):
@@ -152,25 +140,7 @@ def highstate(test=None, **kwargs):
     '''
     st_ = bonneville.client.ssh.state.SSHHighState(__opts__, __pillar__, __salt__)
     chunks = st_.compile_low_chunks()
-    file_refs = bonneville.client.ssh.state.lowstate_file_refs(chunks)
-    trans_tar = bonneville.client.ssh.state.prep_trans_tar(
-            __opts__,
-            chunks,
-            file_refs)
-    trans_tar_sum = bonneville.utils.get_hash(trans_tar, __opts__['hash_type'])
-    cmd = 'state.pkg /tmp/.salt/salt_state.tgz test={0} pkg_sum={1} hash_type={2}'.format(
-            test,
-            trans_tar_sum,
-            __opts__['hash_type'])
-    single = bonneville.client.ssh.Single(
-            __opts__,
-            cmd,
-            **__salt__.kwargs)
-    single.shell.send(
-            trans_tar,
-            '/tmp/.salt/salt_state.tgz')
-    stdout, stderr = single.cmd_block()
-    return json.loads(stdout, object_hook=bonneville.utils.decode_dict)
+    return _exec_pkg(chunks, test)
 
 
 def top(topfn, test=None, **kwargs):
@@ -192,25 +162,7 @@ def top(topfn, test=None, **kwargs):
     st_ = bonneville.client.ssh.state.SSHHighState(__opts__, __pillar__, __salt__)
     st_.opts['state_top'] = os.path.join('salt://', topfn)
     chunks = st_.compile_low_chunks()
-    file_refs = bonneville.client.ssh.state.lowstate_file_refs(chunks)
-    trans_tar = bonneville.client.ssh.state.prep_trans_tar(
-            __opts__,
-            chunks,
-            file_refs)
-    trans_tar_sum = bonneville.utils.get_hash(trans_tar, __opts__['hash_type'])
-    cmd = 'state.pkg /tmp/.salt/salt_state.tgz test={0} pkg_sum={1} hash_type={2}'.format(
-            test,
-            trans_tar_sum,
-            __opts__['hash_type'])
-    single = bonneville.client.ssh.Single(
-            __opts__,
-            cmd,
-            **__salt__.kwargs)
-    single.shell.send(
-            trans_tar,
-            '/tmp/.salt/salt_state.tgz')
-    stdout, stderr = single.cmd_block()
-    return json.loads(stdout, object_hook=bonneville.utils.decode_dict)
+    return _exec_pkg(chunks, test)
 
 
 def show_highstate():
@@ -56,10 +56,15 @@ VALID_OPTS = {
     'autoload_dynamic_modules': bool,
     'environment': str,
     'state_top': str,
+    'top_cache': bool,
+    'ssh_state_bundles': int,
     'startup_states': str,
     'sls_list': list,
     'top_file': str,
     'file_client': str,
+    'file_list_cache_ttl': int,
+    'file_tree_threads': int,
+    'file_manifest_ttl': int,
     'file_roots': dict,
     'pillar_roots': dict,
     'hash_type': str,
@@ -76,6 +81,8 @@ VALID_OPTS = {
     'clean_dynamic_modules': bool,
     'open_mode': bool,
     'multiprocessing': bool,
+    'job_pool_size': int,
+    'job_pool_isolate': list,
     'mine_interval': int,
     'ipc_mode': str,
     'ipv6': bool,
@@ -90,10 +97,14 @@ VALID_OPTS = {
     'log_fmt_console': str,
     'log_fmt_logfile': tuple,
     'log_granular_levels': dict,
+    'log_queue': bool,
+    'log_queue_size': int,
     'test': bool,
     'cython_enable': bool,
     'state_verbose': bool,
     'state_output': str,
+    'state_aggregate': bool,
+    'pkg_list_cache': bool,
     'acceptance_wait_time': float,
     'acceptance_wait_time_max': float,
     'loop_interval': float,
@@ -117,8 +128,13 @@ VALID_OPTS = {
     'tcp_keepalive_intvl': float,
     'interface': str,
     'publish_port': int,
+    'pub_wave_size': int,
+    'pub_wave_interval': float,
+    'pub_send_timeout': float,
+    'pub_stats_interval': int,
     'auth_mode': int,
     'worker_threads': int,
+    'loader_arena': bool,
     'ret_port': int,
     'keep_jobs': int,
     'master_roots': dict,
@@ -136,8 +152,12 @@ VALID_OPTS = {
     'runner_dirs': list,
     'client_acl': dict,
     'client_acl_blacklist': dict,
+    'acl_cache_ttl': int,
     'external_auth': dict,
     'token_expire': int,
+    'token_store': str,
+    'token_cache_size': int,
+    'token_clean_interval': int,
     'file_recv': bool,
     'file_ignore_regex': bool,
     'file_ignore_glob': bool,
@@ -148,9 +168,17 @@ VALID_OPTS = {
     'master_tops': bool,
     'order_masters': bool,
     'job_cache': bool,
+    'job_index': bool,
+    'key_index': bool,
     'ext_job_cache': str,
     'master_ext_job_cache': str,
     'minion_data_cache': bool,
+    'minion_data_store': str,
+    'batch_cache_max_age': int,
+    'mine_store': bool,
+    'mine_events': bool,
+    'overstate_parallel': int,
+    'overstate_cache_max_age': int,
     'publish_session': int,
     'reactor': list,
     'serial': str,
@@ -164,6 +192,8 @@ VALID_OPTS = {
     'enable_lspci': bool,
     'syndic_wait': int,
     'minion_id_caching': bool,
+    'auth_session_cache': bool,
+    'auth_token_ttl': int,
     'sign_pub_messages': bool,
 }
 
@@ -186,10 +216,14 @@ DEFAULT_MINION_OPTS = {
     'autoload_dynamic_modules': True,
     'environment': None,
     'state_top': 'top.sls',
+    'top_cache': True,
     'startup_states': '',
     'sls_list': [],
     'top_file': '',
     'file_client': 'remote',
+    'file_list_cache_ttl': 10,
+    'file_tree_threads': 4,
+    'file_manifest_ttl': 60,
     'file_roots': {
         'base': [bonneville.syspaths.BASE_FILE_ROOTS_DIR],
     },
@@ -211,6 +245,8 @@ DEFAULT_MINION_OPTS = {
     'clean_dynamic_modules': True,
     'open_mode': False,
     'multiprocessing': True,
+    'job_pool_size': 0,
+    'job_pool_isolate': ['state.*', 'saltutil.*'],
     'mine_interval': 60,
     'ipc_mode': 'ipc',
     'ipv6': False,
@@ -225,12 +261,16 @@ DEFAULT_MINION_OPTS = {
     'log_fmt_console': _DFLT_LOG_FMT_CONSOLE,
     'log_fmt_logfile': _DFLT_LOG_FMT_LOGFILE,
     'log_granular_levels': {},
+    'log_queue': True,
+    'log_queue_size': 10000,
     'test': False,
     'ext_job_cache': '',
     'cython_enable': False,
     'state_verbose': True,
     'state_output': 'full',
     'state_auto_order': True,
+    'state_aggregate': True,
+    'pkg_list_cache': True,
     'acceptance_wait_time': 10,
     'acceptance_wait_time_max': 0,
     'loop_interval': 1,
@@ -253,15 +293,22 @@ DEFAULT_MINION_OPTS = {
     'tcp_keepalive_cnt': -1,
     'tcp_keepalive_intvl': -1,
     'minion_id_caching': True,
+    'auth_session_cache': True,
+    'auth_token_ttl': 3600,
 }
 
 DEFAULT_MASTER_OPTS = {
     'interface': '0.0.0.0',
     'publish_port': '4505',
     'pub_hwm': 1000,
+    'pub_wave_size': 0,
+    'pub_wave_interval': 1.0,
+    'pub_send_timeout': 5.0,
+    'pub_stats_interval': 60,
     'auth_mode': 1,
     'user': 'root',
     'worker_threads': 5,
+    'loader_arena': True,
     'sock_dir': os.path.join(bonneville.syspaths.SOCK_DIR, 'master'),
     'ret_port': '4506',
     'timeout': 5,
@@ -293,8 +340,12 @@ DEFAULT_MASTER_OPTS = {
     'outputter_dirs': [],
     'client_acl': {},
     'client_acl_blacklist': {},
+    'acl_cache_ttl': 10,
     'external_auth': {},
     'token_expire': 43200,
+    'token_store': 'file',
+    'token_cache_size': 1000,
+    'token_clean_interval': 3600,
     'file_recv': False,
     'file_buffer_size': 1048576,
     'file_ignore_regex': None,
@@ -309,14 +360,24 @@ DEFAULT_MASTER_OPTS = {
     'renderer': 'yaml_jinja',
     'failhard': False,
     'state_top': 'top.sls',
+    'top_cache': True,
+    'ssh_state_bundles': 64,
     'master_tops': {},
     'external_nodes': '',
     'order_masters': False,
     'job_cache': True,
+    'job_index': True,
+    'key_index': True,
     'ext_job_cache': '',
     'master_ext_job_cache': '',
     'minion_data_cache': True,
+    'minion_data_store': 'sqlite',
+    'batch_cache_max_age': 0,
+    'overstate_parallel': 1,
+    'overstate_cache_max_age': 0,
     'enforce_mine_cache': False,
+    'mine_store': True,
+    'mine_events': False,
     'ipv6': False,
     'log_file': os.path.join(bonneville.syspaths.LOGS_DIR, 'master'),
     'log_level': None,
@@ -326,6 +387,8 @@ DEFAULT_MASTER_OPTS = {
     'log_fmt_console': _DFLT_LOG_FMT_CONSOLE,
     'log_fmt_logfile': _DFLT_LOG_FMT_LOGFILE,
     'log_granular_levels': {},
+    'log_queue': True,
+    'log_queue_size': 10000,
     'pidfile': os.path.join(bonneville.syspaths.PIDFILE_DIR, 'salt-master.pid'),
     'publish_session': 86400,
     'cluster_masters': [],
@@ -21,6 +21,14 @@ try:
 except ImportError:
     # No need for crypt in local mode
     pass
+try:
+    from cryptography.hazmat.backends import default_backend
+    from cryptography.hazmat.primitives.ciphers import (
+        Cipher, algorithms, modes
+    )
+    HAS_CRYPTOGRAPHY = True
+except ImportError:
+    HAS_CRYPTOGRAPHY = False
 
 # Import bonneville libs
 import bonneville.utils
@@ -33,6 +41,31 @@ from bonneville.exceptions import (
 
 log = logging.getLogger(__name__)
 
+try:
+    from hmac import compare_digest as _compare_digest
+except ImportError:
+    # Python < 2.7.7
+    def _compare_digest(digest_a, digest_b):
+        '''
+        Compare two digests in a time which does not depend on their content
+        '''
+        if len(digest_a) != len(digest_b):
+            return False
+        result = 0
+        for byte_a, byte_b in zip(digest_a, digest_b):
+            result |= ord(byte_a) ^ ord(byte_b)
+        return result == 0
+
+# The AES sessions negotiated with the masters, shared by the SAuth objects
+# of the process, by minion id, pki dir and master uri. The job processes
+# forked by the minion inherit the session of the minion.
+_SESSIONS = {}
+# The loaded private keys, by path, with the mtime of the key file
+_KEYS = {}
+# The signed tokens, by key path, key mtime and clear token, with the time
+# they were signed
+_TOKENS = {}
+
 
 def dropfile(cachedir, user=None):
     '''
@@ -111,6 +144,32 @@ def gen_keys(keydir, keyname, keysize, user=None):
     return priv
 
 
+def _session_key(opts):
+    return (opts.get('id'), opts['pki_dir'], opts.get('master_uri'))
+
+
+def set_session(opts, aes, publish_port=None):
+    '''
+    Share a negotiated AES session with the SAuth objects of the process
+    '''
+    if not opts.get('auth_session_cache', True):
+        return None
+    crypticle = Crypticle(opts, aes)
+    _SESSIONS[_session_key(opts)] = {'aes': aes,
+                                     'crypticle': crypticle,
+                                     'publish_port': publish_port}
+    return crypticle
+
+
+def clear_sessions():
+    '''
+    Drop the shared AES sessions, signed tokens and loaded keys
+    '''
+    _SESSIONS.clear()
+    _KEYS.clear()
+    _TOKENS.clear()
+
+
 def sign_message(privkey_path, message):
     '''
     Use M2Crypto's EVP ("Envelope") functions to sign a message.  Returns the signature.
@@ -211,24 +270,39 @@ class Auth(object):
         user = self.opts.get('user', 'root')
         bonneville.utils.verify.check_path_traversal(self.opts['pki_dir'], user)
 
-        if os.path.exists(self.rsa_path):
-            key = RSA.load_key(self.rsa_path)
-            log.debug('Loaded minion key: {0}'.format(self.rsa_path))
-        else:
+        if not os.path.exists(self.rsa_path):
             log.info('Generating keys: {0}'.format(self.opts['pki_dir']))
             gen_keys(self.opts['pki_dir'],
                      'minion',
                      4096,
                      self.opts.get('user'))
-            key = RSA.load_key(self.rsa_path)
+        mtime = os.path.getmtime(self.rsa_path)
+        cached = _KEYS.get(self.rsa_path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        key = RSA.load_key(self.rsa_path)
+        log.debug('Loaded minion key: {0}'.format(self.rsa_path))
+        _KEYS[self.rsa_path] = (mtime, key)
         return key
 
     def gen_token(self, clear_tok):
         '''
         Encrypt a string with the minion private key to verify identity
-        with the master.
+        with the master. The signed tokens are kept for
+        ``auth_token_ttl`` seconds.
         '''
-        return self.get_keys().private_encrypt(clear_tok, 5)
+        key = self.get_keys()
+        ttl = self.opts.get('auth_token_ttl', 0)
+        if not ttl:
+            return key.private_encrypt(clear_tok, 5)
+        cache_key = (self.rsa_path, _KEYS[self.rsa_path][0], clear_tok)
+        now = time.time()
+        cached = _TOKENS.get(cache_key)
+        if cached is not None and now - cached[1] < ttl:
+            return cached[0]
+        tok = key.private_encrypt(clear_tok, 5)
+        _TOKENS[cache_key] = (tok, now)
+        return tok
 
     def minion_sign_in_payload(self):
         '''
@@ -411,6 +485,68 @@ class Auth(object):
         return auth
 
 
+class _PyCryptoCipher(object):
+    '''
+    AES-CBC through PyCrypto
+    '''
+    name = 'pycrypto'
+
+    @staticmethod
+    def available():
+        return 'AES' in globals()
+
+    def encrypt(self, key, iv_bytes, data):
+        return AES.new(key, AES.MODE_CBC, iv_bytes).encrypt(data)
+
+    def decrypt(self, key, iv_bytes, data):
+        return AES.new(key, AES.MODE_CBC, iv_bytes).decrypt(data)
+
+
+class _CryptographyCipher(object):
+    '''
+    AES-CBC through the cryptography library, which runs on OpenSSL and uses
+    the AES instructions of the CPU when there are some
+    '''
+    name = 'cryptography'
+
+    @staticmethod
+    def available():
+        return HAS_CRYPTOGRAPHY
+
+    def _cipher(self, key, iv_bytes):
+        return Cipher(algorithms.AES(key),
+                      modes.CBC(iv_bytes),
+                      backend=default_backend())
+
+    def encrypt(self, key, iv_bytes, data):
+        encryptor = self._cipher(key, iv_bytes).encryptor()
+        return encryptor.update(data) + encryptor.finalize()
+
+    def decrypt(self, key, iv_bytes, data):
+        decryptor = self._cipher(key, iv_bytes).decryptor()
+        return decryptor.update(data) + decryptor.finalize()
+
+
+# The AES-CBC implementations, in order of preference. They all produce the
+# same messages, the minions and the master can use different ones.
+CIPHER_BACKENDS = [_CryptographyCipher(), _PyCryptoCipher()]
+
+
+def cipher_backend(name=None):
+    '''
+    Return the AES-CBC implementation with the given name, the fastest
+    available one by default
+    '''
+    for backend in CIPHER_BACKENDS:
+        if name in (None, backend.name) and backend.available():
+            return backend
+    if name is None:
+        raise SaltClientError('No AES cipher backend is available')
+    raise SaltClientError(
+        'The AES cipher backend {0!r} is not available'.format(name)
+    )
+
+
 class Crypticle(object):
     '''
     Authenticated encryption class
@@ -423,10 +559,20 @@ class Crypticle(object):
     AES_BLOCK_SIZE = 16
     SIG_SIZE = hashlib.sha256().digest_size
 
-    def __init__(self, opts, key_string, key_size=192):
+    def __init__(self, opts, key_string, key_size=192, backend=None):
         self.keys = self.extract_keys(key_string, key_size)
         self.key_size = key_size
         self.serial = bonneville.payload.Serial(opts)
+        self._backend = backend
+
+    @property
+    def backend(self):
+        '''
+        The AES-CBC implementation, looked up on first use
+        '''
+        if self._backend is None or isinstance(self._backend, str):
+            self._backend = cipher_backend(self._backend)
+        return self._backend
 
     @classmethod
     def generate_key_string(cls, key_size=192):
@@ -439,67 +585,128 @@ class Crypticle(object):
         assert len(key) == key_size / 8 + cls.SIG_SIZE, 'invalid key'
         return key[:-cls.SIG_SIZE], key[-cls.SIG_SIZE:]
 
-    def encrypt(self, data):
+    def encrypt(self, data, prefix=''):
         '''
-        encrypt data with AES-CBC and sign it with HMAC-SHA256
+        encrypt data with AES-CBC and sign it with HMAC-SHA256, the prefix
+        is encrypted in front of the data
         '''
         aes_key, hmac_key = self.keys
-        pad = self.AES_BLOCK_SIZE - len(data) % self.AES_BLOCK_SIZE
-        data = data + pad * chr(pad)
+        pad = self.AES_BLOCK_SIZE - \
+            (len(prefix) + len(data)) % self.AES_BLOCK_SIZE
         iv_bytes = os.urandom(self.AES_BLOCK_SIZE)
-        cypher = AES.new(aes_key, AES.MODE_CBC, iv_bytes)
-        data = iv_bytes + cypher.encrypt(data)
-        sig = hmac.new(hmac_key, data, hashlib.sha256).digest()
-        return data + sig
+        data = self.backend.encrypt(
+            aes_key, iv_bytes, ''.join((prefix, data, pad * chr(pad)))
+        )
+        mac = hmac.new(hmac_key, iv_bytes, hashlib.sha256)
+        mac.update(data)
+        return ''.join((iv_bytes, data, mac.digest()))
 
-    def decrypt(self, data):
+    def _decrypt(self, data):
         '''
-        verify HMAC-SHA256 signature and decrypt data with AES-CBC
+        verify HMAC-SHA256 signature and decrypt data with AES-CBC, return
+        the padded clear data and the length of the padding
         '''
         aes_key, hmac_key = self.keys
-        sig = data[-self.SIG_SIZE:]
-        data = data[:-self.SIG_SIZE]
-        mac_bytes = hmac.new(hmac_key, data, hashlib.sha256).digest()
-        if len(mac_bytes) != len(sig):
+        size = len(data) - self.SIG_SIZE
+        if size < self.AES_BLOCK_SIZE * 2 or size % self.AES_BLOCK_SIZE:
             log.debug('Failed to authenticate message')
             raise AuthenticationError('message authentication failed')
-        result = 0
-        for zipped_x, zipped_y in zip(mac_bytes, sig):
-            result |= ord(zipped_x) ^ ord(zipped_y)
-        if result != 0:
+        view = memoryview(data)
+        mac_bytes = hmac.new(hmac_key, view[:size], hashlib.sha256).digest()
+        if not _compare_digest(mac_bytes, data[size:]):
             log.debug('Failed to authenticate message')
             raise AuthenticationError('message authentication failed')
-        iv_bytes = data[:self.AES_BLOCK_SIZE]
-        data = data[self.AES_BLOCK_SIZE:]
-        cypher = AES.new(aes_key, AES.MODE_CBC, iv_bytes)
-        data = cypher.decrypt(data)
-        return data[:-ord(data[-1])]
+        data = self.backend.decrypt(aes_key,
+                                    data[:self.AES_BLOCK_SIZE],
+                                    data[self.AES_BLOCK_SIZE:size])
+        return data, ord(data[-1])
+
+    def decrypt(self, data):
+        '''
+        verify HMAC-SHA256 signature and decrypt data with AES-CBC
+        '''
+        data, pad = self._decrypt(data)
+        return data[:-pad]
 
     def dumps(self, obj):
         '''
         Serialize and encrypt a python object
         '''
-        return self.encrypt(self.PICKLE_PAD + self.serial.dumps(obj))
+        return self.encrypt(self.serial.dumps(obj), self.PICKLE_PAD)
 
     def loads(self, data):
         '''
         Decrypt and un-serialize a python object
         '''
-        data = self.decrypt(data)
+        data, pad = self._decrypt(data)
         # simple integrity check to verify that we got meaningful data
         if not data.startswith(self.PICKLE_PAD):
             return {}
-        return self.serial.loads(data[len(self.PICKLE_PAD):])
+        return self.serial.loads(data[len(self.PICKLE_PAD):-pad])
 
 
 class SAuth(Auth):
     '''
     Set up an object to maintain the standalone authentication session
-    with the salt master
+    with the salt master. Unless ``auth_session_cache`` is disabled, the
+    session negotiated by the minion or by the first SAuth object of the
+    process is reused, no new sign in is made until the master rotates its
+    AES key.
     '''
     def __init__(self, opts):
         super(SAuth, self).__init__(opts)
-        self.crypticle = self.__authenticate()
+        session = None
+        if self.opts.get('auth_session_cache', True):
+            session = _SESSIONS.get(_session_key(self.opts))
+        if session is not None:
+            self.crypticle = session['crypticle']
+        else:
+            self.crypticle = self.__authenticate()
+
+    def renew(self):
+        '''
+        Renew the session after the master rotated its AES key. If another
+        SAuth object already renewed the shared session since this one got
+        its key, that session is used without signing in again.
+        '''
+        session = None
+        if self.opts.get('auth_session_cache', True):
+            session = _SESSIONS.get(_session_key(self.opts))
+        if session is not None and session['crypticle'] is not self.crypticle:
+            self.crypticle = session['crypticle']
+        else:
+            self.crypticle = self.__authenticate()
+        return self.crypticle
+
+    def crypted_transfer(self, load, tries=3, timeout=60, sreq=None,
+                         decrypt=True):
+        '''
+        Send an AES encrypted load to the master and return the reply,
+        decrypted unless decrypt is False.
+
+        A master which can not decrypt the load, because it rotated its AES
+        key since the session was negotiated, replies with an empty string.
+        The session is then renewed and the load sent again, once, as it is
+        when the reply can not be decrypted.
+        '''
+        if sreq is None:
+            sreq = bonneville.payload.SREQ(self.opts['master_uri'])
+
+        def _do_transfer():
+            ret = sreq.send('aes', self.crypticle.dumps(load), tries, timeout)
+            if ret == '':
+                raise AuthenticationError(
+                    'The master could not decrypt the request'
+                )
+            if decrypt:
+                return self.crypticle.loads(ret)
+            return ret
+        try:
+            return _do_transfer()
+        except AuthenticationError:
+            log.debug('Renewing the AES session with the master')
+            self.renew()
+            return _do_transfer()
 
     def __authenticate(self):
         '''
@@ -521,4 +728,9 @@ class SAuth(Auth):
                 time.sleep(self.opts['acceptance_wait_time'])
                 continue
             break
-        return Crypticle(self.opts, creds['aes'])
+        crypticle = set_session(
+            self.opts, creds['aes'], creds['publish_port']
+        )
+        if crypticle is None:
+            crypticle = Crypticle(self.opts, creds['aes'])
+        return crypticle
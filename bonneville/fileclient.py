@@ -5,12 +5,15 @@ Classes that manage file clients
 
 # Import python libs
 import contextlib
+import filecmp
 import logging
 import hashlib
 import os
 import shutil
 import string
 import subprocess
+import threading
+import time
 
 # Import third party libs
 import yaml
@@ -25,7 +28,7 @@ import bonneville.utils
 import bonneville.utils.templates
 import bonneville.utils.gzip_util
 from bonneville._compat import (
-    URLError, HTTPError, BaseHTTPServer, urlparse, urlunparse, url_open,
+    Queue, URLError, HTTPError, BaseHTTPServer, urlparse, urlunparse, url_open,
     url_passwd_mgr, url_auth_handler, url_build_opener, url_install_opener)
 
 log = logging.getLogger(__name__)
@@ -137,6 +140,13 @@ class Client(object):
             ret.append(self.cache_file('salt://{0}'.format(path), env))
         return ret
 
+    def cache_tree(self, path, env='base', gzip=None):
+        '''
+        Download the files of a directory in bulk, returns None if the file
+        client cannot
+        '''
+        return None
+
     def cache_dir(self, path, env='base', include_empty=False):
         '''
         Download all of the files in a subdir of the master
@@ -154,11 +164,15 @@ class Client(object):
                 path, env
             )
         )
-        #go through the list of all files finding ones that are in
-        #the target directory and caching them
-        ret.extend([self.cache_file('salt://' + fn_, env)
-                    for fn_ in self.file_list(env)
-                    if fn_.strip() and fn_.startswith(path)])
+        tree = self.cache_tree('salt://' + path, env)
+        if tree is not None:
+            ret.extend(sorted(tree.values()))
+        else:
+            #go through the list of all files finding ones that are in
+            #the target directory and caching them
+            ret.extend([self.cache_file('salt://' + fn_, env)
+                        for fn_ in self.file_list(env)
+                        if fn_.strip() and fn_.startswith(path)])
 
         if include_empty:
             # Break up the path into a list containing the bottom-level
@@ -316,8 +330,16 @@ class Client(object):
         else:
             prefix = separated[0]
 
+        # Fetch the changed files of the directory in bulk first, they are
+        # then copied from the minion file cache
+        tree = self.cache_tree('salt://{0}'.format(path), env, gzip)
+        if tree is None:
+            tree = {}
+            files = self.file_list(env)
+        else:
+            files = sorted(tree)
         # Copy files from master
-        for fn_ in self.file_list(env):
+        for fn_ in files:
             if fn_.startswith(path):
                 # Prevent files in "salt://foobar/" (or salt://foo.sh) from
                 # matching a path of "salt://foo"
@@ -329,10 +351,19 @@ class Client(object):
                 # Remove the leading directories from path to derive
                 # the relative path on the minion.
                 minion_relpath = string.lstrip(fn_[len(prefix):], '/')
+                minion_dest = '{0}/{1}'.format(dest, minion_relpath)
+                if fn_ in tree:
+                    if not os.path.isdir(os.path.dirname(minion_dest)):
+                        os.makedirs(os.path.dirname(minion_dest))
+                    if not os.path.isfile(minion_dest) or not filecmp.cmp(
+                            tree[fn_], minion_dest, shallow=False):
+                        shutil.copyfile(tree[fn_], minion_dest)
+                    ret.append(minion_dest)
+                    continue
                 ret.append(
                     self.get_file(
                         'salt://{0}'.format(fn_),
-                        '{0}/{1}'.format(dest, minion_relpath),
+                        minion_dest,
                         True, env, gzip
                     )
                 )
@@ -642,26 +673,24 @@ class RemoteClient(Client):
         Client.__init__(self, opts)
         self.auth = bonneville.crypt.SAuth(opts)
         self.sreq = bonneville.payload.SREQ(self.opts['master_uri'])
+        # The file lists of the master, by env and kind of list
+        self.list_cache = {}
+        # The file list versions of the master, by env
+        self.list_versions = {}
+        # The manifests of the directories fetched in bulk, by env and
+        # directory
+        self.manifests = {}
 
-    def _crypted_transfer(self, load, tries=3, timeout=60, payload='aes'):
+    def _crypted_transfer(self, load, tries=3, timeout=60, sreq=None):
         '''
         In case of authentication errors, try to renegotiate authentication
         and retry the method.
         Indeed, we can fail too early in case of a master restart during a
         minion state execution call
         '''
-        def _do_transfer():
-            return self.auth.crypticle.loads(
-                self.sreq.send(payload,
-                               self.auth.crypticle.dumps(load),
-                               tries,
-                               timeout)
-            )
-        try:
-            return _do_transfer()
-        except bonneville.crypt.AuthenticationError:
-            self.auth = bonneville.crypt.SAuth(self.opts)
-            return _do_transfer()
+        if sreq is None:
+            sreq = self.sreq
+        return self.auth.crypted_transfer(load, tries, timeout, sreq)
 
     def get_file(self, path, dest='', makedirs=False, env='base', gzip=None):
         '''
@@ -675,6 +704,10 @@ class RemoteClient(Client):
         dest2check = dest
         if not dest2check:
             rel_path = self._check_proto(path)
+            if rel_path.startswith('|'):
+                # The path arguments are escaped, the file is cached under
+                # its plain path
+                rel_path = rel_path[1:]
             with self._cache_loc(rel_path, env) as cache_dest:
                 dest2check = cache_dest
 
@@ -755,41 +788,316 @@ class RemoteClient(Client):
             log.info('Fetching file ** done ** \'{0}\''.format(path))
         return dest
 
-    def file_list(self, env='base', prefix=''):
+    def _list_cache_path(self, env, cmd):
         '''
-        List the files on the master
+        Return the path of the on-disk copy of a master file list
+        '''
+        return os.path.join(
+            self.opts['cachedir'], 'file_lists', env, '{0}.p'.format(cmd)
+        )
+
+    def _read_list_cache(self, env, cmd):
+        '''
+        Read a master file list cached by an earlier run
+        '''
+        path = self._list_cache_path(env, cmd)
+        if not os.path.isfile(path):
+            return None
+        try:
+            with bonneville.utils.fopen(path, 'rb') as fp_:
+                data = self.serial.load(fp_)
+        except Exception:
+            return None
+        if not isinstance(data, dict) or 'version' not in data:
+            return None
+        return {'version': data['version'],
+                'data': data.get('data', []),
+                'checked': 0}
+
+    def _write_list_cache(self, env, cmd, entry):
         '''
+        Keep a copy of a master file list for the next runs
+        '''
+        path = self._list_cache_path(env, cmd)
+        try:
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            tmp_path = '{0}.{1}'.format(path, os.getpid())
+            with bonneville.utils.fopen(tmp_path, 'wb+') as fp_:
+                self.serial.dump(
+                    {'version': entry['version'], 'data': entry['data']}, fp_
+                )
+            os.rename(tmp_path, path)
+        except (IOError, OSError) as exc:
+            log.debug('Failed to cache the master file list: {0}'.format(exc))
+
+    def _list_version(self, env, now):
+        '''
+        Return the version of the file lists of the master, None if the
+        master cannot tell
+        '''
+        ttl = self.opts.get('file_list_cache_ttl', 0)
+        checked, version = self.list_versions.get(env, (0, None))
+        if now - checked < ttl:
+            return version
         load = {'env': env,
-                'prefix': prefix,
-                'cmd': '_file_list'}
+                'cmd': '_file_list_version'}
         try:
-            return self._crypted_transfer(load)
+            version = self._crypted_transfer(load)
         except SaltReqTimeoutError:
-            return ''
+            version = None
+        if not isinstance(version, basestring):
+            # Masters without file list versions return False
+            version = None
+        self.list_versions[env] = (now, version)
+        return version
+
+    def _cached_list(self, cmd, env, prefix):
+        '''
+        Return a file list of the master, the full list of the environment
+        is cached and reused as long as the master reports the same file
+        list version. Lists are revalidated at most every
+        ``file_list_cache_ttl`` seconds.
+        '''
+        now = time.time()
+        ttl = self.opts.get('file_list_cache_ttl', 0)
+        key = (env, cmd)
+        entry = self.list_cache.get(key)
+        if entry is None:
+            entry = self._read_list_cache(env, cmd)
+        if entry is None or now - entry['checked'] >= ttl:
+            version = self._list_version(env, now)
+            if (entry is not None
+                    and version is not None
+                    and entry['version'] == version):
+                entry['checked'] = now
+            else:
+                load = {'env': env,
+                        'prefix': '',
+                        'cmd': cmd}
+                try:
+                    data = self._crypted_transfer(load)
+                except SaltReqTimeoutError:
+                    return ''
+                if not isinstance(data, list):
+                    # Error from the master, do not cache it
+                    return data
+                entry = {'version': version,
+                         'data': data,
+                         'checked': now}
+                if version is not None:
+                    self._write_list_cache(env, cmd, entry)
+        self.list_cache[key] = entry
+        prefix = prefix.strip('/')
+        if not prefix:
+            return list(entry['data'])
+        return [fn_ for fn_ in entry['data'] if fn_.startswith(prefix)]
+
+    def file_list(self, env='base', prefix=''):
+        '''
+        List the files on the master
+        '''
+        return self._cached_list('_file_list', env, prefix)
 
     def file_list_emptydirs(self, env='base', prefix=''):
         '''
         List the empty dirs on the master
         '''
-        load = {'env': env,
-                'prefix': prefix,
-                'cmd': '_file_list_emptydirs'}
-        try:
-            self._crypted_transfer(load)
-        except SaltReqTimeoutError:
-            return ''
+        return self._cached_list('_file_list_emptydirs', env, prefix)
 
     def dir_list(self, env='base', prefix=''):
         '''
         List the dirs on the master
         '''
+        return self._cached_list('_dir_list', env, prefix)
+
+    def file_manifest(self, env='base', prefix=''):
+        '''
+        Return the hash, size and mode of the files under a directory of the
+        master, by path. Returns None if the master cannot tell.
+        '''
+        prefix = prefix.strip('/')
         load = {'env': env,
                 'prefix': prefix,
-                'cmd': '_dir_list'}
+                'cmd': '_file_manifest'}
         try:
-            return self._crypted_transfer(load)
+            manifest = self._crypted_transfer(load)
         except SaltReqTimeoutError:
-            return ''
+            return None
+        if not isinstance(manifest, dict):
+            # Masters without manifests return False
+            return None
+        self.manifests[(env, prefix)] = (time.time(), manifest)
+        return manifest
+
+    def _manifest_entry(self, path, env):
+        '''
+        Return the manifest entry of a file from a recent manifest covering
+        it, an empty dict if the file is not on the master, or None if no
+        recent manifest covers the file
+        '''
+        if not self.manifests:
+            return None
+        if path.startswith('|'):
+            path = path[1:]
+        elif '?' in path:
+            # The path may carry arguments
+            return None
+        ttl = self.opts.get('file_manifest_ttl', 0)
+        now = time.time()
+        for (menv, prefix), (stamp, manifest) in self.manifests.items():
+            if menv != env or now - stamp >= ttl:
+                continue
+            if prefix and not path.startswith(prefix + '/'):
+                continue
+            return manifest.get(path, {})
+        return None
+
+    def _tree_sreq(self):
+        '''
+        Return a new connection to the master, for a bulk transfer thread
+        '''
+        return bonneville.payload.SREQ(self.opts['master_uri'])
+
+    def _serve_files(self, batches, env, gzip):
+        '''
+        Fetch batches of small files with ``_serve_files``, in up to
+        ``file_tree_threads`` threads each with its own connection to the
+        master. Returns the dict of the fetched file contents, by path, the
+        list of the paths left to fetch one by one and the list of the paths
+        gone from the master.
+        '''
+        work = Queue.Queue()
+        for batch in batches:
+            work.put(batch)
+        fetched = {}
+        left = []
+        missing = []
+
+        def _fetch():
+            sreq = self._tree_sreq()
+            try:
+                while True:
+                    try:
+                        pending = work.get_nowait()
+                    except Queue.Empty:
+                        return
+                    while pending:
+                        load = {'env': env,
+                                'paths': pending,
+                                'cmd': '_serve_files'}
+                        if gzip:
+                            load['gzip'] = int(gzip)
+                        try:
+                            ret = self._crypted_transfer(load, sreq=sreq)
+                        except Exception as exc:
+                            log.debug(
+                                'Bulk file transfer failed: {0}'.format(exc)
+                            )
+                            ret = None
+                        if not isinstance(ret, dict) or 'files' not in ret:
+                            left.extend(pending)
+                            break
+                        for path, data in ret['files'].items():
+                            if ret.get('gzip'):
+                                data = bonneville.utils.gzip_util.uncompress(
+                                    data
+                                )
+                            fetched[path] = data
+                        left.extend(ret.get('large', []))
+                        missing.extend(ret.get('missing', []))
+                        done = set(ret['files'])
+                        done.update(ret.get('large', []))
+                        done.update(ret.get('missing', []))
+                        if not done:
+                            left.extend(pending)
+                            break
+                        pending = [fn_ for fn_ in pending if fn_ not in done]
+            finally:
+                sreq.destroy()
+
+        threads = []
+        count = min(self.opts.get('file_tree_threads', 1), len(batches))
+        for _ in range(count):
+            thread = threading.Thread(target=_fetch)
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
+        return fetched, left, missing
+
+    def cache_tree(self, path, env='base', gzip=None):
+        '''
+        Download the files of a directory of the master which are missing or
+        differ in the minion file cache. A single request returns the
+        manifest of the directory, the small files are then fetched packed
+        together. Returns the dict of the cache paths, by master path, or
+        None if the master does not serve manifests.
+        '''
+        if self.opts.get('file_tree_threads', 1) < 1:
+            return None
+        path = self._check_proto(path).strip('/')
+        manifest = self.file_manifest(env, path)
+        if manifest is None:
+            return None
+        ret = {}
+        small = []
+        large = []
+        for fn_, entry in sorted(manifest.items()):
+            with self._cache_loc(fn_, env) as cache_dest:
+                ret[fn_] = cache_dest
+            if os.path.isfile(cache_dest):
+                hsum = bonneville.utils.get_hash(
+                    cache_dest, form=entry['hash_type'], chunk_size=65536
+                )
+                if hsum == entry['hsum']:
+                    continue
+            if entry['size'] <= self.opts['file_buffer_size']:
+                small.append(fn_)
+            else:
+                large.append(fn_)
+        # Batches of about file_buffer_size bytes
+        batches = []
+        batch = []
+        size = 0
+        for fn_ in small:
+            if batch and size + manifest[fn_]['size'] > \
+                    self.opts['file_buffer_size']:
+                batches.append(batch)
+                batch = []
+                size = 0
+            batch.append(fn_)
+            size += manifest[fn_]['size']
+        if batch:
+            batches.append(batch)
+        fetched, left, missing = self._serve_files(batches, env, gzip)
+        for fn_ in missing:
+            ret.pop(fn_, None)
+        for fn_, data in fetched.items():
+            entry = manifest[fn_]
+            if getattr(hashlib, entry['hash_type'])(data).hexdigest() != \
+                    entry['hsum']:
+                # Changed on the master since the manifest was made
+                left.append(fn_)
+                continue
+            dest = ret[fn_]
+            if os.path.isdir(dest):
+                bonneville.utils.rm_rf(dest)
+            tmp_dest = '{0}.{1}'.format(dest, os.getpid())
+            with bonneville.utils.fopen(tmp_dest, 'wb+') as fp_:
+                fp_.write(data)
+            os.rename(tmp_dest, dest)
+        for fn_ in large + left:
+            if not self.get_file('salt://{0}'.format(fn_), '', True, env, gzip):
+                ret.pop(fn_, None)
+        log.info(
+            'Cached directory \'{0}\' for environment \'{1}\', {2} of {3} '
+            'files fetched'.format(
+                path, env, len(small) + len(large), len(manifest)
+            )
+        )
+        return ret
 
     def symlink_list(self, env='base', prefix=''):
         '''
@@ -822,6 +1130,11 @@ class RemoteClient(Client):
                     path, form='md5', chunk_size=4096)
                 ret['hash_type'] = 'md5'
                 return ret
+        entry = self._manifest_entry(path, env)
+        if entry is not None:
+            if not entry:
+                return ''
+            return {'hsum': entry['hsum'], 'hash_type': entry['hash_type']}
         load = {'path': path,
                 'env': env,
                 'cmd': '_file_hash'}
@@ -834,12 +1147,7 @@ class RemoteClient(Client):
         '''
         Return a list of the files in the file server's specified environment
         '''
-        load = {'env': env,
-                'cmd': '_file_list'}
-        try:
-            return self._crypted_transfer(load)
-        except SaltReqTimeoutError:
-            return ''
+        return self.file_list(env)
 
     def master_opts(self):
         '''
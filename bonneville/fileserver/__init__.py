@@ -6,11 +6,15 @@ File server pluggable modules and generic backend functions
 # Import python libs
 import os
 import re
+import stat
+import hashlib
 import fnmatch
 import logging
 
 # Import bonneville libs
 import bonneville.loader
+import bonneville.utils
+import bonneville.utils.gzip_util
 
 log = logging.getLogger(__name__)
 
@@ -31,17 +35,58 @@ def check_env_cache(opts, env_cache):
     return None
 
 
+def _dir_key(path):
+    '''
+    Return the device and inode of a directory, None if it can not be read
+    '''
+    try:
+        st_ = os.stat(path)
+    except OSError:
+        return None
+    return st_.st_dev, st_.st_ino
+
+
+def walk(path):
+    '''
+    Walk a file root like os.walk, following the links to directories as the
+    file lists of the roots backend do. A link to one of its own parent
+    directories is not followed, it is returned with the file names instead.
+    '''
+    key = _dir_key(path)
+    if key is None:
+        return
+    parents = {path: frozenset([key])}
+    for directory, dirnames, filenames in os.walk(path, followlinks=True):
+        seen = parents.pop(directory, frozenset())
+        for dirname in list(dirnames):
+            full = os.path.join(directory, dirname)
+            key = _dir_key(full)
+            if key is None or key in seen:
+                log.debug('Not following the directory loop at {0}'.format(
+                    full))
+                dirnames.remove(dirname)
+                filenames.append(dirname)
+                continue
+            parents[full] = seen.union([key])
+        yield directory, dirnames, filenames
+
+
 def generate_mtime_map(path_map):
     '''
-    Generate a dict of filename -> mtime
+    Generate a dict of filename -> mtime, directories are included so that
+    adding or removing an empty directory changes the map too
     '''
     file_map = {}
     for env, path_list in path_map.items():
         for path in path_list:
-            for directory, dirnames, filenames in os.walk(path):
-                for item in filenames:
+            for directory, dirnames, filenames in walk(path):
+                for item in filenames + dirnames:
                     file_path = os.path.join(directory, item)
-                    file_map[file_path] = os.path.getmtime(file_path)
+                    try:
+                        file_map[file_path] = os.path.getmtime(file_path)
+                    except OSError:
+                        # A broken link
+                        continue
     return file_map
 
 
@@ -50,12 +95,12 @@ def diff_mtime_map(map1, map2):
     Is there a change to the mtime map? return a boolean
     '''
     # check if the file lists are different
-    if cmp(sorted(map1.keys()), sorted(map2.keys())) != 0:
+    if len(map1) != len(map2) or set(map1) != set(map2):
         log.debug('diff_mtime_map: the keys are different')
         return True
 
     # check if the mtimes are the same
-    if cmp(sorted(map1), sorted(map2)) != 0:
+    if map1 != map2:
         log.debug('diff_mtime_map: the maps are different')
         return True
 
@@ -64,6 +109,105 @@ def diff_mtime_map(map1, map2):
     return False
 
 
+class MtimeMap(object):
+    '''
+    An mtime map, like the one built by generate_mtime_map, kept up to date
+    between updates. The names in a directory are only listed again when the
+    mtime of the directory changed, the other entries are only stat'ed.
+    Like :py:func:`walk`, the links to directories are followed unless they
+    point to one of their own parent directories.
+    '''
+    def __init__(self, files=None):
+        # Maps the files and directories to their mtime
+        self.files = files or {}
+        # Maps the directories to their mtime and the names they hold
+        self.dirs = {}
+
+    def _scan(self, directory, files, dirs, parents=None):
+        '''
+        Add the entries under a directory to the files and dirs maps,
+        parents holds the device and inode of the directories above it
+        '''
+        try:
+            st_ = os.stat(directory)
+        except OSError:
+            return
+        mtime = st_.st_mtime
+        if parents is None:
+            parents = frozenset([(st_.st_dev, st_.st_ino)])
+        cached = self.dirs.get(directory)
+        if cached is not None and cached[0] == mtime:
+            names = cached[1]
+        else:
+            try:
+                names = os.listdir(directory)
+            except OSError:
+                names = []
+        dirs[directory] = (mtime, names)
+        for name in names:
+            full = os.path.join(directory, name)
+            try:
+                st_ = os.stat(full)
+            except OSError:
+                continue
+            files[full] = st_.st_mtime
+            if not stat.S_ISDIR(st_.st_mode):
+                continue
+            key = (st_.st_dev, st_.st_ino)
+            if key in parents:
+                log.debug('Not following the directory loop at {0}'.format(
+                    full))
+                continue
+            self._scan(full, files, dirs, parents.union([key]))
+
+    def update(self, path_map):
+        '''
+        Bring the map up to date with the file roots, return the lists of
+        the added, removed and modified paths
+        '''
+        files = {}
+        dirs = {}
+        for path_list in path_map.values():
+            for path in path_list:
+                if path not in dirs:
+                    self._scan(path, files, dirs)
+        added = []
+        modified = []
+        for path, mtime in files.items():
+            old = self.files.get(path)
+            if old is None:
+                added.append(path)
+            elif old != mtime:
+                modified.append(path)
+        removed = [path for path in self.files if path not in files]
+        self.files = files
+        self.dirs = dirs
+        return sorted(added), sorted(removed), sorted(modified)
+
+
+def reap_fileserver_cache_paths(cache_base, path_map, paths, hash_type):
+    '''
+    Remove the cached hashes of the given paths from the file roots, the
+    cache directory follows the same convention as in
+    reap_fileserver_cache_dir
+    '''
+    for env, path_list in path_map.items():
+        for root in path_list:
+            prefix = os.path.join(root, '')
+            for path in paths:
+                if not path.startswith(prefix):
+                    continue
+                cache_path = os.path.join(
+                    cache_base,
+                    env,
+                    '{0}.hash.{1}'.format(path[len(prefix):], hash_type)
+                )
+                try:
+                    os.unlink(cache_path)
+                except OSError:
+                    pass
+
+
 def reap_fileserver_cache_dir(cache_base, find_func):
     '''
     Remove unused cache items assuming the cache directory follows a directory convention:
@@ -305,6 +449,95 @@ class Fileserver(object):
             ret = [f for f in ret if f.startswith(prefix)]
         return sorted(ret)
 
+    def file_manifest(self, load):
+        '''
+        Return the hash, size and mode of the files under a directory, by
+        path, the minions use it to only download the files which changed
+        '''
+        ret = {}
+        if 'env' not in load:
+            return ret
+        prefix = load.get('prefix', '').strip('/')
+        if prefix:
+            prefix += '/'
+        for path in self.file_list({'env': load['env'], 'prefix': prefix}):
+            if not path.startswith(prefix):
+                continue
+            # Escape the path, file names may contain a '?'
+            fnd = self.find_file('|' + path, load['env'])
+            if not fnd.get('back'):
+                continue
+            fstr = '{0}.file_hash'.format(fnd['back'])
+            if fstr not in self.servers:
+                continue
+            hsum = self.servers[fstr]({'path': path, 'env': load['env']}, fnd)
+            if not hsum:
+                continue
+            try:
+                fstat = os.stat(fnd['path'])
+            except OSError:
+                continue
+            ret[path] = {'hsum': hsum['hsum'],
+                         'hash_type': hsum['hash_type'],
+                         'size': fstat.st_size,
+                         'mode': stat.S_IMODE(fstat.st_mode)}
+        return ret
+
+    def serve_files(self, load):
+        '''
+        Serve up several whole files at once, as many as fit in
+        ``file_buffer_size``. The files larger than that are listed under
+        ``large`` and have to be fetched with ``serve_file``, the files which
+        are gone under ``missing``.
+        '''
+        ret = {'files': {},
+               'large': [],
+               'missing': []}
+        if 'paths' not in load or 'env' not in load:
+            return ret
+        gzip = load.get('gzip', None)
+        if gzip:
+            ret['gzip'] = gzip
+        budget = self.opts['file_buffer_size']
+        size = 0
+        for path in load['paths']:
+            fnd = self.find_file('|' + path, load['env'])
+            if not fnd.get('path') or not os.path.isfile(fnd['path']):
+                ret['missing'].append(path)
+                continue
+            fsize = os.path.getsize(fnd['path'])
+            if fsize > budget:
+                ret['large'].append(path)
+                continue
+            if size + fsize > budget:
+                # The remaining files are requested again
+                break
+            with bonneville.utils.fopen(fnd['path'], 'rb') as fp_:
+                data = fp_.read()
+            size += len(data)
+            if gzip and data:
+                data = bonneville.utils.gzip_util.compress(data, gzip)
+            ret['files'][path] = data
+        return ret
+
+    def file_list_version(self, load):
+        '''
+        Return a token which changes whenever the file lists may have
+        changed, the minions use it to validate their cached file lists.
+        Returns None if a backend in use cannot tell, the file lists should
+        not be cached then.
+        '''
+        tokens = []
+        for fsb in self._gen_back(None):
+            fstr = '{0}.file_list_version'.format(fsb)
+            if fstr not in self.servers:
+                return None
+            token = self.servers[fstr](load)
+            if token is None:
+                return None
+            tokens.append('{0}:{1}'.format(fsb, token))
+        return hashlib.md5('|'.join(tokens)).hexdigest()
+
     def symlink_list(self, load):
         '''
         Return a list of symlinked files and dirs
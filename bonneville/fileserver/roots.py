@@ -8,6 +8,7 @@ option.
 
 # Import python libs
 import os
+import hashlib
 import logging
 
 try:
@@ -24,6 +25,14 @@ from bonneville.utils.event import tagify
 
 log = logging.getLogger(__name__)
 
+# The digest of the mtime map, and the mtime and size of the map it was
+# computed from
+_MTIME_MAP_VERSION = {}
+
+# The mtime map kept up to date by the updates run by the master maintenance
+# process
+_MTIME_MAP = {}
+
 
 def find_file(path, env='base', **kwargs):
     '''
@@ -88,52 +97,107 @@ def serve_file(load, fnd):
     return ret
 
 
-def update():
+def _read_mtime_map(mtime_map_path):
     '''
-    When we are asked to update (regular interval) lets reap the cache
+    Return the mtime map written by a previous update
     '''
+    mtime_map = {}
     try:
-        bonneville.fileserver.reap_fileserver_cache_dir(
-            os.path.join(__opts__['cachedir'], 'roots/hash'),
-            find_file
-        )
+        with bonneville.utils.fopen(mtime_map_path, 'rb') as fp_:
+            for line in fp_:
+                file_path, _, mtime = line.rstrip('\n').rpartition(':')
+                try:
+                    mtime_map[file_path] = float(mtime)
+                except ValueError:
+                    continue
     except (IOError, OSError):
-        # Hash file won't exist if no files have yet been served up
         pass
+    return mtime_map
+
 
+def update():
+    '''
+    When we are asked to update (regular interval) lets reap the cache
+
+    The mtime map is kept in memory and updated incrementally, the event
+    fired lists the added, removed and modified paths. The whole hash cache
+    is reaped by the first update, the next ones only reap the hashes of the
+    changed files.
+    '''
+    cache_base = os.path.join(__opts__['cachedir'], 'roots/hash')
     mtime_map_path = os.path.join(__opts__['cachedir'], 'roots/mtime_map')
     # data to send on event
     data = {'changed': False,
             'backend': 'roots'}
 
-    old_mtime_map = {}
-    # if you have an old map, load that
-    if os.path.exists(mtime_map_path):
-        with bonneville.utils.fopen(mtime_map_path, 'rb') as fp_:
-            for line in fp_:
-                file_path, mtime = line.split(':', 1)
-                old_mtime_map[file_path] = mtime
-
-    # generate the new map
-    new_mtime_map = bonneville.fileserver.generate_mtime_map(__opts__['file_roots'])
-
-    # compare the maps, set changed to the return value
-    data['changed'] = bonneville.fileserver.diff_mtime_map(old_mtime_map, new_mtime_map)
-
-    # write out the new map
-    mtime_map_path_dir = os.path.dirname(mtime_map_path)
-    if not os.path.exists(mtime_map_path_dir):
-        os.makedirs(mtime_map_path_dir)
-    with bonneville.utils.fopen(mtime_map_path, 'w') as fp_:
-        for file_path, mtime in new_mtime_map.items():
-            fp_.write('{file_path}:{mtime}\n'.format(file_path=file_path,
-                                                     mtime=mtime))
+    first = 'map' not in _MTIME_MAP
+    if first:
+        try:
+            bonneville.fileserver.reap_fileserver_cache_dir(
+                cache_base,
+                find_file
+            )
+        except (IOError, OSError):
+            # Hash file won't exist if no files have yet been served up
+            pass
+        # if you have an old map, start from it
+        _MTIME_MAP['map'] = bonneville.fileserver.MtimeMap(
+            _read_mtime_map(mtime_map_path)
+        )
+    mtime_map = _MTIME_MAP['map']
+    previous = bool(mtime_map.files)
+    added, removed, modified = mtime_map.update(__opts__['file_roots'])
+    data['changed'] = bool(added or removed or modified)
+    if data['changed'] and previous:
+        data['added'] = added
+        data['removed'] = removed
+        data['modified'] = modified
+        if not first:
+            bonneville.fileserver.reap_fileserver_cache_paths(
+                cache_base,
+                __opts__['file_roots'],
+                removed + modified,
+                __opts__['hash_type']
+            )
+
+    if data['changed'] or not os.path.isfile(mtime_map_path):
+        # write out the new map
+        mtime_map_path_dir = os.path.dirname(mtime_map_path)
+        if not os.path.exists(mtime_map_path_dir):
+            os.makedirs(mtime_map_path_dir)
+        # write to a temporary file first, the map is read by
+        # file_list_version
+        tmp_path = '{0}.{1}'.format(mtime_map_path, os.getpid())
+        with bonneville.utils.fopen(tmp_path, 'w') as fp_:
+            for file_path, mtime in mtime_map.files.items():
+                fp_.write('{0}:{1!r}\n'.format(file_path, mtime))
+        os.rename(tmp_path, mtime_map_path)
 
     # if there is a change, fire an event
     event = bonneville.utils.event.MasterEvent(__opts__['sock_dir'])
     event.fire_event(data, tagify(['roots', 'update'], prefix='fileserver'))
 
 
+def file_list_version(load):
+    '''
+    Return a digest of the mtime map written by ``update``, it changes when
+    files or directories are added, removed or modified in the file roots
+    '''
+    mtime_map_path = os.path.join(__opts__['cachedir'], 'roots/mtime_map')
+    try:
+        stat = os.stat(mtime_map_path)
+    except OSError:
+        # update has not run yet
+        return None
+    key = (stat.st_mtime, stat.st_size)
+    if _MTIME_MAP_VERSION.get('key') != key:
+        with bonneville.utils.fopen(mtime_map_path, 'rb') as fp_:
+            lines = sorted(fp_.readlines())
+        _MTIME_MAP_VERSION['key'] = key
+        _MTIME_MAP_VERSION['version'] = hashlib.md5(''.join(lines)).hexdigest()
+    return _MTIME_MAP_VERSION['version']
+
+
 def file_hash(load, fnd):
     '''
     Return a file hash, the hash type is set in the master config file
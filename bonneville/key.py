@@ -9,13 +9,20 @@ from __future__ import print_function
 import os
 import shutil
 import fnmatch
+import logging
+import sqlite3
 
 # Import bonneville libs
 import bonneville.crypt
 import bonneville.utils
 import bonneville.utils.event
+import bonneville.utils.datastore
+import bonneville.utils.keyindex
+import bonneville.utils.minestore
 from bonneville.utils.event import tagify
 
+log = logging.getLogger(__name__)
+
 
 class KeyCLI(object):
     '''
@@ -314,6 +321,54 @@ class Key(object):
     def __init__(self, opts):
         self.opts = opts
         self.event = bonneville.utils.event.MasterEvent(opts['sock_dir'])
+        self._index = None
+        self._index_failed = False
+
+    @property
+    def index(self):
+        '''
+        The key index, None if it is disabled or cannot be used
+        '''
+        if not self.opts.get('key_index', True) or self._index_failed:
+            return None
+        if self._index is None:
+            self._index = bonneville.utils.keyindex.KeyIndex(self.opts)
+        return self._index
+
+    def _indexed(self, func, *args):
+        '''
+        Bring the key index up to date and run a query against it. Returns
+        None if the index cannot be used, the caller then reads the key
+        directories.
+        '''
+        index = self.index
+        if index is None:
+            return None
+        try:
+            index.sync()
+            return getattr(index, func)(*args)
+        except sqlite3.Error as exc:
+            log.warning(
+                'The key index at {0} cannot be used, reading the key '
+                'directories instead: {1}'.format(index.path, exc)
+            )
+            self._index_failed = True
+            return None
+
+    def _fire_event(self, act, keys):
+        '''
+        Fire a single event for all the keys changed by one operation. The
+        changed keys are in the ``ids`` list, and in ``id`` as well when a
+        single key changed.
+        '''
+        if not keys:
+            return
+        eload = {'result': True,
+                 'act': act,
+                 'ids': keys}
+        if len(keys) == 1:
+            eload['id'] = keys[0]
+        self.event.fire_event(eload, tagify(prefix='key'))
 
     def _check_minions_directories(self):
         '''
@@ -325,17 +380,52 @@ class Key(object):
                                         'minions_rejected')
         return minions_accepted, minions_pre, minions_rejected
 
-    def check_minion_cache(self):
+    def check_minion_cache(self, minions=None):
         '''
-        Check the minion cache to make sure that old minion data is cleared
+        Check the minion cache to make sure that old minion data is cleared.
+        Pass the ids of the keys which were removed from the accepted keys to
+        only check their cache.
         '''
         m_cache = os.path.join(self.opts['cachedir'], 'minions')
+        accepted = set(self.list_status('acc').get('minions', []))
+        if self.opts.get('mine_store') and \
+                os.path.isfile(bonneville.utils.minestore.store_path(self.opts)):
+            minestore = bonneville.utils.minestore.MineStore(self.opts)
+            try:
+                stale = minestore.minions() - accepted
+                if minions is not None:
+                    stale.intersection_update(minions)
+                for minion in stale:
+                    minestore.delete(minion)
+            except sqlite3.Error as exc:
+                log.warning(
+                    'Failed to clear the mine data of removed minions: '
+                    '{0}'.format(exc)
+                )
+        if self.opts.get('minion_data_store', 'sqlite') != 'file' and \
+                os.path.isfile(bonneville.utils.datastore.store_path(self.opts)):
+            datastore = bonneville.utils.datastore.get_store(self.opts)
+            try:
+                stale = datastore.minions() - accepted
+                if minions is not None:
+                    stale.intersection_update(minions)
+                for minion in stale:
+                    datastore.delete(minion)
+            except sqlite3.Error as exc:
+                log.warning(
+                    'Failed to clear the data of removed minions: '
+                    '{0}'.format(exc)
+                )
         if not os.path.isdir(m_cache):
             return
-        keys = self.list_keys()
-        for minion in os.listdir(m_cache):
-            if minion not in keys['minions']:
-                shutil.rmtree(os.path.join(m_cache, minion))
+        if minions is None:
+            minions = os.listdir(m_cache)
+        for minion in minions:
+            if minion in accepted:
+                continue
+            path = os.path.join(m_cache, minion)
+            if os.path.isdir(path):
+                shutil.rmtree(path)
 
     def check_master(self):
         '''
@@ -354,17 +444,18 @@ class Key(object):
         '''
         Accept a glob which to match the of a key and return the key's location
         '''
+        ret = self._indexed('match', match)
+        if ret is None:
+            ret = {}
+            for status, keys in self.list_keys().items():
+                for key in keys:
+                    if fnmatch.fnmatch(key, match):
+                        ret.setdefault(status, []).append(key)
         if full:
-            matches = self.all_keys()
-        else:
-            matches = self.list_keys()
-        ret = {}
-        for status, keys in matches.items():
-            for key in bonneville.utils.isorted(keys):
-                if fnmatch.fnmatch(key, match):
-                    if status not in ret:
-                        ret[status] = []
-                    ret[status].append(key)
+            local = [key for key in self.local_keys()['local']
+                     if fnmatch.fnmatch(key, match)]
+            if local:
+                ret['local'] = local
         return ret
 
     def dict_match(self, match_dict):
@@ -372,12 +463,23 @@ class Key(object):
         Accept a dictionary of keys and return the current state of the
         specified keys
         '''
+        exprs = set()
+        for keys in match_dict.values():
+            exprs.update(keys)
+        found = self._indexed('match_statuses', exprs)
+        if found is None:
+            cur_keys = self.list_keys()
+            found = {}
+            for expr in exprs:
+                found[expr] = set(
+                    keydir for keydir, keys in cur_keys.items()
+                    if fnmatch.filter(keys, expr)
+                )
         ret = {}
-        cur_keys = self.list_keys()
         for status, keys in match_dict.items():
             for key in bonneville.utils.isorted(keys):
                 for keydir in ('minions', 'minions_pre', 'minions_rejected'):
-                    if fnmatch.filter(cur_keys.get(keydir, []), key):
+                    if keydir in found[key]:
                         ret.setdefault(keydir, []).append(key)
         return ret
 
@@ -397,6 +499,9 @@ class Key(object):
         '''
         Return a dict of managed keys and what the key status are
         '''
+        ret = self._indexed('list')
+        if ret is not None:
+            return ret
         acc, pre, rej = self._check_minions_directories()
         ret = {}
         for dir_ in acc, pre, rej:
@@ -418,25 +523,24 @@ class Key(object):
         '''
         Return a dict of managed keys under a named status
         '''
-        acc, pre, rej = self._check_minions_directories()
-        ret = {}
         if match.startswith('acc'):
-            ret[os.path.basename(acc)] = []
-            for fn_ in bonneville.utils.isorted(os.listdir(acc)):
-                if os.path.isfile(os.path.join(acc, fn_)):
-                    ret[os.path.basename(acc)].append(fn_)
+            status = 'minions'
         elif match.startswith('pre') or match.startswith('un'):
-            ret[os.path.basename(pre)] = []
-            for fn_ in bonneville.utils.isorted(os.listdir(pre)):
-                if os.path.isfile(os.path.join(pre, fn_)):
-                    ret[os.path.basename(pre)].append(fn_)
+            status = 'minions_pre'
         elif match.startswith('rej'):
-            ret[os.path.basename(rej)] = []
-            for fn_ in bonneville.utils.isorted(os.listdir(rej)):
-                if os.path.isfile(os.path.join(rej, fn_)):
-                    ret[os.path.basename(rej)].append(fn_)
+            status = 'minions_rejected'
         elif match.startswith('all'):
             return self.all_keys()
+        else:
+            return {}
+        ret = self._indexed('list', (status,))
+        if ret is not None:
+            return ret
+        dir_ = os.path.join(self.opts['pki_dir'], status)
+        ret = {status: []}
+        for fn_ in bonneville.utils.isorted(os.listdir(dir_)):
+            if os.path.isfile(os.path.join(dir_, fn_)):
+                ret[status].append(fn_)
         return ret
 
     def key_str(self, match):
@@ -479,6 +583,7 @@ class Key(object):
         keydirs = ['minions_pre']
         if include_rejected:
             keydirs.append('minions_rejected')
+        accepted = []
         for keydir in keydirs:
             for key in matches.get(keydir, []):
                 try:
@@ -492,12 +597,10 @@ class Key(object):
                                 'minions',
                                 key)
                             )
-                    eload = {'result': True,
-                             'act': 'accept',
-                             'id': key}
-                    self.event.fire_event(eload, tagify(prefix='key'))
+                    accepted.append(key)
                 except (IOError, OSError):
                     pass
+        self._fire_event('accept', accepted)
         return (
             self.name_match(match) if match is not None
             else self.dict_match(matches)
@@ -507,7 +610,8 @@ class Key(object):
         '''
         Accept all keys in pre
         '''
-        keys = self.list_keys()
+        keys = self.list_status('pre')
+        accepted = []
         for key in keys['minions_pre']:
             try:
                 shutil.move(
@@ -520,12 +624,10 @@ class Key(object):
                             'minions',
                             key)
                         )
-                eload = {'result': True,
-                         'act': 'accept',
-                         'id': key}
-                self.event.fire_event(eload, tagify(prefix='key'))
+                accepted.append(key)
             except (IOError, OSError):
                 pass
+        self._fire_event('accept', accepted)
         return self.list_keys()
 
     def delete_key(self, match=None, match_dict=None):
@@ -539,17 +641,16 @@ class Key(object):
             matches = match_dict
         else:
             matches = {}
+        deleted = []
         for status, keys in matches.items():
             for key in keys:
                 try:
                     os.remove(os.path.join(self.opts['pki_dir'], status, key))
-                    eload = {'result': True,
-                             'act': 'delete',
-                             'id': key}
-                    self.event.fire_event(eload, tagify(prefix='key'))
+                    deleted.append(key)
                 except (OSError, IOError):
                     pass
-        self.check_minion_cache()
+        self._fire_event('delete', deleted)
+        self.check_minion_cache(deleted)
         bonneville.crypt.dropfile(self.opts['cachedir'], self.opts['user'])
         return (
             self.name_match(match) if match is not None
@@ -560,16 +661,15 @@ class Key(object):
         '''
         Delete all keys
         '''
+        deleted = []
         for status, keys in self.list_keys().items():
             for key in keys:
                 try:
                     os.remove(os.path.join(self.opts['pki_dir'], status, key))
-                    eload = {'result': True,
-                             'act': 'delete',
-                             'id': key}
-                    self.event.fire_event(eload, tagify(prefix='key'))
+                    deleted.append(key)
                 except (OSError, IOError):
                     pass
+        self._fire_event('delete', deleted)
         self.check_minion_cache()
         bonneville.crypt.dropfile(self.opts['cachedir'], self.opts['user'])
         return self.list_keys()
@@ -588,6 +688,7 @@ class Key(object):
         keydirs = ['minions_pre']
         if include_accepted:
             keydirs.append('minions')
+        rejected = []
         for keydir in keydirs:
             for key in matches.get(keydir, []):
                 try:
@@ -601,14 +702,12 @@ class Key(object):
                                 'minions_rejected',
                                 key)
                             )
-                    eload = {'result': True,
-                            'act': 'reject',
-                            'id': key}
-                    self.event.fire_event(eload, tagify(prefix='key'))
+                    rejected.append(key)
                 except (IOError, OSError):
                     pass
+        self._fire_event('reject', rejected)
 
-        self.check_minion_cache()
+        self.check_minion_cache(rejected)
         if include_accepted:
             # Since some of the rejected keys may have already been
             # accepted, we must revoke their auth by generating
@@ -624,7 +723,8 @@ class Key(object):
         '''
         Reject all keys in pre
         '''
-        keys = self.list_keys()
+        keys = self.list_status('pre')
+        rejected = []
         for key in keys['minions_pre']:
             try:
                 shutil.move(
@@ -637,13 +737,11 @@ class Key(object):
                             'minions_rejected',
                             key)
                         )
-                eload = {'result': True,
-                         'act': 'reject',
-                         'id': key}
-                self.event.fire_event(eload, tagify(prefix='key'))
+                rejected.append(key)
             except (IOError, OSError):
                 pass
-        self.check_minion_cache()
+        self._fire_event('reject', rejected)
+        self.check_minion_cache(rejected)
         bonneville.crypt.dropfile(self.opts['cachedir'], self.opts['user'])
         return self.list_keys()
 
@@ -8,6 +8,8 @@ import os
 import imp
 import sys
 import bonneville
+import gc
+import hashlib
 import logging
 import tempfile
 
@@ -15,12 +17,36 @@ import tempfile
 from bonneville.exceptions import LoaderError
 from bonneville.template import check_render_pipe_str
 from bonneville.utils.decorators import Depends
+from bonneville.utils.odict import OrderedDict
 
 log = logging.getLogger(__name__)
 
 SALT_BASE_PATH = os.path.dirname(bonneville.__file__)
 LOADED_BASE_NAME = 'bonneville.loaded'
 
+# Loaded function maps shared by every loader consumer in the process. The
+# arena is only populated once ``preload_arena`` has run, which the master
+# does in its parent process so that the forked workers inherit it. The
+# least recently used entries are dropped past ``_ARENA_SIZE`` entries.
+ARENA = OrderedDict()
+_ARENA_ENABLED = False
+_ARENA_SIZE = 32
+
+# The opts which change what is loaded, along with the ``*_dirs`` and
+# ``disable_*`` opts. The consumers only differing by other opts share the
+# loaded modules.
+_ARENA_KEYS = (
+    'conf_file',
+    'id',
+    'file_client',
+    'file_roots',
+    'pillar_roots',
+    'extension_modules',
+    'whitelist_modules',
+    'providers',
+    'cython_enable',
+)
+
 
 def _create_loader(
         opts,
@@ -148,8 +174,13 @@ def wheels(opts, whitelist=None):
     '''
     Returns the wheels modules
     '''
+    funcs = arena_get(opts, 'wheel', whitelist)
+    if funcs is not None:
+        return funcs
     load = _create_loader(opts, 'wheel', 'wheel')
-    return load.gen_functions(whitelist=whitelist)
+    funcs = load.gen_functions(whitelist=whitelist)
+    arena_set(opts, 'wheel', funcs, whitelist)
+    return funcs
 
 
 def outputters(opts):
@@ -310,10 +341,126 @@ def runner(opts):
     '''
     Directly call a function inside a loader directory
     '''
+    funcs = arena_get(opts, 'runner')
+    if funcs is not None:
+        return funcs
     load = _create_loader(
         opts, 'runners', 'runner', ext_type_dirs='runner_dirs'
     )
-    return load.gen_functions()
+    funcs = load.gen_functions()
+    arena_set(opts, 'runner', funcs)
+    return funcs
+
+
+def _digest_update(hasher, data):
+    '''
+    Feed a stable representation of the data to the hasher, the dicts are
+    walked in the order of their sorted keys
+    '''
+    if isinstance(data, dict):
+        hasher.update('{')
+        for key in sorted(data, key=repr):
+            hasher.update(repr(key))
+            _digest_update(hasher, data[key])
+        hasher.update('}')
+    elif isinstance(data, (list, tuple, set, frozenset)):
+        if isinstance(data, (set, frozenset)):
+            data = sorted(data, key=repr)
+        hasher.update('[')
+        for item in data:
+            _digest_update(hasher, item)
+        hasher.update(']')
+    else:
+        hasher.update(repr(data))
+
+
+def _opts_digest(opts):
+    '''
+    Return a digest of the opts which change what is loaded
+    '''
+    hasher = hashlib.md5()
+    _digest_update(
+        hasher,
+        dict((key, val) for key, val in opts.items()
+             if key in _ARENA_KEYS
+             or key.endswith('_dirs')
+             or key.startswith('disable_'))
+    )
+    return hasher.hexdigest()
+
+
+def _arena_key(opts, kind, whitelist=None):
+    '''
+    Build the arena key for a loader type, loaders are only shared between
+    consumers using the same whitelist and the same opts changing what is
+    loaded, so that a consumer changing ``file_client``, like the state
+    runner, gets modules loaded for its own opts
+    '''
+    if whitelist:
+        whitelist = tuple(sorted(whitelist))
+    return (_opts_digest(opts), kind, whitelist)
+
+
+def arena_active(opts):
+    '''
+    Return True if loaded objects are shared through the arena
+    '''
+    return _ARENA_ENABLED and opts.get('loader_arena', True)
+
+
+def arena_get(opts, kind, whitelist=None):
+    '''
+    Return the object stored in the loader arena for the given loader type,
+    or None if the arena is not active or does not hold it yet
+    '''
+    if not arena_active(opts):
+        return None
+    key = _arena_key(opts, kind, whitelist)
+    value = ARENA.pop(key, None)
+    if value is not None:
+        ARENA[key] = value
+    return value
+
+
+def arena_set(opts, kind, value, whitelist=None):
+    '''
+    Store a loaded object in the arena, this is a no-op unless the arena has
+    been activated by ``preload_arena``
+    '''
+    if not arena_active(opts):
+        return
+    key = _arena_key(opts, kind, whitelist)
+    ARENA.pop(key, None)
+    while len(ARENA) >= _ARENA_SIZE:
+        ARENA.popitem(last=False)
+    ARENA[key] = value
+
+
+def preload_arena(opts):
+    '''
+    Load the modules used by the master side consumers (``MasterMinion``,
+    runners and wheels) once and keep them in the arena. This is meant to be
+    called in the master parent process before the workers are forked, every
+    ``MasterMinion``, ``RunnerClient`` and ``Wheel`` created afterwards reuses
+    the preloaded function maps instead of running its own loader passes.
+    '''
+    global _ARENA_ENABLED
+    if not opts.get('loader_arena', True):
+        return
+    _ARENA_ENABLED = True
+    # Import here to avoid a circular import, bonneville.minion imports us
+    import bonneville.minion
+    log.debug('Preloading the master loader arena')
+    bonneville.minion.MasterMinion(opts)
+    runner(opts)
+    wheels(opts)
+    # Move everything loaded so far out of the tracked generations so the
+    # collector in the forked workers doesn't touch, and therefore copy,
+    # the pages shared with the parent. gc.freeze is only available on
+    # newer interpreters.
+    gc.collect()
+    if hasattr(gc, 'freeze'):
+        gc.freeze()
 
 
 def _generate_module(name):
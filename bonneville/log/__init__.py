@@ -21,8 +21,10 @@ from bonneville.log.setup import (
     is_logfile_configured,
     is_logging_configured,
     is_temp_logging_configured,
+    is_queue_logging_configured,
     setup_temp_logger,
     setup_console_logger,
     setup_logfile_logger,
+    setup_queue_logging,
     set_logger_level,
 )
@@ -14,10 +14,12 @@
 '''
 
 # Import python libs
+import os
 import sys
 import atexit
 import logging
 import threading
+import multiprocessing.util
 
 # Import bonneville libs
 from bonneville._compat import Queue
@@ -89,3 +91,115 @@ class TemporaryLoggingHandler(logging.NullHandler):
                     # it should not handle the log record
                     continue
                 handler.handle(record)
+
+
+class QueueLoggingHandler(logging.Handler, NewStyleClassMixIn):
+    '''
+    This logging handler hands the log records over to a thread which emits
+    them through the wrapped logging handlers, the logging calls never wait
+    on a slow log file or log server.
+
+    When the queue is full the log records are dropped, the number of dropped
+    records is logged once the queue drains. A process forked after the
+    handler was created starts its own queue and thread on its first log
+    record. The ``atexit`` handlers do not run in the multiprocessing
+    children, which leave through ``os._exit``, their queue is emptied by a
+    multiprocessing finalizer instead.
+    '''
+
+    def __init__(self, handlers, max_queue_size=10000):
+        self.__max_queue_size = max_queue_size
+        self.handlers = list(handlers)
+        level = min([handler.level for handler in self.handlers] or
+                    [logging.NOTSET])
+        super(QueueLoggingHandler, self).__init__(level=level)
+        self.__pid = None
+        self.__queue = None
+        self.__thread = None
+        self.dropped = 0
+        self.__parent_pid = os.getpid()
+        atexit.register(self.close)
+
+    def __start(self):
+        self.__pid = os.getpid()
+        self.__queue = Queue.Queue(self.__max_queue_size)
+        self.dropped = 0
+        self.__thread = threading.Thread(target=self.__run)
+        self.__thread.daemon = True
+        self.__thread.start()
+        if self.__pid != self.__parent_pid:
+            # Run after the other finalizers, which may still log
+            multiprocessing.util.Finalize(self, self.__stop, exitpriority=-10)
+
+    def __stop(self):
+        '''
+        Emit the queued log records and stop the thread of this process
+        '''
+        if self.__thread is not None and self.__pid == os.getpid():
+            try:
+                self.__queue.put(None, timeout=1)
+            except Queue.Full:
+                pass
+            self.__thread.join(5)
+            self.__thread = None
+            self.__pid = None
+
+    def __run(self):
+        queue = self.__queue
+        while True:
+            record = queue.get()
+            if record is None:
+                return
+            self.__dispatch(record)
+            if self.dropped and queue.empty():
+                dropped, self.dropped = self.dropped, 0
+                self.__dispatch(logging.LogRecord(
+                    __name__, logging.WARNING, __file__, 0,
+                    'The logging queue was full, %d log records were dropped',
+                    (dropped,), None
+                ))
+
+    def __dispatch(self, record):
+        for handler in self.handlers:
+            if record.levelno < handler.level:
+                continue
+            try:
+                handler.handle(record)
+            except Exception:
+                handler.handleError(record)
+
+    def prepare(self, record):
+        '''
+        Format the message and the exception of the record now, their
+        arguments could change before the thread emits the record
+        '''
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = logging.Formatter().formatException(
+                    record.exc_info
+                )
+            record.exc_info = None
+        return record
+
+    def emit(self, record):
+        if self.__pid != os.getpid():
+            self.__start()
+        try:
+            self.__queue.put_nowait(self.prepare(record))
+        except Queue.Full:
+            self.dropped += 1
+        except Exception:
+            self.handleError(record)
+
+    def flush(self):
+        for handler in self.handlers:
+            handler.flush()
+
+    def close(self):
+        '''
+        Emit the queued log records and stop the thread
+        '''
+        self.__stop()
+        super(QueueLoggingHandler, self).close()
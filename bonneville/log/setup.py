@@ -34,7 +34,9 @@ QUIET = logging.QUIET = 1000
 
 # Import bonneville libs
 from bonneville._compat import string_types
-from bonneville.log.handlers import TemporaryLoggingHandler
+from bonneville.log.handlers import (
+    QueueLoggingHandler, TemporaryLoggingHandler
+)
 from bonneville.log.mixins import LoggingMixInMeta, NewStyleClassMixIn
 
 LOG_LEVELS = {
@@ -63,6 +65,7 @@ __CONSOLE_CONFIGURED = False
 __LOGFILE_CONFIGURED = False
 __TEMP_LOGGING_CONFIGURED = False
 __EXTERNAL_LOGGERS_CONFIGURED = False
+__QUEUE_LOGGING_CONFIGURED = False
 
 
 def is_console_configured():
@@ -85,6 +88,10 @@ def is_extended_logging_configured():
     return __EXTERNAL_LOGGERS_CONFIGURED
 
 
+def is_queue_logging_configured():
+    return __QUEUE_LOGGING_CONFIGURED
+
+
 # Store a reference to the temporary queue logging handler
 LOGGING_NULL_HANDLER = TemporaryLoggingHandler(logging.WARNING)
 
@@ -545,6 +552,39 @@ def setup_extended_logging(opts):
     __EXTERNAL_LOGGERS_CONFIGURED = True
 
 
+def setup_queue_logging(max_queue_size=10000):
+    '''
+    Move the logfile and the additional logging handlers behind a
+    :class:`~bonneville.log.handlers.QueueLoggingHandler`, the log records are
+    then written by a thread. The console handler is left alone so the
+    console output stays in order with what the program prints.
+    '''
+    if is_queue_logging_configured():
+        return
+
+    handlers = []
+    for handler in logging.root.handlers[:]:
+        if handler in (LOGGING_NULL_HANDLER,
+                       LOGGING_STORE_HANDLER,
+                       LOGGING_TEMP_HANDLER):
+            continue
+        if getattr(handler, 'stream', None) in (sys.stderr, sys.stdout):
+            continue
+        handlers.append(handler)
+
+    if not handlers:
+        return
+
+    for handler in handlers:
+        logging.root.removeHandler(handler)
+    logging.root.addHandler(
+        QueueLoggingHandler(handlers, max_queue_size=max_queue_size)
+    )
+
+    global __QUEUE_LOGGING_CONFIGURED
+    __QUEUE_LOGGING_CONFIGURED = True
+
+
 def set_logger_level(logger_name, log_level='error'):
     '''
     Tweak a specific logger's logging level
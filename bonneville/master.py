@@ -14,6 +14,7 @@ import signal
 import shutil
 import stat
 import logging
+import heapq
 import hashlib
 import datetime
 try:
@@ -50,8 +51,15 @@ import bonneville.utils.event
 import bonneville.utils.verify
 import bonneville.utils.minions
 import bonneville.utils.gzip_util
+import bonneville.utils.jobindex
+import bonneville.utils.datastore
+import bonneville.utils.minestore
+import bonneville.utils.pubqueue
+import bonneville.utils.tokenstore
 from bonneville.utils.debug import enable_sigusr1_handler, inspect_stack
-from bonneville.exceptions import SaltMasterError, MasterExit
+from bonneville.exceptions import (
+    SaltMasterError, MasterExit, SaltInvocationError
+)
 from bonneville.utils.event import tagify
 
 # Import halite libs
@@ -190,6 +198,23 @@ class Master(SMaster):
         fileserver = bonneville.fileserver.Fileserver(self.opts)
         runners = bonneville.loader.runner(self.opts)
         schedule = bonneville.utils.schedule.Schedule(self.opts, runners)
+        jobindex = None
+        if self.opts['job_index']:
+            jobindex = bonneville.utils.jobindex.JobIndex(self.opts)
+            if not os.path.isfile(jobindex.path):
+                # Index the jobs cached before the index existed
+                jobindex.rebuild()
+        if self.opts['mine_store']:
+            # Load the mine data cached before the store existed, once
+            bonneville.utils.minestore.MineStore(self.opts).import_files()
+        datastore = None
+        if self.opts['minion_data_cache']:
+            datastore = bonneville.utils.datastore.get_store(self.opts)
+            # Load the minion data cached before the store was used
+            datastore.import_files()
+        compacted = int(time.time())
+        tokens = bonneville.utils.tokenstore.get_store(self.opts)
+        tokens_cleaned = 0
         while True:
             now = int(time.time())
             loop_interval = int(self.opts['loop_interval'])
@@ -212,6 +237,26 @@ class Master(SMaster):
                             elif int(cur) - int(jid[:10]) > \
                                     self.opts['keep_jobs']:
                                 shutil.rmtree(f_path)
+                if jobindex is not None:
+                    jobindex.prune(self.opts['keep_jobs'])
+
+            if now - tokens_cleaned >= self.opts['token_clean_interval']:
+                try:
+                    tokens.clean()
+                except Exception as exc:
+                    log.error(
+                        'Exception %s occurred in token store cleanup', exc
+                    )
+                tokens_cleaned = now
+            if datastore is not None and now - compacted >= 3600:
+                try:
+                    datastore.compact()
+                except Exception as exc:
+                    log.error(
+                        'Exception %s occurred compacting the minion data '
+                        'store', exc
+                    )
+                compacted = now
 
             if self.opts.get('publish_session'):
                 if now - rotate >= self.opts['publish_session']:
@@ -313,6 +358,12 @@ class Master(SMaster):
             )
         if not self.opts['fileserver_backend']:
             errors.append('No fileserver backends are configured')
+        try:
+            bonneville.utils.minions.compile_blacklist(
+                self.opts['client_acl_blacklist']
+            )
+        except SaltInvocationError as exc:
+            errors.append(str(exc))
         if errors:
             for error in errors:
                 log.error(error)
@@ -331,6 +382,9 @@ class Master(SMaster):
         enable_sigusr1_handler()
 
         self.__set_max_open_files()
+        # Load the master side modules once, before any process is forked,
+        # so that every worker shares them
+        bonneville.loader.preload_arena(self.opts)
         clear_old_jobs_proc = multiprocessing.Process(
             target=self._clear_old_jobs)
         clear_old_jobs_proc.start()
@@ -400,14 +454,76 @@ class Publisher(multiprocessing.Process):
         super(Publisher, self).__init__()
         self.opts = opts
 
+    def _report(self, event, queue, drops):
+        '''
+        Fire the counters of the publish queue on the event bus, and warn
+        about the payloads dropped at the high water mark
+        '''
+        stats = queue.pop_stats()
+        if not any(stats.values()):
+            return
+        if stats['pressure']:
+            log.warning(
+                '%s publications were refused at the high water mark, %s '
+                'of them were dropped for some minions, consider raising '
+                'pub_hwm or setting pub_wave_size',
+                stats['pressure'], stats['dropped']
+            )
+        if drops:
+            stats['dropped_jids'] = sorted(drops)
+            drops.clear()
+        event.fire_event(stats, tagify('stats', 'publisher'))
+
+    def _send(self, pub_sock, queue, now, nodrop, drops):
+        '''
+        Send the payloads due, the jids of the publications dropped for the
+        minions at the high water mark are added to drops
+        '''
+        while True:
+            entry = queue.pop(now)
+            if entry is None:
+                return
+            if not nodrop:
+                pub_sock.send(entry[-1], copy=False)
+                queue.sent(entry)
+                continue
+            try:
+                pub_sock.send(entry[-1], zmq.NOBLOCK, copy=False)
+                queue.sent(entry)
+                continue
+            except zmq.Again:
+                if queue.retry(entry, now):
+                    # A wave waits for the pressure to ease, the other
+                    # payloads due are still sent
+                    continue
+            # The publication is sent as a PUB socket would, dropped for
+            # the minions at the high water mark only
+            log.error(
+                'The publication of job %s was dropped for the minions at '
+                'the high water mark', entry[-2]
+            )
+            if entry[-2]:
+                drops.add(entry[-2])
+            pub_sock.setsockopt(zmq.XPUB_NODROP, 0)
+            pub_sock.send(entry[-1], copy=False)
+            pub_sock.setsockopt(zmq.XPUB_NODROP, 1)
+            queue.sent(entry)
+
     def run(self):
         '''
         Bind to the interface specified in the configuration file
         '''
         # Set up the context
         context = zmq.Context(1)
-        # Prepare minion publish socket
-        pub_sock = context.socket(zmq.PUB)
+        # Prepare minion publish socket. With zmq >= 4.1 an XPUB socket
+        # refuses the sends at the high water mark instead of silently
+        # dropping them, so the payloads can be retried and the drops counted
+        nodrop = zmq.zmq_version_info() >= (4, 1)
+        if nodrop:
+            pub_sock = context.socket(zmq.XPUB)
+            pub_sock.setsockopt(zmq.XPUB_NODROP, 1)
+        else:
+            pub_sock = context.socket(zmq.PUB)
         # if 2.1 >= zmq < 3.0, we only have one HWM setting
         try:
             pub_sock.setsockopt(zmq.HWM, self.opts.get('pub_hwm', 1000))
@@ -434,13 +550,54 @@ class Publisher(multiprocessing.Process):
             448
         )
 
+        serial = bonneville.payload.Serial(self.opts)
+        event = bonneville.utils.event.MasterEvent(self.opts['sock_dir'])
+        queue = bonneville.utils.pubqueue.PublishQueue(
+            self.opts['pub_send_timeout']
+        )
+        poller = zmq.Poller()
+        poller.register(pull_sock, zmq.POLLIN)
+        if nodrop:
+            # The subscriptions of the minions are read and ignored
+            poller.register(pub_sock, zmq.POLLIN)
+        # The counters are reported every pub_stats_interval seconds, never
+        # if it is 0
+        interval = self.opts['pub_stats_interval']
+        report = None
+        if interval > 0:
+            report = time.time() + interval
+        drops = set()
+
         try:
             while True:
                 # Catch and handle EINTR from when this process is sent
                 # SIGUSR1 gracefully so we don't choke and die horribly
                 try:
-                    package = pull_sock.recv()
-                    pub_sock.send(package)
+                    now = time.time()
+                    timeout = queue.timeout(now)
+                    if report is not None and (
+                            timeout is None or timeout > report - now):
+                        timeout = max(report - now, 0)
+                    if timeout is not None:
+                        timeout *= 1000
+                    socks = dict(poller.poll(timeout))
+                    now = time.time()
+                    if socks.get(pub_sock) == zmq.POLLIN:
+                        pub_sock.recv(zmq.NOBLOCK)
+                    if socks.get(pull_sock) == zmq.POLLIN:
+                        # The payload is forwarded without being copied
+                        frames = pull_sock.recv_multipart(copy=False)
+                        header = {}
+                        if len(frames) > 1:
+                            header = serial.loads(frames[0].bytes)
+                        queue.push(frames[-1],
+                                   now,
+                                   header.get('delay', 0),
+                                   header.get('jid'))
+                    self._send(pub_sock, queue, now, nodrop, drops)
+                    if report is not None and now >= report:
+                        self._report(event, queue, drops)
+                        report = now + interval
                 except zmq.ZMQError as exc:
                     if exc.errno == errno.EINTR:
                         continue
@@ -596,23 +753,47 @@ class MWorker(multiprocessing.Process):
     def __bind(self):
         '''
         Bind to the local port
+
+        The socket is a dealer which keeps the envelope of every request to
+        route its reply, so the replies to failed authentications can be held
+        back without keeping the worker from serving other requests
         '''
         context = zmq.Context(1)
-        socket = context.socket(zmq.REP)
+        socket = context.socket(zmq.DEALER)
         w_uri = 'ipc://{0}'.format(
             os.path.join(self.opts['sock_dir'], 'workers.ipc')
             )
         log.info('Worker binding to socket {0}'.format(w_uri))
+        poller = zmq.Poller()
+        poller.register(socket, zmq.POLLIN)
+        # A heap of the held back replies and the time they are due
+        deferred = []
         try:
             socket.connect(w_uri)
 
             while True:
                 try:
-                    package = socket.recv()
-                    self._update_aes()
-                    payload = self.serial.loads(package)
-                    ret = self.serial.dumps(self._handle_payload(payload))
-                    socket.send(ret)
+                    timeout = None
+                    if deferred:
+                        timeout = max(
+                            int((deferred[0][0] - time.time()) * 1000), 0
+                        )
+                    if poller.poll(timeout):
+                        frames = socket.recv_multipart()
+                        self._update_aes()
+                        payload = self.serial.loads(frames[-1])
+                        ret = self.serial.dumps(self._handle_payload(payload))
+                        delay = self.clear_funcs.loadauth.pop_delay()
+                        if delay:
+                            heapq.heappush(
+                                deferred,
+                                (time.time() + delay, frames[:-1] + [ret])
+                            )
+                        else:
+                            socket.send_multipart(frames[:-1] + [ret])
+                    now = time.time()
+                    while deferred and deferred[0][0] <= now:
+                        socket.send_multipart(heapq.heappop(deferred)[1])
                 # Properly handle EINTR from SIGUSR1
                 except zmq.ZMQError as exc:
                     if exc.errno == errno.EINTR:
@@ -641,7 +822,7 @@ class MWorker(multiprocessing.Process):
         '''
         Take care of a cleartext command
         '''
-        log.info('Clear payload received with command {cmd}'.format(**load))
+        log.info('Clear payload received with command %s', load['cmd'])
         if load['cmd'].startswith('__'):
             return False
         return getattr(self.clear_funcs, load['cmd'])(load)
@@ -652,7 +833,7 @@ class MWorker(multiprocessing.Process):
         '''
         if load['cmd'].startswith('__'):
             return False
-        log.info('Pubkey payload received with command {cmd}'.format(**load))
+        log.info('Pubkey payload received with command %s', load['cmd'])
 
     def _handle_aes(self, load):
         '''
@@ -665,7 +846,7 @@ class MWorker(multiprocessing.Process):
         if 'cmd' not in data:
             log.error('Received malformed command {0}'.format(data))
             return {}
-        log.info('AES payload received with command {0}'.format(data['cmd']))
+        log.info('AES payload received with command %s', data['cmd'])
         if data['cmd'].startswith('__'):
             return False
         return self.aes_funcs.run_func(data['cmd'], data)
@@ -706,6 +887,8 @@ class MWorker(multiprocessing.Process):
                 self.mkey,
                 self.crypticle)
         self.aes_funcs = AESFuncs(self.opts, self.crypticle)
+        # Failed authentications are delayed by holding back their reply
+        self.clear_funcs.loadauth.defer_failures = True
         self.__bind()
 
 
@@ -730,6 +913,13 @@ class AESFuncs(object):
                 self.opts,
                 states=False,
                 rend=False)
+        self.jobindex = None
+        if self.opts['job_index']:
+            self.jobindex = bonneville.utils.jobindex.JobIndex(self.opts)
+        self.minestore = None
+        if self.opts['mine_store']:
+            self.minestore = bonneville.utils.minestore.MineStore(self.opts)
+        self.datastore = bonneville.utils.datastore.get_store(self.opts)
         self.__setup_fileserver()
 
     def __setup_fileserver(self):
@@ -742,6 +932,9 @@ class AESFuncs(object):
         self._file_list = fs_.file_list
         self._file_list_emptydirs = fs_.file_list_emptydirs
         self._dir_list = fs_.dir_list
+        self._file_list_version = fs_.file_list_version
+        self._file_manifest = fs_.file_manifest
+        self._serve_files = fs_.serve_files
         self._file_envs = fs_.envs
 
     def __verify_minion(self, id_, token):
@@ -953,11 +1146,16 @@ class AESFuncs(object):
         ret = {}
         if not bonneville.utils.verify.valid_id(self.opts, load['id']):
             return ret
-        checker = bonneville.utils.minions.CkMinions(self.opts)
-        minions = checker.check_minions(
+        minions = self.ckminions.check_minions(
                 load['tgt'],
                 load.get('expr_form', 'glob')
                 )
+        if self.minestore is not None:
+            for minion, fdata in self.minestore.get(
+                    load['fun'], minions).items():
+                if fdata:
+                    ret[minion] = fdata
+            return ret
         for minion in minions:
             mine = os.path.join(
                     self.opts['cachedir'],
@@ -973,6 +1171,18 @@ class AESFuncs(object):
                 continue
         return ret
 
+    def _mine_event(self, minion, act, funs):
+        '''
+        Fire an event listing the mine functions of a minion whose data
+        changed, if mine_events is enabled
+        '''
+        if not funs or not self.opts.get('mine_events', False):
+            return
+        self.event.fire_event(
+            {'id': minion, 'act': act, 'funs': sorted(funs)},
+            tagify([minion, act], 'mine')
+        )
+
     def _mine(self, load):
         '''
         Return the mine data
@@ -1001,6 +1211,12 @@ class AESFuncs(object):
             return {}
         load.pop('tok')
         if self.opts.get('minion_data_cache', False) or self.opts.get('enforce_mine_cache', False):
+            if self.minestore is not None:
+                changed = self.minestore.update(
+                    load['id'], load['data'], load.get('clear', False)
+                )
+                self._mine_event(load['id'], 'update', changed)
+                return True
             cdir = os.path.join(self.opts['cachedir'], 'minions', load['id'])
             if not os.path.isdir(cdir):
                 os.makedirs(cdir)
@@ -1044,6 +1260,10 @@ class AESFuncs(object):
             return {}
         load.pop('tok')
         if self.opts.get('minion_data_cache', False) or self.opts.get('enforce_mine_cache', False):
+            if self.minestore is not None:
+                changed = self.minestore.delete(load['id'], load['fun'])
+                self._mine_event(load['id'], 'delete', changed)
+                return True
             cdir = os.path.join(self.opts['cachedir'], 'minions', load['id'])
             if not os.path.isdir(cdir):
                 return True
@@ -1088,6 +1308,10 @@ class AESFuncs(object):
             return {}
         load.pop('tok')
         if self.opts.get('minion_data_cache', False) or self.opts.get('enforce_mine_cache', False):
+            if self.minestore is not None:
+                changed = self.minestore.delete(load['id'])
+                self._mine_event(load['id'], 'delete', changed)
+                return True
             cdir = os.path.join(self.opts['cachedir'], 'minions', load['id'])
             if not os.path.isdir(cdir):
                 return True
@@ -1170,16 +1394,10 @@ class AESFuncs(object):
                 load.get('ext'))
         data = pillar.compile_pillar()
         if self.opts.get('minion_data_cache', False):
-            cdir = os.path.join(self.opts['cachedir'], 'minions', load['id'])
-            if not os.path.isdir(cdir):
-                os.makedirs(cdir)
-            datap = os.path.join(cdir, 'data.p')
-            with bonneville.utils.fopen(datap, 'w+b') as fp_:
-                fp_.write(
-                        self.serial.dumps(
-                            {'grains': load['grains'],
-                             'pillar': data})
-                            )
+            self.datastore.store(
+                    load['id'],
+                    {'grains': load['grains'],
+                     'pillar': data})
         return data
 
     def _minion_event(self, load):
@@ -1237,10 +1455,12 @@ class AESFuncs(object):
                     self.opts['cachedir'],
                     self.opts['hash_type'],
                     load.get('nocache', False))
-        log.info('Got return from {id} for job {jid}'.format(**load))
+        log.info('Got return from %s for job %s', load['id'], load['jid'])
         self.event.fire_event(load, load['jid'])  # old dup event
         self.event.fire_event(load, tagify([load['jid'], 'ret', load['id']], 'job'))
         self.event.fire_ret_load(load)
+        if self.jobindex is not None:
+            self.jobindex.add_return(load['jid'])
         if self.opts['master_ext_job_cache']:
             fstr = '{0}.returner'.format(self.opts['master_ext_job_cache'])
             self.mminion.returners[fstr](load)
@@ -1634,6 +1854,10 @@ class ClearFuncs(object):
         self.local = bonneville.client.LocalClient(self.opts['conf_file'])
         # Make an minion checker object
         self.ckminions = bonneville.utils.minions.CkMinions(opts)
+        # Compile the blacklist once instead of on every publish
+        self.blacklist = bonneville.utils.minions.compile_blacklist(
+            self.opts['client_acl_blacklist']
+        )
         # Make an Auth object
         self.loadauth = bonneville.auth.LoadAuth(opts)
         # Stand up the master Minion to access returner data
@@ -1643,6 +1867,26 @@ class ClearFuncs(object):
                 rend=False)
         # Make a wheel object
         self.wheel_ = bonneville.wheel.Wheel(opts)
+        self.jobindex = None
+        if self.opts['job_index']:
+            self.jobindex = bonneville.utils.jobindex.JobIndex(self.opts)
+        self._pub_sock = None
+
+    @property
+    def pub_sock(self):
+        '''
+        The socket to the publisher, connected on first use and kept for
+        the next publications
+        '''
+        if self._pub_sock is None:
+            context = zmq.Context(1)
+            pub_sock = context.socket(zmq.PUSH)
+            pull_uri = 'ipc://{0}'.format(
+                os.path.join(self.opts['sock_dir'], 'publish_pull.ipc')
+                )
+            pub_sock.connect(pull_uri)
+            self._pub_sock = pub_sock
+        return self._pub_sock
 
     def _send_cluster(self):
         '''
@@ -1655,7 +1899,7 @@ class ClearFuncs(object):
                 0,
                 'list'
                 )
-        log.debug('Cluster distributed: {0}'.format(ret))
+        log.debug('Cluster distributed: %s', ret)
 
     def _cluster_load(self):
         '''
@@ -1789,12 +2033,10 @@ class ClearFuncs(object):
         '''
 
         if not bonneville.utils.verify.valid_id(self.opts, load['id']):
-            log.info(
-                'Authentication request from invalid id {id}'.format(**load)
-                )
+            log.info('Authentication request from invalid id %s', load['id'])
             return {'enc': 'clear',
                     'load': {'ret': False}}
-        log.info('Authentication request from {id}'.format(**load))
+        log.info('Authentication request from %s', load['id'])
         pubfn = os.path.join(self.opts['pki_dir'],
                 'minions',
                 load['id'])
@@ -1810,7 +2052,7 @@ class ClearFuncs(object):
             pass
         elif os.path.isfile(pubfn_rejected):
             # The key has been rejected, don't place it in pending
-            log.info('Public key rejected for {id}'.format(**load))
+            log.info('Public key rejected for %s', load['id'])
             ret = {'enc': 'clear',
                    'load': {'ret': False}}
             eload = {'result': False,
@@ -1837,9 +2079,7 @@ class ClearFuncs(object):
                 and not self._check_autosign(load['id']):
             if os.path.isdir(pubfn_pend):
                 # The key path is a directory, error out
-                log.info(
-                    'New public key id is a directory {id}'.format(**load)
-                )
+                log.info('New public key id is a directory %s', load['id'])
                 ret = {'enc': 'clear',
                        'load': {'ret': False}}
                 eload = {'result': False,
@@ -1848,9 +2088,7 @@ class ClearFuncs(object):
                 self.event.fire_event(eload, tagify(prefix='auth'))
                 return ret
             # This is a new key, stick it in pre
-            log.info(
-                'New public key placed in pending for {id}'.format(**load)
-            )
+            log.info('New public key placed in pending for %s', load['id'])
             with bonneville.utils.fopen(pubfn_pend, 'w+') as fp_:
                 fp_.write(load['pub'])
             ret = {'enc': 'clear',
@@ -1879,9 +2117,9 @@ class ClearFuncs(object):
                         'load': {'ret': False}}
             else:
                 log.info(
-                    'Authentication failed from host {id}, the key is in '
+                    'Authentication failed from host %s, the key is in '
                     'pending and needs to be accepted with salt-key '
-                    '-a {id}'.format(**load)
+                    '-a %s', load['id'], load['id']
                 )
                 eload = {'result': True,
                          'act': 'pend',
@@ -1921,7 +2159,7 @@ class ClearFuncs(object):
             return {'enc': 'clear',
                     'load': {'ret': False}}
 
-        log.info('Authentication accepted from {id}'.format(**load))
+        log.info('Authentication accepted from %s', load['id'])
         # only write to disk if you are adding the file, and in open mode,
         # which implies we accept any key from a minion (key needs to be
         # written every time because what's on disk is used for encrypting)
@@ -2247,25 +2485,28 @@ class ClearFuncs(object):
         by the LocalClient.
         '''
         extra = clear_load.get('kwargs', {})
+        # The targets resolved while authorizing the publish, reused to find
+        # its minions
+        resolved = {}
 
         # check blacklist/whitelist
         good = True
         # Check if the user is blacklisted
-        for user_re in self.opts['client_acl_blacklist'].get('users', []):
-            if re.match(user_re, clear_load['user']):
+        for user_re in self.blacklist['users']:
+            if user_re.match(clear_load['user']):
                 good = False
                 break
 
+        # if this is a regular command, its a single function
+        if type(clear_load['fun']) == str:
+            funs_to_check = [clear_load['fun']]
+        # if this a compound function
+        else:
+            funs_to_check = clear_load['fun']
         # check if the cmd is blacklisted
-        for module_re in self.opts['client_acl_blacklist'].get('modules', []):
-            # if this is a regular command, its a single function
-            if type(clear_load['fun']) == str:
-                funs_to_check = [clear_load['fun']]
-            # if this a compound function
-            else:
-                funs_to_check = clear_load['fun']
+        for module_re in self.blacklist['modules']:
             for fun in funs_to_check:
-                if re.match(module_re, fun):
+                if module_re.match(fun):
                     good = False
                     break
 
@@ -2310,7 +2551,9 @@ class ClearFuncs(object):
                         else self.opts['external_auth'][token['eauth']]['*'],
                     clear_load['fun'],
                     clear_load['tgt'],
-                    clear_load.get('tgt_type', 'glob'))
+                    clear_load.get('tgt_type', 'glob'),
+                    resolved,
+                    '{0}:{1}'.format(token['eauth'], token['name']))
             if not good:
                 # Accept find_job so the CLI will function cleanly
                 if clear_load['fun'] != 'saltutil.find_job':
@@ -2319,7 +2562,7 @@ class ClearFuncs(object):
                     )
                     return ''
             clear_load['user'] = token['name']
-            log.debug('Minion tokenized user = "{0}"'.format(clear_load['user']))
+            log.debug('Minion tokenized user = "%s"', clear_load['user'])
         elif 'eauth' in extra:
             if extra['eauth'] not in self.opts['external_auth']:
                 # The eauth system is not enabled, fail
@@ -2351,7 +2594,9 @@ class ClearFuncs(object):
                         else self.opts['external_auth'][extra['eauth']]['*'],
                     clear_load['fun'],
                     clear_load['tgt'],
-                    clear_load.get('tgt_type', 'glob'))
+                    clear_load.get('tgt_type', 'glob'),
+                    resolved,
+                    '{0}:{1}'.format(extra['eauth'], name))
             if not good:
                 # Accept find_job so the CLI will function cleanly
                 if clear_load['fun'] != 'saltutil.find_job':
@@ -2406,7 +2651,9 @@ class ClearFuncs(object):
                             self.opts['client_acl'][clear_load['user']],
                             clear_load['fun'],
                             clear_load['tgt'],
-                            clear_load.get('tgt_type', 'glob'))
+                            clear_load.get('tgt_type', 'glob'),
+                            resolved,
+                            clear_load['user'])
                     if not good:
                         # Accept find_job so the CLI will function cleanly
                         if clear_load['fun'] != 'saltutil.find_job':
@@ -2429,7 +2676,8 @@ class ClearFuncs(object):
         # Retrieve the minions list
         minions = self.ckminions.check_minions(
                 clear_load['tgt'],
-                clear_load.get('tgt_type', 'glob')
+                clear_load.get('tgt_type', 'glob'),
+                resolved
                 )
         # If we order masters (via a syndic), don't short circuit if no minions
         # are found
@@ -2479,6 +2727,8 @@ class ClearFuncs(object):
                 clear_load,
                 bonneville.utils.fopen(os.path.join(jid_dir, '.load.p'), 'w+b')
                 )
+        if self.jobindex is not None:
+            self.jobindex.add(clear_load, minions)
         if self.opts['ext_job_cache']:
             try:
                 fstr = '{0}.save_load'.format(self.opts['ext_job_cache'])
@@ -2495,8 +2745,6 @@ class ClearFuncs(object):
                     'The specified returner threw a stack trace:\n',
                     exc_info=True
                 )
-        # Set up the payload
-        payload = {'enc': 'aes'}
         # Altering the contents of the publish load is serious!! Changes here
         # break compatibility with minion/master versions and even tiny
         # additions can have serious implications on the performance of the
@@ -2522,32 +2770,17 @@ class ClearFuncs(object):
 
         if 'user' in clear_load:
             log.info(
-                'User {user} Published command {fun} with jid {jid}'.format(
-                    **clear_load
-                )
+                'User %s Published command %s with jid %s',
+                clear_load['user'], clear_load['fun'], clear_load['jid']
             )
             load['user'] = clear_load['user']
         else:
             log.info(
-                'Published command {fun} with jid {jid}'.format(
-                    **clear_load
-                )
-            )
-        log.debug('Published command details {0}'.format(load))
-
-        payload['load'] = self.crypticle.dumps(load)
-        if self.opts['sign_pub_messages']:
-            master_pem_path = os.path.join(self.opts['pki_dir'], 'master.pem')
-            log.debug("Signing data packet")
-            payload['sig'] = bonneville.crypt.sign_message(master_pem_path, payload['load'])
-        # Send 0MQ to the publisher
-        context = zmq.Context(1)
-        pub_sock = context.socket(zmq.PUSH)
-        pull_uri = 'ipc://{0}'.format(
-            os.path.join(self.opts['sock_dir'], 'publish_pull.ipc')
+                'Published command %s with jid %s',
+                clear_load['fun'], clear_load['jid']
             )
-        pub_sock.connect(pull_uri)
-        pub_sock.send(self.serial.dumps(payload))
+        log.debug('Published command details %s', load)
+        self._send_pub(load, minions)
         return {
             'enc': 'clear',
             'load': {
@@ -2555,3 +2788,40 @@ class ClearFuncs(object):
                 'minions': minions
             }
         }
+
+    def _send_pub(self, load, minions):
+        '''
+        Hand the publish load over to the publisher, in waves of
+        pub_wave_size minions if it targets more minions
+        '''
+        # Set up the payload
+        payload = {'enc': 'aes'}
+        loads = [load]
+        size = self.opts['pub_wave_size']
+        if size and len(minions) > size and not self.opts['order_masters']:
+            # Split the large publications into waves, the syndics are
+            # left out as the minions of their masters are not known here
+            targets = bonneville.utils.pubqueue.wave_targets(
+                load['tgt'], load.get('tgt_type', 'glob'), minions, size
+            )
+            if targets is None:
+                log.debug(
+                    'The %s target %r can not be published in waves',
+                    load.get('tgt_type', 'glob'), load['tgt']
+                )
+            else:
+                loads = [dict(load, tgt=tgt, tgt_type=tgt_type)
+                         for tgt, tgt_type in targets]
+        for wave, load in enumerate(loads):
+            payload['load'] = self.crypticle.dumps(load)
+            if self.opts['sign_pub_messages']:
+                master_pem_path = os.path.join(self.opts['pki_dir'], 'master.pem')
+                log.debug("Signing data packet")
+                payload['sig'] = bonneville.crypt.sign_message(master_pem_path, payload['load'])
+            # Send 0MQ to the publisher, the payload is serialized once here
+            # and forwarded as is to the minions
+            header = {'jid': load['jid'],
+                      'delay': wave * self.opts['pub_wave_interval']}
+            self.pub_sock.send_multipart(
+                [self.serial.dumps(header), self.serial.dumps(payload)]
+            )
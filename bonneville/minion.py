@@ -47,6 +47,8 @@ import bonneville.crypt
 import bonneville.loader
 import bonneville.utils
 import bonneville.payload
+import bonneville.utils.compound
+import bonneville.utils.jobpool
 import bonneville.utils.schedule
 from bonneville._compat import string_types
 from bonneville.utils.debug import enable_sigusr1_handler
@@ -163,8 +165,8 @@ def parse_args_and_kwargs(func, args, data=None):
         for key, val in data.items():
             kwargs['__pub_{0}'.format(key)] = val
 
-    log.debug('Parsed args: {0}'.format(_args))
-    log.debug('Parsed kwargs: {0}'.format(kwargs))
+    log.debug('Parsed args: %s', _args)
+    log.debug('Parsed kwargs: %s', kwargs)
     if invalid_kwargs:
         raise SaltInvocationError(
             'The following keyword arguments are not valid: {0}'
@@ -285,27 +287,63 @@ class MasterMinion(object):
         self.opts = bonneville.config.minion_config(opts['conf_file'])
         self.opts.update(opts)
         self.whitelist = whitelist
-        self.opts['grains'] = bonneville.loader.grains(opts)
+        grains = bonneville.loader.arena_get(opts, 'grains')
+        if grains is None:
+            grains = bonneville.loader.grains(opts)
+            bonneville.loader.arena_set(opts, 'grains', grains)
+        self.opts['grains'] = grains
         self.opts['pillar'] = {}
         self.mk_returners = returners
         self.mk_states = states
         self.mk_rend = rend
         self.mk_matcher = matcher
-        self.gen_modules()
+        self.gen_modules(arena=True)
 
-    def gen_modules(self):
+    def gen_modules(self, arena=False):
         '''
         Load all of the modules for the minion
+
+        When ``arena`` is True and the loader arena has been preloaded, the
+        shared function maps are reused instead of being loaded again
         '''
-        self.functions = bonneville.loader.minion_mods(
-            self.opts,
-            whitelist=self.whitelist)
+        loaded = None
+        if arena:
+            loaded = bonneville.loader.arena_get(
+                self.opts, 'mminion', self.whitelist
+            )
+        if loaded is None:
+            loaded = {}
+            loaded['functions'] = bonneville.loader.minion_mods(
+                self.opts,
+                whitelist=self.whitelist)
+            # The arena entry is shared by all master minions, so load every
+            # type when it is going to be stored there
+            active = arena and bonneville.loader.arena_active(self.opts)
+            if self.mk_returners or active:
+                loaded['returners'] = bonneville.loader.returners(
+                    self.opts, loaded['functions']
+                )
+            if self.mk_states or active:
+                loaded['states'] = bonneville.loader.states(
+                    self.opts, loaded['functions']
+                )
+            if self.mk_rend or active:
+                loaded['rend'] = bonneville.loader.render(
+                    self.opts, loaded['functions']
+                )
+            if active:
+                bonneville.loader.arena_set(
+                    self.opts, 'mminion', loaded, self.whitelist
+                )
+        # Copy the function map so that sys.reload_modules is bound to this
+        # instance without altering the shared map
+        self.functions = dict(loaded['functions'])
         if self.mk_returners:
-            self.returners = bonneville.loader.returners(self.opts, self.functions)
+            self.returners = loaded['returners']
         if self.mk_states:
-            self.states = bonneville.loader.states(self.opts, self.functions)
+            self.states = loaded['states']
         if self.mk_rend:
-            self.rend = bonneville.loader.render(self.opts, self.functions)
+            self.rend = loaded['rend']
         if self.mk_matcher:
             self.matcher = Matcher(self.opts, self.functions)
         self.functions['sys.reload_modules'] = self.gen_modules
@@ -517,6 +555,7 @@ class Minion(object):
             self.opts,
             self.functions,
             self.returners)
+        self.job_pool = None
 
     def __prep_mod_opts(self):
         '''
@@ -640,14 +679,14 @@ class Minion(object):
         #    return
         if 'user' in data:
             log.info(
-                'User {0[user]} Executing command {0[fun]} with jid '
-                '{0[jid]}'.format(data)
+                'User %s Executing command %s with jid %s',
+                data['user'], data['fun'], data['jid']
             )
         else:
             log.info(
-                'Executing command {0[fun]} with jid {0[jid]}'.format(data)
+                'Executing command %s with jid %s', data['fun'], data['jid']
             )
-        log.debug('Command details {0}'.format(data))
+        log.debug('Command details %s', data)
         self._handle_decoded_payload(data)
 
     def _handle_pub(self, load):
@@ -669,9 +708,14 @@ class Minion(object):
         '''
         if isinstance(data['fun'], string_types):
             if data['fun'] == 'sys.reload_modules':
-                self.functions, self.returners = self.__load_modules()
-                self.schedule.functions = self.functions
-                self.schedule.returners = self.returners
+                self.module_refresh()
+        if self.job_pool is not None and not self.job_pool.isolated(data):
+            if self.job_pool.submit(data):
+                return
+            log.debug(
+                'All the job pool workers are busy, running job {0} in a '
+                'process of its own'.format(data['jid'])
+            )
         if isinstance(data['fun'], tuple) or isinstance(data['fun'], list):
             target = Minion._thread_multi_return
         else:
@@ -696,10 +740,11 @@ class Minion(object):
         process.start()
 
     @classmethod
-    def _thread_return(cls, minion_instance, opts, data):
+    def _thread_return(cls, minion_instance, opts, data, pooled=False):
         '''
         This method should be used as a threading target, start the actual
-        minion side execution.
+        minion side execution. Pass pooled when running in a job pool
+        worker, which is not daemonized.
         '''
         # this seems awkward at first, but it's a workaround for Windows
         # multiprocessing communication.
@@ -707,7 +752,8 @@ class Minion(object):
             minion_instance = cls(opts)
         if opts['multiprocessing']:
             fn_ = os.path.join(minion_instance.proc_dir, data['jid'])
-            bonneville.utils.daemonize_if(opts)
+            if not pooled:
+                bonneville.utils.daemonize_if(opts)
             sdata = {'pid': os.getpid()}
             sdata.update(data)
             with bonneville.utils.fopen(fn_, 'w+b') as fp_:
@@ -856,7 +902,7 @@ class Minion(object):
                 except (OSError, IOError):
                     # The file is gone already
                     pass
-        log.info('Returning information for job: {0}'.format(jid))
+        log.info('Returning information for job: %s', jid)
         sreq = bonneville.payload.SREQ(self.opts['master_uri'])
         if ret_cmd == '_syndic_return':
             load = {'cmd': ret_cmd,
@@ -962,7 +1008,11 @@ class Minion(object):
                 log.debug('Authentication wait time is {0}'.format(acceptance_wait_time))
         self.aes = creds['aes']
         self.publish_port = creds['publish_port']
-        self.crypticle = bonneville.crypt.Crypticle(self.opts, self.aes)
+        # Share the session with the SAuth objects of the modules and of the
+        # job processes
+        self.crypticle = bonneville.crypt.set_session(
+            self.opts, self.aes, self.publish_port
+        ) or bonneville.crypt.Crypticle(self.opts, self.aes)
 
     def module_refresh(self):
         '''
@@ -971,6 +1021,25 @@ class Minion(object):
         self.functions, self.returners = self.__load_modules()
         self.schedule.functions = self.functions
         self.schedule.returners = self.returners
+        if self.job_pool is not None:
+            # The workers were forked with the old modules
+            self.job_pool.restart()
+
+    def _start_job_pool(self):
+        '''
+        Fork the job pool workers if a job pool is configured
+        '''
+        if self.job_pool is not None or not self.opts['multiprocessing']:
+            return
+        if not self.opts.get('job_pool_size') or \
+                sys.platform.startswith('win'):
+            return
+        self.job_pool = bonneville.utils.jobpool.JobPool(
+            self,
+            self.opts['job_pool_size'],
+            self.opts.get('job_pool_isolate', ['state.*', 'saltutil.*'])
+        )
+        self.job_pool.start()
 
     def pillar_refresh(self):
         '''
@@ -1142,12 +1211,16 @@ class Minion(object):
         # Make sure to gracefully handle CTRL_LOGOFF_EVENT
         bonneville.utils.enable_ctrl_logoff_handler()
 
+        self._start_job_pool()
+
         # On first startup execute a state run if configured to do so
         self._state_run()
         time.sleep(.5)
 
         loop_interval = int(self.opts['loop_interval'])
         while True:
+            if self.job_pool is not None:
+                self.job_pool.reap()
             try:
                 self.schedule.eval()
                 # Check if scheduler requires lower loop interval than
@@ -1240,8 +1313,11 @@ class Minion(object):
             ),
             tagify([self.opts['id'], 'start'], 'minion'),
         )
+        self._start_job_pool()
         loop_interval = int(self.opts['loop_interval'])
         while True:
+            if self.job_pool is not None:
+                self.job_pool.reap()
             try:
                 socks = dict(self.poller.poll(
                     loop_interval * 1000)
@@ -1264,6 +1340,8 @@ class Minion(object):
         '''
         Tear down the minion
         '''
+        if getattr(self, 'job_pool', None) is not None:
+            self.job_pool.stop()
         if hasattr(self, 'poller'):
             if isinstance(self.poller.sockets, dict):
                 for socket in self.poller.sockets.keys():
@@ -1329,18 +1407,15 @@ class Syndic(Minion):
         data['to'] = int(data['to']) - 1
         if 'user' in data:
             log.debug(
-                'User {0[user]} Executing syndic command {0[fun]} with '
-                'jid {0[jid]}'.format(
-                    data
-                )
+                'User %s Executing syndic command %s with jid %s',
+                data['user'], data['fun'], data['jid']
             )
         else:
             log.debug(
-                'Executing syndic command {0[fun]} with jid {0[jid]}'.format(
-                    data
-                )
+                'Executing syndic command %s with jid %s',
+                data['fun'], data['jid']
             )
-        log.debug('Command details: {0}'.format(data))
+        log.debug('Command details: %s', data)
         self._handle_decoded_payload(data)
 
     def _handle_decoded_payload(self, data):
@@ -1491,6 +1566,16 @@ class Matcher(object):
         if functions is None:
             functions = bonneville.loader.minion_mods(self.opts)
         self.functions = functions
+        # The matchers of the compound target terms, None for the globs
+        self._compound_ref = {None: self.glob_match,
+                              'G': self.grain_match,
+                              'P': self.grain_pcre_match,
+                              'I': self.pillar_match,
+                              'L': self.list_match,
+                              'S': self.ipcidr_match,
+                              'E': self.pcre_match}
+        if HAS_RANGE:
+            self._compound_ref['R'] = self.range_match
 
     def confirm_top(self, match, data, nodegroups=None):
         '''
@@ -1544,7 +1629,7 @@ class Matcher(object):
         '''
         Reads in the grains glob match
         '''
-        log.debug('grains target: {0}'.format(tgt))
+        log.debug('grains target: %s', tgt)
         if delim not in tgt:
             log.error('Got insufficient arguments for grains match '
                       'statement from master')
@@ -1555,7 +1640,7 @@ class Matcher(object):
         '''
         Matches a grain based on regex
         '''
-        log.debug('grains pcre target: {0}'.format(tgt))
+        log.debug('grains pcre target: %s', tgt)
         if delim not in tgt:
             log.error('Got insufficient arguments for grains pcre match '
                       'statement from master')
@@ -1601,7 +1686,7 @@ class Matcher(object):
         '''
         Reads in the pillar glob match
         '''
-        log.debug('pillar target: {0}'.format(tgt))
+        log.debug('pillar target: %s', tgt)
         if delim not in tgt:
             log.error('Got insufficient arguments for pillar match '
                       'statement from master')
@@ -1642,7 +1727,7 @@ class Matcher(object):
             try:
                 return self.opts['grains']['fqdn'] in range_.expand(tgt)
             except seco.range.RangeException as exc:
-                log.debug('Range exception in compound match: {0}'.format(exc))
+                log.debug('Range exception in compound match: %s', exc)
                 return False
         return False
 
@@ -1653,59 +1738,17 @@ class Matcher(object):
         if not isinstance(tgt, string_types):
             log.debug('Compound target received that is not a string')
             return False
-        ref = {'G': 'grain',
-               'P': 'grain_pcre',
-               'I': 'pillar',
-               'L': 'list',
-               'S': 'ipcidr',
-               'E': 'pcre'}
-        if HAS_RANGE:
-            ref['R'] = 'range'
-        results = []
-        opers = ['and', 'or', 'not', '(', ')']
-        tokens = tgt.split()
-        for match in tokens:
-            # Try to match tokens from the compound target, first by using
-            # the 'G, X, I, L, S, E' matcher types, then by hostname glob.
-            if '@' in match and match[1] == '@':
-                comps = match.split('@')
-                matcher = ref.get(comps[0])
-                if not matcher:
-                    # If an unknown matcher is called at any time, fail out
-                    return False
-                results.append(
-                    str(
-                        getattr(self, '{0}_match'.format(matcher))(
-                            '@'.join(comps[1:])
-                        )
-                    )
-                )
-            elif match in opers:
-                # We didn't match a target, so append a boolean operator or
-                # subexpression
-                if results:
-                    if match == 'not':
-                        if results[-1] == 'and':
-                            pass
-                        elif results[-1] == 'or':
-                            pass
-                        else:
-                            results.append('and')
-                    results.append(match)
-                else:
-                    # seq start with oper, fail
-                    if match not in ['(', ')']:
-                        return False
-            else:
-                # The match is not explicitly defined, evaluate it as a glob
-                results.append(str(self.glob_match(match)))
-        results = ' '.join(results)
         try:
-            return eval(results)
-        except Exception:
+            expr = bonneville.utils.compound.parse(tgt)
+        except SaltInvocationError as exc:
+            log.error(exc)
+            return False
+        ref = self._compound_ref
+        if not expr.matchers.issubset(ref):
+            # If an unknown matcher is called at any time, fail out
             log.error('Invalid compound target: {0}'.format(tgt))
             return False
-        return False
+        return expr.match(lambda matcher, pattern: ref[matcher](pattern))
 
     def nodegroup_match(self, tgt, nodegroups):
         '''
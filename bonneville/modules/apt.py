@@ -4,7 +4,6 @@ Support for APT (Advanced Packaging Tool)
 '''
 
 # Import python libs
-import copy
 import os
 import re
 import logging
@@ -17,6 +16,7 @@ import yaml
 
 # Import bonneville libs
 import bonneville.utils
+import bonneville.utils.pkgcache
 from bonneville._compat import string_types
 from bonneville.exceptions import CommandExecutionError, SaltInvocationError
 
@@ -44,6 +44,12 @@ LP_PVT_SRC_FORMAT = 'deb https://{0}private-ppa.launchpad.net/{1}/{2}/ubuntu' \
 _MODIFY_OK = frozenset(['uri', 'comps', 'architectures', 'disabled',
                         'file', 'dist'])
 
+# The files changed by dpkg when packages are installed or removed, and the
+# available file grep-available reads the virtual packages from
+_DPKG_DB = ['/var/lib/dpkg/status',
+            '/var/lib/dpkg/updates',
+            '/var/lib/dpkg/available']
+
 
 def __virtual__():
     '''
@@ -586,47 +592,64 @@ def list_pkgs(versions_as_list=False, removed=False):
     versions_as_list = bonneville.utils.is_true(versions_as_list)
     removed = bonneville.utils.is_true(removed)
 
-    if 'pkg.list_pkgs' in __context__:
-        if removed:
-            ret = copy.deepcopy(__context__['pkg.list_pkgs']['removed'])
-        else:
-            ret = copy.deepcopy(__context__['pkg.list_pkgs']['installed'])
-        if not versions_as_list:
-            __salt__['pkg_resource.stringify'](ret)
-        return ret
+    if 'pkg.list_pkgs' not in __context__:
+        __context__['pkg.list_pkgs'] = _list_pkgs()
+    pkgs = __context__['pkg.list_pkgs']['removed' if removed else 'installed']
+    # Hand out new dicts, the cached data must not be changed by the callers
+    if versions_as_list:
+        return dict((name, list(vers)) for name, vers in pkgs.items())
+    return dict((name, ','.join(vers)) for name, vers in pkgs.items())
+
+
+def _pkg_cache():
+    '''
+    Return the persistent cache of the package list, or None if disabled
+    '''
+    if not __opts__.get('pkg_list_cache', True):
+        return None
+    return bonneville.utils.pkgcache.PkgCache(__opts__, 'apt', _DPKG_DB)
+
+
+def _list_pkgs():
+    '''
+    Read the installed and removed packages, from the persistent cache if
+    the dpkg database did not change since it was stored
+    '''
+    cache = _pkg_cache()
+    if cache is not None:
+        ret = cache.get()
+        if ret is not None:
+            return ret
+        stamp = cache.stamp()
 
     ret = {'installed': {}, 'removed': {}}
     cmd = 'dpkg-query --showformat=\'${Status} ${Package} ' \
           '${Version} ${Architecture}\n\' -W'
 
     out = __salt__['cmd.run_all'](cmd).get('stdout', '')
+    multiarch = __grains__.get('cpuarch', '') == 'x86_64' \
+        and __grains__.get('osarch', '') == 'amd64'
+    installed = ret['installed']
+    removed = ret['removed']
     # Typical lines of output:
     # install ok installed zsh 4.3.17-1ubuntu1 amd64
     # deinstall ok config-files mc 3:4.8.1-2ubuntu1 amd64
     for line in out.splitlines():
         cols = line.split()
-        try:
-            linetype, status, name, version_num, arch = \
-                [cols[x] for x in (0, 2, 3, 4, 5)]
-        except ValueError:
+        if len(cols) < 6:
             continue
-        if __grains__.get('cpuarch', '') == 'x86_64':
-            osarch = __grains__.get('osarch', '')
-            if arch != 'all' and osarch == 'amd64' and osarch != arch:
-                name += ':{0}'.format(arch)
-        if len(cols):
-            if ('install' in linetype or 'hold' in linetype) and \
-                    'installed' in status:
-                __salt__['pkg_resource.add_pkg'](ret['installed'],
-                                                 name,
-                                                 version_num)
-            elif 'deinstall' in linetype:
-                __salt__['pkg_resource.add_pkg'](ret['removed'],
-                                                 name,
-                                                 version_num)
+        linetype, status, name, version_num, arch = \
+            cols[0], cols[2], cols[3], cols[4], cols[5]
+        if multiarch and arch != 'all' and arch != 'amd64':
+            name += ':{0}'.format(arch)
+        if ('install' in linetype or 'hold' in linetype) and \
+                'installed' in status:
+            installed.setdefault(name, []).append(version_num)
+        elif 'deinstall' in linetype:
+            removed.setdefault(name, []).append(version_num)
 
     # Check for virtual packages. We need dctrl-tools for this.
-    if not removed and __salt__['cmd.has_exec']('grep-available'):
+    if __salt__['cmd.has_exec']('grep-available'):
         virtpkgs_all = _get_virtual()
         virtpkgs = set()
         for realpkg, provides in virtpkgs_all.items():
@@ -642,14 +665,8 @@ def list_pkgs(versions_as_list=False, removed=False):
         __salt__['pkg_resource.sort_pkglist'](ret[pkglist_type])
         _clean_pkglist(ret[pkglist_type])
 
-    __context__['pkg.list_pkgs'] = copy.deepcopy(ret)
-
-    if removed:
-        ret = ret['removed']
-    else:
-        ret = ret['installed']
-    if not versions_as_list:
-        __salt__['pkg_resource.stringify'](ret)
+    if cache is not None:
+        cache.set(stamp, ret)
     return ret
 
 
@@ -281,6 +281,22 @@ def cache_dir(path, env='base', include_empty=False):
     return __context__['cp.fileclient'].cache_dir(path, env, include_empty)
 
 
+def cache_tree(path, env='base'):
+    '''
+    Download the changed files under a directory from the master in bulk,
+    returns the dict of the cached paths by master path, or None if the
+    master cannot serve the directory in bulk. Nothing is downloaded then.
+
+    CLI Example:
+
+    .. code-block:: bash
+
+        salt '*' cp.cache_tree salt://path/to/dir
+    '''
+    _mk_client()
+    return __context__['cp.fileclient'].cache_tree(path, env)
+
+
 def cache_master(env='base'):
     '''
     Retrieve all of the files on the master and cache them locally
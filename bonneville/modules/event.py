@@ -7,7 +7,6 @@ master to the minion and vice-versa.
 # Import bonneville libs
 import bonneville.crypt
 import bonneville.utils.event
-import bonneville.payload
 
 
 def fire_master(data, tag, preload=None):
@@ -31,9 +30,8 @@ def fire_master(data, tag, preload=None):
             'tok': auth.gen_token('salt'),
             'cmd': '_minion_event'})
 
-    sreq = bonneville.payload.SREQ(__opts__['master_uri'])
     try:
-        sreq.send('aes', auth.crypticle.dumps(load))
+        auth.crypted_transfer(load, decrypt=False)
     except Exception:
         pass
     return True
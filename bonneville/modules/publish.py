@@ -67,8 +67,7 @@ def _publish(
             'id': __opts__['id']}
 
     try:
-        peer_data = auth.crypticle.loads(
-            sreq.send('aes', auth.crypticle.dumps(load), 1))
+        peer_data = auth.crypted_transfer(load, 1, sreq=sreq)
     except SaltReqTimeoutError:
         return '{0!r} publish timed out'.format(fun)
     if not peer_data:
@@ -79,8 +78,7 @@ def _publish(
             'id': __opts__['id'],
             'tok': tok,
             'jid': peer_data['jid']}
-    ret = auth.crypticle.loads(
-            sreq.send('aes', auth.crypticle.dumps(load), 5))
+    ret = auth.crypted_transfer(load, 5, sreq=sreq)
     if form == 'clean':
         cret = {}
         for host in ret:
@@ -221,7 +219,6 @@ def runner(fun, arg=None):
             'tok': tok,
             'id': __opts__['id']}
     try:
-        return auth.crypticle.loads(
-            sreq.send('aes', auth.crypticle.dumps(load), 1))
+        return auth.crypted_transfer(load, 1, sreq=sreq)
     except SaltReqTimeoutError:
         return '{0!r} runner publish timed out'.format(fun)
@@ -16,6 +16,7 @@ import time
 import sys
 
 # Import bonneville libs
+import bonneville.crypt
 import bonneville.payload
 import bonneville.state
 import bonneville.client
@@ -491,8 +492,9 @@ def regen_keys():
         except os.error:
             pass
     time.sleep(60)
-    sreq = bonneville.payload.SREQ(__opts__['master_uri'])
-    auth = bonneville.crypt.SAuth(__opts__)
+    # Sign in again with the new keys, not with the session of the process
+    bonneville.crypt.clear_sessions()
+    bonneville.crypt.SAuth(__opts__)
 
 
 def revoke_auth():
@@ -514,8 +516,7 @@ def revoke_auth():
             'id': __opts__['id'],
             'tok': tok}
     try:
-        return auth.crypticle.loads(
-                sreq.send('aes', auth.crypticle.dumps(load), 1))
+        return auth.crypted_transfer(load, 1, sreq=sreq)
     except SaltReqTimeoutError:
         return False
     return False
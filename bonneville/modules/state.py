@@ -30,6 +30,9 @@ __outputter__ = {
 
 log = logging.getLogger(__name__)
 
+# The number of extracted state packages kept by state.pkg
+_PKG_KEEP = 8
+
 
 def _filter_running(runnings):
     '''
@@ -697,12 +700,85 @@ def clear_cache():
     return ret
 
 
-def pkg(pkg_path, pkg_sum, hash_type, test=False, **kwargs):
+def _extract_pkg(pkg_path, root):
+    '''
+    Extract a state package, return False if it would extract outside of
+    the root
+    '''
+    s_pkg = tarfile.open(pkg_path, 'r:gz')
+    try:
+        # Verify that the tarball does not extract outside of the intended
+        # root
+        for member in s_pkg.getmembers():
+            if member.path.startswith((os.sep, '..{0}'.format(os.sep))):
+                return False
+            elif '..{0}'.format(os.sep) in member.path:
+                return False
+        s_pkg.extractall(root)
+    finally:
+        s_pkg.close()
+    return True
+
+
+def _prune_pkgs(pkg_dir):
+    '''
+    Remove the least recently used extracted state packages
+    '''
+    roots = []
+    for fn_ in os.listdir(pkg_dir):
+        full = os.path.join(pkg_dir, fn_)
+        if fn_.startswith('state_') and os.path.isdir(full):
+            roots.append((os.path.getmtime(full), full))
+    roots.sort(reverse=True)
+    for _, full in roots[_PKG_KEEP:]:
+        shutil.rmtree(full, ignore_errors=True)
+
+
+def _cached_pkg_root(pkg_path, pkg_sum, hash_type):
+    '''
+    Return the directory the state package is extracted to, the package is
+    only extracted by the first run using it. Return None if the package is
+    not valid and False if it is missing.
+    '''
+    root = os.path.splitext(pkg_path)[0]
+    if os.path.isdir(root):
+        # Mark the package as recently used
+        os.utime(root, None)
+        return root
+    if not os.path.isfile(pkg_path):
+        return False
+    if not bonneville.utils.get_hash(pkg_path, hash_type) == pkg_sum:
+        return None
+    tmp = tempfile.mkdtemp(dir=os.path.dirname(pkg_path))
+    if not _extract_pkg(pkg_path, tmp):
+        shutil.rmtree(tmp, ignore_errors=True)
+        return None
+    try:
+        os.rename(tmp, root)
+    except OSError:
+        # Extracted by a concurrent run
+        shutil.rmtree(tmp, ignore_errors=True)
+    try:
+        os.remove(pkg_path)
+    except OSError:
+        pass
+    _prune_pkgs(os.path.dirname(pkg_path))
+    return root
+
+
+def pkg(pkg_path, pkg_sum, hash_type, test=False, lowstate=None, **kwargs):
     '''
     Execute a packaged state run, the packaged state run will exist in a
     tarball available locally. This packaged state
     can be generated using salt-ssh.
 
+    When the path to a low state file is passed as ``lowstate``, the tarball
+    only holds the files used by the low state. It is extracted next to the
+    tarball once and the following runs using the same tarball reuse the
+    extracted files, the tarball is then not needed anymore. If neither the
+    tarball nor its extracted files are there, ``{'__pkg_missing__':
+    pkg_sum}`` is returned.
+
     CLI Example:
 
     .. code-block:: bash
@@ -710,25 +786,29 @@ def pkg(pkg_path, pkg_sum, hash_type, test=False, **kwargs):
         salt '*' state.pkg /tmp/state_pkg.tgz
     '''
     # TODO - Add ability to download from salt master or other source
-    if not os.path.isfile(pkg_path):
-        return {}
-    if not bonneville.utils.get_hash(pkg_path, hash_type) == pkg_sum:
-        return {}
-    root = tempfile.mkdtemp()
-    s_pkg = tarfile.open(pkg_path, 'r:gz')
-        # Verify that the tarball does not extract outside of the intended
-        # root
-    members = s_pkg.getmembers()
-    for member in members:
-        if member.path.startswith((os.sep, '..{0}'.format(os.sep))):
+    if lowstate is not None:
+        root = _cached_pkg_root(pkg_path, pkg_sum, hash_type)
+        if root is False:
+            return {'__pkg_missing__': pkg_sum}
+        lowstate_json = lowstate
+        if root is None or not os.path.isfile(lowstate_json):
+            return {}
+        with bonneville.utils.fopen(lowstate_json, 'r') as fp_:
+            lowstate = json.load(fp_, object_hook=bonneville.utils.decode_dict)
+        os.remove(lowstate_json)
+        cached = True
+    else:
+        if not os.path.isfile(pkg_path):
             return {}
-        elif '..{0}'.format(os.sep) in member.path:
+        if not bonneville.utils.get_hash(pkg_path, hash_type) == pkg_sum:
             return {}
-    s_pkg.extractall(root)
-    s_pkg.close()
-    lowstate_json = os.path.join(root, 'lowstate.json')
-    with bonneville.utils.fopen(lowstate_json, 'r') as fp_:
-        lowstate = json.load(fp_, object_hook=bonneville.utils.decode_dict)
+        root = tempfile.mkdtemp()
+        if not _extract_pkg(pkg_path, root):
+            return {}
+        lowstate_json = os.path.join(root, 'lowstate.json')
+        with bonneville.utils.fopen(lowstate_json, 'r') as fp_:
+            lowstate = json.load(fp_, object_hook=bonneville.utils.decode_dict)
+        cached = False
     popts = copy.deepcopy(__opts__)
     popts['fileclient'] = 'local'
     popts['file_roots'] = {}
@@ -743,8 +823,9 @@ def pkg(pkg_path, pkg_sum, hash_type, test=False, **kwargs):
         popts['file_roots'][fn_] = [full]
     st_ = bonneville.state.State(popts)
     ret = st_.call_chunks(lowstate)
-    try:
-        shutil.rmtree(root)
-    except (IOError, OSError):
-        pass
+    if not cached:
+        try:
+            shutil.rmtree(root)
+        except (IOError, OSError):
+            pass
     return ret
@@ -15,7 +15,6 @@ account when configuring your syslog daemon.
 '''
 
 # Import python libs
-import copy
 import logging
 import os
 import re
@@ -23,6 +22,7 @@ import yaml
 
 # Import bonneville libs
 import bonneville.utils
+import bonneville.utils.pkgcache
 from bonneville.exceptions import CommandExecutionError, SaltInvocationError
 
 # Import third party libs
@@ -130,6 +130,9 @@ except (ImportError, AttributeError):
 
 log = logging.getLogger(__name__)
 
+# The files changed by rpm when packages are installed or removed
+_RPM_DB = ['/var/lib/rpm/Packages', '/var/lib/rpm/rpmdb.sqlite']
+
 
 def __virtual__():
     '''
@@ -358,30 +361,51 @@ def list_pkgs(versions_as_list=False, **kwargs):
     if bonneville.utils.is_true(kwargs.get('removed')):
         return {}
 
-    if 'pkg.list_pkgs' in __context__:
-        if versions_as_list:
-            return __context__['pkg.list_pkgs']
-        else:
-            ret = copy.deepcopy(__context__['pkg.list_pkgs'])
-            __salt__['pkg_resource.stringify'](ret)
+    if 'pkg.list_pkgs' not in __context__:
+        __context__['pkg.list_pkgs'] = _list_pkgs()
+    pkgs = __context__['pkg.list_pkgs']
+    # Hand out new dicts, the cached data must not be changed by the callers
+    if versions_as_list:
+        return dict((name, list(vers)) for name, vers in pkgs.items())
+    return dict((name, ','.join(vers)) for name, vers in pkgs.items())
+
+
+def _pkg_cache():
+    '''
+    Return the persistent cache of the package list, or None if disabled
+    '''
+    if not __opts__.get('pkg_list_cache', True):
+        return None
+    return bonneville.utils.pkgcache.PkgCache(__opts__, 'yum', _RPM_DB)
+
+
+def _list_pkgs():
+    '''
+    Read the installed packages, from the persistent cache if the rpm
+    database did not change since it was stored
+    '''
+    cache = _pkg_cache()
+    if cache is not None:
+        ret = cache.get()
+        if ret is not None:
             return ret
+        stamp = cache.stamp()
 
     ret = {}
+    multilib = __grains__.get('cpuarch', '') == 'x86_64'
     yb = _YumBase()
     for p in yb.rpmdb:
         name = p.name
-        if __grains__.get('cpuarch', '') == 'x86_64' \
-                and re.match(r'i\d86', p.arch):
+        if multilib and re.match(r'i\d86', p.arch):
             name += '.{0}'.format(p.arch)
         pkgver = p.version
         if p.release:
             pkgver += '-{0}'.format(p.release)
-        __salt__['pkg_resource.add_pkg'](ret, name, pkgver)
+        ret.setdefault(name, []).append(pkgver)
 
     __salt__['pkg_resource.sort_pkglist'](ret)
-    __context__['pkg.list_pkgs'] = copy.deepcopy(ret)
-    if not versions_as_list:
-        __salt__['pkg_resource.stringify'](ret)
+    if cache is not None:
+        cache.set(stamp, ret)
     return ret
 
 
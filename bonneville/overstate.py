@@ -13,14 +13,21 @@ the deployment of states over groups of servers.
 
 # Import python libs
 import os
+import time
+import logging
+import threading
 
 # Import bonneville libs
 import bonneville.client
 import bonneville.utils
+import bonneville.utils.minions
+from bonneville._compat import Queue
 
 # Import third party libs
 import yaml
 
+log = logging.getLogger(__name__)
+
 
 class OverState(object):
     '''
@@ -32,7 +39,10 @@ class OverState(object):
         self.over = self.__read_over(overstate)
         self.names = self._names()
         self.local = bonneville.client.LocalClient(self.opts['conf_file'])
+        self.ckminions = bonneville.utils.minions.CkMinions(self.opts)
         self.over_run = {}
+        self.timings = {}
+        self.elapsed = 0
 
     def __read_over(self, overstate):
         '''
@@ -71,14 +81,30 @@ class OverState(object):
             comps.append({key: pre_over[key]})
         return comps
 
-    def _stage_list(self, match):
+    def _stage_list(self, match, local=None):
         '''
         Return a list of ids cleared for a given stage
         '''
+        if local is None:
+            local = self.local
         if isinstance(match, list):
             match = ' or '.join(match)
-        raw = self.local.cmd(match, 'test.ping', expr_form='compound')
-        return raw.keys()
+        tgt = match
+        expr_form = 'compound'
+        fresh = []
+        max_age = self.opts.get('overstate_cache_max_age', 0)
+        if max_age and self.opts.get('minion_data_cache', False):
+            # Trust the minions whose data was refreshed recently, only ping
+            # the others
+            fresh, stale = self.ckminions.split_by_data_age(
+                match, 'compound', max_age
+            )
+            if not stale:
+                return fresh
+            tgt = stale
+            expr_form = 'list'
+        raw = local.cmd(tgt, 'test.ping', expr_form=expr_form)
+        return fresh + list(raw.keys())
 
     def _names(self):
         '''
@@ -148,13 +174,13 @@ class OverState(object):
             return errors
         return stage
 
-    def call_stage(self, name, stage):
+    def _stage_fun(self, stage):
         '''
-        Check if a stage has any requisites and run them first
+        Return the function and arguments called by a stage, or None if the
+        stage function is invalid
         '''
         fun = 'state.highstate'
         arg = ()
-        req_fail = {name: {}}
 
         if 'sls' in stage:
             fun = 'state.sls'
@@ -164,132 +190,272 @@ class OverState(object):
             fun_d = stage.get('function', stage.get('fun'))
             if not fun_d:
                 # Function dict is empty
-                yield {name: {}}
+                return None
             if isinstance(fun_d, str):
                 fun = fun_d
             elif isinstance(fun_d, dict):
                 fun = fun_d.keys()[0]
                 arg = fun_d[fun]
             else:
-                yield {name: {}}
+                return None
+        return fun, arg
 
-        reqs = stage.get('require') or []
-        for req in reqs:
+    @staticmethod
+    def _failure(comment, tag_name, retcode, title='Requisite Failure'):
+        '''
+        Return the result of a stage which failed without a minion return,
+        the stages requiring it are held back
+        '''
+        return {tag_name: {
+            'ret': {
+                'result': False,
+                'comment': comment,
+                'name': title,
+                'changes': {},
+                '__run_num__': 0,
+                    },
+            'retcode': retcode,
+            'success': False,
+            'fun': 'req.fail',
+            }
+            }
+
+    def _req_failure(self, name, comment, tag_name, retcode):
+        '''
+        Record and return the failure of a stage which cannot run because of
+        its requisites
+        '''
+        failure = self._failure(comment, tag_name, retcode)
+        self.over_run[name] = failure
+        return failure
 
+    def _check_reqs(self, name, stage, invalid):
+        '''
+        Check the requisites of a stage once they have all finished, return
+        the failures, if any
+        '''
+        req_fail = {name: {}}
+        for req in stage.get('require') or []:
             if req in self.over_run:
-                # The req has been called, check it
                 self.over_run, req_fail = self._check_results(req,
                     name, self.over_run, req_fail)
-
-            elif req not in self.names:
-                # Req does not exist
-                tag_name = 'No_|-Req_|-fail_|-None'
-                failure = {tag_name: {
-                    'ret': {
-                        'result': False,
-                        'comment': 'Requisite {0} not found'.format(req),
-                        'name': 'Requisite Failure',
-                        'changes': {},
-                        '__run_num__': 0,
-                            },
-                        'retcode': 253,
-                        'success': False,
-                        'fun': 'req.fail',
-                        }
-                        }
-                self.over_run[name] = failure
-                req_fail[name].update(failure)
-
+            elif req in invalid:
+                req_fail[name].update(self._req_failure(
+                    name,
+                    'Requisite {0} failed for stage'.format(req),
+                    'req_|-fail_|-fail_|-None',
+                    254))
             else:
-                # Req has not be called
-                for comp in self.over:
-                    rname = comp.keys()[0]
-                    if req == rname:
-                        rstage = comp[rname]
-                        v_stage = self.verify_stage(rstage)
-                        if isinstance(v_stage, list):
-                            yield {rname: v_stage}
-                        else:
-                            yield self.call_stage(rname, rstage)
-                            # Verify that the previous yield returned
-                            # successfully and update req_fail
-                            self.over_run, req_fail = self._check_results(req,
-                                name, self.over_run, req_fail)
-
-        # endfor
-        if req_fail[name]:
-            yield req_fail
+                # Req does not exist
+                req_fail[name].update(self._req_failure(
+                    name,
+                    'Requisite {0} not found'.format(req),
+                    'No_|-Req_|-fail_|-None',
+                    253))
+        return req_fail[name]
+
+    def _run_stage(self, name, stage):
+        '''
+        Execute a single stage whose requisites succeeded. Every stage uses
+        its own client, the returns of concurrent stages would otherwise be
+        read from the same event subscription.
+        '''
+        call = self._stage_fun(stage)
+        if call is None:
+            return self._failure(
+                'Invalid function in stage {0}'.format(name),
+                'req_|-fail_|-fail_|-None',
+                254,
+                'Stage Failure')
+        fun, arg = call
+        local = bonneville.client.LocalClient(self.opts['conf_file'])
+        ret = {}
+        tgt = self._stage_list(stage['match'], local)
+        cmd_kwargs = {
+            'tgt': tgt,
+            'fun': fun,
+            'arg': arg,
+            'expr_form': 'list',
+            'raw': True}
+        if 'batch' in stage:
+            local_cmd = local.cmd_batch
+            cmd_kwargs['batch'] = stage['batch']
         else:
-            ret = {}
-            tgt = self._stage_list(stage['match'])
-            cmd_kwargs = {
-                'tgt': tgt,
-                'fun': fun,
-                'arg': arg,
-                'expr_form': 'list',
-                'raw': True}
-            if 'batch' in stage:
-                local_cmd = self.local.cmd_batch
-                cmd_kwargs['batch'] = stage['batch']
-            else:
-                local_cmd = self.local.cmd_iter
-            for minion in local_cmd(**cmd_kwargs):
-                if all(key not in minion for key in ('id', 'return', 'fun')):
+            local_cmd = local.cmd_iter
+        for minion in local_cmd(**cmd_kwargs):
+            if all(key not in minion for key in ('id', 'return', 'fun')):
+                continue
+            ret.update({minion['id']:
+                    {
+                    'ret': minion['return'],
+                    'fun': minion['fun'],
+                    'retcode': minion.get('retcode', 0),
+                    'success': minion.get('success', True),
+                    }
+                })
+        return ret
+
+    def _stage_thread(self, name, stage, done):
+        '''
+        Run a stage from a worker thread and report it as done
+        '''
+        start = time.time()
+        try:
+            ret = self._run_stage(name, stage)
+        except Exception as exc:
+            log.error(
+                'Failed to execute stage {0}'.format(name), exc_info=True
+            )
+            ret = self._failure(
+                'Failed to execute stage {0}: {1}'.format(name, exc),
+                'req_|-fail_|-fail_|-None',
+                254,
+                'Stage Failure')
+        done.put((name, ret, start, time.time()))
+
+    def _record_timing(self, name, stage, start, end):
+        '''
+        Record how long a stage ran and the length of the longest chain of
+        requisites ending with it
+        '''
+        after = None
+        path = 0
+        for req in stage.get('require') or []:
+            if req in self.timings and self.timings[req]['path'] > path:
+                after = req
+                path = self.timings[req]['path']
+        self.timings[name] = {'start': start,
+                              'duration': end - start,
+                              'path': path + end - start,
+                              'after': after}
+
+    def critical_path(self):
+        '''
+        Return the critical path of the last run, the longest chain of
+        requisites, as a list of ``(stage name, duration)`` tuples
+        '''
+        if not self.timings:
+            return []
+        name = max(self.timings, key=lambda key: self.timings[key]['path'])
+        path = []
+        while name is not None:
+            path.insert(0, (name, self.timings[name]['duration']))
+            name = self.timings[name]['after']
+        return path
+
+    def _schedule(self, names=None):
+        '''
+        Run the named stages and the stages they require, all of them by
+        default. The stages form a graph through their requisites, every
+        stage whose requisites have finished is started right away, with up
+        to ``overstate_parallel`` stages running at once. Yields
+        ``(name, ret)`` tuples as the stages finish, ``ret`` is a list of
+        errors for invalid stages.
+        '''
+        stages = {}
+        order = []
+        for comp in self.over:
+            order.append(comp.keys()[0])
+            stages[order[-1]] = comp[order[-1]]
+        if names is None:
+            names = order
+        wanted = set()
+        pending = list(names)
+        while pending:
+            name = pending.pop()
+            if name in wanted or name not in stages or name in self.over_run:
+                continue
+            wanted.add(name)
+            pending.extend(stages[name].get('require') or [])
+        todo = [name for name in order if name in wanted]
+
+        limit = max(int(self.opts.get('overstate_parallel', 1)), 1)
+        done = Queue.Queue()
+        running = set()
+        invalid = set()
+        while todo or running:
+            # Set when a stage finished without running, its dependents may
+            # be ready now
+            progress = False
+            for name in list(todo):
+                if len(running) >= limit:
+                    break
+                stage = stages[name]
+                v_stage = self.verify_stage(stage)
+                if isinstance(v_stage, list):
+                    todo.remove(name)
+                    invalid.add(name)
+                    progress = True
+                    yield name, v_stage
+                    continue
+                if any(req in todo or req in running
+                       for req in stage.get('require') or []):
+                    # Requisites still to run
+                    continue
+                todo.remove(name)
+                req_fail = self._check_reqs(name, stage, invalid)
+                if req_fail:
+                    progress = True
+                    self._record_timing(name, stage, time.time(), time.time())
+                    yield name, req_fail
                     continue
-                ret.update({minion['id']:
-                        {
-                        'ret': minion['return'],
-                        'fun': minion['fun'],
-                        'retcode': minion.get('retcode', 0),
-                        'success': minion.get('success', True),
-                        }
-                    })
+                running.add(name)
+                thread = threading.Thread(
+                    target=self._stage_thread,
+                    args=(name, stage, done)
+                )
+                thread.daemon = True
+                thread.start()
+            if not running:
+                if progress:
+                    continue
+                # Only stages requiring each other are left
+                for name in todo:
+                    yield name, self._req_failure(
+                        name,
+                        'Requisite cycle detected for stage {0}'.format(name),
+                        'req_|-fail_|-fail_|-None',
+                        254)
+                break
+            try:
+                name, ret, start, end = done.get(True, 1)
+            except Queue.Empty:
+                continue
+            running.discard(name)
             self.over_run[name] = ret
-            yield {name: ret}
+            self._record_timing(name, stages[name], start, end)
+            yield name, ret
+
+    def call_stage(self, name, stage):
+        '''
+        Run a stage, after the stages it requires, and yield the return of
+        each of them as ``{name: ret}``
+        '''
+        for sname, ret in self._schedule([name]):
+            yield {sname: ret}
 
     def stages(self):
         '''
         Execute the stages
         '''
-        self.over_run = {}
-
-        for comp in self.over:
-            name = comp.keys()[0]
-            stage = comp[name]
-            if name not in self.over_run:
-                self.call_stage(name, stage)
+        for _ in self.stages_iter():
+            pass
 
     def stages_iter(self):
         '''
         Return an iterator that yields the state call data as it is processed
         '''
-
-        def yielder(gen_ret):
-            if (not isinstance(gen_ret, list)
-                    and not isinstance(gen_ret, dict)
-                    and hasattr(gen_ret, 'next')):
-                for sub_ret in gen_ret:
-                    for yret in yielder(sub_ret):
-                        yield yret
-            else:
-                yield gen_ret
-
         self.over_run = {}
+        self.timings = {}
+        start = time.time()
         yield self.over
-        for comp in self.over:
-            name = comp.keys()[0]
-            stage = comp[name]
-            if name not in self.over_run:
-                v_stage = self.verify_stage(stage)
-                if isinstance(v_stage, list):
-                    yield [comp]
-                    yield v_stage
-                else:
-                    for sret in self.call_stage(name, stage):
-                        for yret in yielder(sret):
-                            sname = yret.keys()[0]
-                            yield [self.get_stage(sname)]
-                            final = {}
-                            for minion in yret[sname]:
-                                final[minion] = yret[sname][minion]['ret']
-                            yield final
+        for name, ret in self._schedule():
+            yield [self.get_stage(name)]
+            if isinstance(ret, list):
+                yield ret
+                continue
+            final = {}
+            for minion in ret:
+                final[minion] = ret[minion]['ret']
+            yield final
+        self.elapsed = time.time() - start
@@ -13,6 +13,7 @@ import bonneville.loader
 import bonneville.fileclient
 import bonneville.minion
 import bonneville.crypt
+import bonneville.utils.topcache
 from bonneville._compat import string_types
 from bonneville.template import compile_template
 from bonneville.utils.dictupdate import update
@@ -57,7 +58,9 @@ class RemotePillar(object):
                 'cmd': '_pillar'}
         if self.ext:
             load['ext'] = self.ext
-        ret = self.sreq.send('aes', self.auth.crypticle.dumps(load), 3, 7200)
+        ret = self.auth.crypted_transfer(
+            load, 3, 7200, self.sreq, decrypt=False
+        )
         key = self.auth.get_keys()
         aes = key.private_decrypt(ret['key'], 4)
         pcrypt = bonneville.crypt.Crypticle(self.opts, aes)
@@ -93,6 +96,8 @@ class Pillar(object):
         ext_pillar_opts = dict(self.opts)
         ext_pillar_opts['file_roots'] = self.actual_file_roots
         self.ext_pillars = bonneville.loader.pillars(ext_pillar_opts, self.functions)
+        self._top_keys = None
+        self._compiled_top = None
 
     def __valid_ext(self, ext):
         '''
@@ -141,10 +146,27 @@ class Pillar(object):
             envs.update(list(self.opts['file_roots']))
         return envs
 
+    def _render_top(self, path, env):
+        '''
+        Render a top file, recording the key of its cached rendered data
+        '''
+        if not self.opts.get('top_cache', True):
+            self._top_keys = None
+            return compile_template(path, self.rend, self.opts['renderer'], env)
+        data, key = bonneville.utils.topcache.render_top(
+            path, self.rend, self.opts['renderer'], env
+        )
+        if key is None or self._top_keys is None:
+            self._top_keys = None
+        else:
+            self._top_keys.append(key)
+        return data
+
     def get_tops(self):
         '''
         Gather the top files
         '''
+        self._top_keys = []
         tops = collections.defaultdict(list)
         include = collections.defaultdict(list)
         done = collections.defaultdict(list)
@@ -153,27 +175,23 @@ class Pillar(object):
         try:
             if self.opts['environment']:
                 tops[self.opts['environment']] = [
-                        compile_template(
+                        self._render_top(
                             self.client.cache_file(
                                 self.opts['state_top'],
                                 self.opts['environment']
                                 ),
-                            self.rend,
-                            self.opts['renderer'],
                             self.opts['environment']
                             )
                         ]
             else:
                 for env in self._get_envs():
                     tops[env].append(
-                            compile_template(
+                            self._render_top(
                                 self.client.cache_file(
                                     self.opts['state_top'],
                                     env
                                     ),
-                                self.rend,
-                                self.opts['renderer'],
-                                env=env
+                                env
                                 )
                             )
         except Exception as exc:
@@ -201,14 +219,12 @@ class Pillar(object):
                         continue
                     try:
                         tops[env].append(
-                                compile_template(
+                                self._render_top(
                                     self.client.get_state(
                                         sls,
                                         env
                                         ).get('dest', False),
-                                    self.rend,
-                                    self.opts['renderer'],
-                                    env=env
+                                    env
                                     )
                                 )
                     except Exception as exc:
@@ -272,7 +288,15 @@ class Pillar(object):
         Returns the high data derived from the top file
         '''
         tops, errors = self.get_tops()
-        return self.merge_tops(tops), errors
+        top = self.merge_tops(tops)
+        if self.opts.get('top_cache', True) and not errors:
+            keys = self._top_keys
+            if keys is not None:
+                keys = tuple(keys)
+            self._compiled_top = (
+                top, bonneville.utils.topcache.compile_top(keys, top)
+            )
+        return top, errors
 
     def top_matches(self, top):
         '''
@@ -282,6 +306,12 @@ class Pillar(object):
         Returns:
         {'env': ['state1', 'state2', ...]}
         '''
+        if self._compiled_top is not None and self._compiled_top[0] is top:
+            return self._compiled_top[1].matches(
+                self.matcher,
+                self.opts['environment'],
+                self.opts.get('nodegroups', {})
+                )
         matches = {}
         for env, body in top.items():
             if self.opts['environment']:
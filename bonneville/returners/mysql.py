@@ -17,6 +17,19 @@ config, these are the defaults::
     mysql.db: 'salt'
     mysql.port: 3306
 
+The connection to the server is kept open and reused by every call made in
+the same process. Returns can also be written in batches with multi-row
+inserts, which is recommended when this returner is used as the
+``master_ext_job_cache``. A batch is written once ``mysql.batch_size`` returns
+are buffered or ``mysql.batch_interval`` seconds after the first buffered
+return. Batches which cannot be written are spooled to ``mysql.spool_dir``,
+which defaults to ``returner_spool`` in the cachedir, and written once the
+server is reachable again. The batches the server refuses are kept in
+``.failed`` files of the spool directory::
+
+    mysql.batch_size: 100
+    mysql.batch_interval: 1
+
 Use the following mysql database schema::
 
     CREATE DATABASE  `salt`
@@ -58,10 +71,14 @@ Required python modules: MySQLdb
 
 # Import python libs
 from contextlib import contextmanager
+import os
 import sys
 import json
 import logging
 
+# Import bonneville libs
+from bonneville.utils.returnbuffer import PersistentConnection, ReturnBuffer
+
 # Import third party libs
 try:
     import MySQLdb
@@ -71,6 +88,9 @@ except ImportError:
 
 log = logging.getLogger(__name__)
 
+_CONN = None
+_BUFFER = None
+
 
 def __virtual__():
     if not HAS_MYSQL:
@@ -99,42 +119,91 @@ def _get_options():
     return _options
 
 
+def _connect():
+    '''
+    Open a new connection to the mysql server
+    '''
+    _options = _get_options()
+    return MySQLdb.connect(host=_options['host'], user=_options['user'], passwd=_options['pass'], db=_options['db'], port=_options['port'])
+
+
+def _get_conn():
+    '''
+    Return the connection kept open for this process
+    '''
+    global _CONN
+    if _CONN is None:
+        _CONN = PersistentConnection(_connect)
+    return _CONN
+
+
 @contextmanager
 def _get_serv(commit=False):
     '''
     Return a mysql cursor
     '''
-    _options = _get_options()
-    conn = MySQLdb.connect(host=_options['host'], user=_options['user'], passwd=_options['pass'], db=_options['db'], port=_options['port'])
-    cursor = conn.cursor()
-    try:
-        yield cursor
-    except MySQLdb.DatabaseError as err:
-        error, = err.args
-        sys.stderr.write(error.message)
-        cursor.execute("ROLLBACK")
-        raise err
-    else:
-        if commit:
-            cursor.execute("COMMIT")
-        else:
+    conn = _get_conn()
+    with conn.lock:
+        cursor = conn.get().cursor()
+        try:
+            yield cursor
+        except MySQLdb.OperationalError:
+            # The connection is most likely gone, open a new one next time
+            conn.reset()
+            raise
+        except MySQLdb.DatabaseError as err:
+            error, = err.args
+            sys.stderr.write(error.message)
             cursor.execute("ROLLBACK")
-    finally:
-        conn.close()
+            raise err
+        else:
+            if commit:
+                cursor.execute("COMMIT")
+            else:
+                cursor.execute("ROLLBACK")
+        finally:
+            cursor.close()
 
 
-def returner(ret):
+def _write_returns(rows):
     '''
-    Return data to a mysql server
+    Write a batch of returns with a single multi-row insert
     '''
     with _get_serv(commit=True) as cur:
         sql = '''INSERT INTO `salt_returns`
                 (`fun`, `jid`, `return`, `id`, `success`, `full_ret` )
                 VALUES (%s, %s, %s, %s, %s, %s)'''
 
-        cur.execute(sql, (ret['fun'], ret['jid'],
-                            str(ret['return']), ret['id'],
-                            ret['success'], json.dumps(ret)))
+        # MySQLdb turns executemany of an INSERT into a multi-row insert
+        cur.executemany(sql, rows)
+
+
+def _get_buffer():
+    '''
+    Return the write-behind buffer for the returns
+    '''
+    global _BUFFER
+    if _BUFFER is None:
+        spool_dir = __salt__['config.option']('mysql.spool_dir')
+        if not spool_dir:
+            spool_dir = os.path.join(__opts__['cachedir'], 'returner_spool')
+        _BUFFER = ReturnBuffer(
+            'mysql',
+            _write_returns,
+            size=__salt__['config.option']('mysql.batch_size') or 1,
+            interval=__salt__['config.option']('mysql.batch_interval') or 1,
+            spool_dir=spool_dir,
+            retry_errors=(MySQLdb.OperationalError, MySQLdb.InterfaceError))
+    return _BUFFER
+
+
+def returner(ret):
+    '''
+    Return data to a mysql server
+    '''
+    _get_buffer().add((ret['fun'], ret['jid'],
+                       str(ret['return']), ret['id'],
+                       ret['success'], json.dumps(ret)))
 
 
 def save_load(jid, load):
@@ -170,6 +239,7 @@ def get_jid(jid):
     '''
     Return the information returned when the specified job id was executed
     '''
+    _get_buffer().flush()
     with _get_serv(commit=True) as cur:
 
         sql = '''SELECT id, full_ret FROM `salt_returns`
@@ -188,6 +258,7 @@ def get_fun(fun):
     '''
     Return a dict of the last function called for all minions
     '''
+    _get_buffer().flush()
     with _get_serv(commit=True) as cur:
 
         sql = '''SELECT s.id,s.jid, s.full_ret
@@ -229,6 +300,7 @@ def get_minions():
     '''
     Return a list of minions
     '''
+    _get_buffer().flush()
     with _get_serv(commit=True) as cur:
 
         sql = '''SELECT DISTINCT id
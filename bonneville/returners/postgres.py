@@ -16,6 +16,20 @@ the following values configured in the minion or master config::
     returner.postgres.db: 'salt'
     returner.postgres.port: 5432
 
+The connection to the server is kept open and reused by every call made in
+the same process. Returns can also be written in batches with multi-row
+inserts, which is recommended when this returner is used as the
+``master_ext_job_cache``. A batch is written once
+``returner.postgres.batch_size`` returns are buffered or
+``returner.postgres.batch_interval`` seconds after the first buffered return.
+Batches which cannot be written are spooled to ``returner.postgres.spool_dir``,
+which defaults to ``returner_spool`` in the cachedir, and written once the
+server is reachable again. The batches the server refuses are kept in
+``.failed`` files of the spool directory::
+
+    returner.postgres.batch_size: 100
+    returner.postgres.batch_interval: 1
+
 Running the following commands as the postgres user should create the database
 correctly::
 
@@ -58,8 +72,13 @@ Required python modules: psycopg2
 '''
 
 # Import python libs
+from contextlib import contextmanager
+import os
 import json
 
+# Import bonneville libs
+from bonneville.utils.returnbuffer import PersistentConnection, ReturnBuffer
+
 # Import third party libs
 try:
     import psycopg2
@@ -68,6 +87,9 @@ try:
 except ImportError:
     HAS_POSTGRES = False
 
+_CONN = None
+_BUFFER = None
+
 
 def __virtual__():
     if not HAS_POSTGRES:
@@ -75,9 +97,9 @@ def __virtual__():
     return 'postgres'
 
 
-def _get_conn():
+def _connect():
     '''
-    Return a postgres connection.
+    Open a new postgres connection.
     '''
     return psycopg2.connect(
             host=__salt__['config.option']('returner.postgres.host'),
@@ -87,57 +109,109 @@ def _get_conn():
             port=__salt__['config.option']('returner.postgres.port'))
 
 
-def _close_conn(conn):
-    conn.commit()
-    conn.close()
+@contextmanager
+def _get_serv(commit=False):
+    '''
+    Return a cursor of the postgres connection kept open for this process
+    '''
+    global _CONN
+    if _CONN is None:
+        _CONN = PersistentConnection(_connect)
+    with _CONN.lock:
+        conn = _CONN.get()
+        cur = conn.cursor()
+        try:
+            yield cur
+        except psycopg2.Error:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                pass
+            if conn.closed:
+                # The server went away, open a new connection next time
+                _CONN.reset()
+            raise
+        else:
+            if commit:
+                conn.commit()
+            else:
+                conn.rollback()
+        finally:
+            if not cur.closed:
+                cur.close()
+
+
+def _write_returns(rows):
+    '''
+    Write a batch of returns with a single multi-row insert
+    '''
+    with _get_serv(commit=True) as cur:
+        values = ','.join(
+            cur.mogrify('(%s, %s, %s, %s, %s)', row) for row in rows
+        )
+        cur.execute(
+            'INSERT INTO salt_returns (fun, jid, return, id, success) '
+            'VALUES {0}'.format(values)
+        )
+
+
+def _get_buffer():
+    '''
+    Return the write-behind buffer for the returns
+    '''
+    global _BUFFER
+    if _BUFFER is None:
+        option = lambda name: __salt__['config.option'](
+            'returner.postgres.{0}'.format(name)
+        )
+        spool_dir = option('spool_dir')
+        if not spool_dir:
+            spool_dir = os.path.join(__opts__['cachedir'], 'returner_spool')
+        _BUFFER = ReturnBuffer(
+            'postgres',
+            _write_returns,
+            size=option('batch_size') or 1,
+            interval=option('batch_interval') or 1,
+            spool_dir=spool_dir,
+            retry_errors=(psycopg2.OperationalError,
+                          psycopg2.InterfaceError))
+    return _BUFFER
 
 
 def returner(ret):
     '''
     Return data to a postgres server
     '''
-    conn = _get_conn()
-    cur = conn.cursor()
-    sql = '''INSERT INTO salt_returns
-            (fun, jid, return, id, success)
-            VALUES (%s, %s, %s, %s, %s)'''
-    cur.execute(
-        sql, (
-            ret['fun'],
-            ret['jid'],
-            json.dumps(ret['return']),
-            ret['id'],
-            ret['success']
-        )
-    )
-    _close_conn(conn)
+    _get_buffer().add((
+        ret['fun'],
+        ret['jid'],
+        json.dumps(ret['return']),
+        ret['id'],
+        ret['success']
+    ))
 
 
 def save_load(jid, load):
     '''
     Save the load to the specified jid id
     '''
-    conn = _get_conn()
-    cur = conn.cursor()
-    sql = '''INSERT INTO jids (jid, load) VALUES (%s, %s)'''
+    with _get_serv(commit=True) as cur:
+        sql = '''INSERT INTO jids (jid, load) VALUES (%s, %s)'''
 
-    cur.execute(sql, (jid, json.dumps(load)))
-    _close_conn(conn)
+        cur.execute(sql, (jid, json.dumps(load)))
 
 
 def get_load(jid):
     '''
     Return the load data that marks a specified jid
     '''
-    conn = _get_conn()
-    cur = conn.cursor()
-    sql = '''SELECT load FROM jids WHERE jid = %s;'''
+    with _get_serv() as cur:
+        sql = '''SELECT load FROM jids WHERE jid = %s;'''
 
-    cur.execute(sql, (jid,))
-    data = cur.fetchone()
+        cur.execute(sql, (jid,))
+        data = cur.fetchone()
     if data:
         return json.loads(data)
-    _close_conn(conn)
     return {}
 
 
@@ -145,17 +219,16 @@ def get_jid(jid):
     '''
     Return the information returned when the specified job id was executed
     '''
-    conn = _get_conn()
-    cur = conn.cursor()
-    sql = '''SELECT id, full_ret FROM salt_returns WHERE jid = %s'''
+    _get_buffer().flush()
+    with _get_serv() as cur:
+        sql = '''SELECT id, full_ret FROM salt_returns WHERE jid = %s'''
 
-    cur.execute(sql, (jid,))
-    data = cur.fetchall()
+        cur.execute(sql, (jid,))
+        data = cur.fetchall()
     ret = {}
     if data:
         for minion, full_ret in data:
             ret[minion] = json.loads(full_ret)
-    _close_conn(conn)
     return ret
 
 
@@ -163,23 +236,22 @@ def get_fun(fun):
     '''
     Return a dict of the last function called for all minions
     '''
-    conn = _get_conn()
-    cur = conn.cursor()
-    sql = '''SELECT s.id,s.jid, s.full_ret
-            FROM salt_returns s
-            JOIN ( SELECT MAX(jid) AS jid FROM salt_returns GROUP BY fun, id) max
-            ON s.jid = max.jid
-            WHERE s.fun = %s
-            '''
-
-    cur.execute(sql, (fun,))
-    data = cur.fetchall()
+    _get_buffer().flush()
+    with _get_serv() as cur:
+        sql = '''SELECT s.id,s.jid, s.full_ret
+                FROM salt_returns s
+                JOIN ( SELECT MAX(jid) AS jid FROM salt_returns GROUP BY fun, id) max
+                ON s.jid = max.jid
+                WHERE s.fun = %s
+                '''
+
+        cur.execute(sql, (fun,))
+        data = cur.fetchall()
 
     ret = {}
     if data:
         for minion, jid, full_ret in data:
             ret[minion] = json.loads(full_ret)
-    _close_conn(conn)
     return ret
 
 
@@ -187,16 +259,14 @@ def get_jids():
     '''
     Return a list of all job ids
     '''
-    conn = _get_conn()
-    cur = conn.cursor()
-    sql = '''SELECT jid FROM jids'''
+    with _get_serv() as cur:
+        sql = '''SELECT jid FROM jids'''
 
-    cur.execute(sql)
-    data = cur.fetchall()
+        cur.execute(sql)
+        data = cur.fetchall()
     ret = []
     for jid in data:
         ret.append(jid[0])
-    _close_conn(conn)
     return ret
 
 
@@ -204,14 +274,13 @@ def get_minions():
     '''
     Return a list of minions
     '''
-    conn = _get_conn()
-    cur = conn.cursor()
-    sql = '''SELECT DISTINCT id FROM salt_returns'''
+    _get_buffer().flush()
+    with _get_serv() as cur:
+        sql = '''SELECT DISTINCT id FROM salt_returns'''
 
-    cur.execute(sql)
-    data = cur.fetchall()
+        cur.execute(sql)
+        data = cur.fetchall()
     ret = []
     for minion in data:
         ret.append(minion[0])
-    _close_conn(conn)
     return ret
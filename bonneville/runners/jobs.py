@@ -5,6 +5,7 @@ A convenience system to manage jobs, both active and already run
 
 # Import python libs
 import os
+import fnmatch
 
 # Import bonneville libs
 import bonneville.client
@@ -12,6 +13,7 @@ import bonneville.payload
 import bonneville.utils
 import bonneville.output
 import bonneville.minion
+import bonneville.utils.jobindex
 
 
 def active():
@@ -84,10 +86,17 @@ def lookup_jid(jid, ext_source=None):
         bonneville.output.display_output(ret, out, __opts__)
         return ret
 
-    # Fall back to the local job cache
+    # Fall back to the local job cache, the job is already finished so a
+    # single pass over the cache is enough
+    jid_dir = bonneville.utils.jid_dir(
+            jid,
+            __opts__['cachedir'],
+            __opts__['hash_type'])
+    if not os.path.isdir(jid_dir):
+        return ret
     client = bonneville.client.LocalClient(__opts__['conf_file'])
 
-    for mid, data in client.get_full_returns(jid, [], 0).items():
+    for mid, data in client.get_cache_returns(jid).items():
         ret[mid] = data.get('ret')
         bonneville.output.display_output(
                 {mid: ret[mid]},
@@ -97,18 +106,37 @@ def lookup_jid(jid, ext_source=None):
     return ret
 
 
-def list_jobs():
+def list_jobs(start=None,
+              end=None,
+              fun=None,
+              tgt=None,
+              user=None,
+              limit=None,
+              offset=0):
     '''
     List all detectable jobs and associated functions
 
+    The jobs can be filtered by a time range given as (partial) job ids in
+    the form ``YYYYMMDD[HH[MM[SS]]]``, by function and target globs and by
+    user. ``limit`` and ``offset`` paginate the results, newest jobs first.
+    The jobs are served from the job index when :conf_master:`job_index` is
+    enabled.
+
     CLI Example:
 
     .. code-block:: bash
 
         salt-run jobs.list_jobs
+        salt-run jobs.list_jobs start=20131020 fun='state.*' limit=20
     '''
+    if __opts__.get('job_index', False):
+        index = bonneville.utils.jobindex.JobIndex(__opts__)
+        ret = dict(index.query(start, end, fun, tgt, user, limit, offset))
+        bonneville.output.display_output(ret, 'yaml', __opts__)
+        return ret
+
     serial = bonneville.payload.Serial(__opts__)
-    ret = {}
+    jobs = []
     job_dir = os.path.join(__opts__['cachedir'], 'jobs')
     for top in os.listdir(job_dir):
         t_path = os.path.join(job_dir, top)
@@ -118,16 +146,53 @@ def list_jobs():
                 continue
             load = serial.load(bonneville.utils.fopen(loadpath, 'rb'))
             jid = load['jid']
-            ret[jid] = {'Start Time': bonneville.utils.jid_to_time(jid),
-                        'Function': load['fun'],
-                        'Arguments': list(load['arg']),
-                        'Target': load['tgt'],
-                        'Target-type': load['tgt_type'],
-                        'User': load.get('user', 'root')}
+            if start and jid < str(start).ljust(20, '0'):
+                continue
+            if end and jid > str(end).ljust(20, '9'):
+                continue
+            if fun:
+                # The functions of a compound job are a list
+                funs = load['fun']
+                if not isinstance(funs, list):
+                    funs = [funs]
+                if not any(fnmatch.fnmatch(name, fun) for name in funs):
+                    continue
+            if tgt and not fnmatch.fnmatch(str(load['tgt']), tgt):
+                continue
+            if user and load.get('user', 'root') != user:
+                continue
+            jobs.append(
+                (jid, {'Start Time': bonneville.utils.jid_to_time(jid),
+                       'Function': load['fun'],
+                       'Arguments': list(load['arg']),
+                       'Target': load['tgt'],
+                       'Target-type': load['tgt_type'],
+                       'User': load.get('user', 'root')}))
+    jobs.sort(reverse=True)
+    if limit:
+        jobs = jobs[int(offset or 0):int(offset or 0) + int(limit)]
+    ret = dict(jobs)
     bonneville.output.display_output(ret, 'yaml', __opts__)
     return ret
 
 
+def rebuild_index():
+    '''
+    Rebuild the job index from the contents of the job cache
+
+    CLI Example:
+
+    .. code-block:: bash
+
+        salt-run jobs.rebuild_index
+    '''
+    index = bonneville.utils.jobindex.JobIndex(__opts__)
+    count = index.rebuild()
+    ret = 'Indexed {0} jobs'.format(count)
+    bonneville.output.display_output(ret, '', __opts__)
+    return ret
+
+
 def print_job(job_id):
     '''
     Print job available details, including return data.
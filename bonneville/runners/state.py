@@ -48,6 +48,12 @@ def over(env='base', os_fn=None):
                 print('Executed Stage:')
             bonneville.output.display_output(stage, 'overstatestage', opts=__opts__)
             stage_num += 1
+    path = overstate.critical_path()
+    if path:
+        print('Critical path: {0}, {1:.2f}s of {2:.2f}s'.format(
+            ' -> '.join('{0} ({1:.2f}s)'.format(*item) for item in path),
+            sum(item[1] for item in path),
+            overstate.elapsed))
     return overstate.over_run
 
 
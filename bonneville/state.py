@@ -29,6 +29,7 @@ import bonneville.minion
 import bonneville.pillar
 import bonneville.fileclient
 import bonneville.utils.event
+import bonneville.utils.topcache
 import bonneville.syspaths as syspaths
 from bonneville._compat import string_types
 from bonneville.template import compile_template, compile_template_str
@@ -1345,18 +1346,117 @@ class State(object):
         Iterate over a list of chunks and call them, checking for requires.
         '''
         running = {}
-        for low in chunks:
+        for ind, low in enumerate(chunks):
             if '__FAILHARD__' in running:
                 running.pop('__FAILHARD__')
                 return running
             tag = _gen_tag(low)
             if tag not in running:
+                group = self.aggregate_group(chunks, ind, running)
+                if group:
+                    running = self.call_aggregate(group, running)
+                    for glow in group:
+                        if self.check_failhard(glow, running):
+                            return running
+                    continue
                 running = self.call_chunk(low, running, chunks)
                 if self.check_failhard(low, running):
                     return running
             self.active = set()
         return running
 
+    def _can_aggregate(self, low):
+        '''
+        Check if a chunk can be merged with its neighbours, only chunks of
+        state modules with a mod_aggregate function and without requisites
+        are merged
+        '''
+        if not self.opts.get('state_aggregate', False):
+            return False
+        if low.get('aggregate', True) is False:
+            return False
+        if '{0}.mod_aggregate'.format(low['state']) not in self.states:
+            return False
+        for key in ('require', 'watch', 'prereq', 'prerequired',
+                    '__prereq__', 'provider'):
+            if low.get(key):
+                return False
+        return not self.verify_data(low)
+
+    def aggregate_group(self, chunks, ind, running):
+        '''
+        Return the chunks, starting with the chunk at index ``ind``, which
+        can be run together by the mod_aggregate function of their state
+        module. An empty list is returned if there is nothing to merge.
+        '''
+        low = chunks[ind]
+        if not self._can_aggregate(low):
+            return []
+        group = [low]
+        for chunk in chunks[ind + 1:]:
+            if _gen_tag(chunk) in running:
+                # Already called as the requisite of an earlier chunk
+                continue
+            if chunk['state'] != low['state'] or chunk['fun'] != low['fun']:
+                break
+            if not self._can_aggregate(chunk):
+                break
+            group.append(chunk)
+        if len(group) < 2:
+            return []
+        return group
+
+    def call_aggregate(self, lows, running):
+        '''
+        Call a group of chunks of the same state function with a single call
+        to the mod_aggregate function of their state module, the returns are
+        added to the running data under the tag of each chunk
+        '''
+        full = '{0[state]}.{0[fun]}'.format(lows[0])
+        aspec = bonneville.utils.get_function_argspec(self.states[full])
+        calls = []
+        for low in lows:
+            self._mod_init(low)
+            log.info(
+                    'Executing state {0[state]}.{0[fun]} for {0[name]} '
+                    '(aggregated)'.format(low)
+                    )
+            cdata = self.format_call(low)
+            kwargs = dict(zip(aspec.args, cdata['args']))
+            kwargs.update(cdata.get('kwargs', {}))
+            calls.append(kwargs)
+        try:
+            rets = self.states['{0}.mod_aggregate'.format(lows[0]['state'])](
+                    lows[0]['fun'], calls)
+            if len(rets) != len(lows):
+                raise SaltException(
+                        'mod_aggregate returned {0} returns for {1} '
+                        'states'.format(len(rets), len(lows))
+                        )
+            for ret in rets:
+                self.verify_ret(ret)
+        except Exception:
+            log.error(
+                    'Failed to run the {0} states together, running them one '
+                    'by one'.format(full),
+                    exc_info=True
+                    )
+            for low in lows:
+                running[_gen_tag(low)] = self.call(low)
+            return running
+        refreshed = False
+        for low, ret in zip(lows, rets):
+            ret['__run_num__'] = self.__run_num
+            self.__run_num += 1
+            format_log(ret)
+            if not refreshed and (
+                    ret['changes'] or low.get('reload_modules', False)):
+                # A single module refresh covers the whole group
+                self.check_refresh(low, ret)
+                refreshed = True
+            running[_gen_tag(low)] = ret
+        return running
+
     def check_failhard(self, low, running):
         '''
         Check if the low data chunk should send a failhard signal
@@ -1732,6 +1832,8 @@ class BaseHighState(object):
         self.iorder = 10000
         self.avail = self.__gather_avail()
         self.serial = bonneville.payload.Serial(self.opts)
+        self._top_keys = None
+        self._compiled_top = None
 
     def __gather_avail(self):
         '''
@@ -1787,37 +1889,52 @@ class BaseHighState(object):
             envs.update(list(self.opts['file_roots']))
         return envs
 
+    def _render_top(self, path, env):
+        '''
+        Render a top file, recording the key of its cached rendered data
+        '''
+        if not self.opts.get('top_cache', True):
+            self._top_keys = None
+            return compile_template(
+                path, self.state.rend, self.state.opts['renderer'], env=env
+            )
+        data, key = bonneville.utils.topcache.render_top(
+            path, self.state.rend, self.state.opts['renderer'], env
+        )
+        if key is None or self._top_keys is None:
+            self._top_keys = None
+        else:
+            self._top_keys.append(key)
+        return data
+
     def get_tops(self):
         '''
         Gather the top files
         '''
+        self._top_keys = []
         tops = collections.defaultdict(list)
         include = collections.defaultdict(list)
         done = collections.defaultdict(list)
         # Gather initial top files
         if self.opts['environment']:
             tops[self.opts['environment']] = [
-                    compile_template(
+                    self._render_top(
                         self.client.cache_file(
                             self.opts['state_top'],
                             self.opts['environment']
                             ),
-                        self.state.rend,
-                        self.state.opts['renderer'],
-                        env=self.opts['environment']
+                        self.opts['environment']
                         )
                     ]
         else:
             for env in self._get_envs():
                 tops[env].append(
-                        compile_template(
+                        self._render_top(
                             self.client.cache_file(
                                 self.opts['state_top'],
                                 env
                                 ),
-                            self.state.rend,
-                            self.state.opts['renderer'],
-                            env=env
+                            env
                             )
                         )
 
@@ -1841,14 +1958,12 @@ class BaseHighState(object):
                         if sls in done[env]:
                             continue
                         tops[env].append(
-                                compile_template(
+                                self._render_top(
                                     self.client.get_state(
                                         sls,
                                         env
                                         ).get('dest', False),
-                                    self.state.rend,
-                                    self.state.opts['renderer'],
-                                    env=env
+                                    env
                                     )
                                 )
                         done[env].append(sls)
@@ -1935,7 +2050,15 @@ class BaseHighState(object):
         Returns the high data derived from the top file
         '''
         tops = self.get_tops()
-        return self.merge_tops(tops)
+        top = self.merge_tops(tops)
+        if self.opts.get('top_cache', True):
+            keys = self._top_keys
+            if keys is not None:
+                keys = tuple(keys)
+            self._compiled_top = (
+                top, bonneville.utils.topcache.compile_top(keys, top)
+            )
+        return top
 
     def top_matches(self, top):
         '''
@@ -1946,23 +2069,30 @@ class BaseHighState(object):
         {'env': ['state1', 'state2', ...]}
         '''
         matches = {}
-        for env, body in top.items():
-            if self.opts['environment']:
-                if env != self.opts['environment']:
-                    continue
-            for match, data in body.items():
-                if isinstance(data, string_types):
-                    data = [data]
-                if self.matcher.confirm_top(
-                        match,
-                        data,
-                        self.opts['nodegroups']
-                        ):
-                    if env not in matches:
-                        matches[env] = []
-                    for item in data:
-                        if isinstance(item, string_types):
-                            matches[env].append(item)
+        if self._compiled_top is not None and self._compiled_top[0] is top:
+            matches = self._compiled_top[1].matches(
+                self.matcher,
+                self.opts['environment'],
+                self.opts['nodegroups']
+                )
+        else:
+            for env, body in top.items():
+                if self.opts['environment']:
+                    if env != self.opts['environment']:
+                        continue
+                for match, data in body.items():
+                    if isinstance(data, string_types):
+                        data = [data]
+                    if self.matcher.confirm_top(
+                            match,
+                            data,
+                            self.opts['nodegroups']
+                            ):
+                        if env not in matches:
+                            matches[env] = []
+                        for item in data:
+                            if isinstance(item, string_types):
+                                matches[env].append(item)
         ext_matches = self.client.ext_nodes()
         for env in ext_matches:
             if env in matches:
@@ -2547,10 +2677,6 @@ class RemoteHighState(object):
                 'opts': self.opts,
                 'cmd': '_master_state'}
         try:
-            return self.auth.crypticle.loads(self.sreq.send(
-                    'aes',
-                    self.auth.crypticle.dumps(load),
-                    3,
-                    72000))
+            return self.auth.crypted_transfer(load, 3, 72000, self.sreq)
         except SaltReqTimeoutError:
             return {}
@@ -1620,6 +1620,12 @@ def recurse(name,
         #we're searching for things that start with this *directory*.
         # use '/' since #master only runs on POSIX
         srcpath = srcpath + '/'
+    if not include_pat and not exclude_pat and maxdepth is None:
+        # Fetch the changed files of the whole tree in bulk, the files are
+        # then managed out of the minion file cache. Nothing is prefetched
+        # from the masters which cannot serve the tree in bulk, the files
+        # are fetched one by one as they are managed.
+        __salt__['cp.cache_tree'](source, env)
     for fn_ in __salt__['cp.list_master'](env, srcpath):
         if not fn_.strip():
             continue
@@ -31,6 +31,17 @@ This is necessary and can not be replaced by a require clause in the pkg.
 
     logstash:
       pkg.installed
+
+Adjacent ``pkg.installed`` or ``pkg.latest`` states without requisites are
+run together, with a single call to the package manager, when
+:conf_minion:`state_aggregate` is enabled. Each state still gets its own
+result. Set ``aggregate`` to ``False`` to always run a state on its own:
+
+.. code-block:: yaml
+
+    kernel:
+      pkg.latest:
+        - aggregate: False
 '''
 
 # Import python libs
@@ -266,6 +277,64 @@ def _verify_install(desired, new_pkgs):
     return ok, failed
 
 
+def _installed_ret(name,
+                   desired,
+                   targets,
+                   changes,
+                   comment,
+                   new_pkgs=None,
+                   sources=None):
+    '''
+    Build the return of pkg.installed from the changes made by pkg.install
+    and the packages installed afterwards
+    '''
+    comment = list(comment)
+    if sources:
+        modified = [x for x in changes.keys() if x in targets]
+        not_modified = [x for x in desired if x not in targets]
+        failed = [x for x in targets if x not in modified]
+    else:
+        ok, failed = _verify_install(desired, new_pkgs)
+        modified = [x for x in ok if x in targets]
+        not_modified = [x for x in ok if x not in targets]
+
+    if modified:
+        if sources:
+            summary = ', '.join(modified)
+        else:
+            summary = ', '.join([_get_desired_pkg(x, desired)
+                                 for x in modified])
+        comment.append('The following packages were installed/updated: '
+                       '{0}.'.format(summary))
+
+    if not_modified:
+        if sources:
+            summary = ', '.join(not_modified)
+        else:
+            summary = ', '.join([_get_desired_pkg(x, desired)
+                                 for x in not_modified])
+        comment.append('The following packages were already installed: '
+                       '{0}.'.format(summary))
+
+    if failed:
+        if sources:
+            summary = ', '.join(failed)
+        else:
+            summary = ', '.join([_get_desired_pkg(x, desired)
+                                 for x in failed])
+        comment.insert(0, 'The following packages failed to '
+                          'install/update: {0}.'.format(summary))
+        return {'name': name,
+                'changes': changes,
+                'result': False,
+                'comment': ' '.join(comment)}
+    else:
+        return {'name': name,
+                'changes': changes,
+                'result': True,
+                'comment': ' '.join(comment)}
+
+
 def _get_desired_pkg(name, desired):
     '''
     Helper function that retrieves and nicely formats the desired pkg (and
@@ -475,51 +544,117 @@ def installed(
         changes = {}
 
     if sources:
-        modified = [x for x in changes.keys() if x in targets]
-        not_modified = [x for x in desired if x not in targets]
-        failed = [x for x in targets if x not in modified]
+        new_pkgs = None
     else:
-        ok, failed = \
-            _verify_install(desired,
-                            __salt__['pkg.list_pkgs'](versions_as_list=True))
-        modified = [x for x in ok if x in targets]
-        not_modified = [x for x in ok if x not in targets]
+        new_pkgs = __salt__['pkg.list_pkgs'](versions_as_list=True)
+    return _installed_ret(name, desired, targets, changes, comment, new_pkgs,
+                          sources)
 
-    if modified:
-        if sources:
-            summary = ', '.join(modified)
-        else:
-            summary = ', '.join([_get_desired_pkg(x, desired)
-                                 for x in modified])
-        comment.append('The following packages were installed/updated: '
-                       '{0}.'.format(summary))
 
-    if not_modified:
-        if sources:
-            summary = ', '.join(not_modified)
+def _latest_targets(desired_pkgs, cur, avail):
+    '''
+    Return the packages which need to be installed or upgraded to reach the
+    latest available version, along with the packages nothing is known about
+    '''
+    targets = {}
+    problems = []
+    for pkg in desired_pkgs:
+        if not avail[pkg]:
+            if not cur[pkg]:
+                msg = 'No information found for "{0}".'.format(pkg)
+                log.error(msg)
+                problems.append(msg)
+        elif not cur[pkg] \
+                or bonneville.utils.compare_versions(
+                    ver1=cur[pkg],
+                    oper='<',
+                    ver2=avail[pkg],
+                    cmp_func=__salt__.get('version_cmp')):
+            targets[pkg] = avail[pkg]
+
+    return targets, problems
+
+
+def _latest_ret(name, pkgs, desired_pkgs, targets, changes):
+    '''
+    Build the return of pkg.latest from the changes made by pkg.install
+    '''
+    if targets:
+        # Find up-to-date packages
+        if not pkgs:
+            # There couldn't have been any up-to-date packages if this state
+            # only targeted a single package and is being allowed to proceed to
+            # the install step.
+            up_to_date = []
         else:
-            summary = ', '.join([_get_desired_pkg(x, desired)
-                                 for x in not_modified])
-        comment.append('The following packages were already installed: '
-                       '{0}.'.format(summary))
+            up_to_date = [x for x in pkgs if x not in targets]
 
-    if failed:
-        if sources:
-            summary = ', '.join(failed)
+        if changes:
+            # Find failed and successful updates
+            failed = [x for x in targets
+                      if not changes.get(x) or changes[x]['new'] != targets[x]]
+            successful = [x for x in targets if x not in failed]
+
+            comments = []
+            if failed:
+                msg = 'The following packages failed to update: ' \
+                      '{0}.'.format(', '.join(sorted(failed)))
+                comments.append(msg)
+            if successful:
+                msg = 'The following packages were successfully ' \
+                      'installed/upgraded: ' \
+                      '{0}.'.format(', '.join(sorted(successful)))
+                comments.append(msg)
+            if up_to_date:
+                if len(up_to_date) <= 10:
+                    msg = 'The following packages were already up-to-date: ' \
+                        '{0}.'.format(', '.join(sorted(up_to_date)))
+                else:
+                    msg = '{0} packages were already up-to-date. '.format(
+                        len(up_to_date))
+                comments.append(msg)
+
+            return {'name': name,
+                    'changes': changes,
+                    'result': False if failed else True,
+                    'comment': ' '.join(comments)}
         else:
-            summary = ', '.join([_get_desired_pkg(x, desired)
-                                 for x in failed])
-        comment.insert(0, 'The following packages failed to '
-                          'install/update: {0}.'.format(summary))
-        return {'name': name,
-                'changes': changes,
-                'result': False,
-                'comment': ' '.join(comment)}
+            if len(targets) > 10:
+                comment = 'All targeted {0} packages failed to update.'\
+                    .format(len(targets))
+            elif len(targets) > 1:
+                comment = 'All targeted packages failed to update: ' \
+                          '({0}).'.format(', '.join(sorted(targets.keys())))
+            else:
+                comment = 'Package {0} failed to ' \
+                          'update.'.format(targets.keys()[0])
+            if up_to_date:
+                if len(up_to_date) <= 10:
+                    comment += ' The following packages were already ' \
+                        'up-to-date: ' \
+                        '{0}'.format(', '.join(sorted(up_to_date)))
+                else:
+                    comment += '{0} packages were already ' \
+                        'up-to-date.'.format(len(up_to_date))
+            return {'name': name,
+                    'changes': changes,
+                    'result': False,
+                    'comment': comment}
     else:
+        if len(desired_pkgs) > 10:
+            comment = 'All {0} packages are up-to-date.'.format(
+                len(desired_pkgs))
+        elif len(desired_pkgs) > 1:
+            comment = 'All packages are up-to-date ' \
+                '({0}).'.format(', '.join(sorted(desired_pkgs)))
+        else:
+            comment = 'Package {0} is already ' \
+                'up-to-date.'.format(desired_pkgs[0])
+
         return {'name': name,
-                'changes': changes,
+                'changes': {},
                 'result': True,
-                'comment': ' '.join(comment)}
+                'comment': comment}
 
 
 def latest(
@@ -605,21 +740,7 @@ def latest(
     if isinstance(avail, basestring):
         avail = {desired_pkgs[0]: avail}
 
-    targets = {}
-    problems = []
-    for pkg in desired_pkgs:
-        if not avail[pkg]:
-            if not cur[pkg]:
-                msg = 'No information found for "{0}".'.format(pkg)
-                log.error(msg)
-                problems.append(msg)
-        elif not cur[pkg] \
-                or bonneville.utils.compare_versions(
-                    ver1=cur[pkg],
-                    oper='<',
-                    ver2=avail[pkg],
-                    cmp_func=__salt__.get('version_cmp')):
-            targets[pkg] = avail[pkg]
+    targets, problems = _latest_targets(desired_pkgs, cur, avail)
 
     if problems:
         return {'name': name,
@@ -666,73 +787,10 @@ def latest(
                                           skip_verify=skip_verify,
                                           pkgs=targeted_pkgs,
                                           **kwargs)
-
-        if changes:
-            # Find failed and successful updates
-            failed = [x for x in targets
-                      if not changes.get(x) or changes[x]['new'] != targets[x]]
-            successful = [x for x in targets if x not in failed]
-
-            comments = []
-            if failed:
-                msg = 'The following packages failed to update: ' \
-                      '{0}.'.format(', '.join(sorted(failed)))
-                comments.append(msg)
-            if successful:
-                msg = 'The following packages were successfully ' \
-                      'installed/upgraded: ' \
-                      '{0}.'.format(', '.join(sorted(successful)))
-                comments.append(msg)
-            if up_to_date:
-                if len(up_to_date) <= 10:
-                    msg = 'The following packages were already up-to-date: ' \
-                        '{0}.'.format(', '.join(sorted(up_to_date)))
-                else:
-                    msg = '{0} packages were already up-to-date. '.format(
-                        len(up_to_date))
-                comments.append(msg)
-
-            return {'name': name,
-                    'changes': changes,
-                    'result': False if failed else True,
-                    'comment': ' '.join(comments)}
-        else:
-            if len(targets) > 10:
-                comment = 'All targeted {0} packages failed to update.'\
-                    .format(len(targets))
-            elif len(targets) > 1:
-                comment = 'All targeted packages failed to update: ' \
-                          '({0}).'.format(', '.join(sorted(targets.keys())))
-            else:
-                comment = 'Package {0} failed to ' \
-                          'update.'.format(targets.keys()[0])
-            if up_to_date:
-                if len(up_to_date) <= 10:
-                    comment += ' The following packages were already ' \
-                        'up-to-date: ' \
-                        '{0}'.format(', '.join(sorted(up_to_date)))
-                else:
-                    comment += '{0} packages were already ' \
-                        'up-to-date.'.format(len(up_to_date))
-            return {'name': name,
-                    'changes': changes,
-                    'result': False,
-                    'comment': comment}
     else:
-        if len(desired_pkgs) > 10:
-            comment = 'All {0} packages are up-to-date.'.format(
-                len(desired_pkgs))
-        elif len(desired_pkgs) > 1:
-            comment = 'All packages are up-to-date ' \
-                '({0}).'.format(', '.join(sorted(desired_pkgs)))
-        else:
-            comment = 'Package {0} is already ' \
-                'up-to-date.'.format(desired_pkgs[0])
+        changes = {}
 
-        return {'name': name,
-                'changes': {},
-                'result': True,
-                'comment': comment}
+    return _latest_ret(name, pkgs, desired_pkgs, targets, changes)
 
 
 def _uninstall(action='remove', name=None, pkgs=None, **kwargs):
@@ -883,3 +941,241 @@ def mod_init(low):
             bonneville.utils.fopen(rtag, 'w+').write('')
         return ret
     return False
+
+
+# The arguments which may differ between the states merged by mod_aggregate,
+# the other arguments must be the same for the states to be merged
+_AGGREGATE_OWN_ARGS = ('name', 'version', 'pkgs', 'state', 'fun', 'order',
+                       'aggregate')
+
+
+def _aggregate_key(kwargs):
+    '''
+    Return the arguments shared by the states which can be merged with this
+    one
+    '''
+    return tuple(sorted(
+        (key, repr(val)) for key, val in kwargs.items()
+        if key not in _AGGREGATE_OWN_ARGS and not key.startswith('__')
+    ))
+
+
+def _aggregate_args(kwargs):
+    '''
+    Return the arguments passed on to the package manager for a merged group
+    of states
+    '''
+    return dict(
+        (key, val) for key, val in kwargs.items()
+        if key not in _AGGREGATE_OWN_ARGS and not key.startswith('__')
+    )
+
+
+def _split_changes(changes, owned, targets):
+    '''
+    Split the changes of a merged pkg.install between the states of the
+    group, ``owned`` holds the packages of every state and ``targets`` the
+    packages it had to install. The packages no state asked for, the
+    dependencies pulled in by the install, go to the first state which had
+    something to install, as they would if it had run on its own.
+    '''
+    split = [dict((x, y) for x, y in changes.items() if x in names)
+             for names in owned]
+    claimed = set()
+    for names in owned:
+        claimed.update(names)
+    deps = dict((x, y) for x, y in changes.items() if x not in claimed)
+    if deps:
+        for own, wanted in zip(split, targets):
+            if wanted:
+                own.update(deps)
+                break
+    return split
+
+
+def _aggregate_installed(calls):
+    '''
+    Run a group of pkg.installed states with a single pkg.install call
+    '''
+    rtag = __gen_rtag()
+    args = _aggregate_args(calls[0])
+    refresh = args.pop('refresh', False)
+    fromrepo = args.pop('fromrepo', None)
+    skip_verify = args.pop('skip_verify', False)
+
+    if bonneville.utils.is_true(refresh) or os.path.isfile(rtag):
+        __salt__['pkg.refresh_db']()
+        if os.path.isfile(rtag):
+            os.remove(rtag)
+
+    rets = [None] * len(calls)
+    wanted = {}
+    found = []
+    for ind, kwargs in enumerate(calls):
+        version = kwargs.get('version')
+        if not isinstance(version, basestring) and version is not None:
+            version = str(version)
+        result = _find_install_targets(kwargs['name'],
+                                       version,
+                                       kwargs.get('pkgs'),
+                                       None,
+                                       fromrepo=fromrepo,
+                                       **args)
+        try:
+            desired, targets = result
+        except ValueError:
+            rets[ind] = result
+            continue
+        if any(wanted.get(pkg, ver) != ver for pkg, ver in targets.items()):
+            # Another state of the group wants another version of the same
+            # package, this one cannot be merged
+            rets[ind] = installed(**dict(kwargs, refresh=False))
+            continue
+        wanted.update(targets)
+        found.append((ind, desired, targets))
+
+    if not found:
+        return rets
+
+    changes = {}
+    comment = []
+    if wanted:
+        pkg_ret = __salt__['pkg.install'](calls[found[0][0]]['name'],
+                                          refresh=False,
+                                          fromrepo=fromrepo,
+                                          skip_verify=skip_verify,
+                                          pkgs=[dict([(x, y)]) for x, y
+                                                in wanted.items()],
+                                          **args)
+        if isinstance(pkg_ret, dict):
+            changes = pkg_ret
+        elif isinstance(pkg_ret, basestring):
+            comment.append(pkg_ret)
+    new_pkgs = __salt__['pkg.list_pkgs'](versions_as_list=True)
+
+    split = _split_changes(changes,
+                           [desired for _, desired, _ in found],
+                           [targets for _, _, targets in found])
+    for (ind, desired, targets), own in zip(found, split):
+        rets[ind] = _installed_ret(calls[ind]['name'],
+                                   desired,
+                                   targets,
+                                   own,
+                                   comment,
+                                   new_pkgs)
+    return rets
+
+
+def _aggregate_latest(calls):
+    '''
+    Run a group of pkg.latest states with a single pkg.install call
+    '''
+    rtag = __gen_rtag()
+    args = _aggregate_args(calls[0])
+    refresh = args.pop('refresh', False)
+    fromrepo = args.pop('fromrepo', None)
+    skip_verify = args.pop('skip_verify', False)
+
+    rets = [None] * len(calls)
+    found = []
+    all_pkgs = []
+    for ind, kwargs in enumerate(calls):
+        if kwargs.get('pkgs'):
+            desired_pkgs = _repack_pkgs(kwargs['pkgs']).keys()
+            if not desired_pkgs:
+                rets[ind] = latest(**kwargs)
+                continue
+        else:
+            desired_pkgs = [kwargs['name']]
+        found.append((ind, desired_pkgs))
+        all_pkgs.extend(x for x in desired_pkgs if x not in all_pkgs)
+
+    if not found:
+        return rets
+
+    refresh = bonneville.utils.is_true(refresh) or os.path.isfile(rtag)
+    cur = __salt__['pkg.version'](*all_pkgs)
+    avail = __salt__['pkg.latest_version'](*all_pkgs,
+                                           fromrepo=fromrepo,
+                                           refresh=refresh,
+                                           **args)
+    if os.path.isfile(rtag):
+        os.remove(rtag)
+    if isinstance(cur, basestring):
+        cur = {all_pkgs[0]: cur}
+    if isinstance(avail, basestring):
+        avail = {all_pkgs[0]: avail}
+
+    wanted = {}
+    ready = []
+    for ind, desired_pkgs in found:
+        targets, problems = _latest_targets(desired_pkgs, cur, avail)
+        if problems:
+            rets[ind] = {'name': calls[ind]['name'],
+                         'changes': {},
+                         'result': False,
+                         'comment': ' '.join(problems)}
+            continue
+        wanted.update(targets)
+        ready.append((ind, desired_pkgs, targets))
+
+    changes = {}
+    if wanted:
+        changes = __salt__['pkg.install'](calls[ready[0][0]]['name'],
+                                          refresh=False,
+                                          fromrepo=fromrepo,
+                                          skip_verify=skip_verify,
+                                          pkgs=sorted(wanted),
+                                          **args)
+        if not isinstance(changes, dict):
+            changes = {}
+
+    split = _split_changes(changes,
+                           [targets for _, _, targets in ready],
+                           [targets for _, _, targets in ready])
+    for (ind, desired_pkgs, targets), own in zip(ready, split):
+        rets[ind] = _latest_ret(calls[ind]['name'],
+                                calls[ind].get('pkgs'),
+                                desired_pkgs,
+                                targets,
+                                own)
+    return rets
+
+
+def mod_aggregate(fun, calls):
+    '''
+    Run adjacent ``pkg.installed`` or ``pkg.latest`` states together, with a
+    single run of the package manager, instead of one run per state. This is
+    called by the state system, see :conf_minion:`state_aggregate`.
+
+    ``calls`` holds the arguments of every state, the returns are handed
+    back in the same order. States are only merged with states passing the
+    same options, the other states run on their own.
+    '''
+    funcs = {'installed': (installed, _aggregate_installed),
+             'latest': (latest, _aggregate_latest)}
+    if fun not in funcs or __opts__['test']:
+        return [globals()[fun](**kwargs) for kwargs in calls]
+    single, merged = funcs[fun]
+
+    groups = {}
+    order = []
+    for ind, kwargs in enumerate(calls):
+        if kwargs.get('sources'):
+            key = ind
+        else:
+            key = _aggregate_key(kwargs)
+        if key not in groups:
+            groups[key] = []
+            order.append(key)
+        groups[key].append(ind)
+
+    rets = [None] * len(calls)
+    for key in order:
+        inds = groups[key]
+        if len(inds) == 1:
+            rets[inds[0]] = single(**calls[inds[0]])
+            continue
+        for ind, ret in zip(inds, merged([calls[ind] for ind in inds])):
+            rets[ind] = ret
+    return rets
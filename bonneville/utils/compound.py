@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+'''
+    bonneville.utils.compound
+    -------------------------
+
+    Parse the compound targets.
+
+    A compound target is made of whitespace separated terms, ``and``, ``or``
+    and ``not`` operators and parentheses. A term is either a glob on the
+    minion id or an ``X@`` prefixed target for the matcher ``X``:
+
+    .. code-block:: text
+
+        webserv* and G@os:Debian or E@web-dc1-srv.*
+
+    A target is parsed once into a tree kept by :py:func:`parse`, the minion
+    matches it against its own data with :py:meth:`Expression.match` and the
+    master selects the matching minions out of the known ones with
+    :py:meth:`Expression.select`. Both stop evaluating an ``and`` or ``or``
+    as soon as its result is known.
+'''
+
+# Import bonneville libs
+from bonneville.exceptions import SaltInvocationError
+
+# The parsed expressions, by target, only the most recent ones are kept
+_CACHE = {}
+_CACHE_MAX = 512
+
+_OPERS = ('and', 'or', 'not', '(', ')')
+
+
+def parse(tgt):
+    '''
+    Return the parsed :py:class:`Expression` of a compound target, raises
+    SaltInvocationError if the target is not a valid compound target
+    '''
+    expr = _CACHE.get(tgt)
+    if expr is None:
+        expr = Expression(tgt)
+        if len(_CACHE) >= _CACHE_MAX:
+            _CACHE.clear()
+        _CACHE[tgt] = expr
+    return expr
+
+
+class _Parser(object):
+    '''
+    A recursive descent parser building the tree of a compound target.
+
+    The tree is made of tuples, ``('or', children)``, ``('and', children)``,
+    ``('not', child)`` and ``('term', matcher, pattern)``, with the matcher
+    None for the globs. The operators bind as in python, ``not`` first and
+    ``or`` last, and a ``not`` directly following a term is read as ``and
+    not``.
+    '''
+    def __init__(self, tgt):
+        self.tgt = tgt
+        self.tokens = tgt.split()
+        self.pos = 0
+
+    def error(self, msg):
+        raise SaltInvocationError(
+            'Invalid compound target {0!r}: {1}'.format(self.tgt, msg)
+        )
+
+    def peek(self):
+        if self.pos < len(self.tokens):
+            return self.tokens[self.pos]
+        return None
+
+    def parse(self):
+        if not self.tokens:
+            self.error('empty target')
+        node = self.parse_or()
+        if self.peek() is not None:
+            self.error('unexpected {0!r}'.format(self.peek()))
+        return node
+
+    def parse_or(self):
+        children = [self.parse_and()]
+        while self.peek() == 'or':
+            self.pos += 1
+            children.append(self.parse_and())
+        if len(children) == 1:
+            return children[0]
+        return ('or', tuple(children))
+
+    def parse_and(self):
+        children = [self.parse_not()]
+        while self.peek() in ('and', 'not'):
+            if self.peek() == 'and':
+                self.pos += 1
+            children.append(self.parse_not())
+        if len(children) == 1:
+            return children[0]
+        return ('and', tuple(children))
+
+    def parse_not(self):
+        if self.peek() == 'not':
+            self.pos += 1
+            return ('not', self.parse_not())
+        return self.parse_atom()
+
+    def parse_atom(self):
+        token = self.peek()
+        if token is None:
+            self.error('unexpected end of target')
+        self.pos += 1
+        if token == '(':
+            node = self.parse_or()
+            if self.peek() != ')':
+                self.error('missing right parenthesis')
+            self.pos += 1
+            return node
+        if token in _OPERS:
+            self.error('unexpected {0!r}'.format(token))
+        if len(token) > 1 and token[1] == '@':
+            return ('term', token[0], token[2:])
+        return ('term', None, token)
+
+
+class Expression(object):
+    '''
+    A parsed compound target
+    '''
+    def __init__(self, tgt):
+        self.tgt = tgt
+        self.tree = _Parser(tgt).parse()
+        self.matchers = frozenset(self._matchers(self.tree))
+
+    def _matchers(self, node):
+        '''
+        Yield the matchers used by the terms of a tree
+        '''
+        if node[0] == 'term':
+            yield node[1]
+        elif node[0] == 'not':
+            for matcher in self._matchers(node[1]):
+                yield matcher
+        else:
+            for child in node[1]:
+                for matcher in self._matchers(child):
+                    yield matcher
+
+    def match(self, check):
+        '''
+        Return True if the target matches, ``check(matcher, pattern)``
+        returns whether a single term matches
+        '''
+        return _match(self.tree, check)
+
+    def select(self, minions, check):
+        '''
+        Return the set of the given minions matched by the target.
+        ``check(matcher, pattern, minions)`` returns the set of the given
+        minions matched by a single term.
+        '''
+        return _select(self.tree, set(minions), check)
+
+
+def _match(node, check):
+    oper = node[0]
+    if oper == 'term':
+        return bool(check(node[1], node[2]))
+    if oper == 'not':
+        return not _match(node[1], check)
+    if oper == 'and':
+        for child in node[1]:
+            if not _match(child, check):
+                return False
+        return True
+    for child in node[1]:
+        if _match(child, check):
+            return True
+    return False
+
+
+def _select(node, minions, check):
+    # Every branch only selects among the minions it is given: the right
+    # side of an and among the ones selected by the left side, the right side
+    # of an or among the ones the left side did not select
+    oper = node[0]
+    if not minions:
+        return set()
+    if oper == 'term':
+        return set(check(node[1], node[2], minions)) & minions
+    if oper == 'not':
+        return minions - _select(node[1], minions, check)
+    if oper == 'and':
+        ret = minions
+        for child in node[1]:
+            ret = _select(child, ret, check)
+            if not ret:
+                break
+        return ret
+    ret = set()
+    for child in node[1]:
+        ret |= _select(child, minions - ret, check)
+        if len(ret) == len(minions):
+            break
+    return ret
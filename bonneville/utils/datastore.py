@@ -0,0 +1,335 @@
+# -*- coding: utf-8 -*-
+'''
+    bonneville.utils.datastore
+    --------------------------
+
+    The store of the grains and pillar data of the minions, kept by the
+    master when :conf_master:`minion_data_cache` is enabled.
+
+    The ``minion_data_store`` master option selects the backend:
+
+    ``sqlite``
+        A single sqlite database in the master cachedir, in write ahead log
+        mode so that the readers do not block the master writing the data of
+        the minions. Every minion has one row, with its grains and its pillar
+        in separate columns, so reading the grains does not decode the
+        pillar. The master maintenance process compacts the database.
+
+    ``file``
+        One ``data.p`` file per minion in the minions directory of the
+        cachedir, the way the data always was stored.
+
+    The consumers read the data of many minions with one ``fetch_many``
+    call, limited to the fields, and the top level keys of the fields, they
+    need.
+'''
+
+# Import python libs
+import os
+import time
+import logging
+import sqlite3
+import threading
+
+# Import bonneville libs
+import bonneville.payload
+import bonneville.utils
+from bonneville.exceptions import SaltInvocationError
+
+log = logging.getLogger(__name__)
+
+FIELDS = ('grains', 'pillar')
+
+# The number of minions looked up by a single query
+_CHUNK = 500
+
+_SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS minions ('
+    'minion TEXT PRIMARY KEY, '
+    'updated REAL, '
+    'grains BLOB, '
+    'pillar BLOB)',
+)
+
+
+def store_path(opts):
+    '''
+    Return the path to the minion data database
+    '''
+    return os.path.join(opts['cachedir'], 'minion_data.db')
+
+
+def _project(data, keys):
+    '''
+    Return the data limited to the given top level keys
+    '''
+    if keys is None or not isinstance(data, dict):
+        return data
+    return dict((key, data[key]) for key in keys if key in data)
+
+
+class MinionDataStore(object):
+    '''
+    The interface of the minion data store backends
+    '''
+    def __init__(self, opts):
+        self.opts = opts
+
+    def store(self, minion, data, updated=None):
+        '''
+        Replace the data of a minion, a dict holding its ``grains`` and, or,
+        its ``pillar``. The data is recorded as stored at the updated time,
+        now by default.
+        '''
+        raise NotImplementedError
+
+    def fetch_many(self, minions=None, fields=FIELDS, keys=None):
+        '''
+        Return a dict of the data of the given minions, or of all the
+        minions, holding only the given fields. With keys, only these top
+        level keys of the fields are returned. The minions without data are
+        left out.
+        '''
+        raise NotImplementedError
+
+    def fetch(self, minion, fields=FIELDS, keys=None):
+        '''
+        Return the data of a minion, an empty dict if there is none
+        '''
+        return self.fetch_many([minion], fields, keys).get(minion, {})
+
+    def delete(self, minion):
+        '''
+        Remove the data of a minion
+        '''
+        raise NotImplementedError
+
+    def minions(self):
+        '''
+        Return the set of minions with data in the store
+        '''
+        raise NotImplementedError
+
+    def updated(self, minions=None):
+        '''
+        Return a dict of the time the data of the minions was last stored
+        '''
+        raise NotImplementedError
+
+    def compact(self):
+        '''
+        Give the space left by the removed and replaced data back
+        '''
+
+    def import_files(self):
+        '''
+        Load the data cached by the file backend before this backend was
+        used, return the number of minions loaded
+        '''
+        return 0
+
+
+class FileDataStore(MinionDataStore):
+    '''
+    Keep the data of every minion in its own data.p file
+    '''
+    def __init__(self, opts):
+        super(FileDataStore, self).__init__(opts)
+        self.serial = bonneville.payload.Serial(opts)
+        self.cdir = os.path.join(opts['cachedir'], 'minions')
+
+    def _path(self, minion):
+        return os.path.join(self.cdir, minion, 'data.p')
+
+    def store(self, minion, data, updated=None):
+        mdir = os.path.join(self.cdir, minion)
+        if not os.path.isdir(mdir):
+            os.makedirs(mdir)
+        with bonneville.utils.fopen(self._path(minion), 'w+b') as fp_:
+            fp_.write(self.serial.dumps(data))
+        if updated is not None:
+            os.utime(self._path(minion), (updated, updated))
+
+    def fetch_many(self, minions=None, fields=FIELDS, keys=None):
+        if minions is None:
+            minions = self.minions()
+        ret = {}
+        for minion in minions:
+            try:
+                with bonneville.utils.fopen(self._path(minion), 'rb') as fp_:
+                    data = self.serial.load(fp_)
+            except (IOError, OSError):
+                continue
+            ret[minion] = dict(
+                (field, _project(data[field], keys))
+                for field in fields if field in data
+            )
+        return ret
+
+    def delete(self, minion):
+        try:
+            os.remove(self._path(minion))
+        except OSError:
+            pass
+
+    def minions(self):
+        try:
+            return set(
+                minion for minion in os.listdir(self.cdir)
+                if os.path.isfile(self._path(minion))
+            )
+        except OSError:
+            return set()
+
+    def updated(self, minions=None):
+        if minions is None:
+            minions = self.minions()
+        ret = {}
+        for minion in minions:
+            try:
+                ret[minion] = os.path.getmtime(self._path(minion))
+            except OSError:
+                continue
+        return ret
+
+
+class SqliteDataStore(MinionDataStore):
+    '''
+    Keep the data of all the minions in one sqlite database
+    '''
+    def __init__(self, opts):
+        super(SqliteDataStore, self).__init__(opts)
+        self.path = store_path(opts)
+        self.serial = bonneville.payload.Serial('msgpack')
+        self._local = threading.local()
+
+    @property
+    def conn(self):
+        '''
+        The connection of the current thread to the store, opened on first
+        use so that the object can be created before forking. The sqlite
+        connections can not be shared by threads, the stages of an
+        overstate share the store from their own threads.
+        '''
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            for statement in _SCHEMA:
+                conn.execute(statement)
+            self._local.conn = conn
+        return conn
+
+    def _blob(self, data, field):
+        if field not in data:
+            return None
+        return sqlite3.Binary(self.serial.dumps(data[field]))
+
+    def store(self, minion, data, updated=None):
+        if updated is None:
+            updated = time.time()
+        self.conn.execute(
+            'INSERT OR REPLACE INTO minions (minion, updated, grains, pillar) '
+            'VALUES (?, ?, ?, ?)',
+            (minion,
+             updated,
+             self._blob(data, 'grains'),
+             self._blob(data, 'pillar'))
+        )
+
+    def _select(self, columns, minions):
+        '''
+        Yield the rows of the given columns, after the minion id, of the
+        given minions or of all the minions
+        '''
+        query = 'SELECT minion, {0} FROM minions'.format(', '.join(columns))
+        if minions is None:
+            for row in self.conn.execute(query):
+                yield row
+            return
+        minions = list(minions)
+        for ind in range(0, len(minions), _CHUNK):
+            chunk = minions[ind:ind + _CHUNK]
+            for row in self.conn.execute(
+                    '{0} WHERE minion IN ({1})'.format(
+                        query, ', '.join('?' * len(chunk))),
+                    chunk):
+                yield row
+
+    def fetch_many(self, minions=None, fields=FIELDS, keys=None):
+        fields = [field for field in FIELDS if field in fields]
+        if not fields:
+            return {}
+        ret = {}
+        for row in self._select(fields, minions):
+            data = {}
+            for field, blob in zip(fields, row[1:]):
+                if blob is not None:
+                    data[field] = _project(
+                        self.serial.loads(bytes(blob)), keys
+                    )
+            ret[row[0]] = data
+        return ret
+
+    def delete(self, minion):
+        self.conn.execute('DELETE FROM minions WHERE minion = ?', (minion,))
+
+    def minions(self):
+        return set(
+            row[0] for row in self.conn.execute('SELECT minion FROM minions')
+        )
+
+    def updated(self, minions=None):
+        return dict(self._select(['updated'], minions))
+
+    def compact(self):
+        self.conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        pages, free = [
+            self.conn.execute('PRAGMA {0}'.format(pragma)).fetchone()[0]
+            for pragma in ('page_count', 'freelist_count')
+        ]
+        if free and free * 4 > pages:
+            # More than a quarter of the database is unused
+            self.conn.execute('VACUUM')
+
+    def import_files(self):
+        '''
+        Load the ``data.p`` files written before the store was used, the
+        data already sent to the store is kept. The files are removed, the
+        data keeps the time the files were written.
+        '''
+        if self.opts.get('minion_data_store') == 'file':
+            return 0
+        files = FileDataStore(self.opts)
+        updated = files.updated()
+        count = 0
+        for minion in updated:
+            data = files.fetch(minion)
+            if self.conn.execute(
+                    'SELECT 1 FROM minions WHERE minion = ?', (minion,)
+                    ).fetchone() is None:
+                self.store(minion, data, updated[minion])
+                count += 1
+            files.delete(minion)
+        return count
+
+
+BACKENDS = {
+    'file': FileDataStore,
+    'sqlite': SqliteDataStore,
+}
+
+
+def get_store(opts):
+    '''
+    Return the minion data store selected by the minion_data_store option
+    '''
+    backend = opts.get('minion_data_store', 'sqlite')
+    if backend not in BACKENDS:
+        raise SaltInvocationError(
+            'Invalid minion_data_store {0!r}, valid stores are: {1}'.format(
+                backend, ', '.join(sorted(BACKENDS))
+            )
+        )
+    return BACKENDS[backend](opts)
@@ -97,6 +97,7 @@ TAGS = {
     'wheel': 'wheel',  # prefix for all salt/wheel events
     'cloud': 'cloud',  # prefix for all salt/cloud events
     'fileserver': 'fileserver',  # prefix for all salt/fileserver events
+    'mine': 'mine',  # prefix for all salt/mine events
 }
 
 
@@ -169,10 +170,10 @@ class SaltEvent(object):
                         ))
                 bonneville.utils.check_ipc_path_max_len(pulluri)
         log.debug(
-            '{0} PUB socket URI: {1}'.format(self.__class__.__name__, puburi)
+            '%s PUB socket URI: %s', self.__class__.__name__, puburi
         )
         log.debug(
-            '{0} PULL socket URI: {1}'.format(self.__class__.__name__, pulluri)
+            '%s PULL socket URI: %s', self.__class__.__name__, pulluri
         )
         return puburi, pulluri
 
@@ -472,7 +473,7 @@ class Reactor(multiprocessing.Process, bonneville.state.Compiler):
         Take in the tag from an event and return a list of the reactors to
         process
         '''
-        log.debug('Gathering reactors for tag {0}'.format(tag))
+        log.debug('Gathering reactors for tag %s', tag)
         reactors = []
         if isinstance(self.opts['reactor'], basestring):
             try:
@@ -510,7 +511,7 @@ class Reactor(multiprocessing.Process, bonneville.state.Compiler):
         '''
         Render a list of reactor files and returns a reaction struct
         '''
-        log.debug('Compiling reactions for tag {0}'.format(tag))
+        log.debug('Compiling reactions for tag %s', tag)
         high = {}
         chunks = []
         for fn_ in reactors:
@@ -621,9 +622,8 @@ class StateFire(object):
                     'cmd': '_minion_event',
                     'tok': self.auth.gen_token('salt')})
 
-        sreq = bonneville.payload.SREQ(self.opts['master_uri'])
         try:
-            sreq.send('aes', self.auth.crypticle.dumps(load))
+            self.auth.crypted_transfer(load, decrypt=False)
         except Exception:
             pass
         return True
@@ -651,9 +651,8 @@ class StateFire(object):
                     {'tag': tag,
                      'data': running[stag]}
                     )
-        sreq = bonneville.payload.SREQ(self.opts['master_uri'])
         try:
-            sreq.send('aes', self.auth.crypticle.dumps(load))
+            self.auth.crypted_transfer(load, decrypt=False)
         except Exception:
             pass
         return True
@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+'''
+    bonneville.utils.jobindex
+    -------------------------
+
+    An index of the jobs in the master job cache.
+
+    The index keeps one row per job holding what is needed to list and filter
+    jobs (jid, function, target, user, number of targeted minions and number
+    of returns), so the jobs runner does not need to open every ``.load.p`` in
+    the job cache. The master updates it when a job is published and when a
+    minion returns. It is stored in a sqlite database in the master cachedir.
+'''
+
+# Import python libs
+import os
+import fnmatch
+import logging
+import datetime
+import sqlite3
+
+# Import bonneville libs
+import bonneville.payload
+import bonneville.utils
+
+log = logging.getLogger(__name__)
+
+_SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS jobs ('
+    'jid TEXT PRIMARY KEY, '
+    'fun TEXT, '
+    'tgt TEXT, '
+    'tgt_type TEXT, '
+    'user TEXT, '
+    'minions INTEGER DEFAULT 0, '
+    'returned INTEGER DEFAULT 0, '
+    'load BLOB)',
+    'CREATE INDEX IF NOT EXISTS jobs_fun ON jobs (fun)',
+    'CREATE INDEX IF NOT EXISTS jobs_user ON jobs (user)',
+)
+
+_COLUMNS = 'jid, fun, tgt, tgt_type, user, minions, returned, load'
+
+
+def index_path(opts):
+    '''
+    Return the path to the job index database
+    '''
+    return os.path.join(opts['cachedir'], 'job_index.db')
+
+
+def _fun_match(funs, expr):
+    '''
+    Match the functions of an index row, joined by commas for the compound
+    jobs, against a glob. A compound job matches if one of its functions
+    does.
+    '''
+    if funs is None:
+        return False
+    return any(fnmatch.fnmatch(fun, expr) for fun in funs.split(','))
+
+
+def _jid_bound(value, fill):
+    '''
+    Pad a partial jid, like ``2013102012``, to a full jid so it can be used
+    as a bound of a time range
+    '''
+    return str(value).ljust(20, fill)
+
+
+class JobIndex(object):
+    '''
+    Maintain and query the job index
+    '''
+    def __init__(self, opts):
+        self.opts = opts
+        self.path = index_path(opts)
+        self.serial = bonneville.payload.Serial('msgpack')
+        self._conn = None
+
+    @property
+    def conn(self):
+        '''
+        The connection to the index, opened on first use so that the object
+        can be created before forking
+        '''
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            for statement in _SCHEMA:
+                conn.execute(statement)
+            conn.create_function('fun_match', 2, _fun_match)
+            self._conn = conn
+        return self._conn
+
+    def _execute(self, query, args=()):
+        '''
+        Run a statement against the index, errors are logged and never
+        propagated to the publish and return paths
+        '''
+        try:
+            return self.conn.execute(query, args)
+        except sqlite3.Error as exc:
+            log.error('Failed to update the job index: {0}'.format(exc))
+            return None
+
+    def add(self, load, minions):
+        '''
+        Add a newly published job to the index
+        '''
+        tgt = load.get('tgt', '')
+        if isinstance(tgt, (list, tuple)):
+            tgt = ','.join(tgt)
+        # The functions of a compound job are a list
+        fun = load.get('fun', '')
+        if isinstance(fun, (list, tuple)):
+            fun = ','.join(fun)
+        data = self.serial.dumps({'tgt': load.get('tgt', ''),
+                                  'fun': load.get('fun', ''),
+                                  'arg': load.get('arg', [])})
+        self._execute(
+            'INSERT OR REPLACE INTO jobs ({0}) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)'.format(_COLUMNS),
+            (load['jid'],
+             fun,
+             tgt,
+             load.get('tgt_type', 'glob'),
+             load.get('user', 'root'),
+             len(minions),
+             0,
+             sqlite3.Binary(data)))
+
+    def add_return(self, jid):
+        '''
+        Count a minion return for the given job
+        '''
+        self._execute(
+            'UPDATE jobs SET returned = returned + 1 WHERE jid = ?', (jid,)
+        )
+
+    def prune(self, keep_jobs):
+        '''
+        Drop the jobs older than ``keep_jobs`` hours from the index
+        '''
+        cutoff = datetime.datetime.now() - datetime.timedelta(hours=keep_jobs)
+        self._execute(
+            'DELETE FROM jobs WHERE jid < ?',
+            ('{0:%Y%m%d%H%M%S%f}'.format(cutoff),)
+        )
+
+    def _format(self, row):
+        '''
+        Turn an index row into the job structure used by the jobs runner
+        '''
+        data = self.serial.loads(bytes(row[7]))
+        return {'Start Time': bonneville.utils.jid_to_time(row[0]),
+                'Function': data.get('fun', row[1]),
+                'Arguments': list(data.get('arg', [])),
+                'Target': data.get('tgt', row[2]),
+                'Target-type': row[3],
+                'User': row[4],
+                'Minions': row[5],
+                'Returned': row[6]}
+
+    def get(self, jid):
+        '''
+        Return the indexed information of a single job, or None
+        '''
+        cur = self._execute(
+            'SELECT {0} FROM jobs WHERE jid = ?'.format(_COLUMNS), (jid,)
+        )
+        row = cur.fetchone() if cur is not None else None
+        if row is None:
+            return None
+        return self._format(row)
+
+    def query(self,
+              start=None,
+              end=None,
+              fun=None,
+              tgt=None,
+              user=None,
+              limit=None,
+              offset=0):
+        '''
+        Return a list of ``(jid, job)`` tuples, newest first, filtered by:
+
+        start, end
+            A time range given as (partial) jids, i.e. ``YYYYMMDD[HH[MM]]``
+
+        fun, tgt
+            Glob expressions matched against the function, any function of
+            a compound job, and the target
+
+        user
+            The user who published the job
+
+        limit, offset
+            Paginate the results
+        '''
+        where = []
+        args = []
+        if start:
+            where.append('jid >= ?')
+            args.append(_jid_bound(start, '0'))
+        if end:
+            where.append('jid <= ?')
+            args.append(_jid_bound(end, '9'))
+        if fun:
+            where.append('fun_match(fun, ?)')
+            args.append(fun)
+        if tgt:
+            where.append('tgt GLOB ?')
+            args.append(tgt)
+        if user:
+            where.append('user = ?')
+            args.append(user)
+        query = 'SELECT {0} FROM jobs'.format(_COLUMNS)
+        if where:
+            query += ' WHERE {0}'.format(' AND '.join(where))
+        query += ' ORDER BY jid DESC'
+        if limit:
+            query += ' LIMIT ? OFFSET ?'
+            args.extend([int(limit), int(offset or 0)])
+        cur = self._execute(query, args)
+        if cur is None:
+            return []
+        return [(row[0], self._format(row)) for row in cur]
+
+    def rebuild(self):
+        '''
+        Rebuild the index from the contents of the job cache
+        '''
+        serial = bonneville.payload.Serial(self.opts)
+        job_dir = os.path.join(self.opts['cachedir'], 'jobs')
+        if not os.path.isdir(job_dir):
+            return 0
+        self._execute('DELETE FROM jobs')
+        count = 0
+        for top in os.listdir(job_dir):
+            t_path = os.path.join(job_dir, top)
+            if not os.path.isdir(t_path):
+                continue
+            for final in os.listdir(t_path):
+                f_path = os.path.join(t_path, final)
+                loadpath = os.path.join(f_path, '.load.p')
+                if not os.path.isfile(loadpath):
+                    continue
+                try:
+                    with bonneville.utils.fopen(loadpath, 'rb') as fp_:
+                        load = serial.load(fp_)
+                except Exception:
+                    continue
+                returned = [fn_ for fn_ in os.listdir(f_path)
+                            if not fn_.startswith('.')
+                            and os.path.isdir(os.path.join(f_path, fn_))]
+                self.add(load, load.get('minions', returned))
+                self._execute(
+                    'UPDATE jobs SET returned = ? WHERE jid = ?',
+                    (len(returned), load['jid'])
+                )
+                count += 1
+        return count
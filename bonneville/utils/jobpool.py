@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+'''
+    bonneville.utils.jobpool
+    ------------------------
+
+    A pool of pre-forked processes executing the jobs published to a minion.
+
+    Without the pool the minion forks a new process for every job it
+    receives. The pool workers are forked once, with the execution modules
+    already loaded. A job is handed to the pool only if a worker is idle, it
+    never waits behind another job: the jobs received while all the workers
+    are busy and the functions matching ``job_pool_isolate`` keep running in
+    a process of their own. A job thus always runs, and has a proc file for
+    ``saltutil.find_job`` and ``saltutil.running``, as soon as it is received.
+
+    A worker records its pid in the proc file of the job it runs, so
+    ``saltutil.kill_job`` and ``saltutil.term_job`` stop the worker running
+    the job, and the pool forks a new worker in its place. The proc file is
+    removed once the job is done, the worker living on.
+
+    Every generation of workers has a queue of its own: once the pool is
+    restarted, the previous workers finish the jobs already handed to them
+    and exit, the new jobs go to the new workers.
+'''
+
+# Import python libs
+import os
+import sys
+import fnmatch
+import logging
+import multiprocessing
+
+# Import bonneville libs
+from bonneville._compat import Queue
+
+log = logging.getLogger(__name__)
+
+
+def _module_context(functions):
+    '''
+    Return the ``__context__`` dict shared by the loaded execution modules
+    '''
+    for func in functions.values():
+        module = sys.modules.get(getattr(func, '__module__', None))
+        context = getattr(module, '__context__', None)
+        if isinstance(context, dict):
+            return context
+    return None
+
+
+def _remove_proc_file(minion, jid):
+    '''
+    Remove the proc file of a job run by a worker, the pid it holds stays
+    alive after the job
+    '''
+    proc_dir = getattr(minion, 'proc_dir', None)
+    if proc_dir is None:
+        return
+    try:
+        os.remove(os.path.join(proc_dir, jid))
+    except OSError:
+        pass
+
+
+def _worker(minion, queue, idle, stop, parent):
+    '''
+    The loop run by the pool workers, a stopped worker exits once its queue
+    is empty. An idle worker releases the ``idle`` semaphore once, the pool
+    acquires it for every job it queues.
+    '''
+    context = _module_context(minion.functions)
+    initial = dict(context) if context is not None else None
+    ready = False
+    while True:
+        if os.getppid() != parent:
+            # The minion is gone
+            break
+        if not ready and not stop.is_set():
+            idle.release()
+            ready = True
+        try:
+            data = queue.get(timeout=1)
+        except Queue.Empty:
+            if stop.is_set():
+                break
+            continue
+        ready = False
+        try:
+            if isinstance(data['fun'], (list, tuple)):
+                minion._thread_multi_return(minion, minion.opts, data)
+            else:
+                minion._thread_return(minion, minion.opts, data, True)
+        except Exception:
+            log.error(
+                'Job {0} failed in the job pool'.format(data.get('jid')),
+                exc_info=True
+            )
+        finally:
+            _remove_proc_file(minion, data['jid'])
+            if context is not None:
+                # Every job starts with the context of a freshly forked job
+                context.clear()
+                context.update(initial)
+
+
+class JobPool(object):
+    '''
+    Run the minion jobs in a fixed number of worker processes
+    '''
+    def __init__(self, minion, size, isolate=()):
+        self.minion = minion
+        self.size = int(size)
+        self.queue = multiprocessing.Queue()
+        self.idle = multiprocessing.Semaphore(0)
+        self.isolate = list(isolate or [])
+        self.workers = []
+        # The job processes forked from the minion carry a copy of the pool,
+        # only the minion itself manages the workers
+        self.pid = os.getpid()
+
+    def _spawn(self):
+        '''
+        Fork a worker
+        '''
+        stop = multiprocessing.Event()
+        process = multiprocessing.Process(
+            target=_worker,
+            args=(self.minion, self.queue, self.idle, stop, os.getpid())
+        )
+        process.daemon = True
+        process.start()
+        self.workers.append((process, stop))
+
+    def start(self):
+        '''
+        Fork the workers
+        '''
+        self.reap()
+
+    def reap(self):
+        '''
+        Collect the workers which exited, killed along with their job for
+        instance, and fork new ones in their place
+        '''
+        if os.getpid() != self.pid:
+            return
+        alive = []
+        for process, stop in self.workers:
+            if process.is_alive():
+                alive.append((process, stop))
+            else:
+                process.join(0)
+                if not stop.is_set():
+                    log.debug(
+                        'Job pool worker {0} exited with {1}'.format(
+                            process.pid, process.exitcode
+                        )
+                    )
+        self.workers = alive
+        running = len([1 for _, stop in alive if not stop.is_set()])
+        for _ in range(self.size - running):
+            self._spawn()
+
+    def restart(self):
+        '''
+        Replace the workers, used once the minion reloaded its modules. The
+        current workers exit once done with the jobs already handed to them,
+        the new workers take the next jobs from a queue of their own.
+        '''
+        if os.getpid() != self.pid:
+            return
+        for _, stop in self.workers:
+            stop.set()
+        self.queue = multiprocessing.Queue()
+        self.idle = multiprocessing.Semaphore(0)
+        self.reap()
+
+    def stop(self):
+        '''
+        Stop all the workers once done with the queued jobs
+        '''
+        if os.getpid() != self.pid:
+            return
+        for _, stop in self.workers:
+            stop.set()
+        self.size = 0
+
+    def isolated(self, data):
+        '''
+        Return True if the job has to run in a process of its own
+        '''
+        funs = data['fun']
+        if not isinstance(funs, (list, tuple)):
+            funs = [funs]
+        for fun in funs:
+            for pattern in self.isolate:
+                if fnmatch.fnmatch(fun, pattern):
+                    return True
+        return False
+
+    def submit(self, data):
+        '''
+        Hand a job to an idle worker. Returns False if all the workers are
+        busy, the caller then runs the job on its own.
+        '''
+        self.reap()
+        if not self.idle.acquire(False):
+            return False
+        self.queue.put(data)
+        return True
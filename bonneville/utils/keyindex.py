@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+'''
+    bonneville.utils.keyindex
+    -------------------------
+
+    An index of the minion keys in the master pki directories.
+
+    The index holds the id and status of every key in ``minions``,
+    ``minions_pre`` and ``minions_rejected``, so listing and matching keys
+    does not need to list and stat every key file. It is stored in a sqlite
+    database in the master cachedir.
+
+    The key directories stay the source of truth, keys are added to them by
+    the master when minions authenticate and may be copied in by hand. Before
+    every query the index compares the mtime of each key directory with the
+    one it was indexed at, a changed directory is listed again and only the
+    difference is applied to the index.
+'''
+
+# Import python libs
+import os
+import time
+import logging
+import sqlite3
+
+log = logging.getLogger(__name__)
+
+STATUSES = ('minions', 'minions_pre', 'minions_rejected')
+
+_SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS keys ('
+    'status TEXT, '
+    'id TEXT, '
+    'PRIMARY KEY (status, id))',
+    'CREATE INDEX IF NOT EXISTS keys_id ON keys (id)',
+    'CREATE TABLE IF NOT EXISTS dirs ('
+    'status TEXT PRIMARY KEY, '
+    'mtime REAL, '
+    'scanned REAL)',
+)
+
+
+def index_path(opts):
+    '''
+    Return the path to the key index database
+    '''
+    return os.path.join(opts['cachedir'], 'key_index.db')
+
+
+def glob_to_sql(expr):
+    '''
+    Translate a shell glob, as understood by fnmatch, to a sqlite GLOB
+    expression
+    '''
+    return expr.replace('[!', '[^')
+
+
+def _trusted(mtime, scanned):
+    '''
+    Whether a directory indexed at ``scanned`` with the given mtime can be
+    trusted to still match the index. On file systems with a coarse mtime a
+    change made in the same tick as the scan would go unnoticed, so such a
+    directory is listed again until it has settled.
+    '''
+    if mtime != int(mtime):
+        return True
+    return scanned - mtime > 2
+
+
+class KeyIndex(object):
+    '''
+    Maintain and query the key index, errors are raised as
+    ``sqlite3.Error`` so that the caller can fall back to the directories
+    '''
+    def __init__(self, opts):
+        self.opts = opts
+        self.path = index_path(opts)
+        self._conn = None
+
+    @property
+    def conn(self):
+        '''
+        The connection to the index, opened on first use
+        '''
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            for statement in _SCHEMA:
+                conn.execute(statement)
+            self._conn = conn
+        return self._conn
+
+    def _scan(self, status, path, mtime):
+        '''
+        Apply the difference between a key directory and its indexed keys
+        '''
+        try:
+            names = set(os.listdir(path))
+        except OSError:
+            names = set()
+        conn = self.conn
+        indexed = set(
+            row[0] for row in conn.execute(
+                'SELECT id FROM keys WHERE status = ?', (status,)
+            )
+        )
+        added = [name for name in names - indexed
+                 if os.path.isfile(os.path.join(path, name))]
+        removed = indexed - names
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.executemany(
+                'DELETE FROM keys WHERE status = ? AND id = ?',
+                [(status, name) for name in removed]
+            )
+            conn.executemany(
+                'INSERT OR IGNORE INTO keys (status, id) VALUES (?, ?)',
+                [(status, name) for name in added]
+            )
+            conn.execute(
+                'INSERT OR REPLACE INTO dirs (status, mtime, scanned) '
+                'VALUES (?, ?, ?)',
+                (status, mtime, time.time())
+            )
+            conn.execute('COMMIT')
+        except sqlite3.Error:
+            conn.execute('ROLLBACK')
+            raise
+        if added or removed:
+            log.debug(
+                'Key index {0}: {1} keys added, {2} removed'.format(
+                    status, len(added), len(removed)
+                )
+            )
+
+    def sync(self):
+        '''
+        Bring the index up to date with the key directories which changed
+        since they were indexed
+        '''
+        indexed = dict(
+            (row[0], (row[1], row[2])) for row in self.conn.execute(
+                'SELECT status, mtime, scanned FROM dirs'
+            )
+        )
+        for status in STATUSES:
+            path = os.path.join(self.opts['pki_dir'], status)
+            try:
+                mtime = os.stat(path).st_mtime
+            except OSError:
+                mtime = None
+            if status in indexed:
+                last_mtime, scanned = indexed[status]
+                if mtime == last_mtime and (
+                        mtime is None or _trusted(mtime, scanned)):
+                    continue
+            self._scan(status, path, mtime)
+
+    def list(self, statuses=STATUSES):
+        '''
+        Return a dict of the indexed keys under each of the given statuses,
+        sorted without regard to case
+        '''
+        ret = dict((status, []) for status in statuses)
+        for status, id_ in self.conn.execute(
+                'SELECT status, id FROM keys ORDER BY id COLLATE NOCASE'):
+            if status in ret:
+                ret[status].append(id_)
+        return ret
+
+    def match(self, expr, statuses=STATUSES):
+        '''
+        Return a dict of the keys matching a glob expression, only the
+        statuses with matching keys are in the dict
+        '''
+        ret = {}
+        for status, id_ in self.conn.execute(
+                'SELECT status, id FROM keys WHERE id GLOB ? '
+                'ORDER BY id COLLATE NOCASE', (glob_to_sql(expr),)):
+            if status in statuses:
+                ret.setdefault(status, []).append(id_)
+        return ret
+
+    def statuses(self, expr):
+        '''
+        Return the set of statuses with keys matching a glob expression
+        '''
+        return set(
+            row[0] for row in self.conn.execute(
+                'SELECT DISTINCT status FROM keys WHERE id GLOB ?',
+                (glob_to_sql(expr),)
+            )
+        )
+
+    def match_statuses(self, exprs):
+        '''
+        Return a dict mapping each of the given glob expressions to the set
+        of statuses with keys matching it
+        '''
+        return dict((expr, self.statuses(expr)) for expr in exprs)
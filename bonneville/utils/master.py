@@ -17,6 +17,8 @@ import bonneville.client
 import bonneville.pillar
 import bonneville.utils
 import bonneville.payload
+import bonneville.utils.datastore
+import bonneville.utils.minestore
 from bonneville.exceptions import SaltException
 
 log = logging.getLogger(__name__)
@@ -75,28 +77,29 @@ class MasterPillarUtil(object):
         self.pillar_fallback = pillar_fallback
         log.debug('Init settings: tgt: \"{0}\", expr_form: \"{1}\", env: \"{2}\", use_cached_grains: {3}, use_cached_pillar: {4}, grains_fallback: {5}, pillar_fallback: {6}'.format(tgt, expr_form, env, use_cached_grains, use_cached_pillar, grains_fallback, pillar_fallback))
 
-    def _get_cached_minion_data(self, *minion_ids):
-        # Return two separate dicts of cached grains and pillar data of the minions
+    def _get_cached_minion_data(self, *minion_ids, **kwargs):
+        # Return two separate dicts of cached grains and pillar data of the
+        # minions, only the data in kwargs['fields'] is read when passed
+        fields = kwargs.get('fields', bonneville.utils.datastore.FIELDS)
         grains = dict([(minion_id, {}) for minion_id in minion_ids])
         pillars = grains.copy()
         if not self.opts.get('minion_data_cache', False):
             log.debug('Skipping cached data because minion_data_cache is not enabled.')
             return grains, pillars
-        mdir = os.path.join(self.opts['cachedir'], 'minions')
+        datastore = bonneville.utils.datastore.get_store(self.opts)
+        minion_ids = [
+            minion_id for minion_id in minion_ids
+            if bonneville.utils.verify.valid_id(self.opts, minion_id)
+        ]
         try:
-            for minion_id in minion_ids:
-                if not bonneville.utils.verify.valid_id(self.opts, minion_id):
-                    continue
-                path = os.path.join(mdir, minion_id, 'data.p')
-                if os.path.isfile(path):
-                    with bonneville.utils.fopen(path, 'rb') as fp_:
-                        mdata = self.serial.loads(fp_.read())
-                        if mdata.get('grains', False):
-                            grains[minion_id] = mdata['grains']
-                        if mdata.get('pillar', False):
-                            pillars[minion_id] = mdata['pillar']
+            cached = datastore.fetch_many(minion_ids, fields)
         except (OSError, IOError):
             return grains, pillars
+        for minion_id, mdata in cached.items():
+            if mdata.get('grains', False):
+                grains[minion_id] = mdata['grains']
+            if mdata.get('pillar', False):
+                pillars[minion_id] = mdata['pillar']
         return grains, pillars
 
     def _get_live_minion_grains(self, minion_ids):
@@ -244,7 +247,9 @@ class MasterPillarUtil(object):
         minion_ids = self._tgt_to_list()
         if any(arg for arg in [self.use_cached_grains, self.grains_fallback]):
             log.debug('Getting cached minion data.')
-            cached_minion_grains, cached_minion_pillars = self._get_cached_minion_data(*minion_ids)
+            cached_minion_grains, cached_minion_pillars = self._get_cached_minion_data(
+                    *minion_ids,
+                    fields=('grains',))
         else:
             cached_minion_grains = {}
         log.debug('Getting minion grain data for: {0}'.format(minion_ids))
@@ -286,32 +291,50 @@ class MasterPillarUtil(object):
         else:
             # Unless both clear_pillar and clear_grains are True, we need
             # to read in the pillar/grains data since they are both stored
-            # in the same file, 'data.p'
+            # in the same record
             grains, pillars = self._get_cached_minion_data(*minion_ids)
+        datastore = bonneville.utils.datastore.get_store(self.opts)
+        # The data left is stored again with its age, clearing a part of it
+        # does not make it fresh
+        updated = {}
+        if clear_pillar != clear_grains:
+            updated = datastore.updated(minion_ids)
+        minestore = None
+        if self.opts.get('mine_store') and (clear_mine or clear_mine_func):
+            minestore = bonneville.utils.minestore.MineStore(self.opts)
         try:
             for minion_id in minion_ids:
                 if not bonneville.utils.verify.valid_id(self.opts, minion_id):
                     continue
-                cdir = os.path.join(self.opts['cachedir'], 'minions', minion_id)
-                if not os.path.isdir(cdir):
-                    # Cache dir for this minion does not exist. Nothing to do.
-                    continue
-                data_file = os.path.join(cdir, 'data.p')
-                mine_file = os.path.join(cdir, 'mine.p')
+                if minestore is not None:
+                    if clear_mine:
+                        minestore.delete(minion_id)
+                    else:
+                        minestore.delete(minion_id, clear_mine_func)
                 minion_pillar = pillars.pop(minion_id, False)
                 minion_grains = grains.pop(minion_id, False)
                 if ((clear_pillar and clear_grains) or
                     (clear_pillar and not minion_grains) or
                     (clear_grains and not minion_pillar)):
-                    # Not saving pillar or grains, so just delete the cache file
-                    os.remove(os.path.join(data_file))
+                    # Not saving pillar or grains, so just delete the data
+                    datastore.delete(minion_id)
                 elif clear_pillar and minion_grains:
-                    with bonneville.utils.fopen(data_file, 'w+b') as fp_:
-                        fp_.write(self.serial.dumps({'grains': minion_grains}))
+                    datastore.store(minion_id,
+                                    {'grains': minion_grains},
+                                    updated.get(minion_id))
                 elif clear_grains and minion_pillar:
-                    with bonneville.utils.fopen(data_file, 'w+b') as fp_:
-                        fp_.write(self.serial.dumps({'pillar': minion_pillar}))
-                if clear_mine:
+                    datastore.store(minion_id,
+                                    {'pillar': minion_pillar},
+                                    updated.get(minion_id))
+                cdir = os.path.join(self.opts['cachedir'], 'minions', minion_id)
+                if not os.path.isdir(cdir):
+                    # Cache dir for this minion does not exist. Nothing to do.
+                    continue
+                mine_file = os.path.join(cdir, 'mine.p')
+                if minestore is not None:
+                    # The mine data is not kept in the cache dir
+                    pass
+                elif clear_mine:
                     # Delete the whole mine file
                     os.remove(os.path.join(mine_file))
                 elif clear_mine_func is not None:
@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+'''
+    bonneville.utils.minestore
+    --------------------------
+
+    The store of the mine data sent to the master by the minions.
+
+    The data is kept in a sqlite database in the master cachedir, in write
+    ahead log mode, with one row per function and minion. Sending the data of
+    a mine function only writes the rows which changed, instead of the whole
+    ``mine.p`` of the minion, and ``mine.get`` reads the rows of the
+    requested function instead of one ``mine.p`` per targeted minion.
+
+    Every process using the store keeps the decoded data of the functions it
+    read in memory, along with the version of the function, which is bumped
+    on every change. The data is only read again from the database once its
+    version changed.
+'''
+
+# Import python libs
+import os
+import time
+import logging
+import sqlite3
+
+# Import bonneville libs
+import bonneville.payload
+import bonneville.utils
+
+log = logging.getLogger(__name__)
+
+_SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS mine ('
+    'fun TEXT, '
+    'minion TEXT, '
+    'data BLOB, '
+    'PRIMARY KEY (fun, minion))',
+    'CREATE INDEX IF NOT EXISTS mine_minion ON mine (minion)',
+    'CREATE TABLE IF NOT EXISTS funs ('
+    'fun TEXT PRIMARY KEY, '
+    'version INTEGER DEFAULT 0)',
+    'CREATE TABLE IF NOT EXISTS meta ('
+    'key TEXT PRIMARY KEY, '
+    'value TEXT)',
+)
+
+
+def store_path(opts):
+    '''
+    Return the path to the mine database
+    '''
+    return os.path.join(opts['cachedir'], 'mine.db')
+
+
+class MineStore(object):
+    '''
+    Store and query the mine data
+    '''
+    def __init__(self, opts):
+        self.opts = opts
+        self.path = store_path(opts)
+        self.serial = bonneville.payload.Serial('msgpack')
+        self._conn = None
+        # Maps the functions to their version and {minion: data} dict
+        self._cache = {}
+
+    @property
+    def conn(self):
+        '''
+        The connection to the store, opened on first use so that the object
+        can be created before forking
+        '''
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            for statement in _SCHEMA:
+                conn.execute(statement)
+            self._conn = conn
+        return self._conn
+
+    def _write(self, func, *args):
+        '''
+        Run ``func(conn, *args)`` in a transaction, bumping the version of
+        the functions it returns as changed
+        '''
+        conn = self.conn
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            changed = func(conn, *args)
+            for fun in changed:
+                conn.execute(
+                    'INSERT OR IGNORE INTO funs (fun, version) VALUES (?, 0)',
+                    (fun,)
+                )
+                conn.execute(
+                    'UPDATE funs SET version = version + 1 WHERE fun = ?',
+                    (fun,)
+                )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return changed
+
+    def _update(self, conn, minion, data, clear):
+        changed = []
+        current = dict(
+            (row[0], bytes(row[1])) for row in conn.execute(
+                'SELECT fun, data FROM mine WHERE minion = ?', (minion,)
+            )
+        )
+        if clear:
+            for fun in set(current) - set(data):
+                conn.execute(
+                    'DELETE FROM mine WHERE fun = ? AND minion = ?',
+                    (fun, minion)
+                )
+                changed.append(fun)
+        for fun, value in data.items():
+            blob = self.serial.dumps(value)
+            if current.get(fun) == blob:
+                continue
+            conn.execute(
+                'INSERT OR REPLACE INTO mine (fun, minion, data) '
+                'VALUES (?, ?, ?)',
+                (fun, minion, sqlite3.Binary(blob))
+            )
+            changed.append(fun)
+        return changed
+
+    def update(self, minion, data, clear=False):
+        '''
+        Store the mine data sent by a minion, a dict of function names to
+        return data. With clear the functions not in data are removed.
+        Returns the list of functions whose data changed.
+        '''
+        return self._write(self._update, minion, data, clear)
+
+    def _delete(self, conn, minion, fun):
+        if fun is None:
+            changed = [row[0] for row in conn.execute(
+                'SELECT fun FROM mine WHERE minion = ?', (minion,)
+            )]
+            conn.execute('DELETE FROM mine WHERE minion = ?', (minion,))
+            return changed
+        cur = conn.execute(
+            'DELETE FROM mine WHERE fun = ? AND minion = ?', (fun, minion)
+        )
+        return [fun] if cur.rowcount else []
+
+    def delete(self, minion, fun=None):
+        '''
+        Remove the data of a single function, or all the data, of a minion.
+        Returns the list of functions whose data was removed.
+        '''
+        return self._write(self._delete, minion, fun)
+
+    def minions(self):
+        '''
+        Return the set of minions with data in the store
+        '''
+        return set(
+            row[0] for row in self.conn.execute(
+                'SELECT DISTINCT minion FROM mine'
+            )
+        )
+
+    def get(self, fun, minions=None):
+        '''
+        Return a dict of the data of a function, by minion, limited to the
+        given minions
+        '''
+        row = self.conn.execute(
+            'SELECT version FROM funs WHERE fun = ?', (fun,)
+        ).fetchone()
+        if row is None:
+            return {}
+        version = row[0]
+        cached = self._cache.get(fun)
+        if cached is None or cached[0] != version:
+            # Read the version along with the rows, a write made in between
+            # would otherwise be cached under the version read above
+            conn = self.conn
+            conn.execute('BEGIN')
+            try:
+                version = conn.execute(
+                    'SELECT version FROM funs WHERE fun = ?', (fun,)
+                ).fetchone()[0]
+                data = dict(
+                    (minion, self.serial.loads(bytes(blob)))
+                    for minion, blob in conn.execute(
+                        'SELECT minion, data FROM mine WHERE fun = ?', (fun,)
+                    )
+                )
+            finally:
+                conn.execute('COMMIT')
+            cached = (version, data)
+            self._cache[fun] = cached
+        if minions is None:
+            return dict(cached[1])
+        return dict(
+            (minion, cached[1][minion])
+            for minion in minions if minion in cached[1]
+        )
+
+    def _import(self, conn, minion, data):
+        changed = []
+        for fun, value in data.items():
+            cur = conn.execute(
+                'INSERT OR IGNORE INTO mine (fun, minion, data) '
+                'VALUES (?, ?, ?)',
+                (fun, minion, sqlite3.Binary(self.serial.dumps(value)))
+            )
+            if cur.rowcount:
+                changed.append(fun)
+        return changed
+
+    def import_files(self):
+        '''
+        Load the ``mine.p`` files written before the store was used, the
+        data already sent to the store by the minions is kept. The import
+        only runs once, a marker row records that it was done, as the
+        workers may have created the store first.
+        '''
+        if self.conn.execute(
+                "SELECT 1 FROM meta WHERE key = 'imported'").fetchone():
+            return 0
+        serial = bonneville.payload.Serial(self.opts)
+        m_cache = os.path.join(self.opts['cachedir'], 'minions')
+        count = 0
+        names = []
+        if os.path.isdir(m_cache):
+            names = os.listdir(m_cache)
+        for minion in names:
+            datap = os.path.join(m_cache, minion, 'mine.p')
+            if not os.path.isfile(datap):
+                continue
+            try:
+                with bonneville.utils.fopen(datap, 'rb') as fp_:
+                    data = serial.load(fp_)
+            except Exception:
+                continue
+            if isinstance(data, dict):
+                self._write(self._import, minion, data)
+                count += 1
+        self.conn.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES ('imported', ?)",
+            (str(time.time()),)
+        )
+        return count
@@ -8,12 +8,18 @@ expected to return
 import os
 import glob
 import re
+import time
+import socket
+import fnmatch
 import logging
 
 # Import bonneville libs
 import bonneville.payload
 import bonneville.utils
-from bonneville.exceptions import CommandExecutionError
+import bonneville.utils.compound
+import bonneville.utils.datastore
+import bonneville.utils.network
+from bonneville.exceptions import CommandExecutionError, SaltInvocationError
 
 HAS_RANGE = False
 try:
@@ -24,6 +30,74 @@ except ImportError:
 
 log = logging.getLogger(__name__)
 
+# The matchers of the compound terms evaluated by the master, None for the
+# globs
+_COMPOUND_MATCHERS = frozenset([None, 'G', 'P', 'I', 'L', 'S', 'E', 'R'])
+
+# The compiled ACL regular expressions, None for the invalid ones
+_REGEX = {}
+_REGEX_MAX = 4096
+
+
+def compile_regex(regex, log_invalid=True):
+    '''
+    Return the compiled form of an ACL regular expression, or None if it is
+    not valid. The ACLs are evaluated on every publish, they are only
+    compiled once instead of going through the small cache of the re module.
+    '''
+    try:
+        return _REGEX[regex]
+    except KeyError:
+        pass
+    except TypeError:
+        if log_invalid:
+            log.error('Invalid regular expression: {0!r}'.format(regex))
+        return None
+    try:
+        compiled = re.compile(regex)
+    except Exception:
+        if log_invalid:
+            log.error('Invalid regular expression: {0}'.format(regex))
+        compiled = None
+    if len(_REGEX) >= _REGEX_MAX:
+        _REGEX.clear()
+    _REGEX[regex] = compiled
+    return compiled
+
+
+def compile_blacklist(blacklist):
+    '''
+    Compile the ``users`` and ``modules`` regular expressions of the
+    :conf_master:`client_acl_blacklist`. Raise SaltInvocationError if one of
+    them is not valid, the blacklist can not be enforced without it.
+    '''
+    ret = {}
+    invalid = []
+    for key in ('users', 'modules'):
+        ret[key] = []
+        for regex in blacklist.get(key, []):
+            compiled = compile_regex(regex, log_invalid=False)
+            if compiled is None:
+                invalid.append('{0}: {1!r}'.format(key, regex))
+                continue
+            ret[key].append(compiled)
+    if invalid:
+        raise SaltInvocationError(
+            'Invalid client_acl_blacklist regular expressions, {0}'.format(
+                ', '.join(invalid)
+            )
+        )
+    return ret
+
+
+def _hashable(value):
+    '''
+    Return a hashable form of a function or target, lists become tuples
+    '''
+    if isinstance(value, list):
+        return tuple(_hashable(item) for item in value)
+    return value
+
 
 def nodegroup_comp(group, nodegroups, skip=None):
     '''
@@ -43,10 +117,56 @@ def nodegroup_comp(group, nodegroups, skip=None):
         if ngroup in skip:
             continue
         skip.add(ngroup)
-        ret += nodegroup_comp(ngroup, nodegroups, skip)
+        expanded = nodegroup_comp(ngroup, nodegroups, skip)
+        if expanded:
+            # Keep the nested group together whatever the operators around it
+            ret += '( {0}) '.format(expanded)
     return ret
 
 
+def _expr_keys(expr, delim=':'):
+    '''
+    Return the top level keys a subdict_match expression may look at
+    '''
+    splits = expr.split(delim)
+    return [delim.join(splits[:idx]) for idx in range(1, len(splits))]
+
+
+def _data_test(matcher, pattern):
+    '''
+    Return a function testing the cached data of a minion against a grain,
+    grain pcre, pillar or ipcidr compound term, None if no minion can match
+    '''
+    if matcher == 'G':
+        return lambda data: bonneville.utils.subdict_match(
+            data.get('grains') or {}, pattern
+        )
+    if matcher == 'P':
+        return lambda data: bonneville.utils.subdict_match(
+            data.get('grains') or {}, pattern, delim=':', regex_match=True
+        )
+    if matcher == 'I':
+        return lambda data: bonneville.utils.subdict_match(
+            data.get('pillar') or {}, pattern
+        )
+    num_parts = len(pattern.split('/'))
+    if num_parts > 2:
+        # Target is not valid CIDR, no minions match
+        return None
+    if num_parts == 2:
+        # Target is CIDR
+        return lambda data: bonneville.utils.network.in_subnet(
+            pattern, addrs=(data.get('grains') or {}).get('ipv4', [])
+        )
+    # Target is an IPv4 address
+    try:
+        socket.inet_aton(pattern)
+    except socket.error:
+        # Not a valid IPv4 address, no minions match
+        return None
+    return lambda data: pattern in (data.get('grains') or {}).get('ipv4', [])
+
+
 class CkMinions(object):
     '''
     Used to check what minions should respond from a target
@@ -54,6 +174,19 @@ class CkMinions(object):
     def __init__(self, opts):
         self.opts = opts
         self.serial = bonneville.payload.Serial(opts)
+        self._datastore = None
+        # Maps (user, functions, target, target type) to the time, the
+        # accepted minion keys and the result of an authorization check
+        self._decisions = {}
+
+    @property
+    def datastore(self):
+        '''
+        The minion data store, set up on first use
+        '''
+        if self._datastore is None:
+            self._datastore = bonneville.utils.datastore.get_store(self.opts)
+        return self._datastore
 
     def _check_glob_minions(self, expr):
         '''
@@ -93,122 +226,51 @@ class CkMinions(object):
         os.chdir(cwd)
         return ret
 
-    def _check_grain_minions(self, expr):
+    def _check_data_minions(self, matcher, expr):
         '''
-        Return the minions found by looking via grains
+        Return the minions found by looking via a grain, grain pcre, pillar
+        or ipcidr matcher in the cached minion data, the minions without
+        cached data may match
         '''
         minions = set(
             os.listdir(os.path.join(self.opts['pki_dir'], 'minions'))
         )
-        if self.opts.get('minion_data_cache', False):
-            cdir = os.path.join(self.opts['cachedir'], 'minions')
-            if not os.path.isdir(cdir):
-                return list(minions)
-            for id_ in os.listdir(cdir):
-                if id_ not in minions:
-                    continue
-                datap = os.path.join(cdir, id_, 'data.p')
-                if not os.path.isfile(datap):
-                    continue
-                grains = self.serial.load(
-                    bonneville.utils.fopen(datap, 'rb')
-                ).get('grains')
-                if not bonneville.utils.subdict_match(grains, expr):
-                    minions.remove(id_)
+        if not self.opts.get('minion_data_cache', False):
+            return list(minions)
+        test = _data_test(matcher, expr)
+        if test is None:
+            return []
+        field = 'pillar' if matcher == 'I' else 'grains'
+        keys = ['ipv4'] if matcher == 'S' else _expr_keys(expr)
+        for id_, data in self.datastore.fetch_many(
+                minions, (field,), keys).items():
+            if not test(data):
+                minions.discard(id_)
         return list(minions)
 
+    def _check_grain_minions(self, expr):
+        '''
+        Return the minions found by looking via grains
+        '''
+        return self._check_data_minions('G', expr)
+
     def _check_grain_pcre_minions(self, expr):
         '''
         Return the minions found by looking via grains with PCRE
         '''
-        minions = set(
-            os.listdir(os.path.join(self.opts['pki_dir'], 'minions'))
-        )
-        if self.opts.get('minion_data_cache', False):
-            cdir = os.path.join(self.opts['cachedir'], 'minions')
-            if not os.path.isdir(cdir):
-                return list(minions)
-            for id_ in os.listdir(cdir):
-                if id_ not in minions:
-                    continue
-                datap = os.path.join(cdir, id_, 'data.p')
-                if not os.path.isfile(datap):
-                    continue
-                grains = self.serial.load(
-                    bonneville.utils.fopen(datap, 'rb')
-                ).get('grains')
-                if not bonneville.utils.subdict_match(grains, expr,
-                                                delim=':', regex_match=True):
-                    minions.remove(id_)
-        return list(minions)
+        return self._check_data_minions('P', expr)
 
     def _check_pillar_minions(self, expr):
         '''
         Return the minions found by looking via pillar
         '''
-        minions = set(
-            os.listdir(os.path.join(self.opts['pki_dir'], 'minions'))
-        )
-        if self.opts.get('minion_data_cache', False):
-            cdir = os.path.join(self.opts['cachedir'], 'minions')
-            if not os.path.isdir(cdir):
-                return list(minions)
-            for id_ in os.listdir(cdir):
-                if id_ not in minions:
-                    continue
-                datap = os.path.join(cdir, id_, 'data.p')
-                if not os.path.isfile(datap):
-                    continue
-                pillar = self.serial.load(
-                    bonneville.utils.fopen(datap, 'rb')
-                ).get('pillar')
-                if not bonneville.utils.subdict_match(pillar, expr):
-                    minions.remove(id_)
-        return list(minions)
+        return self._check_data_minions('I', expr)
 
     def _check_ipcidr_minions(self, expr):
         '''
         Return the minions found by looking via ipcidr
         '''
-        minions = set(
-            os.listdir(os.path.join(self.opts['pki_dir'], 'minions'))
-        )
-        if self.opts.get('minion_data_cache', False):
-            cdir = os.path.join(self.opts['cachedir'], 'minions')
-            if not os.path.isdir(cdir):
-                return list(minions)
-            for id_ in os.listdir(cdir):
-                if id_ not in minions:
-                    continue
-                datap = os.path.join(cdir, id_, 'data.p')
-                if not os.path.isfile(datap):
-                    continue
-                grains = self.serial.load(
-                    bonneville.utils.fopen(datap, 'rb')
-                ).get('grains')
-
-                num_parts = len(expr.split('/'))
-                if num_parts > 2:
-                    # Target is not valid CIDR, no minions match
-                    return []
-                elif num_parts == 2:
-                    # Target is CIDR
-                    if not bonneville.utils.network.in_subnet(
-                            expr,
-                            addrs=grains.get('ipv4', [])):
-                        minions.remove(id_)
-                else:
-                    # Target is an IPv4 address
-                    import socket
-                    try:
-                        socket.inet_aton(expr)
-                    except socket.error:
-                        # Not a valid IPv4 address, no minions match
-                        return []
-                    else:
-                        if not expr in grains.get('ipv4', []):
-                            minions.remove(id_)
-        return list(minions)
+        return self._check_data_minions('S', expr)
 
     def _check_range_minions(self, expr):
         '''
@@ -223,19 +285,9 @@ class CkMinions(object):
             os.listdir(os.path.join(self.opts['pki_dir'], 'minions'))
         )
         if self.opts.get('minion_data_cache', False):
-            cdir = os.path.join(self.opts['cachedir'], 'minions')
-            if not os.path.isdir(cdir):
-                return list(minions)
-            for id_ in os.listdir(cdir):
-                if id_ not in minions:
-                    continue
-                datap = os.path.join(cdir, id_, 'data.p')
-                if not os.path.isfile(datap):
-                    continue
-                grains = self.serial.load(
-                    bonneville.utils.fopen(datap, 'rb')
-                ).get('grains')
-
+            for id_, data in self.datastore.fetch_many(
+                    minions, ('grains',), ['fqdn']).items():
+                grains = data.get('grains') or {}
                 range_ = seco.range.Range(self.opts['range_server'])
                 try:
                     if grains.get('fqdn', '') not in range_.expand(expr):
@@ -254,98 +306,56 @@ class CkMinions(object):
         minions = set(
             os.listdir(os.path.join(self.opts['pki_dir'], 'minions'))
         )
-        if self.opts.get('minion_data_cache', False):
-            ref = {'G': self._check_grain_minions,
-                   'P': self._check_grain_pcre_minions,
-                   'I': self._check_pillar_minions,
-                   'L': self._check_list_minions,
-                   'S': self._check_ipcidr_minions,
-                   'E': self._check_pcre_minions,
-                   'R': self._all_minions}
-            results = []
-            unmatched = []
-            opers = ['and', 'or', 'not', '(', ')']
-            tokens = expr.split()
-            for match in tokens:
-                # Try to match tokens from the compound target, first by using
-                # the 'G, X, I, L, S, E' matcher types, then by hostname glob.
-                if '@' in match and match[1] == '@':
-                    comps = match.split('@')
-                    matcher = ref.get(comps[0])
-                    if not matcher:
-                        # If an unknown matcher is called at any time, fail out
-                        return []
-                    if unmatched and unmatched[-1] == '-':
-                        results.append(str(set(matcher('@'.join(comps[1:])))))
-                        results.append(')')
-                        unmatched.pop()
-                    else:
-                        results.append(str(set(matcher('@'.join(comps[1:])))))
-                elif match in opers:
-                    # We didn't match a target, so append a boolean operator or
-                    # subexpression
-                    if results:
-                        if match == 'not':
-                            if results[-1] == '&':
-                                pass
-                            elif results[-1] == '|':
-                                pass
-                            else:
-                                results.append('&')
-                            results.append('(')
-                            results.append(str(set(minions)))
-                            results.append('-')
-                            unmatched.append('-')
-                        elif match == 'and':
-                            results.append('&')
-                        elif match == 'or':
-                            results.append('|')
-                        elif match == '(':
-                            results.append(match)
-                            unmatched.append(match)
-                        elif match == ')':
-                            if not unmatched or unmatched[-1] != '(':
-                                log.error('Invalid compound expr (unexpected '
-                                          'right parenthesis): {0}'
-                                          .format(expr))
-                                return []
-                            results.append(match)
-                            unmatched.pop()
-                            if unmatched and unmatched[-1] == '-':
-                                results.append(')')
-                                unmatched.pop()
-                        else:  # Won't get here, unless oper is added
-                            log.error('Unhandled oper in compound expr: {0}'
-                                      .format(expr))
-                            return []
-                    else:
-                        # seq start with oper, fail
-                        if match == '(':
-                            results.append(match)
-                            unmatched.append(match)
-                        else:
-                            return []
-                else:
-                    # The match is not explicitly defined, evaluate as a glob
-                    if unmatched and unmatched[-1] == '-':
-                        results.append(
-                                str(set(self._check_glob_minions(match))))
-                        results.append(')')
-                        unmatched.pop()
-                    else:
-                        results.append(
-                                str(set(self._check_glob_minions(match))))
-            for token in unmatched:
-                results.append(')')
-            results = ' '.join(results)
-            log.debug('Evaluating final compound matching expr: {0}'
-                      .format(results))
-            try:
-                return list(eval(results))
-            except Exception:
-                log.error('Invalid compound target: {0}'.format(expr))
+        if not self.opts.get('minion_data_cache', False):
+            return list(minions)
+        try:
+            cexpr = bonneville.utils.compound.parse(expr)
+        except SaltInvocationError as exc:
+            log.error(exc)
+            return []
+        if not cexpr.matchers.issubset(_COMPOUND_MATCHERS):
+            # If an unknown matcher is called at any time, fail out
+            log.error('Invalid compound target: {0}'.format(expr))
+            return []
+        cache = {}
+
+        def data(candidates):
+            '''
+            Read the cached data of the candidates in one go, the data of a
+            minion is read once for all the terms
+            '''
+            missing = [id_ for id_ in candidates if id_ not in cache]
+            if missing:
+                fetched = self.datastore.fetch_many(missing)
+                for id_ in missing:
+                    cache[id_] = fetched.get(id_)
+
+        def check(matcher, pattern, candidates):
+            '''
+            Return the candidates matched by a term
+            '''
+            if matcher is None:
+                return fnmatch.filter(candidates, pattern)
+            if matcher == 'L':
+                return candidates.intersection(pattern.split(','))
+            if matcher == 'E':
+                reg = re.compile(pattern)
+                return [id_ for id_ in candidates if reg.match(id_)]
+            if matcher == 'R':
+                return candidates
+            test = _data_test(matcher, pattern)
+            if test is None:
                 return []
-        return list(minions)
+            data(candidates)
+            # The minions without cached data may match
+            return [id_ for id_ in candidates
+                    if cache[id_] is None or test(cache[id_])]
+
+        try:
+            return list(cexpr.select(minions, check))
+        except Exception:
+            log.error('Invalid compound target: {0}'.format(expr))
+            return []
 
     def _all_minions(self, expr=None):
         '''
@@ -353,13 +363,21 @@ class CkMinions(object):
         '''
         return os.listdir(os.path.join(self.opts['pki_dir'], 'minions'))
 
-    def check_minions(self, expr, expr_form='glob'):
+    def check_minions(self, expr, expr_form='glob', cache=None):
         '''
         Check the passed regex against the available minions' public keys
         stored for authentication. This should return a set of ids which
         match the regex, this will then be used to parse the returns to
         make sure everyone has checked back in.
-        '''
+
+        A dict passed as cache keeps the resolved targets, so one publish
+        resolves each target once for its authorization and its minions.
+        '''
+        if cache is not None:
+            key = (expr_form, _hashable(expr))
+            if key not in cache:
+                cache[key] = self.check_minions(expr, expr_form)
+            return cache[key]
         try:
             minions = {'glob': self._check_glob_minions,
                        'pcre': self._check_pcre_minions,
@@ -378,7 +396,26 @@ class CkMinions(object):
             minions = []
         return minions
 
-    def validate_tgt(self, valid, expr, expr_form):
+    def split_by_data_age(self, expr, expr_form, max_age):
+        '''
+        Return the minions matched by the target as two lists, the minions
+        whose cached minion data was refreshed within the last ``max_age``
+        seconds and the remaining ones. Callers use it to only ping the
+        minions which may not be up.
+        '''
+        oldest = time.time() - max_age
+        fresh = []
+        stale = []
+        minions = self.check_minions(expr, expr_form)
+        updated = self.datastore.updated(minions)
+        for minion in minions:
+            if updated.get(minion, 0) >= oldest:
+                fresh.append(minion)
+            else:
+                stale.append(minion)
+        return fresh, stale
+
+    def validate_tgt(self, valid, expr, expr_form, cache=None):
         '''
         Return a Bool. This function returns if the expression sent in is
         within the scope of the valid expression
@@ -413,8 +450,8 @@ class CkMinions(object):
             if v_matcher != expr_form:
                 return False
             return v_expr == expr
-        v_minions = set(self.check_minions(v_expr, v_matcher))
-        minions = set(self.check_minions(expr, expr_form))
+        v_minions = set(self.check_minions(v_expr, v_matcher, cache))
+        minions = set(self.check_minions(expr, expr_form, cache))
         d_bool = not bool(minions.difference(v_minions))
         if len(v_minions) == len(minions) and d_bool:
             return True
@@ -426,24 +463,56 @@ class CkMinions(object):
         can be a list of functions. It is all or nothing for a list of
         functions
         '''
-        vals = []
+        compiled = compile_regex(regex)
+        if compiled is None:
+            return False
         if isinstance(fun, str):
             fun = [fun]
         for func in fun:
             try:
-                if re.match(regex, func):
-                    vals.append(True)
-                else:
-                    vals.append(False)
-            except Exception:
-                log.error('Invalid regular expression: {0}'.format(regex))
-        return all(vals)
+                if not compiled.match(func):
+                    return False
+            except TypeError:
+                return False
+        return True
 
-    def auth_check(self, auth_list, funs, tgt, tgt_type='glob'):
+    def auth_check(self, auth_list, funs, tgt, tgt_type='glob', cache=None,
+                   user=None):
         '''
         Returns a bool which defines if the requested function is authorized.
         Used to evaluate the standard structure under external master
         authentication interfaces, like eauth, peer, peer_run, etc.
+
+        When the user the auth_list belongs to is passed, the result is kept
+        for ``acl_cache_ttl`` seconds, or until the accepted minion keys
+        change.
+        '''
+        ttl = self.opts.get('acl_cache_ttl', 0)
+        if user is None or ttl <= 0:
+            return self._auth_check(auth_list, funs, tgt, tgt_type, cache)
+        try:
+            keys = os.path.getmtime(
+                os.path.join(self.opts['pki_dir'], 'minions')
+            )
+        except OSError:
+            keys = None
+        try:
+            key = (user, _hashable(funs), _hashable(tgt), tgt_type)
+            cached = self._decisions.get(key)
+        except TypeError:
+            return self._auth_check(auth_list, funs, tgt, tgt_type, cache)
+        now = time.time()
+        if cached is not None and cached[0] + ttl > now and cached[1] == keys:
+            return cached[2]
+        ret = self._auth_check(auth_list, funs, tgt, tgt_type, cache)
+        if len(self._decisions) >= _REGEX_MAX:
+            self._decisions.clear()
+        self._decisions[key] = (now, keys, ret)
+        return ret
+
+    def _auth_check(self, auth_list, funs, tgt, tgt_type, cache):
+        '''
+        Evaluate an auth_list, see auth_check
         '''
         # compound commands will come in a list so treat everything as a list
         if not isinstance(funs, list):
@@ -464,7 +533,8 @@ class CkMinions(object):
                     if self.validate_tgt(
                             valid,
                             tgt,
-                            tgt_type):
+                            tgt_type,
+                            cache):
                         # Minions are allowed, verify function in allowed list
                         if isinstance(ind[valid], str):
                             if self.match_check(ind[valid], fun):
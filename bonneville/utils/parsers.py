@@ -561,6 +561,8 @@ class LogLevelMixIn(object):
         )
         for name, level in self.config['log_granular_levels'].items():
             log.set_logger_level(name, level)
+        if self.config.get('log_queue', False):
+            log.setup_queue_logging(self.config.get('log_queue_size', 10000))
 
     def __setup_extended_logging(self, *args):
         log.setup_extended_logging(self.config)
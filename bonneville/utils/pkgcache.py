@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+'''
+    bonneville.utils.pkgcache
+    -------------------------
+
+    A persistent cache of the installed packages, used by the pkg modules so
+    that ``pkg.list_pkgs`` does not query the package database on every
+    call, or in every run.
+
+    The cache is stored in the minion cachedir along with the mtime, size
+    and inode of the package database files. It is used for as long as none
+    of them changed, so any change made to the package database, by the
+    minion or by anything else, invalidates it.
+'''
+
+# Import python libs
+import os
+import logging
+
+# Import bonneville libs
+import bonneville.payload
+import bonneville.utils
+
+log = logging.getLogger(__name__)
+
+
+class PkgCache(object):
+    '''
+    The cached package list of a pkg module, validated against the state of
+    the package database files in ``db_paths``
+    '''
+    def __init__(self, opts, name, db_paths):
+        self.path = os.path.join(
+            opts['cachedir'], 'pkg_list', '{0}.p'.format(name)
+        )
+        self.db_paths = db_paths
+        self.serial = bonneville.payload.Serial('msgpack')
+
+    def stamp(self):
+        '''
+        Return the current state of the package database files, take it
+        before reading the package database so that a concurrent change is
+        not missed
+        '''
+        stamp = []
+        for path in self.db_paths:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                stamp.append([path, None, None, None])
+                continue
+            stamp.append([path, stat.st_mtime, stat.st_size, stat.st_ino])
+        return stamp
+
+    def get(self):
+        '''
+        Return the cached packages, or None if the package database changed
+        since they were stored
+        '''
+        if not os.path.isfile(self.path):
+            return None
+        try:
+            with bonneville.utils.fopen(self.path, 'rb') as fp_:
+                data = self.serial.load(fp_)
+        except Exception:
+            return None
+        if not isinstance(data, dict) or data.get('stamp') != self.stamp():
+            return None
+        return data.get('pkgs')
+
+    def set(self, stamp, pkgs):
+        '''
+        Store the packages read from the package database in the state given
+        by ``stamp``
+        '''
+        tmp_path = '{0}.{1}'.format(self.path, os.getpid())
+        try:
+            if not os.path.isdir(os.path.dirname(self.path)):
+                os.makedirs(os.path.dirname(self.path))
+            with bonneville.utils.fopen(tmp_path, 'wb+') as fp_:
+                self.serial.dump({'stamp': stamp, 'pkgs': pkgs}, fp_)
+            os.rename(tmp_path, self.path)
+        except (IOError, OSError) as exc:
+            log.debug('Failed to store the package list cache: {0}'.format(
+                exc))
+
+    def clear(self):
+        '''
+        Drop the cached packages
+        '''
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+'''
+    bonneville.utils.pubqueue
+    -------------------------
+
+    The queue of the master publisher.
+
+    The publish commands reach the publisher as two frames, a small header
+    and the payload already serialized for the minions. The publisher
+    forwards the payload frame as is and keeps the header for itself: the
+    delay before the payload is sent and the jid it belongs to.
+
+    A publication to more minions than :conf_master:`pub_wave_size` is split
+    into waves by :py:func:`wave_targets`, every wave is sent
+    :conf_master:`pub_wave_interval` seconds after the previous one.
+
+    When the publish socket is at its high water mark, a payload is counted
+    as dropped and the publisher sends it anyway, the minions at the high
+    water mark miss it. Only the waves of a paced publication wait in the
+    queue and are retried, for :conf_master:`pub_send_timeout` seconds at
+    most: a single stalled minion must not hold back every publication. The
+    counters of the queue are reported by the publisher on the event bus.
+'''
+
+# Import python libs
+import heapq
+import itertools
+
+# Import bonneville libs
+from bonneville._compat import string_types
+
+# The target types the master resolves to the exact list of minions
+_EXACT = ('glob', 'pcre', 'list')
+
+# The compound prefix of the other target types
+_PREFIXES = {
+    'grain': 'G@',
+    'grain_pcre': 'P@',
+    'pillar': 'I@',
+    'ipcidr': 'S@',
+    'range': 'R@',
+}
+
+# The seconds to wait for the high water mark pressure to ease
+_RETRY = 0.05
+
+
+def wave_targets(tgt, tgt_type, minions, size):
+    '''
+    Split a publication to the given minions into waves of size minions.
+
+    Return a list of ``(tgt, tgt_type)`` tuples, one per wave, or None when
+    the target can not be split. A wave of a target resolved to the exact
+    minions is a list target, the other targets are limited to the minions
+    of the wave in a compound target, so that the minions keep matching the
+    target themselves.
+    '''
+    minions = sorted(minions)
+    if tgt_type in _EXACT:
+        def make(wave):
+            return wave, 'list'
+    else:
+        if tgt_type == 'compound':
+            term = '( {0} )'.format(tgt)
+        elif (tgt_type in _PREFIXES
+              and isinstance(tgt, string_types)
+              and len(tgt.split()) == 1):
+            term = _PREFIXES[tgt_type] + tgt
+        else:
+            return None
+
+        def make(wave):
+            return 'L@{0} and {1}'.format(','.join(wave), term), 'compound'
+    return [make(minions[ind:ind + size])
+            for ind in range(0, len(minions), size)]
+
+
+class PublishQueue(object):
+    '''
+    The payloads waiting to be published, ordered by the time they are due
+    '''
+    def __init__(self, send_timeout=5):
+        self.send_timeout = send_timeout
+        self._heap = []
+        self._seq = itertools.count()
+        self.stats = self._new_stats()
+
+    @staticmethod
+    def _new_stats():
+        return {'published': 0,
+                'bytes': 0,
+                'paced': 0,
+                'pressure': 0,
+                'dropped': 0}
+
+    def __len__(self):
+        return len(self._heap)
+
+    def push(self, frame, now, delay=0, jid=None):
+        '''
+        Queue a payload frame to be sent delay seconds from now, only the
+        delayed payloads are retried at the high water mark
+        '''
+        due = now + delay
+        deadline = due
+        if delay:
+            self.stats['paced'] += 1
+            deadline += self.send_timeout
+        # The due time, the order of arrival, the time to give up retrying,
+        # whether the payload was refused yet, the jid and the frame
+        heapq.heappush(
+            self._heap,
+            [due, next(self._seq), deadline, False, jid, frame]
+        )
+
+    def timeout(self, now):
+        '''
+        Return the seconds until the next payload is due, None if the queue
+        is empty
+        '''
+        if not self._heap:
+            return None
+        return max(self._heap[0][0] - now, 0)
+
+    def pop(self, now):
+        '''
+        Return the next due entry, a list ending with the jid and the frame,
+        or None if no payload is due
+        '''
+        if self._heap and self._heap[0][0] <= now:
+            return heapq.heappop(self._heap)
+        return None
+
+    def sent(self, entry):
+        '''
+        Count a payload sent to the minions
+        '''
+        self.stats['published'] += 1
+        self.stats['bytes'] += len(entry[-1])
+
+    def retry(self, entry, now):
+        '''
+        Queue again a payload refused at the high water mark, return False
+        and count it as dropped if it is not retried or waited too long
+        '''
+        if not entry[3]:
+            # Counted once per payload, not once per retry
+            entry[3] = True
+            self.stats['pressure'] += 1
+        if now >= entry[2]:
+            self.stats['dropped'] += 1
+            return False
+        entry[0] = now + _RETRY
+        heapq.heappush(self._heap, entry)
+        return True
+
+    def pop_stats(self):
+        '''
+        Return the counters since the last call, with the current length of
+        the queue, and reset them
+        '''
+        stats, self.stats = self.stats, self._new_stats()
+        stats['queued'] = len(self._heap)
+        return stats
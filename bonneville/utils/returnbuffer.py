@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+'''
+    bonneville.utils.returnbuffer
+    -----------------------------
+
+    Helpers shared by the database returners: a connection kept open for the
+    life of the process and a write-behind buffer which writes returns to the
+    database in batches.
+
+    Batches which cannot be written because the database is unreachable are
+    spooled to local disk and written again, before any new batch, once the
+    database is reachable. Batches the database refuses for any other reason
+    would never be written, they are moved aside to ``.failed`` files in the
+    spool directory. The rows still buffered are written when the process
+    exits.
+'''
+
+# Import python libs
+import os
+import json
+import time
+import errno
+import logging
+import threading
+import multiprocessing.util
+
+# Import bonneville libs
+import bonneville.utils
+
+log = logging.getLogger(__name__)
+
+
+class PersistentConnection(object):
+    '''
+    Keep a single database connection per process, the connection is opened
+    on first use and opened again after a fork or after ``reset`` is called.
+    Hold ``lock`` while using the connection, the buffer may write from its
+    timer thread.
+    '''
+    def __init__(self, connect):
+        self.connect = connect
+        self.conn = None
+        self.pid = None
+        self.lock = threading.RLock()
+
+    def get(self):
+        '''
+        Return the connection, opening it if needed
+        '''
+        if self.conn is None or self.pid != os.getpid():
+            # Never reuse a connection inherited from the parent process
+            self.conn = self.connect()
+            self.pid = os.getpid()
+        return self.conn
+
+    def reset(self):
+        '''
+        Drop the connection, the next call to ``get`` opens a new one
+        '''
+        if self.conn is not None and self.pid == os.getpid():
+            try:
+                self.conn.close()
+            except Exception:
+                pass
+        self.conn = None
+
+
+def _alive(pid):
+    '''
+    Return True if the process is running, and is not this one
+    '''
+    if pid == os.getpid():
+        return False
+    try:
+        os.kill(pid, 0)
+    except OSError as exc:
+        return exc.errno != errno.ESRCH
+    return True
+
+
+class ReturnBuffer(object):
+    '''
+    Collect rows and pass them to ``write`` in batches. A batch is written
+    once ``size`` rows are buffered or ``interval`` seconds after the first
+    buffered row, whichever comes first. With a size of 1 every row is
+    written right away.
+
+    Only the errors in ``retry_errors``, raised by ``write`` when the
+    database can not be reached, spool a batch to be written again.
+    '''
+    def __init__(self, name, write, size=1, interval=1.0, spool_dir=None,
+                 retry_errors=(EnvironmentError,)):
+        self.name = name
+        self.write = write
+        self.retry_errors = retry_errors
+        self.size = max(int(size), 1)
+        self.interval = float(interval)
+        self.spool_dir = spool_dir
+        self.rows = []
+        self.lock = threading.RLock()
+        self.pid = None
+        self.timer = None
+
+    def add(self, row):
+        '''
+        Buffer a row, writing the batch if it is full
+        '''
+        with self.lock:
+            if self.pid != os.getpid():
+                # Rows buffered by the parent process are its own to write
+                self.rows = []
+                self.timer = None
+                self.pid = os.getpid()
+                # Runs at exit, in the multiprocessing children as well
+                multiprocessing.util.Finalize(
+                    self, self._exit_flush, exitpriority=10
+                )
+            self.rows.append(row)
+            if len(self.rows) >= self.size:
+                self.flush()
+            elif self.timer is None:
+                self.timer = threading.Timer(self.interval, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def flush(self):
+        '''
+        Write the spooled and buffered rows to the database
+        '''
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            rows, self.rows = self.rows, []
+            if not self._replay():
+                self._spool(rows)
+                return False
+            if not rows:
+                return True
+            try:
+                self.write(rows)
+            except self.retry_errors as exc:
+                log.error(
+                    'Failed to write {0} returns to the {1} database, '
+                    'spooling them: {2}'.format(len(rows), self.name, exc)
+                )
+                self._spool(rows)
+                return False
+            except Exception as exc:
+                log.error(
+                    'The {0} database refused {1} returns, moving them to '
+                    'the spool directory: {2}'.format(
+                        self.name, len(rows), exc
+                    )
+                )
+                self._spool(rows, '.failed')
+            return True
+
+    def _exit_flush(self):
+        '''
+        Write the rows buffered by this process before it exits
+        '''
+        if self.pid == os.getpid() and self.rows:
+            self.flush()
+
+    def _spool(self, rows, ext='.spool'):
+        '''
+        Store rows which could not be written on local disk
+        '''
+        if not rows or not self.spool_dir:
+            return
+        if not os.path.isdir(self.spool_dir):
+            os.makedirs(self.spool_dir)
+        path = os.path.join(
+            self.spool_dir,
+            '{0}-{1:.6f}-{2}{3}'.format(
+                self.name, time.time(), os.getpid(), ext
+            )
+        )
+        with bonneville.utils.fopen(path, 'w+') as fp_:
+            json.dump(rows, fp_)
+
+    def _replay(self):
+        '''
+        Write the spooled rows, oldest first. Returns False if the database
+        is still failing.
+        '''
+        if not self.spool_dir or not os.path.isdir(self.spool_dir):
+            return True
+        prefix = '{0}-'.format(self.name)
+        for fn_ in sorted(os.listdir(self.spool_dir)):
+            if not fn_.startswith(prefix):
+                continue
+            path = os.path.join(self.spool_dir, fn_)
+            if not fn_.endswith('.spool'):
+                # A file claimed by a worker which died before writing it
+                # is replayed again
+                path, _, pid = path.rpartition('.')
+                if (not path.endswith('.spool') or not pid.isdigit()
+                        or _alive(int(pid))):
+                    continue
+                source = '{0}.{1}'.format(path, pid)
+            else:
+                source = path
+            # Claim the file so that no other worker replays it as well
+            claimed = '{0}.{1}'.format(path, os.getpid())
+            try:
+                os.rename(source, claimed)
+            except OSError:
+                continue
+            failed = '{0}.failed'.format(path[:-len('.spool')])
+            try:
+                with bonneville.utils.fopen(claimed, 'r') as fp_:
+                    rows = [tuple(row) for row in json.load(fp_)]
+            except (IOError, ValueError) as exc:
+                log.error(
+                    'Failed to read the spooled returns of {0}, moving them '
+                    'aside: {1}'.format(path, exc)
+                )
+                os.rename(claimed, failed)
+                continue
+            try:
+                self.write(rows)
+            except self.retry_errors as exc:
+                log.debug(
+                    'The {0} database is still failing: {1}'.format(
+                        self.name, exc
+                    )
+                )
+                os.rename(claimed, path)
+                return False
+            except Exception as exc:
+                log.error(
+                    'The {0} database refused the spooled returns of {1}, '
+                    'moving them aside: {2}'.format(self.name, path, exc)
+                )
+                os.rename(claimed, failed)
+                continue
+            os.remove(claimed)
+        return True
@@ -0,0 +1,291 @@
+# -*- coding: utf-8 -*-
+'''
+    bonneville.utils.tokenstore
+    ---------------------------
+
+    The store of the tokens handed out by the external authentication system.
+
+    The ``token_store`` master option selects where the tokens are kept:
+
+    ``file``
+        One file per token in the ``token_dir``, the way the tokens always
+        were stored. The expired tokens are found by the modification time of
+        their file, only those files are read to check their expiration.
+
+    ``sqlite``
+        A sqlite database in the ``token_dir``, in write ahead log mode, with
+        an index on the expiration time of the tokens.
+
+    Every process using the store keeps the tokens it read in a bounded least
+    recently used cache of ``token_cache_size`` entries. A cached token is
+    used until it expires, and is read again from the store after
+    ``_RECHECK`` seconds so that a token removed from the store is refused by
+    every worker shortly after. The master maintenance process removes the
+    expired tokens from the store with ``clean`` every
+    ``token_clean_interval`` seconds, an expired token is also removed when
+    it is read.
+'''
+
+# Import python libs
+import os
+import time
+import logging
+import sqlite3
+
+# Import bonneville libs
+import bonneville.payload
+import bonneville.utils
+from bonneville.exceptions import SaltInvocationError
+from bonneville.utils.odict import OrderedDict
+
+log = logging.getLogger(__name__)
+
+# The seconds a cached token is used before it is read from the store again
+_RECHECK = 60
+
+_SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS tokens ('
+    'token TEXT PRIMARY KEY, '
+    'expire REAL, '
+    'data BLOB)',
+    'CREATE INDEX IF NOT EXISTS tokens_expire ON tokens (expire)',
+)
+
+
+def _expired(tdata, now):
+    '''
+    Return True if the token data has no valid expiration time or expired
+    '''
+    try:
+        return float(tdata['expire']) < now
+    except (KeyError, TypeError, ValueError):
+        return True
+
+
+class TokenStore(object):
+    '''
+    The interface of the token store backends, with the token cache
+    '''
+    def __init__(self, opts):
+        self.opts = opts
+        self.cache_size = opts.get('token_cache_size', 1000)
+        # Maps the tokens to the time they were read and their data
+        self._cache = OrderedDict()
+
+    def _get(self, tok):
+        '''
+        Return the data of a token from the backend, or an empty dict
+        '''
+        raise NotImplementedError
+
+    def _put(self, tdata):
+        '''
+        Store the data of a token in the backend
+        '''
+        raise NotImplementedError
+
+    def _delete(self, tok):
+        '''
+        Remove a token from the backend
+        '''
+        raise NotImplementedError
+
+    def _clean(self, now):
+        '''
+        Remove the tokens expired at the given time from the backend, return
+        their number
+        '''
+        raise NotImplementedError
+
+    def _remember(self, tok, tdata, now):
+        '''
+        Add a token to the cache, dropping the least recently used one when
+        it is full
+        '''
+        if self.cache_size <= 0:
+            return
+        self._cache.pop(tok, None)
+        while len(self._cache) >= self.cache_size:
+            self._cache.popitem(last=False)
+        self._cache[tok] = (now, tdata)
+
+    def exists(self, tok):
+        '''
+        Return True if the token is in the store, expired or not
+        '''
+        return bool(self._get(tok))
+
+    def get(self, tok):
+        '''
+        Return the data of a token, or an empty dict if the token is unknown
+        or expired. An expired token is removed from the store.
+        '''
+        now = time.time()
+        cached = self._cache.pop(tok, None)
+        if cached is not None:
+            if cached[0] + _RECHECK > now and not _expired(cached[1], now):
+                self._cache[tok] = cached
+                return cached[1]
+        tdata = self._get(tok)
+        if not tdata:
+            return {}
+        if _expired(tdata, now):
+            self.delete(tok)
+            return {}
+        self._remember(tok, tdata, now)
+        return tdata
+
+    def put(self, tdata):
+        '''
+        Store the data of a token, keyed by its ``token`` field
+        '''
+        self._put(tdata)
+        self._remember(tdata['token'], tdata, time.time())
+
+    def delete(self, tok):
+        '''
+        Remove a token from the store
+        '''
+        self._cache.pop(tok, None)
+        self._delete(tok)
+
+    def clean(self):
+        '''
+        Remove the expired tokens from the store, return their number
+        '''
+        now = time.time()
+        for tok, cached in list(self._cache.items()):
+            if _expired(cached[1], now):
+                del self._cache[tok]
+        return self._clean(now)
+
+
+class FileTokenStore(TokenStore):
+    '''
+    Keep one file per token in the token_dir
+    '''
+    def __init__(self, opts):
+        super(FileTokenStore, self).__init__(opts)
+        self.serial = bonneville.payload.Serial(opts)
+
+    def _path(self, tok):
+        return os.path.join(self.opts['token_dir'], tok)
+
+    def _get(self, tok):
+        if os.sep in tok or tok.startswith('.'):
+            # Not a token, keep out of the rest of the filesystem
+            return {}
+        try:
+            with bonneville.utils.fopen(self._path(tok), 'rb') as fp_:
+                tdata = self.serial.loads(fp_.read())
+        except (IOError, OSError):
+            return {}
+        except Exception:
+            # A corrupted token, it is removed as an expired one
+            return {'token': tok}
+        if not isinstance(tdata, dict):
+            return {'token': tok}
+        return tdata
+
+    def _put(self, tdata):
+        with bonneville.utils.fopen(self._path(tdata['token']), 'w+b') as fp_:
+            fp_.write(self.serial.dumps(tdata))
+
+    def _delete(self, tok):
+        try:
+            os.remove(self._path(tok))
+        except (IOError, OSError):
+            pass
+
+    def _clean(self, now):
+        # Every token lives token_expire seconds from the time its file was
+        # written, the younger files do not need to be read
+        cutoff = now - self.opts.get('token_expire', 43200)
+        count = 0
+        try:
+            names = os.listdir(self.opts['token_dir'])
+        except OSError:
+            return 0
+        for tok in names:
+            if tok.startswith('.'):
+                continue
+            try:
+                if os.path.getmtime(self._path(tok)) > cutoff:
+                    continue
+            except OSError:
+                continue
+            if _expired(self._get(tok), now):
+                self._delete(tok)
+                count += 1
+        return count
+
+
+class SqliteTokenStore(TokenStore):
+    '''
+    Keep the tokens in a sqlite database indexed by expiration time
+    '''
+    def __init__(self, opts):
+        super(SqliteTokenStore, self).__init__(opts)
+        self.path = os.path.join(opts['token_dir'], '.tokens.db')
+        self.serial = bonneville.payload.Serial('msgpack')
+        self._conn = None
+
+    @property
+    def conn(self):
+        '''
+        The connection to the store, opened on first use so that the object
+        can be created before forking
+        '''
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            for statement in _SCHEMA:
+                conn.execute(statement)
+            self._conn = conn
+        return self._conn
+
+    def _get(self, tok):
+        row = self.conn.execute(
+            'SELECT data FROM tokens WHERE token = ?', (tok,)
+        ).fetchone()
+        if row is None:
+            return {}
+        return self.serial.loads(bytes(row[0]))
+
+    def _put(self, tdata):
+        self.conn.execute(
+            'INSERT OR REPLACE INTO tokens (token, expire, data) '
+            'VALUES (?, ?, ?)',
+            (tdata['token'],
+             tdata['expire'],
+             sqlite3.Binary(self.serial.dumps(tdata)))
+        )
+
+    def _delete(self, tok):
+        self.conn.execute('DELETE FROM tokens WHERE token = ?', (tok,))
+
+    def _clean(self, now):
+        return self.conn.execute(
+            'DELETE FROM tokens WHERE expire < ?', (now,)
+        ).rowcount
+
+
+BACKENDS = {
+    'file': FileTokenStore,
+    'sqlite': SqliteTokenStore,
+}
+
+
+def get_store(opts):
+    '''
+    Return the token store selected by the token_store option
+    '''
+    backend = opts.get('token_store', 'file')
+    if backend not in BACKENDS:
+        raise SaltInvocationError(
+            'Invalid token_store {0!r}, valid stores are: {1}'.format(
+                backend, ', '.join(sorted(BACKENDS))
+            )
+        )
+    return BACKENDS[backend](opts)
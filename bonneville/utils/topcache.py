@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+'''
+    bonneville.utils.topcache
+    -------------------------
+
+    Caches for the state and pillar top files.
+
+    Rendering the top files, and matching every target in them against the
+    minion, happens for every highstate and every pillar compile, and on the
+    master once per minion requesting its pillar. The top files which are
+    not templates render to the same data for every minion, so their
+    rendered data is kept for as long as their content does not change, and
+    the merged top built from them is compiled once into a table of
+    matchers reused for every minion.
+
+    A top file using a template engine, or selecting its renderers with a
+    shebang line, may render differently for every minion and is rendered
+    every time.
+'''
+
+# Import python libs
+import os
+import re
+import copy
+import fnmatch
+import hashlib
+import logging
+
+# Import bonneville libs
+import bonneville.utils
+from bonneville._compat import string_types
+from bonneville.template import compile_template
+
+log = logging.getLogger(__name__)
+
+# The renderers which render a file without template markers verbatim
+_PLAIN_RENDERERS = frozenset(['yaml', 'yamlex', 'json', 'jinja', 'mako',
+                              'wempy'])
+
+# Text marking a template for any of the template engines above
+_TEMPLATE_MARKERS = (b'{{', b'{%', b'{#', b'${', b'<%')
+
+# Maps (path, env, renderer) to the content hash and rendered data of the
+# plain top files
+RENDERED = {}
+
+# Maps the keys of the top files making up a merged top to its compiled
+# form, only the most recent ones are kept
+COMPILED = {}
+_COMPILED_MAX = 32
+
+
+def _plain_renderer(renderer):
+    '''
+    Return True if the default renderer pipe renders plain data verbatim
+    '''
+    if not isinstance(renderer, string_types):
+        return False
+    parts = re.split(r'[_|]', renderer)
+    return all(part.strip() in _PLAIN_RENDERERS for part in parts)
+
+
+def _is_plain(data):
+    '''
+    Return True if the content of a top file holds no template markers
+    '''
+    if data.startswith(b'#!'):
+        return False
+    if any(marker in data for marker in _TEMPLATE_MARKERS):
+        return False
+    for line in data.splitlines():
+        if line.lstrip().startswith(b'%'):
+            # A mako control line
+            return False
+    return True
+
+
+def render_top(path, rend, renderer, env):
+    '''
+    Render a top file. Returns the rendered data and the cache key of the
+    file, the key is None if the file is a template and its rendered data
+    cannot be shared.
+    '''
+    if not isinstance(path, string_types) or not path:
+        return {}, ('', env)
+    try:
+        with bonneville.utils.fopen(path, 'rb') as fp_:
+            data = fp_.read()
+    except (IOError, OSError):
+        return {}, ('', env)
+    if not _plain_renderer(renderer) or not _is_plain(data):
+        return compile_template(path, rend, renderer, env=env), None
+    digest = hashlib.md5(data).hexdigest()
+    cache_key = (path, env, renderer)
+    cached = RENDERED.get(cache_key)
+    if cached is None or cached[0] != digest:
+        cached = (digest, compile_template(path, rend, renderer, env=env))
+        RENDERED[cache_key] = cached
+    # The callers pop the includes out of the rendered data
+    return copy.deepcopy(cached[1]), (path, env, digest)
+
+
+def compile_top(keys, top):
+    '''
+    Return the compiled form of a merged top, made of the top files with the
+    given keys. The compiled top is shared by the merged tops built from the
+    same top files, unless one of them is a template.
+    '''
+    if keys is None:
+        return CompiledTop(top)
+    compiled = COMPILED.get(keys)
+    if compiled is None:
+        compiled = CompiledTop(top)
+        if len(COMPILED) >= _COMPILED_MAX:
+            COMPILED.clear()
+        COMPILED[keys] = compiled
+    return compiled
+
+
+class CompiledTop(object):
+    '''
+    The table of the matchers of a merged top. The glob, pcre and list
+    matches are compiled once, the other matches are passed to
+    :py:meth:`Matcher.confirm_top <bonneville.minion.Matcher.confirm_top>`.
+    '''
+    def __init__(self, top):
+        self.table = []
+        for env, body in top.items():
+            for match, data in body.items():
+                if isinstance(data, string_types):
+                    data = [data]
+                states = [item for item in data
+                          if isinstance(item, string_types)]
+                self.table.append(
+                    (env, match, data, self._compile(match, data), states)
+                )
+
+    @staticmethod
+    def _compile(match, data):
+        '''
+        Return a function matching a minion id against a target, or None if
+        the target needs the full matcher
+        '''
+        if not data:
+            # Logged by the full matcher
+            return None
+        matcher = 'glob'
+        for item in data:
+            if isinstance(item, dict):
+                if 'match' in item:
+                    matcher = item['match']
+                else:
+                    # An unusual declaration, keep the full matcher
+                    return None
+        if matcher == 'glob' and type(match) == str:
+            glob = re.compile(fnmatch.translate(os.path.normcase(match)))
+            return lambda id_: glob.match(os.path.normcase(id_))
+        if matcher == 'pcre' and isinstance(match, string_types):
+            try:
+                return re.compile(match).match
+            except re.error:
+                return None
+        if matcher == 'list' and isinstance(match, string_types):
+            targets = set(match.split(','))
+            return lambda id_: id_ in targets
+        return None
+
+    def matches(self, matcher, env=None, nodegroups=None):
+        '''
+        Return the states matching the minion, by environment
+        '''
+        id_ = matcher.opts['id']
+        ret = {}
+        for tenv, match, data, compiled, states in self.table:
+            if env and tenv != env:
+                continue
+            if compiled is not None:
+                matched = bool(compiled(id_))
+            else:
+                matched = matcher.confirm_top(match, data, nodegroups or {})
+            if matched:
+                ret.setdefault(tenv, []).extend(states)
+        return ret
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+'''
+Time the encryption and decryption of the messages exchanged with the master
+over a range of payload sizes, for every available AES cipher backend. This
+script is useful when working on the Crypticle class
+'''
+
+# Import Python libs
+import os
+import optparse
+import time
+
+# Import Salt Libs
+import bonneville.crypt
+
+
+def parse():
+    '''
+    Parse the command line options
+    '''
+    parser = optparse.OptionParser()
+    parser.add_option('-s',
+            '--sizes',
+            dest='sizes',
+            default='64,1024,65536,1048576,8388608',
+            help='A comma delimited list of payload sizes in bytes')
+    parser.add_option('-n',
+            '--iterations',
+            dest='iterations',
+            default=0,
+            type='int',
+            help=('The number of round trips per payload size, by default '
+                  'enough to handle 64MB per size'))
+    parser.add_option('-b',
+            '--backends',
+            dest='backends',
+            default='',
+            help='A comma delimited list of cipher backends, all by default')
+
+    options, args = parser.parse_args()
+    return options.__dict__
+
+
+class CryptBench(object):
+    '''
+    Run Crypticle round trips the way the minion and master do
+    '''
+    def __init__(self, cli):
+        self.cli = cli
+        self.key = bonneville.crypt.Crypticle.generate_key_string()
+        self.sizes = [int(size) for size in cli['sizes'].split(',')]
+        if cli['backends']:
+            self.backends = cli['backends'].split(',')
+        else:
+            self.backends = [
+                backend.name for backend in bonneville.crypt.CIPHER_BACKENDS
+                if backend.available()
+            ]
+
+    def run(self, backend, size):
+        '''
+        Run the round trips of a payload size, return the seconds spent
+        encrypting and decrypting
+        '''
+        crypticle = bonneville.crypt.Crypticle(
+            {'serial': 'msgpack'}, self.key, backend=backend
+        )
+        iterations = self.cli['iterations'] or \
+            max(64 * 1024 * 1024 // size, 1)
+        # A return made of one large string, the way file chunks and state
+        # outputs are sent
+        payload = {'return': os.urandom(size // 2).encode('hex')}
+        enc_time = dec_time = 0
+        for _ in range(iterations):
+            start = time.time()
+            data = crypticle.dumps(payload)
+            enc_time += time.time() - start
+            start = time.time()
+            crypticle.loads(data)
+            dec_time += time.time() - start
+        return iterations, enc_time, dec_time
+
+    def report(self):
+        '''
+        Print the timings of every backend and payload size
+        '''
+        print('{0:<14} {1:>10} {2:>8} {3:>12} {4:>12} {5:>10}'.format(
+            'backend', 'size', 'count', 'dumps us', 'loads us', 'MB/s'))
+        for backend in self.backends:
+            for size in self.sizes:
+                count, enc_time, dec_time = self.run(backend, size)
+                print('{0:<14} {1:>10} {2:>8} {3:>12.1f} {4:>12.1f} '
+                      '{5:>10.1f}'.format(
+                          backend,
+                          size,
+                          count,
+                          enc_time * 1000000 / count,
+                          dec_time * 1000000 / count,
+                          size * count * 2 / 1048576.0 /
+                          max(enc_time + dec_time, 0.000001)))
+
+
+if __name__ == '__main__':
+    CryptBench(parse()).report()
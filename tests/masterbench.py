@@ -0,0 +1,739 @@
+#!/usr/bin/env python
+'''
+The masterbench script simulates a swarm of minions inside a single process
+and drives scripted workloads against a local master to measure its
+throughput.
+
+Unlike the minionswarm script it does not start a minion process per
+simulated minion: all of the minions share one key pair and one grains
+template, but they still sign in, receive and decrypt the publications and
+send their returns through the master's real request server. The master
+must be running and this script needs to read its configuration and keys,
+run it as the master user:
+
+.. code-block:: bash
+
+    python tests/masterbench.py -m 2000 -w auth,publish,returns,mine \\
+        --output bench.json
+    # after a change
+    python tests/masterbench.py -m 2000 -w auth,publish,returns,mine \\
+        --compare bench.json
+
+The report gives the latency percentiles of each ``cmd`` sent to the master,
+the share of the MWorker processes CPU time used by the run and the memory
+used by the master and by the swarm.
+'''
+
+# Import Python Libs
+import os
+import copy
+import json
+import time
+import shutil
+import optparse
+import resource
+import tempfile
+import threading
+import subprocess
+
+# Import bonneville libs
+import bonneville.client
+import bonneville.config
+import bonneville.crypt
+import bonneville.minion
+import bonneville.payload
+import bonneville.utils
+from bonneville._compat import Queue
+
+# Import third party libs
+import yaml
+import zmq
+from M2Crypto import RSA
+
+try:
+    import psutil
+    HAS_PSUTIL = True
+except ImportError:
+    HAS_PSUTIL = False
+
+WORKLOADS = ('auth', 'publish', 'returns', 'pillar', 'mine', 'files')
+
+GRAINS = {
+    'os': 'Debian',
+    'os_family': 'Debian',
+    'kernel': 'Linux',
+    'cpuarch': 'x86_64',
+    'num_cpus': 4,
+    'mem_total': 4096,
+}
+
+
+def parse():
+    '''
+    Parse the cli options
+    '''
+    parser = optparse.OptionParser()
+    parser.add_option('-c',
+            '--config-dir',
+            dest='config_dir',
+            default='/etc/salt',
+            help='The location of the master configuration')
+    parser.add_option('-m',
+            '--minions',
+            dest='minions',
+            default=1000,
+            type='int',
+            help='The number of minions to simulate')
+    parser.add_option('--name',
+            '-n',
+            dest='name',
+            default='mb',
+            help='The id prefix of the simulated minions')
+    parser.add_option('-w',
+            '--workloads',
+            dest='workloads',
+            default=','.join(WORKLOADS),
+            help=('A comma delimited list of the workloads to run, in order, '
+                  'out of {0}. The minions always sign in first'.format(
+                      ', '.join(WORKLOADS))))
+    parser.add_option('-i',
+            '--iterations',
+            dest='iterations',
+            default=5,
+            type='int',
+            help=('The number of publications of the publish workload, and '
+                  'of requests per minion of the other workloads'))
+    parser.add_option('-t',
+            '--threads',
+            dest='threads',
+            default=32,
+            type='int',
+            help='The number of concurrent requests sent to the master')
+    parser.add_option('-s',
+            '--subscribers',
+            dest='subscribers',
+            default=0,
+            type='int',
+            help=('The number of publish subscriptions, the minions are '
+                  'spread over them, defaults to one per minion. Lower it '
+                  'when the swarm runs out of file descriptors'))
+    parser.add_option('--tgt',
+            dest='tgt',
+            default='*',
+            help='The target of the publish workload')
+    parser.add_option('--expr-form',
+            dest='expr_form',
+            default='glob',
+            help='The target type of the publish workload')
+    parser.add_option('--fun',
+            dest='fun',
+            default='test.ping',
+            help='The function published by the publish workload')
+    parser.add_option('--grains',
+            dest='grains',
+            default=None,
+            help=('A YAML file with the grains template shared by the '
+                  'minions, the id is set per minion'))
+    parser.add_option('--env',
+            dest='env',
+            default='base',
+            help='The environment of the pillar and files workloads')
+    parser.add_option('--files',
+            dest='files',
+            default=5,
+            type='int',
+            help='The number of files fetched per minion by the files workload')
+    parser.add_option('--keysize',
+            dest='keysize',
+            default=2048,
+            type='int',
+            help='The size of the shared minion key')
+    parser.add_option('--timeout',
+            dest='timeout',
+            default=60,
+            type='int',
+            help='The time to wait for a reply or a publication, in seconds')
+    parser.add_option('--output',
+            dest='output',
+            default=None,
+            help='Write the results as JSON to this file')
+    parser.add_option('--compare',
+            dest='compare',
+            default=None,
+            help='Compare the results with a JSON file written by --output')
+    parser.add_option('--keep-keys',
+            dest='keep_keys',
+            default=False,
+            action='store_true',
+            help='Keep the accepted keys of the simulated minions on exit')
+
+    options, args = parser.parse_args()
+
+    opts = {}
+
+    for key, val in options.__dict__.items():
+        opts[key] = val
+
+    opts['workloads'] = [wl.strip() for wl in opts['workloads'].split(',')
+                         if wl.strip()]
+    for workload in opts['workloads']:
+        if workload not in WORKLOADS:
+            parser.error('Unknown workload {0!r}'.format(workload))
+    return opts
+
+
+def percentile(values, pct):
+    '''
+    Return the given percentile of a sorted list of values
+    '''
+    if not values:
+        return 0.0
+    idx = int(round(pct / 100.0 * (len(values) - 1)))
+    return values[idx]
+
+
+class Stats(object):
+    '''
+    Collect the latency of the requests, by cmd
+    '''
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.times = {}
+        self.errors = {}
+
+    def add(self, cmd, elapsed):
+        with self.lock:
+            self.times.setdefault(cmd, []).append(elapsed)
+
+    def error(self, cmd):
+        with self.lock:
+            self.errors[cmd] = self.errors.get(cmd, 0) + 1
+
+    def report(self):
+        '''
+        Return the count, errors and percentiles in milliseconds of each cmd
+        '''
+        ret = {}
+        for cmd in set(self.times) | set(self.errors):
+            times = sorted(self.times.get(cmd, []))
+            ret[cmd] = {
+                'count': len(times),
+                'errors': self.errors.get(cmd, 0),
+                'p50': percentile(times, 50) * 1000,
+                'p90': percentile(times, 90) * 1000,
+                'p99': percentile(times, 99) * 1000,
+                'max': (times[-1] if times else 0.0) * 1000,
+            }
+        return ret
+
+
+class SimMinion(object):
+    '''
+    The state of a single simulated minion
+    '''
+    def __init__(self, id_, grains):
+        self.id = id_
+        self.opts = {'id': id_, 'grains': grains, 'pillar': {}}
+        self.matcher = bonneville.minion.Matcher(self.opts, functions={})
+
+    def match(self, data):
+        '''
+        Return True if a publication targets this minion
+        '''
+        tgt_type = data.get('tgt_type', 'glob')
+        func = getattr(self.matcher, '{0}_match'.format(tgt_type), None)
+        if func is None:
+            return False
+        try:
+            return func(data['tgt'])
+        except Exception:
+            return False
+
+
+class Swarm(object):
+    '''
+    Simulate the minions and drive the workloads against the master
+    '''
+    def __init__(self, opts):
+        self.opts = opts
+        self.mopts = bonneville.config.master_config(
+            os.path.join(opts['config_dir'], 'master')
+        )
+        self.serial = bonneville.payload.Serial(self.mopts)
+        self.master_uri = 'tcp://{0}:{1}'.format(
+            bonneville.utils.ip_bracket(self.mopts['interface']),
+            self.mopts['ret_port']
+        )
+        self.stats = Stats()
+        self.root = tempfile.mkdtemp(prefix='mbench-root', suffix='.d')
+        self.key = self._gen_keys()
+        self.tok = self.key.private_encrypt('salt', 5)
+        self.crypticle = None
+        self.grains = self._grains()
+        zfill = len(str(opts['minions']))
+        self.minions = [
+            SimMinion(
+                '{0}-{1}'.format(opts['name'], str(idx).zfill(zfill)),
+                dict(self.grains)
+            )
+            for idx in range(opts['minions'])
+        ]
+        for minion in self.minions:
+            minion.opts['grains']['id'] = minion.id
+        self.pending = {}
+        self.pending_lock = threading.Lock()
+
+    def _gen_keys(self):
+        '''
+        Generate the key pair shared by the minions and accept it on the
+        master for every simulated minion
+        '''
+        print('Generating the shared minion keys')
+        bonneville.crypt.gen_keys(self.root, 'minion', self.opts['keysize'])
+        return RSA.load_key(os.path.join(self.root, 'minion.pem'))
+
+    def _grains(self):
+        '''
+        Return the grains template of the minions
+        '''
+        if not self.opts['grains']:
+            return copy.deepcopy(GRAINS)
+        with open(self.opts['grains']) as fp_:
+            return yaml.safe_load(fp_) or {}
+
+    def accept_keys(self):
+        '''
+        Write the shared public key as the accepted key of every minion
+        '''
+        with open(os.path.join(self.root, 'minion.pub')) as fp_:
+            self.pub = fp_.read()
+        accepted = os.path.join(self.mopts['pki_dir'], 'minions')
+        for minion in self.minions:
+            with open(os.path.join(accepted, minion.id), 'w+') as fp_:
+                fp_.write(self.pub)
+
+    def cleanup(self):
+        '''
+        Remove the keys of the simulated minions and the temporary files
+        '''
+        if not self.opts['keep_keys']:
+            accepted = os.path.join(self.mopts['pki_dir'], 'minions')
+            for minion in self.minions:
+                try:
+                    os.remove(os.path.join(accepted, minion.id))
+                except OSError:
+                    pass
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def run_requests(self, requests):
+        '''
+        Send the ``(cmd, enc, load)`` requests over a pool of sockets and
+        record their latency, return the replies by position
+        '''
+        jobs = Queue.Queue()
+        for idx, request in enumerate(requests):
+            jobs.put((idx, request))
+        replies = [None] * len(requests)
+
+        def worker():
+            sreq = bonneville.payload.SREQ(self.master_uri)
+            try:
+                while True:
+                    try:
+                        idx, (cmd, enc, load) = jobs.get_nowait()
+                    except Queue.Empty:
+                        return
+                    if enc == 'aes':
+                        load = self.crypticle.dumps(load)
+                    start = time.time()
+                    try:
+                        replies[idx] = sreq.send(
+                            enc, load, timeout=self.opts['timeout']
+                        )
+                    except Exception:
+                        self.stats.error(cmd)
+                        # The REQ socket is stuck waiting for the reply
+                        sreq.destroy()
+                        sreq = bonneville.payload.SREQ(self.master_uri)
+                        continue
+                    self.stats.add(cmd, time.time() - start)
+            finally:
+                sreq.destroy()
+
+        threads = []
+        for _ in range(min(self.opts['threads'], len(requests))):
+            thread = threading.Thread(target=worker)
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
+        return replies
+
+    def wl_auth(self):
+        '''
+        Sign in every minion and keep the AES key of the master
+        '''
+        requests = []
+        for minion in self.minions:
+            requests.append(('_auth', 'clear', {
+                'cmd': '_auth',
+                'id': minion.id,
+                'pub': self.pub,
+            }))
+        for reply in self.run_requests(requests):
+            if not reply or 'aes' not in reply:
+                continue
+            if self.crypticle is None:
+                aes = self.key.private_decrypt(
+                    reply['aes'], RSA.pkcs1_oaep_padding
+                )
+                self.crypticle = bonneville.crypt.Crypticle(
+                    self.mopts, aes.split('_|-')[0]
+                )
+                self.publish_port = reply['publish_port']
+        if self.crypticle is None:
+            raise SystemExit('No minion could sign in to the master')
+
+    def subscribe(self):
+        '''
+        Connect the publish subscriptions and start receiving publications
+        '''
+        count = self.opts['subscribers'] or len(self.minions)
+        count = min(count, len(self.minions))
+        self.context = zmq.Context()
+        self.poller = zmq.Poller()
+        self.groups = {}
+        pub_uri = 'tcp://{0}:{1}'.format(
+            bonneville.utils.ip_bracket(self.mopts['interface']),
+            self.publish_port
+        )
+        for idx in range(count):
+            socket = self.context.socket(zmq.SUB)
+            socket.setsockopt(zmq.SUBSCRIBE, '')
+            socket.connect(pub_uri)
+            self.poller.register(socket, zmq.POLLIN)
+            self.groups[socket] = self.minions[idx::count]
+        self.returns = Queue.Queue()
+        self.running = True
+        thread = threading.Thread(target=self._receive)
+        thread.daemon = True
+        thread.start()
+        # Let the subscriptions connect before the first publication
+        time.sleep(1)
+
+    def _receive(self):
+        '''
+        Decrypt the publications and queue the returns of the targeted
+        minions
+        '''
+        while self.running:
+            for socket, _ in self.poller.poll(1000):
+                payload = self.serial.loads(socket.recv())
+                if payload.get('enc') != 'aes':
+                    continue
+                try:
+                    data = self.crypticle.loads(payload['load'])
+                except Exception:
+                    self.stats.error('publish_recv')
+                    continue
+                if 'jid' not in data or 'tgt' not in data:
+                    continue
+                now = time.time()
+                for minion in self.groups[socket]:
+                    if not minion.match(data):
+                        continue
+                    with self.pending_lock:
+                        start = self.pending.get(data['jid'])
+                    if start is not None:
+                        self.stats.add('publish_recv', now - start)
+                    self.returns.put(('_return', 'aes', {
+                        'cmd': '_return',
+                        'id': minion.id,
+                        'jid': data['jid'],
+                        'fun': data['fun'],
+                        'fun_args': data.get('arg', []),
+                        'return': True,
+                        'retcode': 0,
+                        'success': True,
+                    }))
+
+    def wl_publish(self):
+        '''
+        Publish jobs and send the returns of the minions they target
+        '''
+        if not hasattr(self, 'groups'):
+            self.subscribe()
+        client = bonneville.client.LocalClient(
+            os.path.join(self.opts['config_dir'], 'master')
+        )
+        for _ in range(self.opts['iterations']):
+            jid = bonneville.utils.gen_jid()
+            with self.pending_lock:
+                self.pending[jid] = time.time()
+            start = time.time()
+            pub = client.pub(self.opts['tgt'],
+                             self.opts['fun'],
+                             expr_form=self.opts['expr_form'],
+                             jid=jid,
+                             timeout=self.opts['timeout'])
+            if not pub or not pub.get('jid'):
+                self.stats.error('publish')
+                continue
+            self.stats.add('publish', time.time() - start)
+            expected = len(pub.get('minions', []))
+            requests = []
+            deadline = time.time() + self.opts['timeout']
+            while len(requests) < expected and time.time() < deadline:
+                try:
+                    requests.append(self.returns.get(timeout=1))
+                except Queue.Empty:
+                    continue
+            if len(requests) < expected:
+                self.stats.error('publish_recv')
+            self.run_requests(requests)
+
+    def wl_returns(self):
+        '''
+        Send a storm of standalone job returns
+        '''
+        requests = []
+        for _ in range(self.opts['iterations']):
+            for minion in self.minions:
+                requests.append(('_return', 'aes', {
+                    'cmd': '_return',
+                    'id': minion.id,
+                    'jid': 'req',
+                    'fun': 'test.ping',
+                    'fun_args': [],
+                    'return': True,
+                    'retcode': 0,
+                }))
+        self.run_requests(requests)
+
+    def wl_pillar(self):
+        '''
+        Refresh the pillar of every minion
+        '''
+        requests = []
+        for _ in range(self.opts['iterations']):
+            for minion in self.minions:
+                requests.append(('_pillar', 'aes', {
+                    'cmd': '_pillar',
+                    'id': minion.id,
+                    'grains': minion.opts['grains'],
+                    'env': self.opts['env'],
+                    'ver': '2',
+                }))
+        self.run_requests(requests)
+
+    def wl_mine(self):
+        '''
+        Update the mine data of every minion
+        '''
+        requests = []
+        for _ in range(self.opts['iterations']):
+            for minion in self.minions:
+                requests.append(('_mine', 'aes', {
+                    'cmd': '_mine',
+                    'id': minion.id,
+                    'tok': self.tok,
+                    'data': {
+                        'test.ping': True,
+                        'grains.items': minion.opts['grains'],
+                    },
+                }))
+        self.run_requests(requests)
+
+    def wl_files(self):
+        '''
+        Hash and fetch files from the file server for every minion
+        '''
+        load = {'cmd': '_file_list', 'id': self.minions[0].id,
+                'env': self.opts['env'], 'prefix': ''}
+        reply = self.run_requests([('_file_list', 'aes', load)])[0]
+        paths = self.crypticle.loads(reply)[:self.opts['files']] if reply \
+            else []
+        if not paths:
+            print('No files found in the {0} environment'.format(
+                self.opts['env']))
+            return
+        for _ in range(self.opts['iterations']):
+            requests = []
+            for minion in self.minions:
+                for path in paths:
+                    requests.append(('_file_hash', 'aes', {
+                        'cmd': '_file_hash',
+                        'id': minion.id,
+                        'path': path,
+                        'env': self.opts['env'],
+                    }))
+                    requests.append(('_serve_file', 'aes', {
+                        'cmd': '_serve_file',
+                        'id': minion.id,
+                        'path': path,
+                        'env': self.opts['env'],
+                        'loc': 0,
+                    }))
+            self.run_requests(requests)
+
+    def _worker_procs(self):
+        '''
+        Return the MWorker processes of the master, the children of the
+        master process
+        '''
+        if not HAS_PSUTIL:
+            return None, []
+        try:
+            with open(self.mopts['pidfile']) as fp_:
+                master = psutil.Process(int(fp_.read().strip()))
+            children = getattr(master, 'children', None) \
+                or master.get_children
+            return master, children()
+        except (IOError, ValueError, psutil.Error):
+            return None, []
+
+    def _cpu(self, procs):
+        '''
+        Return the CPU times of the given processes, by pid
+        '''
+        ret = {}
+        for proc in procs:
+            try:
+                times = getattr(proc, 'cpu_times', None) \
+                    or proc.get_cpu_times
+                times = times()
+                ret[proc.pid] = times.user + times.system
+            except psutil.Error:
+                pass
+        return ret
+
+    def _rss(self, proc):
+        try:
+            info = getattr(proc, 'memory_info', None) \
+                or proc.get_memory_info
+            return info().rss
+        except psutil.Error:
+            return 0
+
+    def run(self):
+        '''
+        Run the workloads and return the results
+        '''
+        self.accept_keys()
+        master, procs = self._worker_procs()
+        before = self._cpu(procs)
+        results = {'workloads': {}}
+        start = time.time()
+        for workload in ['auth'] + [wl for wl in self.opts['workloads']
+                                    if wl != 'auth']:
+            print('Running the {0} workload'.format(workload))
+            wl_start = time.time()
+            getattr(self, 'wl_{0}'.format(workload))()
+            results['workloads'][workload] = time.time() - wl_start
+        elapsed = time.time() - start
+        self.running = False
+        results['elapsed'] = elapsed
+        results['cmds'] = self.stats.report()
+        for cmd, data in results['cmds'].items():
+            data['rate'] = data['count'] / elapsed if elapsed else 0.0
+        after = self._cpu(procs)
+        if procs:
+            used = sum(after[pid] - before.get(pid, 0) for pid in after)
+            # The share of the time the workers were busy, all of the
+            # children of the master count as the processes which are not
+            # workers are mostly idle
+            results['mworker_util'] = used / (elapsed * len(procs))
+            results['master_rss'] = sum(
+                self._rss(proc) for proc in [master] + procs
+            )
+        else:
+            results['mworker_util'] = None
+            results['master_rss'] = None
+        # ru_maxrss is in kilobytes on linux
+        results['swarm_rss'] = resource.getrusage(
+            resource.RUSAGE_SELF).ru_maxrss * 1024
+        results['minions'] = len(self.minions)
+        results['options'] = dict(
+            (key, self.opts[key])
+            for key in ('minions', 'workloads', 'iterations', 'threads',
+                        'subscribers', 'tgt', 'fun', 'files')
+        )
+        results['commit'] = self._commit()
+        results['time'] = time.time()
+        return results
+
+    def _commit(self):
+        '''
+        Return the commit of the tree the master runs from
+        '''
+        try:
+            proc = subprocess.Popen(
+                ['git', 'rev-parse', 'HEAD'],
+                cwd=os.path.dirname(os.path.abspath(__file__)),
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE
+            )
+            return proc.communicate()[0].strip() or None
+        except OSError:
+            return None
+
+
+def _fmt_bytes(num):
+    if num is None:
+        return 'n/a'
+    return '{0:.1f}MB'.format(num / 1048576.0)
+
+
+def report(results, previous=None):
+    '''
+    Print the results, compared to the previous results when given
+    '''
+    print('')
+    print('Commit: {0}'.format(results['commit']))
+    print('Minions: {0}, elapsed: {1:.2f}s'.format(
+        results['minions'], results['elapsed']))
+    header = '{0:<14} {1:>8} {2:>6} {3:>9} {4:>9} {5:>9} {6:>9} {7:>9}'
+    print(header.format(
+        'cmd', 'count', 'errors', 'p50 ms', 'p90 ms', 'p99 ms', 'max ms',
+        'req/s'))
+    row = '{0:<14} {1[count]:>8} {1[errors]:>6} {1[p50]:>9.2f} ' \
+          '{1[p90]:>9.2f} {1[p99]:>9.2f} {1[max]:>9.2f} {1[rate]:>9.1f}'
+    for cmd in sorted(results['cmds']):
+        data = results['cmds'][cmd]
+        print(row.format(cmd, data))
+        if previous and cmd in previous.get('cmds', {}):
+            old = previous['cmds'][cmd]
+            deltas = []
+            for key in ('p50', 'p99', 'rate'):
+                if old.get(key):
+                    deltas.append('{0} {1:+.1f}%'.format(
+                        key, (data[key] - old[key]) * 100.0 / old[key]))
+            if deltas:
+                print('{0:<14} {1}'.format('', ', '.join(deltas)))
+    if results['mworker_util'] is None:
+        print('MWorker utilization: n/a (needs psutil and the master pidfile)')
+    else:
+        print('MWorker utilization: {0:.1f}%'.format(
+            results['mworker_util'] * 100))
+    print('Master memory: {0}, swarm memory: {1}'.format(
+        _fmt_bytes(results['master_rss']), _fmt_bytes(results['swarm_rss'])))
+    if previous:
+        print('Compared to commit {0}'.format(previous.get('commit')))
+
+
+if __name__ == '__main__':
+    opts = parse()
+    previous = None
+    if opts['compare']:
+        with open(opts['compare']) as fp_:
+            previous = json.load(fp_)
+    swarm = Swarm(opts)
+    try:
+        results = swarm.run()
+    finally:
+        swarm.cleanup()
+    report(results, previous)
+    if opts['output']:
+        with open(opts['output'], 'w+') as fp_:
+            json.dump(results, fp_, indent=2, sort_keys=True)
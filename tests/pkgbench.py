@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+'''
+Time the pkg.list_pkgs calls made during a highstate. This script is useful
+when working on the pkg modules or on the package list cache
+'''
+
+# Import Python libs
+import optparse
+import time
+
+# Import Salt Libs
+import bonneville.config
+import bonneville.loader
+
+
+def parse():
+    '''
+    Parse the command line options
+    '''
+    parser = optparse.OptionParser()
+    parser.add_option('-c',
+            '--config-dir',
+            dest='config_dir',
+            default='/etc/salt',
+            help='The location of the minion configuration')
+    parser.add_option('-n',
+            '--calls',
+            dest='calls',
+            default=100,
+            type='int',
+            help='The number of pkg.list_pkgs calls per run')
+    parser.add_option('-i',
+            '--installs',
+            dest='installs',
+            default=10,
+            type='int',
+            help=('The number of package installs per run, each of them '
+                  'clears the package list kept for the run'))
+
+    options, args = parser.parse_args()
+    return options.__dict__
+
+
+class PkgBench(object):
+    '''
+    Call pkg.list_pkgs the way a highstate does
+    '''
+    def __init__(self, cli):
+        self.cli = cli
+        self.opts = bonneville.config.minion_config(
+            '{0}/minion'.format(cli['config_dir'])
+        )
+        self.opts['grains'] = bonneville.loader.grains(self.opts)
+        self.functions = bonneville.loader.minion_mods(self.opts)
+        self.context = self.functions['pkg.list_pkgs'].__globals__['__context__']
+
+    def run(self, pkg_list_cache):
+        '''
+        Run the calls, return the elapsed time
+        '''
+        self.opts['pkg_list_cache'] = pkg_list_cache
+        self.context.pop('pkg.list_pkgs', None)
+        every = max(self.cli['calls'] // max(self.cli['installs'], 1), 1)
+        start = time.time()
+        for num in range(self.cli['calls']):
+            if num and not num % every:
+                # An install made by the minion drops the list kept for the
+                # run, the same as pkg.install does
+                self.context.pop('pkg.list_pkgs', None)
+            self.functions['pkg.list_pkgs'](versions_as_list=True)
+        return time.time() - start
+
+    def report(self):
+        '''
+        Print the timings with and without the package list cache
+        '''
+        print('{0} pkg.list_pkgs calls, {1} installs'.format(
+            self.cli['calls'], self.cli['installs']))
+        print('Without the package list cache: {0:.3f}s'.format(
+            self.run(False)))
+        # The first run fills the cache
+        self.run(True)
+        print('With the package list cache:    {0:.3f}s'.format(
+            self.run(True)))
+
+
+if __name__ == '__main__':
+    PkgBench(parse()).report()
@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+'''
+    tests.unit.crypt_test
+    ~~~~~~~~~~~~~~~~~~~~~
+'''
+
+# Import python libs
+import os
+import hmac
+import shutil
+import hashlib
+import tempfile
+
+# Import Salt Testing libs
+from salttesting import skipIf, TestCase
+from salttesting.helpers import ensure_in_syspath
+from salttesting.mock import NO_MOCK, NO_MOCK_REASON, MagicMock, patch
+ensure_in_syspath('../')
+
+# Import bonneville libs
+from bonneville import crypt
+from bonneville.exceptions import AuthenticationError, SaltClientError
+
+
+def _creds():
+    return {'aes': crypt.Crypticle.generate_key_string(),
+            'publish_port': 4505}
+
+
+class FakeCipher(object):
+    '''
+    A cipher keeping the length of the data, to test the framing without
+    the crypto libraries
+    '''
+    name = 'fake'
+
+    @staticmethod
+    def available():
+        return True
+
+    def encrypt(self, key, iv_bytes, data):
+        return data[::-1]
+
+    def decrypt(self, key, iv_bytes, data):
+        return data[::-1]
+
+
+class FakeMaster(object):
+    '''
+    A master connection echoing the loads it can decrypt, replying with an
+    empty string to the others like the master does
+    '''
+    def __init__(self):
+        self.rotate()
+        self.sent = 0
+
+    def rotate(self):
+        self.aes = crypt.Crypticle.generate_key_string()
+        self.crypticle = crypt.Crypticle({'serial': 'msgpack'}, self.aes)
+
+    def creds(self, *args):
+        return {'aes': self.aes, 'publish_port': 4505}
+
+    def send(self, enc, load, tries=1, timeout=60):
+        self.sent += 1
+        try:
+            data = self.crypticle.loads(load)
+        except AuthenticationError:
+            return ''
+        return self.crypticle.dumps(data)
+
+
+@skipIf(NO_MOCK, NO_MOCK_REASON)
+class CrypticleTestCase(TestCase):
+
+    def setUp(self):
+        self.crypticle = crypt.Crypticle(
+            {'serial': 'msgpack'},
+            crypt.Crypticle.generate_key_string(),
+            backend=FakeCipher()
+        )
+
+    def test_encrypt(self):
+        for size in (0, 1, 15, 16, 17, 1024 * 1024):
+            data = 'x' * size
+            enc = self.crypticle.encrypt(data)
+            # iv, data padded to the block size, signature
+            self.assertEqual(len(enc), 16 + (size // 16 + 1) * 16 + 32)
+            self.assertEqual(
+                enc[-32:],
+                hmac.new(self.crypticle.keys[1], enc[:-32],
+                         hashlib.sha256).digest()
+            )
+            self.assertEqual(self.crypticle.decrypt(enc), data)
+        enc = self.crypticle.encrypt('data', 'prefix::')
+        self.assertEqual(self.crypticle.decrypt(enc), 'prefix::data')
+
+    def test_tampered(self):
+        enc = self.crypticle.encrypt('some data')
+        tampered = enc[:20] + chr(ord(enc[20]) ^ 1) + enc[21:]
+        for data in (tampered, enc[:-1], enc[16:], ''):
+            self.assertRaises(AuthenticationError,
+                              self.crypticle.decrypt, data)
+
+    def test_dumps(self):
+        serial = MagicMock()
+        serial.dumps.return_value = 'serialized'
+        serial.loads.side_effect = lambda data: data
+        self.crypticle.serial = serial
+        enc = self.crypticle.dumps({'foo': 'bar'})
+        self.assertEqual(self.crypticle.decrypt(enc), 'pickle::serialized')
+        self.assertEqual(self.crypticle.loads(enc), 'serialized')
+        self.assertEqual(
+            self.crypticle.loads(self.crypticle.encrypt('serialized')), {}
+        )
+
+    def test_backend(self):
+        with patch.object(crypt, 'CIPHER_BACKENDS', [FakeCipher()]):
+            self.assertEqual(crypt.cipher_backend().name, 'fake')
+            self.assertEqual(crypt.cipher_backend('fake').name, 'fake')
+            self.assertRaises(SaltClientError,
+                              crypt.cipher_backend, 'pycrypto')
+            crypticle = crypt.Crypticle(
+                {}, crypt.Crypticle.generate_key_string(), backend='fake'
+            )
+            self.assertEqual(crypticle.backend.name, 'fake')
+
+
+@skipIf(NO_MOCK, NO_MOCK_REASON)
+class AuthSessionTestCase(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.opts = {'id': 'minion',
+                     'pki_dir': self.tmp,
+                     'master_uri': 'tcp://127.0.0.1:4506',
+                     'auth_session_cache': True,
+                     'auth_token_ttl': 3600,
+                     'serial': 'msgpack'}
+        crypt.clear_sessions()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+        crypt.clear_sessions()
+
+    def test_shared_session(self):
+        sign_in = MagicMock(side_effect=lambda *args: _creds())
+        with patch.object(crypt.SAuth, 'sign_in', sign_in):
+            first = crypt.SAuth(self.opts)
+            second = crypt.SAuth(self.opts)
+            self.assertEqual(sign_in.call_count, 1)
+            self.assertIs(first.crypticle, second.crypticle)
+            # Another minion id gets its own session
+            crypt.SAuth(dict(self.opts, id='other'))
+            self.assertEqual(sign_in.call_count, 2)
+            self.opts['auth_session_cache'] = False
+            crypt.SAuth(self.opts)
+            crypt.SAuth(self.opts)
+            self.assertEqual(sign_in.call_count, 4)
+
+    def test_renew(self):
+        sign_in = MagicMock(side_effect=lambda *args: _creds())
+        with patch.object(crypt.SAuth, 'sign_in', sign_in):
+            first = crypt.SAuth(self.opts)
+            second = crypt.SAuth(self.opts)
+            stale = first.crypticle
+            first.renew()
+            self.assertEqual(sign_in.call_count, 2)
+            self.assertIsNot(first.crypticle, stale)
+            # The session renewed by the first object is picked up
+            second.renew()
+            self.assertEqual(sign_in.call_count, 2)
+            self.assertIs(second.crypticle, first.crypticle)
+            first.renew()
+            self.assertEqual(sign_in.call_count, 3)
+        # The session set by the minion is used by the new SAuth objects
+        crypticle = crypt.set_session(self.opts, _creds()['aes'], 4505)
+        self.assertIs(crypt.SAuth(self.opts).crypticle, crypticle)
+
+    def test_crypted_transfer(self):
+        master = FakeMaster()
+        load = {'cmd': '_minion_event', 'id': 'minion'}
+        sign_in = MagicMock(side_effect=master.creds)
+        with patch.object(crypt, 'CIPHER_BACKENDS', [FakeCipher()]):
+            with patch.object(crypt.SAuth, 'sign_in', sign_in):
+                first = crypt.SAuth(self.opts)
+                second = crypt.SAuth(self.opts)
+                self.assertEqual(
+                    first.crypted_transfer(load, sreq=master), load
+                )
+                self.assertEqual(master.sent, 1)
+                # The master rotates its key, the next request is sent again
+                # with a renewed session
+                master.rotate()
+                self.assertEqual(
+                    first.crypted_transfer(load, sreq=master), load
+                )
+                self.assertEqual(master.sent, 3)
+                self.assertEqual(sign_in.call_count, 2)
+                # The other objects pick up the renewed session
+                reply = second.crypted_transfer(load, sreq=master,
+                                                decrypt=False)
+                self.assertEqual(first.crypticle.loads(reply), load)
+                self.assertEqual(master.sent, 5)
+                self.assertEqual(sign_in.call_count, 2)
+                self.assertIs(second.crypticle, first.crypticle)
+                self.assertEqual(
+                    crypt.SAuth(self.opts).crypted_transfer(load,
+                                                            sreq=master),
+                    load
+                )
+                self.assertEqual(master.sent, 6)
+
+    def test_gen_token(self):
+        rsa_path = os.path.join(self.tmp, 'minion.pem')
+        with open(rsa_path, 'w') as fp_:
+            fp_.write('key')
+        key = MagicMock()
+        key.private_encrypt.side_effect = lambda tok, pad: 'signed ' + tok
+        rsa = MagicMock()
+        rsa.load_key.return_value = key
+        with patch.object(crypt, 'RSA', rsa, create=True):
+            with patch.object(crypt.bonneville.utils.verify,
+                              'check_path_traversal', MagicMock()):
+                auth = crypt.Auth(self.opts)
+                self.assertEqual(auth.gen_token('salt'), 'signed salt')
+                self.assertEqual(auth.gen_token('salt'), 'signed salt')
+                self.assertEqual(rsa.load_key.call_count, 1)
+                self.assertEqual(key.private_encrypt.call_count, 1)
+                # A new key is loaded and signs a new token
+                mtime = os.path.getmtime(rsa_path)
+                os.utime(rsa_path, (mtime + 10, mtime + 10))
+                auth.gen_token('salt')
+                self.assertEqual(rsa.load_key.call_count, 2)
+                self.assertEqual(key.private_encrypt.call_count, 2)
+                self.opts['auth_token_ttl'] = 0
+                auth.gen_token('salt')
+                self.assertEqual(key.private_encrypt.call_count, 3)
+
+
+if __name__ == '__main__':
+    from integration import run_tests
+    run_tests(CrypticleTestCase, AuthSessionTestCase, needs_daemon=False)
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+'''
+    tests.unit.fileclient_test
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~
+'''
+
+# Import python libs
+import os
+import shutil
+import hashlib
+import tempfile
+
+# Import Salt Testing libs
+from salttesting import TestCase
+from salttesting.helpers import ensure_in_syspath
+ensure_in_syspath('../')
+
+# Import bonneville libs
+import bonneville.payload
+import bonneville.fileclient
+
+
+class FakeRemoteClient(bonneville.fileclient.RemoteClient):
+    '''
+    A remote file client answering from a dict instead of the master
+    '''
+    def __init__(self, opts, master):
+        self.opts = opts
+        self.serial = bonneville.payload.Serial('msgpack')
+        self.list_cache = {}
+        self.list_versions = {}
+        self.manifests = {}
+        self.master = master
+        self.calls = []
+
+    def _crypted_transfer(self, load, tries=3, timeout=60, sreq=None):
+        self.calls.append(load['cmd'])
+        if load['cmd'] == '_file_list_version':
+            return self.master['version']
+        if load['cmd'] == '_serve_files':
+            return {'files': dict((path, self.master['files'][path])
+                                  for path in load['paths'][:2]),
+                    'large': [],
+                    'missing': []}
+        return self.master[load['cmd']]
+
+    def _tree_sreq(self):
+        return FakeSREQ()
+
+    def get_file(self, path, dest='', makedirs=False, env='base', gzip=None):
+        self.calls.append(('get_file', path))
+        return path
+
+
+class FakeSREQ(object):
+    '''
+    A connection the fake client does not use
+    '''
+    def destroy(self):
+        pass
+
+
+class FileListCacheTestCase(TestCase):
+
+    def setUp(self):
+        self.cachedir = tempfile.mkdtemp()
+        self.opts = {'cachedir': self.cachedir, 'file_list_cache_ttl': 0}
+        self.master = {'version': 'v1',
+                       '_file_list': ['top.sls', 'web/init.sls'],
+                       '_dir_list': ['web']}
+
+    def tearDown(self):
+        shutil.rmtree(self.cachedir)
+
+    def test_reuse_while_version_unchanged(self):
+        client = FakeRemoteClient(self.opts, self.master)
+        self.assertEqual(client.file_list('base'), self.master['_file_list'])
+        self.assertEqual(client.file_list('base', 'web/'), ['web/init.sls'])
+        self.assertEqual(client.calls.count('_file_list'), 1)
+
+        # A new client, as in the next run, uses the copy on disk
+        other = FakeRemoteClient(self.opts, self.master)
+        self.assertEqual(other.file_list('base'), self.master['_file_list'])
+        self.assertNotIn('_file_list', other.calls)
+
+        # A new version on the master invalidates the cached lists
+        self.master['version'] = 'v2'
+        self.master['_file_list'] = ['top.sls']
+        self.assertEqual(other.file_list('base'), ['top.sls'])
+        self.assertEqual(other.calls.count('_file_list'), 1)
+
+    def test_ttl(self):
+        self.opts['file_list_cache_ttl'] = 60
+        client = FakeRemoteClient(self.opts, self.master)
+        client.dir_list('base')
+        client.dir_list('base')
+        self.assertEqual(client.calls, ['_file_list_version', '_dir_list'])
+
+    def test_no_version(self):
+        # Masters, or backends, without file list versions are not cached
+        self.master['version'] = False
+        client = FakeRemoteClient(self.opts, self.master)
+        client.file_list('base')
+        client.file_list('base')
+        self.assertEqual(client.calls.count('_file_list'), 2)
+
+
+class FileTreeTestCase(TestCase):
+
+    def setUp(self):
+        self.cachedir = tempfile.mkdtemp()
+        self.opts = {'cachedir': self.cachedir,
+                     'file_buffer_size': 8,
+                     'file_tree_threads': 2,
+                     'file_manifest_ttl': 60}
+        files = {'app/a': 'aaa', 'app/b': 'bbb', 'app/c': 'ccc',
+                 'app/d': 'ddd', 'app/big': 'x' * 16}
+        manifest = dict(
+            (path, {'hsum': hashlib.md5(data).hexdigest(),
+                    'hash_type': 'md5',
+                    'size': len(data),
+                    'mode': 420})
+            for path, data in files.items()
+        )
+        self.master = {'files': files, '_file_manifest': manifest}
+
+    def tearDown(self):
+        shutil.rmtree(self.cachedir)
+
+    def _cached(self, path):
+        return os.path.join(self.cachedir, 'files', 'base', path)
+
+    def test_cache_tree(self):
+        client = FakeRemoteClient(self.opts, self.master)
+        tree = client.cache_tree('salt://app', 'base')
+        self.assertEqual(sorted(tree), sorted(self.master['files']))
+        for path in ('app/a', 'app/b', 'app/c', 'app/d'):
+            with open(self._cached(path)) as fp_:
+                self.assertEqual(fp_.read(), self.master['files'][path])
+        # The small files came packed together, the large one on its own
+        self.assertEqual(client.calls.count('_serve_files'), 2)
+        self.assertIn(('get_file', 'salt://app/big'), client.calls)
+        # The manifest answers the hash requests
+        self.assertEqual(
+            client.hash_file('salt://|app/a')['hsum'],
+            self.master['_file_manifest']['app/a']['hsum']
+        )
+        self.assertEqual(client.hash_file('salt://app/gone'), '')
+        self.assertEqual(client.calls.count('_file_hash'), 0)
+
+    def test_unchanged(self):
+        client = FakeRemoteClient(self.opts, self.master)
+        client.cache_tree('salt://app', 'base')
+        self.master['files']['app/a'] = 'new'
+        self.master['_file_manifest']['app/a']['hsum'] = \
+            hashlib.md5('new').hexdigest()
+        client = FakeRemoteClient(self.opts, self.master)
+        client.cache_tree('salt://app', 'base')
+        # Only the changed file is fetched again
+        self.assertEqual(client.calls.count('_serve_files'), 1)
+        with open(self._cached('app/a')) as fp_:
+            self.assertEqual(fp_.read(), 'new')
+
+
+if __name__ == '__main__':
+    from integration import run_tests
+    run_tests(FileListCacheTestCase, FileTreeTestCase, needs_daemon=False)
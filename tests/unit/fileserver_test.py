@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+'''
+    tests.unit.fileserver_test
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~
+'''
+
+# Import python libs
+import os
+import shutil
+import tempfile
+
+# Import Salt Testing libs
+from salttesting import skipIf, TestCase
+from salttesting.helpers import ensure_in_syspath
+from salttesting.mock import NO_MOCK, NO_MOCK_REASON, MagicMock, patch
+ensure_in_syspath('../')
+
+# Import bonneville libs
+from bonneville import fileserver
+from bonneville.fileserver import roots
+
+
+@skipIf(NO_MOCK, NO_MOCK_REASON)
+class MtimeMapTestCase(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.root = os.path.join(self.tmp, 'base')
+        os.makedirs(os.path.join(self.root, 'web', 'files'))
+        for name in ('top.sls', 'web/init.sls', 'web/files/index.html'):
+            self._write(name, name)
+        self.path_map = {'base': [self.root]}
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def _write(self, name, data, age=100):
+        path = os.path.join(self.root, name)
+        with open(path, 'w') as fp_:
+            fp_.write(data)
+        mtime = os.path.getmtime(path) - age
+        os.utime(path, (mtime, mtime))
+        return path
+
+    def test_update(self):
+        mtime_map = fileserver.MtimeMap()
+        added, removed, modified = mtime_map.update(self.path_map)
+        self.assertEqual(mtime_map.files,
+                         fileserver.generate_mtime_map(self.path_map))
+        self.assertEqual(len(added), 5)
+        self.assertEqual(mtime_map.update(self.path_map), ([], [], []))
+
+        # The unchanged directories are not listed again
+        listdir = MagicMock(side_effect=os.listdir)
+        with patch.object(fileserver.os, 'listdir', listdir):
+            index = self._write('web/files/index.html', 'new', age=10)
+            self.assertEqual(mtime_map.update(self.path_map),
+                             ([], [], [index]))
+            self.assertEqual(listdir.call_count, 0)
+
+        os.remove(os.path.join(self.root, 'top.sls'))
+        motd = self._write('web/files/motd', 'motd')
+        added, removed, modified = mtime_map.update(self.path_map)
+        self.assertEqual(added, [motd])
+        self.assertEqual(removed, [os.path.join(self.root, 'top.sls')])
+        self.assertEqual(mtime_map.files,
+                         fileserver.generate_mtime_map(self.path_map))
+
+    def test_update_links(self):
+        shared = os.path.join(self.tmp, 'shared')
+        os.makedirs(shared)
+        os.symlink(shared, os.path.join(self.root, 'linked'))
+        os.symlink(self.root, os.path.join(self.root, 'web', 'loop'))
+        mtime_map = fileserver.MtimeMap()
+        mtime_map.update(self.path_map)
+        self.assertEqual(mtime_map.files,
+                         fileserver.generate_mtime_map(self.path_map))
+
+        # A change under a linked directory is found
+        init = os.path.join(shared, 'init.sls')
+        with open(init, 'w') as fp_:
+            fp_.write('linked')
+        added, removed, modified = mtime_map.update(self.path_map)
+        self.assertEqual(added, [os.path.join(self.root, 'linked', 'init.sls')])
+        mtime = os.path.getmtime(init) + 10
+        os.utime(init, (mtime, mtime))
+        self.assertEqual(mtime_map.update(self.path_map)[2],
+                         [os.path.join(self.root, 'linked', 'init.sls')])
+
+    def test_reap_paths(self):
+        cache_base = os.path.join(self.tmp, 'hash')
+        os.makedirs(os.path.join(cache_base, 'base', 'web'))
+        for name in ('top.sls', 'web/init.sls'):
+            open(os.path.join(
+                cache_base, 'base', '{0}.hash.md5'.format(name)), 'w').close()
+        fileserver.reap_fileserver_cache_paths(
+            cache_base,
+            self.path_map,
+            [os.path.join(self.root, 'web', 'init.sls'),
+             os.path.join(self.tmp, 'other', 'top.sls')],
+            'md5'
+        )
+        self.assertEqual(os.listdir(os.path.join(cache_base, 'base', 'web')),
+                         [])
+        self.assertEqual(
+            sorted(os.listdir(os.path.join(cache_base, 'base'))),
+            ['top.sls.hash.md5', 'web']
+        )
+
+    def test_generate_mtime_map_links(self):
+        shared = os.path.join(self.tmp, 'shared')
+        os.makedirs(shared)
+        open(os.path.join(shared, 'init.sls'), 'w').close()
+        os.symlink(shared, os.path.join(self.root, 'linked'))
+        # A link back to the root is not followed again
+        loop = os.path.join(self.root, 'web', 'loop')
+        os.symlink(self.root, loop)
+        mtime_map = fileserver.generate_mtime_map(self.path_map)
+        self.assertIn(os.path.join(self.root, 'linked', 'init.sls'),
+                      mtime_map)
+        self.assertIn(loop, mtime_map)
+        self.assertNotIn(os.path.join(loop, 'top.sls'), mtime_map)
+
+    def test_diff_mtime_map(self):
+        self.assertFalse(fileserver.diff_mtime_map({'a': 1.0}, {'a': 1.0}))
+        self.assertTrue(fileserver.diff_mtime_map({'a': 1.0}, {'a': 2.0}))
+        self.assertTrue(fileserver.diff_mtime_map({'a': 1.0}, {'b': 1.0}))
+
+
+@skipIf(NO_MOCK, NO_MOCK_REASON)
+class RootsVersionTestCase(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        root = os.path.join(self.tmp, 'base')
+        self.shared = os.path.join(self.tmp, 'shared')
+        os.makedirs(root)
+        os.makedirs(self.shared)
+        open(os.path.join(root, 'top.sls'), 'w').close()
+        open(os.path.join(self.shared, 'init.sls'), 'w').close()
+        os.symlink(self.shared, os.path.join(root, 'linked'))
+        roots.__opts__ = {'cachedir': os.path.join(self.tmp, 'cache'),
+                          'sock_dir': self.tmp,
+                          'file_roots': {'base': [root]},
+                          'hash_type': 'md5'}
+        roots._MTIME_MAP.clear()
+        roots._MTIME_MAP_VERSION.clear()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+        roots._MTIME_MAP.clear()
+        roots._MTIME_MAP_VERSION.clear()
+
+    def test_linked_change(self):
+        with patch('bonneville.utils.event.MasterEvent', MagicMock()):
+            roots.update()
+            version = roots.file_list_version({})
+            init = os.path.join(self.shared, 'init.sls')
+            mtime = os.path.getmtime(init) + 10
+            os.utime(init, (mtime, mtime))
+            roots.update()
+        self.assertNotEqual(roots.file_list_version({}), version)
+
+
+if __name__ == '__main__':
+    from integration import run_tests
+    run_tests([MtimeMapTestCase, RootsVersionTestCase], needs_daemon=False)
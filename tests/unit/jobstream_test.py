@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+'''
+    tests.unit.jobstream_test
+    ~~~~~~~~~~~~~~~~~~~~~~~~~
+'''
+
+# Import Salt Testing libs
+from salttesting import skipIf, TestCase
+from salttesting.helpers import ensure_in_syspath
+from salttesting.mock import NO_MOCK, NO_MOCK_REASON, MagicMock, patch
+ensure_in_syspath('../')
+
+# Import bonneville libs
+from bonneville.client.jobstream import ReturnDemux
+
+
+def _ret(jid, minion, data=True):
+    return {'jid': jid, 'id': minion, 'return': data}
+
+
+class StopReading(BaseException):
+    '''
+    End the reader loop, which survives the regular exceptions
+    '''
+
+
+class JobStreamTestCase(TestCase):
+
+    def setUp(self):
+        self.demux = ReturnDemux({'sock_dir': '/tmp'})
+
+    def test_routing(self):
+        first = self.demux.register('1', ['web1', 'web2'], 5)
+        second = self.demux.register('2', ['db1'], 5)
+        self.demux._route(_ret('2', 'db1', 'db'))
+        self.demux._route(_ret('1', 'web1', 'a'))
+        self.demux._route(_ret('1', 'web2', 'b'))
+        self.assertEqual(
+            list(first),
+            [{'web1': {'ret': 'a'}}, {'web2': {'ret': 'b'}}]
+        )
+        self.assertEqual(second.wait(), {'db1': 'db'})
+        # Finished streams are no longer routed to
+        self.assertEqual(self.demux.streams, {})
+
+    def test_expect(self):
+        # The stream is registered before the job is published, the returns
+        # of the other jobs are dropped
+        self.demux._route(_ret('6', 'web1'))
+        stream = self.demux.register('3', [], 5)
+        self.demux._route(_ret('3', 'web1'))
+        stream.expect(['web1'])
+        self.assertEqual(stream.wait(), {'web1': True})
+        self.assertEqual(self.demux.streams, {})
+
+    @skipIf(NO_MOCK, NO_MOCK_REASON)
+    def test_backoff(self):
+        event = MagicMock()
+        event.get_event.side_effect = [IOError()] * 7 + [StopReading()]
+        sleep = MagicMock()
+        with patch('bonneville.utils.event.LocalClientEvent',
+                   MagicMock(return_value=event)):
+            with patch('time.sleep', sleep):
+                self.assertRaises(StopReading, self.demux._run)
+        self.assertEqual([call[0][0] for call in sleep.call_args_list],
+                         [1, 2, 4, 8, 16, 30, 30])
+
+    def test_timeout_and_cancel(self):
+        stream = self.demux.register('4', ['web1', 'web2'], 0.1)
+        self.demux._route(_ret('4', 'web1'))
+        self.assertEqual(stream.wait(), {'web1': True})
+        stream = self.demux.register('5', ['web1'], 5)
+        stream.cancel()
+        self.assertIsNone(stream.next())
+
+
+if __name__ == '__main__':
+    from integration import run_tests
+    run_tests(JobStreamTestCase, needs_daemon=False)
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+'''
+    tests.unit.loader_test
+    ~~~~~~~~~~~~~~~~~~~~~~
+'''
+
+# Import Salt Testing libs
+from salttesting import skipIf, TestCase
+from salttesting.helpers import ensure_in_syspath
+from salttesting.mock import NO_MOCK, NO_MOCK_REASON, MagicMock, patch
+ensure_in_syspath('../')
+
+# Import bonneville libs
+import bonneville.loader
+import bonneville.minion
+
+
+class LoaderArenaTestCase(TestCase):
+
+    def setUp(self):
+        self.opts = {'conf_file': '/etc/salt/master'}
+        bonneville.loader.ARENA.clear()
+        self._enabled = bonneville.loader._ARENA_ENABLED
+
+    def tearDown(self):
+        bonneville.loader.ARENA.clear()
+        bonneville.loader._ARENA_ENABLED = self._enabled
+
+    def test_inactive_arena_stores_nothing(self):
+        bonneville.loader._ARENA_ENABLED = False
+        bonneville.loader.arena_set(self.opts, 'runner', {'a.b': None})
+        self.assertEqual(bonneville.loader.ARENA, {})
+        self.assertIsNone(bonneville.loader.arena_get(self.opts, 'runner'))
+
+    def test_active_arena(self):
+        bonneville.loader._ARENA_ENABLED = True
+        funcs = {'jobs.active': None}
+        bonneville.loader.arena_set(self.opts, 'runner', funcs)
+        self.assertIs(bonneville.loader.arena_get(self.opts, 'runner'), funcs)
+        # Other configurations do not share the entry
+        self.assertIsNone(
+            bonneville.loader.arena_get({'conf_file': '/tmp/master'}, 'runner')
+        )
+        self.assertIsNone(
+            bonneville.loader.arena_get(
+                dict(self.opts, file_client='local'), 'runner'
+            )
+        )
+        self.assertIsNone(
+            bonneville.loader.arena_get(
+                dict(self.opts, runner_dirs=['/srv/runners']), 'runner'
+            )
+        )
+        # The other opts, like the rotated AES key, do not change the loaded
+        # modules
+        self.assertIs(
+            bonneville.loader.arena_get(dict(self.opts, aes='key'), 'runner'),
+            funcs
+        )
+        self.assertIs(
+            bonneville.loader.arena_get(dict(self.opts, jid='1'), 'runner'),
+            funcs
+        )
+        # It can be disabled by configuration
+        self.opts['loader_arena'] = False
+        self.assertIsNone(bonneville.loader.arena_get(self.opts, 'runner'))
+
+    def test_whitelist_key(self):
+        bonneville.loader._ARENA_ENABLED = True
+        funcs = {'key.list_all': None}
+        bonneville.loader.arena_set(
+            self.opts, 'wheel', funcs, whitelist=['key', 'config']
+        )
+        self.assertIs(
+            bonneville.loader.arena_get(
+                self.opts, 'wheel', whitelist=['config', 'key']
+            ),
+            funcs
+        )
+        self.assertIsNone(bonneville.loader.arena_get(self.opts, 'wheel'))
+
+    def test_bounded(self):
+        bonneville.loader._ARENA_ENABLED = True
+        size = bonneville.loader._ARENA_SIZE
+        for num in range(size):
+            bonneville.loader.arena_set(
+                dict(self.opts, id=str(num)), 'runner', {}
+            )
+        # The least recently used entry is dropped
+        bonneville.loader.arena_get(dict(self.opts, id='0'), 'runner')
+        bonneville.loader.arena_set(dict(self.opts, id='new'), 'runner', {})
+        self.assertEqual(len(bonneville.loader.ARENA), size)
+        self.assertIsNotNone(
+            bonneville.loader.arena_get(dict(self.opts, id='0'), 'runner')
+        )
+        self.assertIsNone(
+            bonneville.loader.arena_get(dict(self.opts, id='1'), 'runner')
+        )
+
+    @skipIf(NO_MOCK, NO_MOCK_REASON)
+    def test_master_minion(self):
+        bonneville.loader._ARENA_ENABLED = True
+        mods = MagicMock(side_effect=lambda opts, whitelist=None: {})
+        loaders = dict(
+            (name, MagicMock(side_effect=lambda *args: {}))
+            for name in ('returners', 'states', 'render')
+        )
+        with patch('bonneville.config.minion_config',
+                   MagicMock(return_value={})), \
+                patch('bonneville.loader.grains',
+                      MagicMock(return_value={})), \
+                patch('bonneville.loader.minion_mods', mods), \
+                patch.multiple(bonneville.loader, **loaders), \
+                patch('bonneville.minion.Matcher', MagicMock()):
+            opts = dict(self.opts, file_client='remote')
+            first = bonneville.minion.MasterMinion(opts)
+            second = bonneville.minion.MasterMinion(dict(opts))
+            self.assertEqual(mods.call_count, 1)
+            self.assertIs(second.states, first.states)
+            # A caller changing its opts gets modules bound to them
+            local = bonneville.minion.MasterMinion(
+                dict(opts, file_client='local')
+            )
+            self.assertEqual(mods.call_count, 2)
+            self.assertIsNot(local.states, first.states)
+            self.assertEqual(mods.call_args[0][0]['file_client'], 'local')
+
+
+if __name__ == '__main__':
+    from integration import run_tests
+    run_tests(LoaderArenaTestCase, needs_daemon=False)
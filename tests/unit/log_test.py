@@ -11,6 +11,14 @@
     Test salt's "hacked" logging
 '''
 
+# Import python libs
+import os
+import shutil
+import logging
+import tempfile
+import threading
+import multiprocessing
+
 # Import Salt Testing libs
 from salttesting import TestCase
 from salttesting.helpers import ensure_in_syspath, TestsLoggingHandler
@@ -66,6 +74,93 @@ class TestLog(TestCase):
             log.removeHandler(handler)
 
 
+class ListHandler(logging.Handler):
+    '''
+    Keep the messages of the log records, the first record waits for the
+    unblock event
+    '''
+    def __init__(self, level=logging.NOTSET):
+        super(ListHandler, self).__init__(level)
+        self.messages = []
+        self.started = threading.Event()
+        self.unblock = threading.Event()
+
+    def emit(self, record):
+        self.started.set()
+        self.unblock.wait(5)
+        self.messages.append(record.getMessage())
+
+
+def _log_lines(logger, count):
+    for num in range(count):
+        logger.info('line %d', num)
+
+
+class QueueLoggingHandlerTestCase(TestCase):
+
+    def _logger(self, handler):
+        logger = logging.getLogger('{0}.queue'.format(__name__))
+        logger.propagate = False
+        logger.setLevel(logging.DEBUG)
+        logger.handlers = [handler]
+        return logger
+
+    def test_queue(self):
+        from bonneville.log.handlers import QueueLoggingHandler
+        target = ListHandler(logging.INFO)
+        target.unblock.set()
+        handler = QueueLoggingHandler([target])
+        self.assertEqual(handler.level, logging.INFO)
+        logger = self._logger(handler)
+        data = {'foo': 'bar'}
+        logger.info('data %s', data)
+        # The message is formatted when logged
+        data['foo'] = 'changed'
+        logger.debug('not emitted')
+        handler.close()
+        self.assertEqual(target.messages, ["data {'foo': 'bar'}"])
+
+    def test_full_queue(self):
+        from bonneville.log.handlers import QueueLoggingHandler
+        target = ListHandler()
+        handler = QueueLoggingHandler([target], max_queue_size=1)
+        logger = self._logger(handler)
+        logger.info('one')
+        target.started.wait(5)
+        logger.info('two')
+        logger.info('three')
+        target.unblock.set()
+        handler.close()
+        self.assertEqual(
+            target.messages,
+            ['one', 'two',
+             'The logging queue was full, 1 log records were dropped']
+        )
+
+    def test_child_process(self):
+        from bonneville.log.handlers import QueueLoggingHandler
+        tmp = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp, 'log')
+            target = logging.FileHandler(path)
+            handler = QueueLoggingHandler([target])
+            logger = self._logger(handler)
+            # The child leaves through os._exit, without the atexit handlers
+            proc = multiprocessing.Process(target=_log_lines,
+                                           args=(logger, 1000))
+            proc.start()
+            proc.join()
+            self.assertEqual(proc.exitcode, 0)
+            handler.close()
+            target.close()
+            with open(path) as fp_:
+                lines = fp_.read().splitlines()
+            self.assertEqual(lines,
+                             ['line {0}'.format(num) for num in range(1000)])
+        finally:
+            shutil.rmtree(tmp)
+
+
 if __name__ == '__main__':
     from integration import run_tests
-    run_tests(TestLog, needs_daemon=False)
+    run_tests(TestLog, QueueLoggingHandlerTestCase, needs_daemon=False)
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+'''
+    tests.unit.master_test
+    ~~~~~~~~~~~~~~~~~~~~~~
+'''
+
+# Import python libs
+import copy
+
+# Import Salt Testing libs
+from salttesting import skipIf, TestCase
+from salttesting.helpers import ensure_in_syspath
+from salttesting.mock import NO_MOCK, NO_MOCK_REASON, MagicMock
+ensure_in_syspath('../')
+
+# Import bonneville libs
+from bonneville import master
+from bonneville.utils import pubqueue
+
+MINIONS = ['web3', 'web1', 'db1', 'web2', 'db2']
+
+
+class FakeSocket(object):
+    '''
+    A publish socket refusing the non blocking sends while it is full
+    '''
+    def __init__(self):
+        self.full = False
+        self.sent = []
+        self.options = []
+
+    def send(self, frame, flags=0, copy=True):
+        if self.full and flags & master.zmq.NOBLOCK:
+            raise master.zmq.Again()
+        self.sent.append(frame)
+
+    def setsockopt(self, option, value):
+        self.options.append((option, value))
+
+
+class PublisherTestCase(TestCase):
+
+    def setUp(self):
+        self.publisher = master.Publisher({})
+        self.sock = FakeSocket()
+        self.queue = pubqueue.PublishQueue(send_timeout=1)
+        self.drops = set()
+
+    def _send(self, now, nodrop=True):
+        self.publisher._send(self.sock, self.queue, now, nodrop, self.drops)
+
+    def test_send(self):
+        self.queue.push('first', 100, jid='1')
+        self.queue.push('second', 100, delay=1, jid='2')
+        self._send(100)
+        self._send(101)
+        self.assertEqual(self.sock.sent, ['first', 'second'])
+        self.assertEqual(self.sock.options, [])
+        self.assertEqual(len(self.queue), 0)
+
+    def test_high_water_mark(self):
+        self.sock.full = True
+        self.queue.push('wave0', 100, jid='1')
+        self.queue.push('wave1', 100, delay=1, jid='1')
+        self.queue.push('other', 100, jid='2')
+        # The payloads which are not paced are not retried, the other
+        # publications are not held back
+        self._send(100)
+        self.assertEqual(self.sock.sent, ['wave0', 'other'])
+        self.assertEqual(self.drops, set(['1', '2']))
+        self.assertEqual(self.sock.options,
+                         [(master.zmq.XPUB_NODROP, 0),
+                          (master.zmq.XPUB_NODROP, 1)] * 2)
+        # The wave is retried until the pressure eases
+        self.drops.clear()
+        self._send(101)
+        self._send(101.5)
+        self.assertEqual(len(self.queue), 1)
+        self.sock.full = False
+        self._send(102)
+        self.assertEqual(self.sock.sent, ['wave0', 'other', 'wave1'])
+        self.assertEqual(self.drops, set())
+        stats = self.queue.pop_stats()
+        self.assertEqual(stats['pressure'], 3)
+        self.assertEqual(stats['dropped'], 2)
+        self.assertEqual(stats['published'], 3)
+
+    def test_no_nodrop(self):
+        self.sock.full = True
+        self.queue.push('first', 100, jid='1')
+        self._send(100, nodrop=False)
+        self.assertEqual(self.sock.sent, ['first'])
+        self.assertEqual(self.drops, set())
+
+
+@skipIf(NO_MOCK, NO_MOCK_REASON)
+class ClearFuncsPublishTestCase(TestCase):
+
+    def setUp(self):
+        self.clear_funcs = master.ClearFuncs.__new__(master.ClearFuncs)
+        self.clear_funcs.opts = {'pub_wave_size': 2,
+                                 'pub_wave_interval': 1.0,
+                                 'order_masters': False,
+                                 'sign_pub_messages': False}
+        self.clear_funcs.crypticle = MagicMock()
+        self.clear_funcs.crypticle.dumps.side_effect = copy.deepcopy
+        self.clear_funcs.serial = MagicMock()
+        self.clear_funcs.serial.dumps.side_effect = copy.deepcopy
+        self.clear_funcs._pub_sock = MagicMock()
+
+    def _frames(self):
+        return [call[0][0] for call in
+                self.clear_funcs._pub_sock.send_multipart.call_args_list]
+
+    def _sent(self):
+        return [(header['delay'],
+                 payload['load']['tgt'],
+                 payload['load'].get('tgt_type'))
+                for header, payload in self._frames()]
+
+    def _load(self, tgt, tgt_type):
+        return {'fun': 'test.ping',
+                'arg': [],
+                'tgt': tgt,
+                'tgt_type': tgt_type,
+                'jid': '20131018000000000000',
+                'ret': ''}
+
+    def test_waves(self):
+        self.clear_funcs._send_pub(self._load('*', 'glob'), MINIONS)
+        self.assertEqual(self._sent(),
+                         [(0, ['db1', 'db2'], 'list'),
+                          (1.0, ['web1', 'web2'], 'list'),
+                          (2.0, ['web3'], 'list')])
+        self.assertEqual([header['jid'] for header, _ in self._frames()],
+                         ['20131018000000000000'] * 3)
+
+    def test_compound_waves(self):
+        self.clear_funcs.opts['pub_wave_size'] = 3
+        self.clear_funcs._send_pub(self._load('os:Debian', 'grain'), MINIONS)
+        self.assertEqual(
+            self._sent(),
+            [(0, 'L@db1,db2,web1 and G@os:Debian', 'compound'),
+             (1.0, 'L@web2,web3 and G@os:Debian', 'compound')]
+        )
+
+    def test_no_waves(self):
+        # Small publications, the targets which can not be split and the
+        # masters of syndics publish at once
+        self.clear_funcs._send_pub(self._load('web1', 'glob'), ['web1'])
+        self.clear_funcs._send_pub(self._load('os:Red Hat', 'grain'), MINIONS)
+        self.clear_funcs.opts['order_masters'] = True
+        self.clear_funcs._send_pub(self._load('*', 'glob'), MINIONS)
+        self.assertEqual(self._sent(),
+                         [(0, 'web1', 'glob'),
+                          (0, 'os:Red Hat', 'grain'),
+                          (0, '*', 'glob')])
+
+
+if __name__ == '__main__':
+    from integration import run_tests
+    run_tests([PublisherTestCase, ClearFuncsPublishTestCase],
+              needs_daemon=False)
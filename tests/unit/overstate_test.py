@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+'''
+    tests.unit.overstate_test
+    ~~~~~~~~~~~~~~~~~~~~~~~~~
+'''
+
+# Import python libs
+import os
+import time
+import shutil
+import tempfile
+import threading
+
+# Import Salt Testing libs
+from salttesting import TestCase
+from salttesting.helpers import ensure_in_syspath
+ensure_in_syspath('../')
+
+# Import bonneville libs
+import bonneville.overstate
+import bonneville.utils.minions
+
+
+class FakeOverState(bonneville.overstate.OverState):
+    '''
+    Run the stages without a master, every stage sleeps for its ``sleep``
+    value and returns a successful ``test.ping``
+    '''
+    def __init__(self, over, parallel):
+        self.opts = {'overstate_parallel': parallel}
+        self.env = 'base'
+        self.over = [{name: over[name]} for name in sorted(over)]
+        self.names = set(over)
+        self.over_run = {}
+        self.timings = {}
+        self.elapsed = 0
+        self.lock = threading.Lock()
+        self.running = 0
+        self.max_running = 0
+
+    def _run_stage(self, name, stage):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(stage.get('sleep', 0))
+        with self.lock:
+            self.running -= 1
+        if stage.get('raise'):
+            raise RuntimeError('stage {0} raised'.format(name))
+        success = not stage.get('fail')
+        return {'web1': {'ret': success,
+                         'fun': 'test.ping',
+                         'retcode': 0 if success else 1,
+                         'success': success}}
+
+
+class FakeLocal(object):
+    '''
+    A client finding every pinged minion up
+    '''
+    def cmd(self, tgt, fun, expr_form='glob'):
+        return dict((minion, True) for minion in tgt)
+
+
+class CachedOverState(FakeOverState):
+    '''
+    Find the minions of the stages in the cached minion data
+    '''
+    def __init__(self, over, opts):
+        super(CachedOverState, self).__init__(over, 1)
+        self.opts.update(opts)
+        self.ckminions = bonneville.utils.minions.CkMinions(self.opts)
+
+    def _run_stage(self, name, stage):
+        return dict(
+            (minion, {'ret': True,
+                      'fun': 'test.ping',
+                      'retcode': 0,
+                      'success': True})
+            for minion in self._stage_list(stage['match'], FakeLocal())
+        )
+
+
+class OverStateTestCase(TestCase):
+
+    def _finished(self, overstate):
+        return [name for name, _ in overstate._schedule()]
+
+    def test_independent_stages_overlap(self):
+        over = {'a': {'match': '*', 'sleep': 0.2},
+                'b': {'match': '*', 'sleep': 0.2},
+                'c': {'match': '*', 'require': ['a', 'b']}}
+        overstate = FakeOverState(over, 4)
+        self.assertEqual(self._finished(overstate)[-1], 'c')
+        self.assertEqual(overstate.max_running, 2)
+        self.assertEqual(
+            [name for name, _ in overstate.critical_path()][-1], 'c'
+        )
+
+    def test_parallel_limit(self):
+        over = dict((name, {'match': '*', 'sleep': 0.05}) for name in 'abcd')
+        overstate = FakeOverState(over, 1)
+        self.assertEqual(self._finished(overstate), ['a', 'b', 'c', 'd'])
+        self.assertEqual(overstate.max_running, 1)
+
+    def test_requisite_failures(self):
+        over = {'a': {'match': '*', 'fail': True},
+                'b': {'match': '*', 'require': ['a']},
+                'c': {'match': '*', 'require': ['b']},
+                'd': {'match': '*', 'require': ['missing']},
+                'e': {'match': '*', 'require': ['f']},
+                'f': {'match': '*', 'require': ['e']}}
+        overstate = FakeOverState(over, 4)
+        self.assertEqual(sorted(self._finished(overstate)), sorted(over))
+        for name in 'bcdef':
+            ret = list(overstate.over_run[name].values())[0]
+            self.assertEqual(ret['fun'], 'req.fail')
+        self.assertTrue(overstate.over_run['a']['web1']['retcode'])
+
+    def test_stage_exception(self):
+        over = {'a': {'match': '*', 'raise': True},
+                'b': {'match': '*', 'require': ['a']}}
+        overstate = FakeOverState(over, 1)
+        self.assertEqual(self._finished(overstate), ['a', 'b'])
+        # The stage which raised failed, the stage requiring it did not run
+        for name in 'ab':
+            ret = list(overstate.over_run[name].values())[0]
+            self.assertEqual(ret['fun'], 'req.fail')
+            self.assertFalse(ret['success'])
+        ret = list(overstate.over_run['a'].values())[0]
+        self.assertIn('stage a raised', ret['ret']['comment'])
+
+    def test_cached_data_stages(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            os.makedirs(os.path.join(tmp, 'minions'))
+            for id_ in ('web1', 'web2'):
+                open(os.path.join(tmp, 'minions', id_), 'w').close()
+            opts = {'pki_dir': tmp,
+                    'cachedir': tmp,
+                    'serial': 'msgpack',
+                    'minion_data_cache': True,
+                    'overstate_cache_max_age': 60}
+            over = {'a': {'match': 'web*'},
+                    'b': {'match': 'web*', 'require': ['a']}}
+            overstate = CachedOverState(over, opts)
+            overstate.ckminions.datastore.store('web1', {'grains': {}})
+            # Every stage runs in its own thread and reads the same store
+            self.assertEqual(self._finished(overstate), ['a', 'b'])
+            for name in 'ab':
+                self.assertEqual(sorted(overstate.over_run[name]),
+                                 ['web1', 'web2'])
+        finally:
+            shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    from integration import run_tests
+    run_tests(OverStateTestCase, needs_daemon=False)
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+'''
+    tests.unit.ssh_state_test
+    ~~~~~~~~~~~~~~~~~~~~~~~~~
+'''
+
+# Import python libs
+import os
+import shutil
+import tarfile
+import tempfile
+
+# Import Salt Testing libs
+from salttesting import skipIf, TestCase
+from salttesting.helpers import ensure_in_syspath
+from salttesting.mock import NO_MOCK, NO_MOCK_REASON, MagicMock, patch
+ensure_in_syspath('../')
+
+# Import bonneville libs
+from bonneville.client.ssh import state
+
+
+@skipIf(NO_MOCK, NO_MOCK_REASON)
+class TransBundleTestCase(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.roots = os.path.join(self.tmp, 'roots')
+        os.makedirs(self.roots)
+        self.opts = {'cachedir': os.path.join(self.tmp, 'cache'),
+                     'hash_type': 'md5',
+                     'ssh_state_bundles': 2}
+        client = MagicMock()
+        client.cache_file.side_effect = self._cache_file
+        client.cache_dir.return_value = []
+        patcher = patch.object(state.bonneville.fileclient, 'LocalClient',
+                               MagicMock(return_value=client))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def _cache_file(self, name, env):
+        path = os.path.join(self.roots, name[7:])
+        if os.path.isfile(path):
+            return path
+        return ''
+
+    def _write(self, name, data):
+        with open(os.path.join(self.roots, name), 'w') as fp_:
+            fp_.write(data)
+
+    def _refs(self, *names):
+        return {'base': [['salt://{0}'.format(name)] for name in names]}
+
+    def test_cached(self):
+        self._write('motd', 'hello')
+        self._write('vimrc', 'set nu')
+        bundle, key, bundle_sum = state.trans_bundle(
+            self.opts, self._refs('motd', 'vimrc')
+        )
+        with tarfile.open(bundle, 'r:gz') as tfp:
+            self.assertEqual(sorted(tfp.getnames()),
+                             ['base', 'base/motd', 'base/vimrc'])
+        # The same file set in any order is served from the cache
+        mtime = os.path.getmtime(bundle)
+        os.utime(bundle, (mtime - 100, mtime - 100))
+        self.assertEqual(
+            state.trans_bundle(self.opts, self._refs('vimrc', 'motd')),
+            (bundle, key, bundle_sum)
+        )
+        self.assertTrue(os.path.getmtime(bundle) > mtime - 100)
+        # A changed file makes a new bundle
+        self._write('motd', 'hello world')
+        self.assertNotEqual(
+            state.trans_bundle(self.opts, self._refs('motd', 'vimrc'))[1],
+            key
+        )
+
+    def test_prune(self):
+        keys = []
+        for name in ('one', 'two', 'three'):
+            self._write(name, name)
+            bundle, key, _ = state.trans_bundle(self.opts, self._refs(name))
+            mtime = os.path.getmtime(bundle)
+            os.utime(bundle, (mtime - 100 + len(keys), mtime - 100 + len(keys)))
+            keys.append(key)
+        cachedir = os.path.join(self.opts['cachedir'], 'ssh_state')
+        self.assertEqual(
+            sorted(fn_ for fn_ in os.listdir(cachedir) if fn_ != '.lock'),
+            sorted('{0}{1}'.format(key, ext)
+                   for key in keys[1:] for ext in ('.tgz', '.sum'))
+        )
+
+
+if __name__ == '__main__':
+    from integration import run_tests
+    run_tests(TransBundleTestCase, needs_daemon=False)
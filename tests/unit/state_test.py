@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+'''
+    tests.unit.state_test
+    ~~~~~~~~~~~~~~~~~~~~~
+'''
+
+# Import Salt Testing libs
+from salttesting import skipIf, TestCase
+from salttesting.helpers import ensure_in_syspath
+from salttesting.mock import NO_MOCK, NO_MOCK_REASON, MagicMock, patch
+ensure_in_syspath('../')
+
+# Import bonneville libs
+import bonneville.state
+
+
+def installed(name, version=None, **kwargs):
+    '''
+    The pkg.installed state of the tests, never called by the aggregated runs
+    '''
+    raise AssertionError('installed called for {0}'.format(name))
+
+
+def _ret(name, changes=None):
+    return {'name': name,
+            'result': True,
+            'changes': changes or {},
+            'comment': ''}
+
+
+def _low(name, fun='installed', **kwargs):
+    low = {'state': 'pkg',
+           'fun': fun,
+           'name': name,
+           '__id__': name,
+           '__sls__': 'pkgs',
+           '__env__': 'base',
+           'order': 10000}
+    low.update(kwargs)
+    return low
+
+
+class FakeState(bonneville.state.State):
+    '''
+    Run the chunks without loading any module, the chunks which are not
+    aggregated are recorded in ``called``
+    '''
+    def __init__(self, aggregate=True):
+        self.opts = {'state_aggregate': aggregate,
+                     'failhard': False,
+                     'test': False}
+        self.mod_aggregate = MagicMock(
+            side_effect=lambda fun, calls: [_ret(call['name'])
+                                            for call in calls]
+        )
+        self.states = {'pkg.installed': installed,
+                       'pkg.removed': installed,
+                       'pkg.mod_aggregate': self.mod_aggregate}
+        self.functions = {}
+        self.state_con = {}
+        self.active = set()
+        self.mod_init = set()
+        self.pre = {}
+        self._State__run_num = 0
+        self.called = []
+
+    def call(self, low):
+        self.called.append(low['name'])
+        ret = _ret(low['name'])
+        ret['__run_num__'] = self._State__run_num
+        self._State__run_num += 1
+        return ret
+
+    def call_chunk(self, low, running, chunks):
+        running[bonneville.state._gen_tag(low)] = self.call(low)
+        return running
+
+
+@skipIf(NO_MOCK, NO_MOCK_REASON)
+class StateAggregateTestCase(TestCase):
+
+    def _names(self, group):
+        return [low['name'] for low in group]
+
+    def test_aggregate_group(self):
+        state = FakeState()
+        chunks = [_low('git'),
+                  _low('vim'),
+                  _low('tmux', require=[{'pkg': 'git'}]),
+                  _low('nginx'),
+                  _low('curl', aggregate=False),
+                  _low('zsh'),
+                  _low('emacs', fun='removed')]
+        self.assertEqual(
+            self._names(state.aggregate_group(chunks, 0, {})), ['git', 'vim']
+        )
+        # The chunks with requisites and the chunks opting out are not
+        # merged, neither are other functions
+        self.assertEqual(state.aggregate_group(chunks, 2, {}), [])
+        self.assertEqual(state.aggregate_group(chunks, 3, {}), [])
+        self.assertEqual(state.aggregate_group(chunks, 4, {}), [])
+        self.assertEqual(state.aggregate_group(chunks, 5, {}), [])
+        # The chunks already run as requisites are skipped
+        running = {bonneville.state._gen_tag(chunks[4]): _ret('curl')}
+        chunks[4]['aggregate'] = True
+        self.assertEqual(
+            self._names(state.aggregate_group(chunks[3:], 0, running)),
+            ['nginx', 'zsh']
+        )
+        # It can be disabled by configuration
+        self.assertEqual(
+            FakeState(False).aggregate_group(chunks, 0, {}), []
+        )
+
+    def test_call_chunks(self):
+        state = FakeState()
+        chunks = [_low('git'), _low('vim'), _low('tmux', aggregate=False)]
+        with patch.object(state, 'check_refresh', MagicMock()) as refresh:
+            running = state.call_chunks(chunks)
+        self.assertEqual(state.mod_aggregate.call_count, 1)
+        fun, calls = state.mod_aggregate.call_args[0]
+        self.assertEqual(fun, 'installed')
+        self.assertEqual(self._names(calls), ['git', 'vim'])
+        self.assertEqual(state.called, ['tmux'])
+        # Every chunk gets its own return and run number, in order
+        self.assertEqual(
+            [running[bonneville.state._gen_tag(low)]['__run_num__']
+             for low in chunks],
+            [0, 1, 2]
+        )
+        self.assertEqual(refresh.call_count, 0)
+
+    def test_single_refresh(self):
+        state = FakeState()
+        state.mod_aggregate.side_effect = lambda fun, calls: [
+            _ret(call['name'], {call['name']: {'old': '', 'new': '1.0'}})
+            for call in calls
+        ]
+        with patch.object(state, 'check_refresh', MagicMock()) as refresh:
+            state.call_chunks([_low('git'), _low('vim')])
+        self.assertEqual(refresh.call_count, 1)
+
+    def test_fallback(self):
+        state = FakeState()
+        state.mod_aggregate.side_effect = lambda fun, calls: [_ret('git')]
+        chunks = [_low('git'), _low('vim'), _low('tmux')]
+        running = state.call_chunks(chunks)
+        # A bad mod_aggregate return runs the chunks one by one
+        self.assertEqual(state.called, ['git', 'vim', 'tmux'])
+        self.assertEqual(
+            [running[bonneville.state._gen_tag(low)]['__run_num__']
+             for low in chunks],
+            [0, 1, 2]
+        )
+
+
+if __name__ == '__main__':
+    from integration import run_tests
+    run_tests(StateAggregateTestCase, needs_daemon=False)
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+'''
+    tests.unit.states.pkg_test
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~
+'''
+
+# Import python libs
+import tempfile
+import shutil
+
+# Import Salt Testing libs
+from salttesting import skipIf, TestCase
+from salttesting.helpers import ensure_in_syspath
+from salttesting.mock import NO_MOCK, NO_MOCK_REASON, MagicMock, patch
+ensure_in_syspath('../../')
+
+# Late import so mock can do it's job
+import bonneville.states.pkg as pkg
+pkg.__salt__ = {}
+pkg.__opts__ = {'test': False}
+
+
+@skipIf(NO_MOCK, NO_MOCK_REASON)
+class TestPkgAggregate(TestCase):
+
+    def setUp(self):
+        self.cachedir = tempfile.mkdtemp()
+        self.installed = {'vim': ['7.3']}
+
+    def tearDown(self):
+        shutil.rmtree(self.cachedir)
+
+    def _salt(self):
+        def list_pkgs(**kwargs):
+            return dict(self.installed)
+
+        def install(name=None, pkgs=None, **kwargs):
+            changes = {}
+            for item in pkgs or [name]:
+                pkgname = item if not isinstance(item, dict) else \
+                    item.keys()[0]
+                self.installed[pkgname] = ['1.0']
+                changes[pkgname] = {'old': '', 'new': '1.0'}
+                if pkgname == 'tmux':
+                    # Pulled in as a dependency
+                    changes['libevent'] = {'old': '', 'new': '2.0'}
+            return changes
+
+        return {'pkg.list_pkgs': list_pkgs,
+                'pkg.install': MagicMock(side_effect=install),
+                'pkg.refresh_db': MagicMock(),
+                'pkg_resource.version_clean': MagicMock(return_value=None),
+                'pkg_resource.check_extra_requirements':
+                    MagicMock(return_value=True)}
+
+    def test_installed(self):
+        calls = [{'name': 'git', '__id__': 'git'},
+                 {'name': 'vim', '__id__': 'vim'},
+                 {'name': 'tmux', '__id__': 'tmux'},
+                 {'name': 'nginx', '__id__': 'nginx', 'fromrepo': 'epel'}]
+        salt = self._salt()
+        with patch.dict(pkg.__opts__, {'cachedir': self.cachedir}):
+            with patch.dict(pkg.__salt__, salt):
+                rets = pkg.mod_aggregate('installed', calls)
+        self.assertEqual([ret['name'] for ret in rets],
+                         ['git', 'vim', 'tmux', 'nginx'])
+        self.assertTrue(all(ret['result'] for ret in rets))
+        # One install for git and tmux, one for the other repository
+        self.assertEqual(salt['pkg.install'].call_count, 2)
+        # The dependencies are reported by the first state which installed
+        # something
+        self.assertEqual(sorted(rets[0]['changes']), ['git', 'libevent'])
+        self.assertEqual(rets[1]['changes'], {})
+        self.assertEqual(rets[2]['changes'].keys(), ['tmux'])
+
+    def test_test_mode(self):
+        calls = [{'name': 'git'}, {'name': 'tmux'}]
+        salt = self._salt()
+        with patch.dict(pkg.__opts__,
+                        {'cachedir': self.cachedir, 'test': True}):
+            with patch.dict(pkg.__salt__, salt):
+                rets = pkg.mod_aggregate('installed', calls)
+        self.assertEqual([ret['result'] for ret in rets], [None, None])
+        self.assertFalse(salt['pkg.install'].called)
+
+
+if __name__ == '__main__':
+    from integration import run_tests
+    run_tests(TestPkgAggregate, needs_daemon=False)
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+'''
+    tests.unit.utils.compound_test
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+'''
+
+# Import python libs
+import fnmatch
+
+# Import Salt Testing libs
+from salttesting import TestCase
+from salttesting.helpers import ensure_in_syspath
+ensure_in_syspath('../../')
+
+# Import bonneville libs
+from bonneville.exceptions import SaltInvocationError
+from bonneville.utils import compound
+
+GRAINS = {
+    'web1': 'Debian',
+    'web2': 'RedHat',
+    'db1': 'Debian',
+    'db2': 'RedHat',
+}
+
+
+def _check(id_):
+    '''
+    Return a term matcher for a single minion
+    '''
+    def check(matcher, pattern):
+        if matcher == 'G':
+            return GRAINS[id_] == pattern.split(':', 1)[1]
+        if matcher == 'L':
+            return id_ in pattern.split(',')
+        return fnmatch.fnmatch(id_, pattern)
+    return check
+
+
+def _select_check(calls):
+    '''
+    Return a term selector recording the terms it evaluates
+    '''
+    def check(matcher, pattern, minions):
+        calls.append((matcher, pattern))
+        return set(id_ for id_ in minions if _check(id_)(matcher, pattern))
+    return check
+
+
+class CompoundTestCase(TestCase):
+
+    def _match(self, tgt):
+        expr = compound.parse(tgt)
+        return sorted(id_ for id_ in GRAINS if expr.match(_check(id_)))
+
+    def test_parse(self):
+        expr = compound.parse('web* and G@os:Debian')
+        self.assertIs(compound.parse('web* and G@os:Debian'), expr)
+        self.assertEqual(
+            expr.tree,
+            ('and', (('term', None, 'web*'), ('term', 'G', 'os:Debian')))
+        )
+        self.assertEqual(expr.matchers, frozenset([None, 'G']))
+        for tgt in ('', 'web* and', 'or web*', 'web* db*', '( web*',
+                    'web* )', '( )'):
+            self.assertRaises(SaltInvocationError, compound.parse, tgt)
+
+    def test_match(self):
+        self.assertEqual(self._match('web* and G@os:Debian'), ['web1'])
+        # not binds before and, and before or
+        self.assertEqual(self._match('db* or web* and not G@os:Debian'),
+                         ['db1', 'db2', 'web2'])
+        self.assertEqual(self._match('( db* or web* ) and not G@os:Debian'),
+                         ['db2', 'web2'])
+        # A not directly after a term is an and not
+        self.assertEqual(self._match('web* not G@os:Debian'), ['web2'])
+        self.assertEqual(self._match('not L@web1,db1'), ['db2', 'web2'])
+
+    def test_select(self):
+        calls = []
+        expr = compound.parse('web* and G@os:Debian or L@db2')
+        self.assertEqual(expr.select(GRAINS, _select_check(calls)),
+                         set(['web1', 'db2']))
+        # The right side of the and only sees the minions left by its left
+        # side, an and whose left side is empty stops there
+        calls = []
+        expr = compound.parse('nomatch* and G@os:Debian')
+        self.assertEqual(expr.select(GRAINS, _select_check(calls)), set())
+        self.assertEqual(calls, [(None, 'nomatch*')])
+        calls = []
+        expr = compound.parse('* or G@os:Debian')
+        self.assertEqual(expr.select(GRAINS, _select_check(calls)),
+                         set(GRAINS))
+        self.assertEqual(calls, [(None, '*')])
+
+
+if __name__ == '__main__':
+    from integration import run_tests
+    run_tests(CompoundTestCase, needs_daemon=False)
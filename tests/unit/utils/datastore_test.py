@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+'''
+    tests.unit.utils.datastore_test
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+'''
+
+# Import python libs
+import os
+import shutil
+import tempfile
+
+# Import Salt Testing libs
+from salttesting import TestCase
+from salttesting.helpers import ensure_in_syspath
+ensure_in_syspath('../../')
+
+# Import bonneville libs
+from bonneville.exceptions import SaltInvocationError
+from bonneville.utils import datastore
+
+GRAINS = {'web1': {'os': 'Debian', 'ipv4': ['10.0.0.1']},
+          'web2': {'os': 'RedHat', 'ipv4': ['10.0.0.2']}}
+
+
+class DataStoreTestCase(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.opts = {'cachedir': self.tmp, 'serial': 'msgpack'}
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def _check_store(self, backend):
+        self.opts['minion_data_store'] = backend
+        store = datastore.get_store(self.opts)
+        for minion, grains in GRAINS.items():
+            store.store(minion, {'grains': grains,
+                                 'pillar': {'role': minion[:3]}})
+        self.assertEqual(store.minions(), set(GRAINS))
+        self.assertEqual(store.fetch('web1')['pillar'], {'role': 'web'})
+        self.assertEqual(store.fetch('db1'), {})
+        self.assertEqual(
+            store.fetch_many(['web1', 'web2', 'db1'], ('grains',), ['os']),
+            {'web1': {'grains': {'os': 'Debian'}},
+             'web2': {'grains': {'os': 'RedHat'}}}
+        )
+        self.assertEqual(sorted(store.fetch_many(fields=('pillar',))),
+                         ['web1', 'web2'])
+        store.store('web2', {'grains': GRAINS['web2']})
+        self.assertEqual(store.fetch('web2'), {'grains': GRAINS['web2']})
+        self.assertEqual(sorted(store.updated(['web2', 'db1'])), ['web2'])
+        # The data can be stored again with the time it was first stored
+        store.store('web1', {'grains': GRAINS['web1']}, 1000)
+        self.assertEqual(store.updated(['web1']), {'web1': 1000})
+        self.assertEqual(store.fetch('web1'), {'grains': GRAINS['web1']})
+        store.delete('web2')
+        self.assertEqual(store.minions(), set(['web1']))
+        store.compact()
+        return store
+
+    def test_file(self):
+        self._check_store('file')
+        self.assertTrue(
+            os.path.isfile(os.path.join(self.tmp, 'minions', 'web1', 'data.p'))
+        )
+
+    def test_sqlite(self):
+        self._check_store('sqlite')
+        self.assertRaises(SaltInvocationError, datastore.get_store,
+                          dict(self.opts, minion_data_store='redis'))
+
+    def test_import_files(self):
+        files = datastore.get_store(dict(self.opts, minion_data_store='file'))
+        files.store('web1', {'grains': GRAINS['web1']}, 1000)
+        files.store('web2', {'grains': GRAINS['web2']})
+        store = datastore.get_store(self.opts)
+        store.store('web2', {'grains': {'os': 'Arch'}})
+        self.assertEqual(store.import_files(), 1)
+        self.assertEqual(files.minions(), set())
+        # The data stored before the import is kept
+        self.assertEqual(
+            store.fetch_many(fields=('grains',), keys=['os']),
+            {'web1': {'grains': {'os': 'Debian'}},
+             'web2': {'grains': {'os': 'Arch'}}}
+        )
+        # The imported data is as old as the file
+        self.assertEqual(store.updated(['web1']), {'web1': 1000})
+
+
+if __name__ == '__main__':
+    from integration import run_tests
+    run_tests(DataStoreTestCase, needs_daemon=False)
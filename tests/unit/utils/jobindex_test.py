@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+'''
+    tests.unit.utils.jobindex_test
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+'''
+
+# Import python libs
+import shutil
+import tempfile
+
+# Import Salt Testing libs
+from salttesting import TestCase
+from salttesting.helpers import ensure_in_syspath
+ensure_in_syspath('../../')
+
+# Import bonneville libs
+from bonneville.utils.jobindex import JobIndex
+
+
+class JobIndexTestCase(TestCase):
+
+    def setUp(self):
+        self.cachedir = tempfile.mkdtemp()
+        self.index = JobIndex({'cachedir': self.cachedir})
+        self.index.add({'jid': '20131020120000000000',
+                        'fun': 'state.sls',
+                        'tgt': ['web1', 'web2'],
+                        'tgt_type': 'list',
+                        'arg': ['nginx'],
+                        'user': 'ops'},
+                       ['web1', 'web2'])
+        self.index.add({'jid': '20131021120000000000',
+                        'fun': 'test.ping',
+                        'tgt': 'db*',
+                        'arg': []},
+                       ['db1'])
+        self.index.add({'jid': '20131019120000000000',
+                        'fun': ['cmd.run', 'state.highstate'],
+                        'tgt': 'web*',
+                        'arg': [['uptime'], []]},
+                       ['web1', 'web2'])
+
+    def tearDown(self):
+        shutil.rmtree(self.cachedir)
+
+    def test_get(self):
+        job = self.index.get('20131020120000000000')
+        self.assertEqual(job['Function'], 'state.sls')
+        self.assertEqual(job['Target'], ['web1', 'web2'])
+        self.assertEqual(job['Arguments'], ['nginx'])
+        self.assertEqual(job['Minions'], 2)
+        self.assertEqual(job['Returned'], 0)
+        self.assertIsNone(self.index.get('20131022120000000000'))
+
+    def test_compound(self):
+        job = self.index.get('20131019120000000000')
+        self.assertEqual(job['Function'], ['cmd.run', 'state.highstate'])
+        self.assertEqual(job['Arguments'], [['uptime'], []])
+        # A compound job matches if one of its functions does
+        jids = [jid for jid, _ in self.index.query(fun='state.high*')]
+        self.assertEqual(jids, ['20131019120000000000'])
+        self.assertEqual(self.index.query(fun='run'), [])
+
+    def test_add_return(self):
+        self.index.add_return('20131020120000000000')
+        self.index.add_return('20131020120000000000')
+        self.assertEqual(self.index.get('20131020120000000000')['Returned'], 2)
+
+    def test_query_filters(self):
+        jids = lambda jobs: [jid for jid, _ in jobs]
+        self.assertEqual(
+            jids(self.index.query()),
+            ['20131021120000000000',
+             '20131020120000000000',
+             '20131019120000000000']
+        )
+        self.assertEqual(
+            jids(self.index.query(fun='state.*')),
+            ['20131020120000000000', '20131019120000000000']
+        )
+        self.assertEqual(
+            jids(self.index.query(tgt='db*')), ['20131021120000000000']
+        )
+        self.assertEqual(
+            jids(self.index.query(user='ops')), ['20131020120000000000']
+        )
+        self.assertEqual(
+            jids(self.index.query(start='20131021')), ['20131021120000000000']
+        )
+        self.assertEqual(
+            jids(self.index.query(end='20131020')),
+            ['20131020120000000000', '20131019120000000000']
+        )
+        self.assertEqual(
+            jids(self.index.query(limit=1, offset=1)),
+            ['20131020120000000000']
+        )
+
+    def test_prune(self):
+        self.index.prune(1)
+        self.assertEqual(self.index.query(), [])
+
+
+if __name__ == '__main__':
+    from integration import run_tests
+    run_tests(JobIndexTestCase, needs_daemon=False)
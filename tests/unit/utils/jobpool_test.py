@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+'''
+    tests.unit.utils.jobpool_test
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+'''
+
+# Import python libs
+import os
+import sys
+import time
+import shutil
+import signal
+import tempfile
+
+# Import Salt Testing libs
+from salttesting import TestCase, skipIf
+from salttesting.helpers import ensure_in_syspath
+ensure_in_syspath('../../')
+
+# Import bonneville libs
+from bonneville.utils.jobpool import JobPool
+
+__context__ = {'initial': True}
+
+
+def _context_fun():
+    '''
+    A loaded function, the pool finds the module context through it
+    '''
+
+
+class FakeMinion(object):
+    '''
+    Write the pid and context of the worker running a job to a file
+    '''
+    functions = {'test.fun': _context_fun}
+
+    def __init__(self, tmp):
+        self.opts = {'multiprocessing': True}
+        self.tmp = tmp
+        self.proc_dir = os.path.join(tmp, 'proc')
+        os.makedirs(self.proc_dir)
+
+    @classmethod
+    def _thread_return(cls, minion, opts, data, pooled=False):
+        with open(os.path.join(minion.proc_dir, data['jid']), 'w') as fp_:
+            fp_.write(str(os.getpid()))
+        path = os.path.join(minion.tmp, data['jid'])
+        with open(path + '.tmp', 'w') as fp_:
+            fp_.write('{0} {1}'.format(os.getpid(), sorted(__context__)))
+        os.rename(path + '.tmp', path)
+        __context__[data['jid']] = True
+        if data['fun'] == 'test.sleep':
+            time.sleep(30)
+
+
+@skipIf(sys.platform.startswith('win'), 'The job pool needs fork')
+class JobPoolTestCase(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.pool = JobPool(FakeMinion(self.tmp), 1, ['state.*'])
+
+    def tearDown(self):
+        self.pool.stop()
+        for process, _ in self.pool.workers:
+            process.terminate()
+        shutil.rmtree(self.tmp)
+
+    def _wait(self, jid):
+        path = os.path.join(self.tmp, jid)
+        for _ in range(100):
+            if os.path.isfile(path):
+                with open(path) as fp_:
+                    return fp_.read()
+            time.sleep(0.1)
+        self.fail('Job {0} did not run'.format(jid))
+
+    def _submit(self, data):
+        # The workers take the jobs once forked and idle
+        for _ in range(100):
+            if self.pool.submit(data):
+                return
+            time.sleep(0.1)
+        self.fail('Job {0} was not taken by the pool'.format(data['jid']))
+
+    def test_isolated(self):
+        self.assertTrue(self.pool.isolated({'fun': 'state.highstate'}))
+        self.assertTrue(self.pool.isolated({'fun': ['test.ping', 'state.sls']}))
+        self.assertFalse(self.pool.isolated({'fun': 'test.ping'}))
+
+    def test_submit(self):
+        self.pool.start()
+        self._submit({'jid': '1', 'fun': 'test.fun'})
+        first = self._wait('1').split(' ', 1)
+        self._submit({'jid': '2', 'fun': 'test.fun'})
+        second = self._wait('2').split(' ', 1)
+        # Both jobs ran in the same worker, starting with the same context
+        self.assertEqual(first[0], second[0])
+        self.assertNotEqual(int(first[0]), os.getpid())
+        self.assertEqual(first[1], second[1])
+
+    def test_proc_file_removed(self):
+        self.pool.start()
+        self._submit({'jid': '1', 'fun': 'test.fun'})
+        self._wait('1')
+        # The worker outlives the job, its proc file does not
+        proc = os.path.join(self.tmp, 'proc', '1')
+        for _ in range(50):
+            if not os.path.exists(proc):
+                break
+            time.sleep(0.1)
+        self.assertFalse(os.path.exists(proc))
+
+    def test_restart(self):
+        self.pool.start()
+        self._submit({'jid': '1', 'fun': 'test.fun'})
+        pid = self._wait('1').split(' ', 1)[0]
+        self.pool.restart()
+        # The stopped worker does not take the next job
+        self._submit({'jid': '2', 'fun': 'test.fun'})
+        self.assertNotEqual(self._wait('2').split(' ', 1)[0], pid)
+        time.sleep(1.5)
+        self.pool.reap()
+        self.assertEqual(len(self.pool.workers), 1)
+
+    def test_busy(self):
+        # Without an idle worker the jobs are not queued
+        self.assertFalse(self.pool.submit({'jid': '1', 'fun': 'test.fun'}))
+        self.pool.start()
+        self._submit({'jid': '2', 'fun': 'test.sleep'})
+        self._wait('2')
+        self.assertFalse(self.pool.submit({'jid': '3', 'fun': 'test.fun'}))
+        time.sleep(1.5)
+        self.assertFalse(os.path.exists(os.path.join(self.tmp, '3')))
+
+    def test_killed_worker(self):
+        self.pool.start()
+        self._submit({'jid': '1', 'fun': 'test.sleep'})
+        pid = int(self._wait('1').split(' ', 1)[0])
+        os.kill(pid, signal.SIGKILL)
+        time.sleep(0.2)
+        self.pool.reap()
+        self.assertEqual(len(self.pool.workers), 1)
+        self._submit({'jid': '2', 'fun': 'test.fun'})
+        self.assertNotEqual(int(self._wait('2').split(' ', 1)[0]), pid)
+
+
+if __name__ == '__main__':
+    from integration import run_tests
+    run_tests(JobPoolTestCase, needs_daemon=False)
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+'''
+    tests.unit.utils.keyindex_test
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+'''
+
+# Import python libs
+import os
+import shutil
+import tempfile
+
+# Import Salt Testing libs
+from salttesting import TestCase
+from salttesting.helpers import ensure_in_syspath
+ensure_in_syspath('../../')
+
+# Import bonneville libs
+from bonneville.utils.keyindex import KeyIndex, STATUSES
+
+
+class KeyIndexTestCase(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.pki_dir = os.path.join(self.tmp, 'pki')
+        for status in STATUSES:
+            os.makedirs(os.path.join(self.pki_dir, status))
+        self.add('minions', 'web1', 'Web2', 'db1')
+        self.add('minions_pre', 'web3')
+        self.index = KeyIndex({'cachedir': self.tmp, 'pki_dir': self.pki_dir})
+        self.index.sync()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def add(self, status, *ids):
+        for id_ in ids:
+            with open(os.path.join(self.pki_dir, status, id_), 'w') as fp_:
+                fp_.write('key')
+
+    def test_list(self):
+        self.assertEqual(
+            self.index.list(),
+            {'minions': ['db1', 'web1', 'Web2'],
+             'minions_pre': ['web3'],
+             'minions_rejected': []}
+        )
+        self.assertEqual(self.index.list(('minions_pre',)),
+                         {'minions_pre': ['web3']})
+
+    def test_match(self):
+        self.assertEqual(self.index.match('web*'),
+                         {'minions': ['web1'], 'minions_pre': ['web3']})
+        self.assertEqual(self.index.match('[!w]*'),
+                         {'minions': ['db1', 'Web2']})
+        self.assertEqual(self.index.match('nomatch'), {})
+        self.assertEqual(
+            self.index.match_statuses(['web*', 'db?']),
+            {'web*': set(['minions', 'minions_pre']), 'db?': set(['minions'])}
+        )
+
+    def test_sync(self):
+        shutil.move(os.path.join(self.pki_dir, 'minions_pre', 'web3'),
+                    os.path.join(self.pki_dir, 'minions_rejected', 'web3'))
+        os.remove(os.path.join(self.pki_dir, 'minions', 'db1'))
+        self.add('minions_pre', 'web4')
+        # Directories are never indexed as keys
+        os.makedirs(os.path.join(self.pki_dir, 'minions_pre', 'subdir'))
+        self.index.sync()
+        self.assertEqual(
+            self.index.list(),
+            {'minions': ['web1', 'Web2'],
+             'minions_pre': ['web4'],
+             'minions_rejected': ['web3']}
+        )
+
+
+if __name__ == '__main__':
+    from integration import run_tests
+    run_tests(KeyIndexTestCase, needs_daemon=False)
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+'''
+    tests.unit.utils.minestore_test
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+'''
+
+# Import python libs
+import os
+import shutil
+import tempfile
+
+# Import Salt Testing libs
+from salttesting import TestCase
+from salttesting.helpers import ensure_in_syspath
+ensure_in_syspath('../../')
+
+# Import bonneville libs
+import bonneville.payload
+from bonneville.utils.minestore import MineStore
+
+
+class MineStoreTestCase(TestCase):
+
+    def setUp(self):
+        self.cachedir = tempfile.mkdtemp()
+        self.store = MineStore({'cachedir': self.cachedir})
+        self.store.update('web1', {'network.ip_addrs': ['10.0.0.1'],
+                                   'grains.items': {'os': 'Debian'}})
+        self.store.update('web2', {'network.ip_addrs': ['10.0.0.2']})
+
+    def tearDown(self):
+        shutil.rmtree(self.cachedir)
+
+    def test_get(self):
+        self.assertEqual(
+            self.store.get('network.ip_addrs'),
+            {'web1': ['10.0.0.1'], 'web2': ['10.0.0.2']}
+        )
+        self.assertEqual(self.store.get('network.ip_addrs', ['web2', 'db1']),
+                         {'web2': ['10.0.0.2']})
+        self.assertEqual(self.store.get('test.ping'), {})
+
+    def test_update(self):
+        # Unchanged data is not reported as changed
+        self.assertEqual(
+            self.store.update('web1', {'network.ip_addrs': ['10.0.0.1']}),
+            []
+        )
+        self.assertEqual(
+            self.store.update('web1', {'network.ip_addrs': ['10.0.0.3']}),
+            ['network.ip_addrs']
+        )
+        self.assertEqual(self.store.get('network.ip_addrs', ['web1']),
+                         {'web1': ['10.0.0.3']})
+        # Clear drops the functions which were not sent
+        self.assertEqual(
+            self.store.update('web1', {'network.ip_addrs': ['10.0.0.3']},
+                              clear=True),
+            ['grains.items']
+        )
+        self.assertEqual(self.store.get('grains.items'), {})
+
+    def test_shared(self):
+        # A change made through another store is seen by the cached reader
+        self.assertEqual(self.store.get('grains.items'),
+                         {'web1': {'os': 'Debian'}})
+        other = MineStore({'cachedir': self.cachedir})
+        other.update('web1', {'grains.items': {'os': 'RedHat'}})
+        self.assertEqual(self.store.get('grains.items'),
+                         {'web1': {'os': 'RedHat'}})
+
+    def test_delete(self):
+        self.assertEqual(self.store.delete('web1', 'grains.items'),
+                         ['grains.items'])
+        self.assertEqual(self.store.delete('web1', 'grains.items'), [])
+        self.assertEqual(self.store.minions(), set(['web1', 'web2']))
+        self.assertEqual(self.store.delete('web1'), ['network.ip_addrs'])
+        self.assertEqual(self.store.minions(), set(['web2']))
+
+    def test_import_files(self):
+        serial = bonneville.payload.Serial('msgpack')
+        for minion, data in (('web1', {'grains.items': {'os': 'RedHat'}}),
+                             ('db1', {'network.ip_addrs': ['10.0.0.9']})):
+            os.makedirs(os.path.join(self.cachedir, 'minions', minion))
+            with open(os.path.join(self.cachedir, 'minions', minion,
+                                   'mine.p'), 'w+b') as fp_:
+                fp_.write(serial.dumps(data))
+        # The store already exists, created by a worker for instance, the
+        # files are imported anyway
+        store = MineStore({'cachedir': self.cachedir})
+        self.assertEqual(store.import_files(), 2)
+        self.assertEqual(store.get('network.ip_addrs', ['db1']),
+                         {'db1': ['10.0.0.9']})
+        # The data sent by the minions is kept
+        self.assertEqual(store.get('grains.items'),
+                         {'web1': {'os': 'Debian'}})
+        # The import only runs once
+        self.assertEqual(store.import_files(), 0)
+
+
+if __name__ == '__main__':
+    from integration import run_tests
+    run_tests(MineStoreTestCase, needs_daemon=False)
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+'''
+    tests.unit.utils.minions_test
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+'''
+
+# Import python libs
+import os
+import shutil
+import tempfile
+
+# Import Salt Testing libs
+from salttesting import skipIf, TestCase
+from salttesting.helpers import ensure_in_syspath
+from salttesting.mock import NO_MOCK, NO_MOCK_REASON, MagicMock, patch
+ensure_in_syspath('../../')
+
+# Import bonneville libs
+from bonneville.exceptions import SaltInvocationError
+from bonneville.utils import minions
+
+ACL = [{'web*': ['test.*', 'pkg.list_pkgs']}, 'grains.item']
+
+
+@skipIf(NO_MOCK, NO_MOCK_REASON)
+class AuthCheckTestCase(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.tmp, 'minions'))
+        for id_ in ('web1', 'web2', 'db1'):
+            open(os.path.join(self.tmp, 'minions', id_), 'w').close()
+        self.opts = {'pki_dir': self.tmp,
+                     'cachedir': self.tmp,
+                     'acl_cache_ttl': 10,
+                     'serial': 'msgpack'}
+        self.ckminions = minions.CkMinions(self.opts)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_match_check(self):
+        self.assertTrue(self.ckminions.match_check('test.*', 'test.ping'))
+        self.assertTrue(self.ckminions.match_check(
+            'test.*', ['test.ping', 'test.echo']))
+        self.assertFalse(self.ckminions.match_check(
+            'test.*', ['test.ping', 'cmd.run']))
+        # An invalid regular expression does not allow anything
+        self.assertFalse(self.ckminions.match_check('test.(', 'test.ping'))
+        self.assertIs(minions.compile_regex('test.*'),
+                      minions.compile_regex('test.*'))
+
+    def test_compile_blacklist(self):
+        blacklist = minions.compile_blacklist({'users': ['root', '^sudo_']})
+        self.assertEqual([reg.pattern for reg in blacklist['users']],
+                         ['root', '^sudo_'])
+        self.assertEqual(blacklist['modules'], [])
+        # The blacklist can not be enforced with an invalid expression
+        self.assertRaises(SaltInvocationError,
+                          minions.compile_blacklist,
+                          {'users': ['root', 'web('], 'modules': ['cmd']})
+
+    def test_data_minions(self):
+        self.opts['minion_data_cache'] = True
+        self.ckminions.datastore.store(
+            'web1', {'grains': {'os': 'Debian', 'ipv4': ['10.0.0.1']}}
+        )
+        self.ckminions.datastore.store(
+            'web2', {'grains': {'os': 'RedHat', 'ipv4': ['10.0.0.2']}}
+        )
+        # db1 has no cached data, it may match
+        self.assertEqual(
+            sorted(self.ckminions.check_minions('os:Debian', 'grain')),
+            ['db1', 'web1']
+        )
+        self.assertEqual(
+            sorted(self.ckminions.check_minions('10.0.0.0/24', 'ipcidr')),
+            ['db1', 'web1', 'web2']
+        )
+        self.assertEqual(
+            self.ckminions.split_by_data_age('web*', 'glob', 60)[1], []
+        )
+
+    def test_resolved(self):
+        check = MagicMock(side_effect=self.ckminions.check_minions)
+        resolved = {}
+        with patch.object(self.ckminions, 'check_minions', check):
+            self.assertTrue(self.ckminions.auth_check(
+                ACL, ['test.ping', 'pkg.list_pkgs'], 'web1', 'glob', resolved))
+            self.assertFalse(self.ckminions.auth_check(
+                ACL, 'test.ping', '*', 'glob', resolved))
+        self.assertEqual(sorted(resolved),
+                         [('glob', '*'), ('glob', 'web*'), ('glob', 'web1')])
+        self.assertEqual(
+            self.ckminions.check_minions('web1', 'glob', resolved), ['web1']
+        )
+
+    def test_decisions(self):
+        check = MagicMock(side_effect=self.ckminions.validate_tgt)
+        with patch.object(self.ckminions, 'validate_tgt', check):
+            for _ in range(3):
+                self.assertTrue(self.ckminions.auth_check(
+                    ACL, 'test.ping', 'web*', user='pam:fred'))
+            self.assertEqual(check.call_count, 1)
+            # A new minion key may change the result
+            minions_dir = os.path.join(self.tmp, 'minions')
+            mtime = os.path.getmtime(minions_dir)
+            os.utime(minions_dir, (mtime + 10, mtime + 10))
+            self.assertTrue(self.ckminions.auth_check(
+                ACL, 'test.ping', 'web*', user='pam:fred'))
+            self.assertEqual(check.call_count, 2)
+            self.opts['acl_cache_ttl'] = 0
+            self.ckminions.auth_check(ACL, 'test.ping', 'web*',
+                                      user='pam:fred')
+            self.assertEqual(check.call_count, 3)
+
+
+if __name__ == '__main__':
+    from integration import run_tests
+    run_tests(AuthCheckTestCase, needs_daemon=False)
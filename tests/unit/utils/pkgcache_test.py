@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+'''
+    tests.unit.utils.pkgcache_test
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+'''
+
+# Import python libs
+import os
+import shutil
+import tempfile
+
+# Import Salt Testing libs
+from salttesting import TestCase
+from salttesting.helpers import ensure_in_syspath
+ensure_in_syspath('../../')
+
+# Import bonneville libs
+from bonneville.utils.pkgcache import PkgCache
+
+
+class PkgCacheTestCase(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.db = os.path.join(self.tmp, 'status')
+        with open(self.db, 'w') as fp_:
+            fp_.write('Package: zsh\n')
+        self.cache = PkgCache({'cachedir': self.tmp}, 'apt', [self.db])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_get_set(self):
+        self.assertIsNone(self.cache.get())
+        pkgs = {'installed': {'zsh': ['5.0.2-3']}, 'removed': {}}
+        self.cache.set(self.cache.stamp(), pkgs)
+        self.assertEqual(self.cache.get(), pkgs)
+        self.cache.clear()
+        self.assertIsNone(self.cache.get())
+
+    def test_database_change(self):
+        self.cache.set(self.cache.stamp(), {'zsh': ['5.0.2-3']})
+        with open(self.db, 'a') as fp_:
+            fp_.write('Package: vim\n')
+        self.assertIsNone(self.cache.get())
+
+    def test_stale_stamp(self):
+        # A list read while the database was changing is never used
+        stamp = self.cache.stamp()
+        os.remove(self.db)
+        self.cache.set(stamp, {'zsh': ['5.0.2-3']})
+        self.assertIsNone(self.cache.get())
+
+
+if __name__ == '__main__':
+    from integration import run_tests
+    run_tests(PkgCacheTestCase, needs_daemon=False)
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+'''
+    tests.unit.utils.pubqueue_test
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+'''
+
+# Import Salt Testing libs
+from salttesting import TestCase
+from salttesting.helpers import ensure_in_syspath
+ensure_in_syspath('../../')
+
+# Import bonneville libs
+from bonneville.utils import pubqueue
+
+MINIONS = ['web3', 'web1', 'db1', 'web2', 'db2']
+
+
+class PubQueueTestCase(TestCase):
+
+    def test_wave_targets(self):
+        self.assertEqual(
+            pubqueue.wave_targets('*', 'glob', MINIONS, 2),
+            [(['db1', 'db2'], 'list'),
+             (['web1', 'web2'], 'list'),
+             (['web3'], 'list')]
+        )
+        self.assertEqual(
+            pubqueue.wave_targets('os:Debian', 'grain', MINIONS, 3),
+            [('L@db1,db2,web1 and G@os:Debian', 'compound'),
+             ('L@web2,web3 and G@os:Debian', 'compound')]
+        )
+        self.assertEqual(
+            pubqueue.wave_targets('web* or G@os:Debian', 'compound',
+                                  MINIONS, 5),
+            [('L@db1,db2,web1,web2,web3 and ( web* or G@os:Debian )',
+              'compound')]
+        )
+        self.assertIsNone(
+            pubqueue.wave_targets('os:Red Hat', 'grain', MINIONS, 2)
+        )
+        self.assertIsNone(pubqueue.wave_targets('web', 'custom', MINIONS, 2))
+
+    def test_queue(self):
+        queue = pubqueue.PublishQueue(send_timeout=1)
+        queue.push('second', 100, delay=1, jid='2')
+        queue.push('first', 100, jid='1')
+        self.assertEqual(queue.timeout(100), 0)
+        entry = queue.pop(100)
+        self.assertEqual(entry[-2:], ['1', 'first'])
+        queue.sent(entry)
+        self.assertIsNone(queue.pop(100))
+        self.assertEqual(queue.timeout(100.5), 0.5)
+
+        # A paced payload refused at the high water mark is retried, then
+        # dropped
+        entry = queue.pop(101)
+        self.assertTrue(queue.retry(entry, 101))
+        self.assertIsNone(queue.pop(101))
+        entry = queue.pop(101.5)
+        self.assertTrue(queue.retry(entry, 101.5))
+        entry = queue.pop(102)
+        self.assertEqual(entry[-1], 'second')
+        self.assertFalse(queue.retry(entry, 102))
+        self.assertIsNone(queue.timeout(102))
+        # The other payloads are dropped at once
+        queue.push('third', 103, jid='3')
+        self.assertFalse(queue.retry(queue.pop(103), 103))
+        self.assertEqual(queue.pop_stats(),
+                         {'published': 1,
+                          'bytes': 5,
+                          'paced': 1,
+                          'pressure': 2,
+                          'dropped': 2,
+                          'queued': 0})
+        self.assertFalse(any(queue.pop_stats().values()))
+
+
+if __name__ == '__main__':
+    from integration import run_tests
+    run_tests(PubQueueTestCase, needs_daemon=False)
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+'''
+    tests.unit.utils.returnbuffer_test
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+'''
+
+# Import python libs
+import os
+import shutil
+import tempfile
+import multiprocessing
+
+# Import Salt Testing libs
+from salttesting import TestCase
+from salttesting.helpers import ensure_in_syspath
+ensure_in_syspath('../../')
+
+# Import bonneville libs
+from bonneville.utils.returnbuffer import ReturnBuffer
+
+
+class ReturnBufferTestCase(TestCase):
+
+    def setUp(self):
+        self.spool_dir = tempfile.mkdtemp()
+        self.written = []
+        self.fail = False
+
+    def tearDown(self):
+        shutil.rmtree(self.spool_dir)
+
+    def _write(self, rows):
+        if self.fail:
+            raise IOError('database is down')
+        if ('bad',) in rows:
+            raise ValueError('bad row')
+        self.written.append(rows)
+
+    def test_batches(self):
+        buf = ReturnBuffer('test', self._write, size=3, interval=60,
+                           spool_dir=self.spool_dir)
+        buf.add(('a', 1))
+        buf.add(('b', 2))
+        self.assertEqual(self.written, [])
+        buf.add(('c', 3))
+        self.assertEqual(self.written, [[('a', 1), ('b', 2), ('c', 3)]])
+        buf.add(('d', 4))
+        buf.flush()
+        self.assertEqual(self.written[-1], [('d', 4)])
+
+    def test_spool_and_replay(self):
+        buf = ReturnBuffer('test', self._write, size=2, interval=60,
+                           spool_dir=self.spool_dir)
+        self.fail = True
+        buf.add(('a', 1))
+        buf.add(('b', 2))
+        self.assertEqual(self.written, [])
+        self.assertEqual(len(os.listdir(self.spool_dir)), 1)
+
+        self.fail = False
+        buf.add(('c', 3))
+        buf.add(('d', 4))
+        self.assertEqual(
+            self.written,
+            [[('a', 1), ('b', 2)], [('c', 3), ('d', 4)]]
+        )
+        self.assertEqual(os.listdir(self.spool_dir), [])
+
+    def test_refused_batch(self):
+        buf = ReturnBuffer('test', self._write, size=2, interval=60,
+                           spool_dir=self.spool_dir)
+        buf.add(('a', 1))
+        buf.add(('bad',))
+        # The batch is moved aside, the next ones are written
+        self.assertEqual(self.written, [])
+        failed = os.listdir(self.spool_dir)
+        self.assertEqual(len(failed), 1)
+        self.assertTrue(failed[0].endswith('.failed'))
+        buf.add(('c', 3))
+        buf.add(('d', 4))
+        self.assertEqual(self.written, [[('c', 3), ('d', 4)]])
+
+        # A refused spooled batch is moved aside as well
+        self.fail = True
+        buf.add(('bad',))
+        buf.add(('e', 5))
+        self.fail = False
+        self.assertTrue(buf.flush())
+        self.assertEqual(len(self.written), 1)
+        self.assertEqual(
+            len([fn_ for fn_ in os.listdir(self.spool_dir)
+                 if fn_.endswith('.failed')]),
+            2
+        )
+        self.assertTrue(buf.flush())
+
+    def test_stale_claim(self):
+        buf = ReturnBuffer('test', self._write, size=2, interval=60,
+                           spool_dir=self.spool_dir)
+        self.fail = True
+        buf.add(('a', 1))
+        buf.add(('b', 2))
+        # A worker died after claiming the spooled batch
+        path = os.path.join(self.spool_dir, os.listdir(self.spool_dir)[0])
+        os.rename(path, '{0}.{1}'.format(path, os.getpid()))
+        self.fail = False
+        buf.flush()
+        self.assertEqual(self.written, [[('a', 1), ('b', 2)]])
+        self.assertEqual(os.listdir(self.spool_dir), [])
+
+    def test_exit_flush(self):
+        path = os.path.join(self.spool_dir, 'written')
+
+        def write(rows):
+            with open(path, 'a') as fp_:
+                fp_.write('{0}\n'.format(len(rows)))
+
+        buf = ReturnBuffer('test', write, size=10, interval=60)
+        # The rows left in the buffer are written when the child exits,
+        # through os._exit
+        proc = multiprocessing.Process(target=buf.add, args=(('a', 1),))
+        proc.start()
+        proc.join()
+        with open(path) as fp_:
+            self.assertEqual(fp_.read(), '1\n')
+
+
+if __name__ == '__main__':
+    from integration import run_tests
+    run_tests(ReturnBufferTestCase, needs_daemon=False)
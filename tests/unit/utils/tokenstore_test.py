@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+'''
+    tests.unit.utils.tokenstore_test
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+'''
+
+# Import python libs
+import os
+import time
+import shutil
+import tempfile
+
+# Import Salt Testing libs
+from salttesting import skipIf, TestCase
+from salttesting.helpers import ensure_in_syspath
+from salttesting.mock import NO_MOCK, NO_MOCK_REASON, patch
+ensure_in_syspath('../../')
+
+# Import bonneville libs
+from bonneville.exceptions import SaltInvocationError
+from bonneville.utils import tokenstore
+
+
+def _token(tok, ttl):
+    now = time.time()
+    return {'start': now,
+            'expire': now + ttl,
+            'name': 'fred',
+            'eauth': 'pam',
+            'token': tok}
+
+
+@skipIf(NO_MOCK, NO_MOCK_REASON)
+class TokenStoreTestCase(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.opts = {'token_dir': self.tmp,
+                     'token_expire': 3600,
+                     'token_cache_size': 2,
+                     'serial': 'msgpack'}
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def _check_store(self, backend):
+        self.opts['token_store'] = backend
+        store = tokenstore.get_store(self.opts)
+        other = tokenstore.get_store(self.opts)
+        store.put(_token('good', 3600))
+        store.put(_token('gone', -10))
+        self.assertEqual(other.get('good')['name'], 'fred')
+        self.assertTrue(other.exists('gone'))
+        # An expired token is removed when read
+        self.assertEqual(other.get('gone'), {})
+        self.assertFalse(store.exists('gone'))
+        self.assertEqual(other.get('nope'), {})
+        # A cached token is used until it is checked again
+        store.delete('good')
+        self.assertEqual(other.get('good')['name'], 'fred')
+        with patch.object(tokenstore, '_RECHECK', -1):
+            self.assertEqual(other.get('good'), {})
+        store.put(_token('old', -10))
+        store.put(_token('new', 3600))
+        if backend == 'file':
+            # The cleanup only reads the files older than token_expire
+            past = time.time() - 7200
+            os.utime(os.path.join(self.tmp, 'old'), (past, past))
+        self.assertEqual(store.clean(), 1)
+        self.assertFalse(store.exists('old'))
+        self.assertTrue(store.exists('new'))
+        return store
+
+    def test_file(self):
+        self._check_store('file')
+        self.assertEqual(sorted(os.listdir(self.tmp)), ['new'])
+        self.assertEqual(tokenstore.get_store(self.opts).get('../new'), {})
+
+    def test_sqlite(self):
+        self._check_store('sqlite')
+        self.assertRaises(SaltInvocationError, tokenstore.get_store,
+                          dict(self.opts, token_store='returner'))
+
+    def test_cache(self):
+        store = tokenstore.get_store(self.opts)
+        for tok in ('one', 'two', 'three'):
+            store.put(_token(tok, 3600))
+        self.assertEqual(list(store._cache), ['two', 'three'])
+        store.get('two')
+        self.assertEqual(list(store._cache), ['three', 'two'])
+
+
+if __name__ == '__main__':
+    from integration import run_tests
+    run_tests(TokenStoreTestCase, needs_daemon=False)
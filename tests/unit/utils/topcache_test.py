@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+'''
+    tests.unit.utils.topcache_test
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+'''
+
+# Import python libs
+import os
+import shutil
+import tempfile
+
+# Import Salt Testing libs
+from salttesting import skipIf, TestCase
+from salttesting.helpers import ensure_in_syspath
+from salttesting.mock import NO_MOCK, NO_MOCK_REASON, MagicMock, patch
+ensure_in_syspath('../../')
+
+# Import bonneville libs
+from bonneville.utils import topcache
+
+
+class FakeMatcher(object):
+    '''
+    Match the compound targets of the tests on the grains
+    '''
+    def __init__(self, id_):
+        self.opts = {'id': id_, 'grains': {'os': 'Debian'}}
+
+    def confirm_top(self, match, data, nodegroups=None):
+        return match == 'G@os:' + self.opts['grains']['os']
+
+
+@skipIf(NO_MOCK, NO_MOCK_REASON)
+class TopCacheTestCase(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        topcache.RENDERED.clear()
+        topcache.COMPILED.clear()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def _write(self, name, data):
+        path = os.path.join(self.tmp, name)
+        with open(path, 'w') as fp_:
+            fp_.write(data)
+        return path
+
+    def test_render_plain(self):
+        path = self._write('top.sls', 'base:\n  "*":\n    - core\n')
+        compile_template = MagicMock(
+            return_value={'base': {'*': ['core']}, 'include': ['other']}
+        )
+        with patch.object(topcache, 'compile_template', compile_template):
+            data, key = topcache.render_top(path, {}, 'yaml_jinja', 'base')
+            data.pop('include')
+            again, same = topcache.render_top(path, {}, 'yaml_jinja', 'base')
+            self.assertEqual(compile_template.call_count, 1)
+            self.assertEqual(key, same)
+            # The caller changing the data does not change the cache
+            self.assertIn('include', again)
+            self._write('top.sls', 'base:\n  "*":\n    - core\n    - web\n')
+            _, changed = topcache.render_top(path, {}, 'yaml_jinja', 'base')
+            self.assertEqual(compile_template.call_count, 2)
+            self.assertNotEqual(key, changed)
+
+    def test_render_template(self):
+        path = self._write(
+            'top.sls', 'base:\n  {{ grains.id }}:\n    - core\n'
+        )
+        compile_template = MagicMock(return_value={'base': {}})
+        with patch.object(topcache, 'compile_template', compile_template):
+            self.assertIsNone(
+                topcache.render_top(path, {}, 'yaml_jinja', 'base')[1]
+            )
+            topcache.render_top(path, {}, 'yaml_jinja', 'base')
+            self.assertEqual(compile_template.call_count, 2)
+            path = self._write('py.sls', '#!yaml\nbase: {}\n')
+            self.assertIsNone(
+                topcache.render_top(path, {}, 'yaml_jinja', 'base')[1]
+            )
+        self.assertEqual(
+            topcache.render_top(False, {}, 'yaml_jinja', 'base')[0], {}
+        )
+
+    def test_matches(self):
+        top = {
+            'base': {
+                '*': ['core'],
+                'web*': ['web'],
+                'db[0-9]': ['db'],
+                r'^web\d+$': [{'match': 'pcre'}, 'nginx'],
+                'web1,web2': [{'match': 'list'}, 'lb'],
+                'G@os:Debian': [{'match': 'compound'}, 'apt'],
+                'empty': [],
+            },
+            'dev': {'web1': ['debug']},
+        }
+        compiled = topcache.compile_top(('key',), top)
+        self.assertIs(topcache.compile_top(('key',), {}), compiled)
+        matches = compiled.matches(FakeMatcher('web1'))
+        self.assertEqual(sorted(matches['base']),
+                         ['apt', 'core', 'lb', 'nginx', 'web'])
+        self.assertEqual(matches['dev'], ['debug'])
+        matches = compiled.matches(FakeMatcher('db1'), 'base')
+        self.assertEqual(sorted(matches['base']), ['apt', 'core', 'db'])
+        self.assertNotIn('dev', matches)
+
+
+if __name__ == '__main__':
+    from integration import run_tests
+    run_tests(TopCacheTestCase, needs_daemon=False)